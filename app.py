@@ -1,21 +1,24 @@
 import os
+import sys
+from services import startup_service  # 最先导入，记录进程启动时间
+os.environ.setdefault('MPLBACKEND', 'Agg')  # 非交互式后端，matplotlib 在生成图表时才导入
+
 from flask import Flask, render_template, request, send_from_directory, jsonify
-import matplotlib
-matplotlib.use('Agg')  # 非交互式后端
 import socket
 import argparse
+from database import dataset_versions
 from database.models import Database
+from services.response_service import FastJSONProvider
+from services import metrics_service, request_recorder, scheduler_service, snapshot_service
 import pandas as pd
 import logging
-import sys
 from datetime import datetime
 import time
 import json
-import requests
 
 # 配置全局日志
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=getattr(logging, os.getenv('LOG_LEVEL', 'DEBUG').upper(), logging.DEBUG),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.StreamHandler(sys.stdout),
@@ -30,6 +33,11 @@ RELEASE_DATE = "2025-06-10"
 
 # 创建Flask应用
 app = Flask(__name__)
+app.json = FastJSONProvider(app)  # orjson编码，未安装时回退到标准库
+metrics_service.init_app(app)  # 请求计时、Server-Timing 和 /metrics
+startup_service.init_app(app)  # /healthz、/ready，预热期间请求等待就绪
+request_recorder.init_app(app)  # ETF_RECORD_REQUESTS 设置时记录请求供压测回放
+scheduler_service.init_app(app)  # /api/jobs 后台任务状态
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 限制上传文件大小为50MB
 app.logger.setLevel(logging.DEBUG)
@@ -69,6 +77,7 @@ app.register_blueprint(data_bp)
 app.register_blueprint(analysis_bp)
 app.register_blueprint(search_bp)
 app.register_blueprint(feishu_bp)
+startup_service.mark_app_loaded()
 
 # 飞书API配置
 # FEISHU_APP_ID = "cli_a8af2342507bd00b"  # 替换为您的APP ID
@@ -178,12 +187,8 @@ def index():
         # 创建数据库连接
         db = Database()
         
-        # 获取最新的交易日期
-        conn = db.connect()
-        cursor = conn.cursor()
-        cursor.execute("SELECT MAX(date) FROM etf_price")
-        latest_date_result = cursor.fetchone()
-        latest_date = latest_date_result[0] if latest_date_result and latest_date_result[0] else None
+        # 获取最新的交易日期（数据集版本登记，见 database/dataset_versions.py）
+        latest_date = dataset_versions.registry.latest_date('price')
         
         if latest_date:
             # 直接使用最新数据的日期，而不是当前日期
@@ -295,6 +300,25 @@ def ajax_sort_company_analytics():
                                   current_order=order)
     return jsonify({"html_fragment": html_fragment, "sort_by": sort_by, "order": order})
 
+@app.route('/api/company_analytics/history')
+def api_company_analytics_history():
+    """基金公司分析历史：传 name 返回单个公司的时间序列，否则返回指定 date（默认最新）的全部公司快照"""
+    company_name = request.args.get('name')
+    start = request.args.get('start')
+    end = request.args.get('end')
+    try:
+        db = Database()
+        if company_name:
+            data = db.get_company_analytics_history(company_name, start=start, end=end)
+        else:
+            sort_by = request.args.get('sort_by', 'total_holding_value')
+            ascending = request.args.get('order', 'desc') == 'asc'
+            data = db.get_company_analytics_on_date(request.args.get('date'), sort_by=sort_by, ascending=ascending)
+        return jsonify(data)
+    except Exception as e:
+        logger.error(f"获取基金公司分析历史出错: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/business-products')
 def business_products_page_route():
     """新的商务品分析页面，包含飞书推广数据。"""
@@ -338,20 +362,6 @@ def preload_data():
         attention_recommendations = db.get_etf_attention_recommendations()
         value_recommendations = db.get_etf_value_recommendations()
         
-        # 读取价格建议文件
-        today = datetime.now().strftime('%Y%m%d')
-        price_recommendations_file = os.path.join(app.config['UPLOAD_FOLDER'], f'etf_price_recommendations_{today}.json')
-        
-        if os.path.exists(price_recommendations_file):
-            try:
-                with open(price_recommendations_file, 'r') as f:
-                    from_file = json.load(f)
-                if isinstance(from_file, list) and len(from_file) > 0:
-                    print(f"从文件加载价格推荐数据: {len(from_file)}条记录")
-                    price_recommendations = from_file
-            except Exception as e:
-                print(f"读取价格推荐文件失败: {str(e)}")
-        
         # 保存到应用配置
         app.config['PRICE_RECOMMENDATIONS'] = price_recommendations
         app.config['HOLDERS_RECOMMENDATIONS'] = holders_recommendations
@@ -363,18 +373,6 @@ def preload_data():
         print(f"ETF自选推荐数据: {len(attention_recommendations)}条记录")
         print(f"ETF持仓价值推荐数据: {len(value_recommendations)}条记录")
         
-        # 写入价格推荐文件
-        try:
-            today = datetime.now().strftime('%Y%m%d')
-            price_recommendations_file = os.path.join(app.config['UPLOAD_FOLDER'], f'etf_price_recommendations_{today}.json')
-            
-            with open(price_recommendations_file, 'w') as f:
-                json.dump(price_recommendations, f)
-            
-            print(f"价格推荐数据已保存到: {price_recommendations_file}")
-        except Exception as e:
-            print(f"保存价格推荐数据失败: {str(e)}")
-        
         # 记录加载时间
         end_time = time.time()
         elapsed_time = end_time - start_time
@@ -391,24 +389,110 @@ def preload_data():
         traceback.print_exc()
         app.config['DATA_LOADED'] = False
 
+def refresh_keyword_index():
+    """构建搜索关键词索引"""
+    from services.keyword_index import get_keyword_index
+    get_keyword_index()
+
+
+def load_price_universe():
+    """加载价格涨幅推荐使用的最新涨幅全集"""
+    from services.price_recommendation_service import get_return_universe
+    get_return_universe()
+
+
+def load_index_intro_map():
+    """加载指数简介映射"""
+    from services.index_service import load_index_info
+    load_index_info()
+
+
+def sync_feishu_data():
+    """同步飞书推广数据（经任务调度执行，持有写锁并记录运行历史）"""
+    run = scheduler_service.run_job('feishu_sync', trigger='startup')
+    if run.status == 'failed':
+        raise RuntimeError(run.error)
+
+
+def build_company_daily_metrics():
+    """旧库尚未建立基金公司日汇总表时构建（经任务调度执行，持有写锁并记录运行历史）"""
+    run = scheduler_service.run_job('company_daily_metrics', trigger='startup')
+    if run.status == 'failed':
+        raise RuntimeError(run.error)
+
+
+# 预热中写库的步骤，不在多进程部署的主进程执行
+WRITE_STEPS = {'company_daily_metrics', 'feishu_sync'}
+
+
+def warmup_steps():
+    """启动预热步骤，飞书同步依赖外网，不阻塞就绪"""
+    return [
+        startup_service.WarmupStep('imports', startup_service.import_heavy_modules),
+        startup_service.WarmupStep('recommendations', preload_data),
+        startup_service.WarmupStep('index_info', load_index_intro_map),
+        startup_service.WarmupStep('keyword_index', refresh_keyword_index),
+        startup_service.WarmupStep('price_universe', load_price_universe),
+        startup_service.WarmupStep('company_daily_metrics', build_company_daily_metrics, required=False),
+        startup_service.WarmupStep('feishu_sync', sync_feishu_data, required=False),
+    ]
+
+
+def snapshot_steps():
+    """多进程部署时在主进程加载的只读数据；飞书同步等写操作不在主进程执行"""
+    steps = [step for step in warmup_steps() if step.name not in WRITE_STEPS]
+    steps.append(startup_service.WarmupStep('etf_universe', snapshot_service.load_etf_universe))
+    return steps
+
+
+def create_app():
+    """应用工厂：加载数据快照后返回应用，gunicorn 以 preload_app 在主进程调用一次（见 gunicorn.conf.py）"""
+    snapshot_service.load(snapshot_steps())
+    return app
+
+
+def reload_snapshot():
+    """数据版本变化后在主进程重新加载快照，返回是否实际重载"""
+    if not snapshot_service.is_stale():
+        return False
+    snapshot_service.load(snapshot_steps())
+    return True
+
 # 启动应用
 if __name__ == '__main__':
     # 解析命令行参数
     parser = argparse.ArgumentParser(description='ETF数据分析平台')
     parser.add_argument('--port', type=int, default=5007, help='指定服务端口，默认为5007')
+    parser.add_argument('--fast-start', action='store_true',
+                        help='快速启动：先绑定端口，在后台预热数据（也可设置 ETF_FAST_START=1）')
     args = parser.parse_args()
+    args.fast_start = args.fast_start or os.getenv('ETF_FAST_START') == '1'
     
     # 创建必要的目录
     os.makedirs('templates', exist_ok=True)
     os.makedirs('static', exist_ok=True)
     os.makedirs('data', exist_ok=True)
     
-    # 预加载数据
-    preload_data()
+    # 调试重载器（非快速启动模式）：父进程只监视文件变化，由子进程（WERKZEUG_RUN_MAIN=true）提供服务，
+    # 调度和预热只在提供服务的进程中执行，否则会执行两次
+    use_reloader = not args.fast_start
+    serving = not use_reloader or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+
+    # 后台任务调度（价格抓取、数据导入、飞书同步、基金公司分析刷新），ETF_SCHEDULER=0 时关闭
+    if serving and os.getenv('ETF_SCHEDULER', '1') != '0':
+        scheduler_service.start()
+    
+    if serving and args.fast_start:
+        # 后台预热，端口立即绑定；预热期间 /ready 返回503
+        startup_service.start_warmup(warmup_steps())
+    elif serving:
+        # 预加载数据并同步飞书数据后再启动
+        startup_service.run_warmup(warmup_steps())
     
     # 检查端口是否可用，如果不可用则自动查找可用端口
+    # （重载器子进程沿用父进程已绑定的端口，不再检查）
     port = args.port
-    if not is_port_available(port):
+    if os.environ.get('WERKZEUG_RUN_MAIN') != 'true' and not is_port_available(port):
         print(f"端口 {port} 已被占用，正在查找可用端口...")
         available_port = find_available_port(port + 1)
         if available_port:
@@ -419,113 +503,17 @@ if __name__ == '__main__':
             print("提示：您可以使用 --port 参数指定其他端口，例如: python app.py --port 8080")
             exit(1)
     
-    # 自动同步飞书数据
-    try:
-        from blueprints.feishu_routes import get_feishu_poster_data
-        from database.models import Database
-        print("正在同步飞书推广数据...")
-        
-        # 获取飞书数据
-        poster_data = get_feishu_poster_data()
-        if poster_data:
-            # 创建数据库连接
-            db = Database()
-            conn = db.connect()
-            cursor = conn.cursor()
-            
-            # 确保表存在
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='feishu_promo_data'")
-            table_exists = cursor.fetchone() is not None
-            
-            if not table_exists:
-                # 创建表
-                cursor.execute("""
-                    CREATE TABLE feishu_promo_data (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        code TEXT NOT NULL,
-                        name TEXT,
-                        publish_date TEXT,
-                        offline_date TEXT,
-                        publish_channel TEXT,
-                        remarks TEXT,
-                        banner_url TEXT,
-                        long_image_url TEXT,
-                        expiry_date TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                conn.commit()
-            else:
-                # 检查表结构，确保expiry_date字段存在
-                cursor.execute("PRAGMA table_info(feishu_promo_data)")
-                columns = [column[1] for column in cursor.fetchall()]
-                if 'expiry_date' not in columns:
-                    print("正在更新表结构，添加expiry_date字段...")
-                    cursor.execute("ALTER TABLE feishu_promo_data ADD COLUMN expiry_date TEXT")
-                    conn.commit()
-            
-            # 先清空现有数据，完全重建
-            print("清空现有数据，准备全量同步...")
-            cursor.execute("DELETE FROM feishu_promo_data")
-            conn.commit()
-            
-            # 保存数据
-            saved_count = 0
-            for poster in poster_data:
-                try:
-                    code = poster.get('code', '')
-                    if not code:  # 跳过没有代码的记录
-                        print("跳过一条没有证券代码的记录")
-                        continue
-                    
-                    # 插入新记录
-                    cursor.execute("""
-                        INSERT INTO feishu_promo_data
-                        (code, name, publish_date, offline_date, publish_channel, remarks, 
-                         banner_url, long_image_url, expiry_date)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        code,
-                        poster.get('name', ''),
-                        poster.get('publish_date', ''),
-                        poster.get('offline_date', ''),
-                        poster.get('publish_channel', ''),
-                        poster.get('remarks', ''),
-                        poster.get('banner_url', ''),
-                        poster.get('long_image_url', ''),
-                        poster.get('expiry_date', '')  # 添加过期日期字段
-                    ))
-                    
-                    saved_count += 1
-                except Exception as e:
-                    print(f"保存推广记录时出错: {str(e)}")
-            
-            conn.commit()
-            
-            # 打印一些记录示例，帮助调试
-            print("数据同步完成，检查部分记录示例:")
-            cursor.execute("""
-                SELECT code, name, publish_date, offline_date, expiry_date, publish_channel
-                FROM feishu_promo_data
-                LIMIT 5
-            """)
-            sample_records = cursor.fetchall()
-            for i, record in enumerate(sample_records):
-                print(f"样本{i+1}: 代码={record[0]}, 名称={record[1]}, 推送时间={record[2]}, 下线时间={record[3]}, 过期时间={record[4]}, 渠道={record[5]}")
-            
-            conn.close()
-            print(f"成功同步 {saved_count}/{len(poster_data)} 条飞书推广数据")
-        else:
-            print("无法获取飞书推广数据，请检查网络连接或API配置")
-    except Exception as e:
-        print(f"同步飞书数据时出错: {str(e)}")
-        import traceback
-        traceback.print_exc()
-    
     # 启动应用
     print(f"服务已启动，请访问 http://localhost:{port} 或 http://127.0.0.1:{port}")
     print(f"如果浏览器无法访问，请确认使用的是 http://localhost:{port} 而不是 https://localhost:{port}")
     print(f"您也可以尝试使用其他端口启动，例如: python app.py --port 8080")
-    app.run(debug=True, host='0.0.0.0', port=port)
+    startup_service.mark_bound()
+    print(f"启动耗时: 模块加载 {startup_service.state.app_loaded - startup_service.PROCESS_STARTED:.2f}秒，"
+          f"绑定端口 {startup_service.state.bound_at - startup_service.PROCESS_STARTED:.2f}秒，"
+          f"就绪状态见 http://localhost:{port}/ready")
+    if args.fast_start:
+        # 调试重载器会在子进程中重新导入全部模块，快速启动模式下关闭
+        app.run(debug=False, use_reloader=False, threaded=True, host='0.0.0.0', port=port)
+    else:
+        app.run(debug=True, use_reloader=use_reloader, host='0.0.0.0', port=port)
     
\ No newline at end of file
@@ -4,14 +4,14 @@
 """
 自动更新ETF数据脚本
 
-本脚本用于自动获取最新的ETF价格数据并生成推荐。
-可以设置为定时任务，确保系统始终使用最新的ETF价格数据。
+本脚本用于立即获取一次最新的ETF价格数据（调度任务 price_update）。
+服务运行时该任务已由内置任务调度按计划执行（默认每个工作日16:00，见 services/scheduler_service.py），
+不再需要外部 cron；本脚本用于手动补跑，运行历史见 /api/jobs。
 
 使用方法：
-python auto_update_etf_data.py
+python auto_update_etf_data.py [任务名]
 
-定时任务设置示例（每个工作日下午4点执行）：
-0 16 * * 1-5 cd /path/to/Weekly_ETF_Data_Changes && python auto_update_etf_data.py
+任务名默认为 price_update，也可以是 import_data、feishu_sync、company_analytics
 """
 
 import os
@@ -36,23 +36,20 @@ logging.basicConfig(
 
 logger = logging.getLogger('etf_updater')
 
-def main():
+def main(job_name='price_update'):
     """主函数"""
     try:
-        logger.info("开始自动更新ETF数据")
+        from services import scheduler_service
         
-        # 导入获取最新ETF数据的函数
-        from get_latest_etf_data import main as get_latest_data
+        logger.info(f"开始执行任务 {job_name}")
+        # 与服务内的调度任务共用写锁，不会与正在进行的导入同时写库
+        run = scheduler_service.run_job(job_name, trigger='cli')
         
-        # 获取最新ETF数据
-        logger.info("正在获取最新ETF价格数据...")
-        result = get_latest_data()
-        
-        if result != 0:
-            logger.error("获取ETF价格数据失败")
+        if run.status != 'ok':
+            logger.error(f"任务 {job_name} 失败: {run.error}")
             return 1
         
-        logger.info("ETF数据更新完成")
+        logger.info(f"任务 {job_name} 完成，耗时 {run.seconds} 秒，结果: {run.result}")
         return 0
         
     except Exception as e:
@@ -60,4 +57,4 @@ def main():
         return 1
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main(*sys.argv[1:2]))
\ No newline at end of file
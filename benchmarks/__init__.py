@@ -0,0 +1 @@
+# 基准测试：合成数据生成与性能基准
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+请求回放压测
+
+读取 services/request_recorder.py 记录的 JSON Lines 请求日志，按指定并发回放，
+统计每个接口的吞吐、延迟分位数和错误率。
+
+回放目标:
+- wsgi（默认）：进程内 Flask 测试客户端，不经过网络
+- http://host:port：已运行的服务（如 gunicorn）
+- --gunicorn N：临时启动 N 个 worker 的本地 gunicorn 再回放，结束后关闭
+
+用法:
+    ETF_RECORD_REQUESTS=recorded.jsonl python app.py        # 先录制
+    python -m benchmarks.replay recorded.jsonl --concurrency 8 --requests 2000
+    python -m benchmarks.replay recorded.jsonl --target http://127.0.0.1:8000 --duration 60
+    python -m benchmarks.replay recorded.jsonl --gunicorn 4 --concurrency 16 --revalidate
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+from werkzeug.datastructures import MultiDict
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_requests(path, include=None, exclude=None):
+    """读取请求描述，可按路径前缀筛选；上传文件的请求无法回放，直接跳过"""
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if entry.get('files'):
+                continue
+            path_ = entry.get('path', '')
+            if include and not any(path_.startswith(p) for p in include):
+                continue
+            if exclude and any(path_.startswith(p) for p in exclude):
+                continue
+            entries.append(entry)
+    return entries
+
+
+def _request_key(entry):
+    return json.dumps([entry['method'], entry['path'], entry.get('args'), entry.get('form'), entry.get('json')],
+                      sort_keys=True, ensure_ascii=False)
+
+
+class WSGISender:
+    """经 Flask 测试客户端发送，每个线程一个客户端"""
+
+    def __init__(self):
+        os.environ.setdefault('LOG_LEVEL', 'WARNING')
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            from app import app
+        self.app = app
+        self._local = threading.local()
+
+    def send(self, entry, headers):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(
+            entry['path'], method=entry['method'],
+            query_string=MultiDict([tuple(p) for p in entry.get('args') or []]),
+            data=MultiDict([tuple(p) for p in entry['form']]) if entry.get('form') else None,
+            json=entry.get('json') if 'json' in entry else None,
+            headers=headers)
+        body = response.get_data()
+        return response.status_code, response.headers.get('ETag'), len(body)
+
+
+class HTTPSender:
+    """经 HTTP 发送到运行中的服务，每个线程一个连接池会话"""
+
+    def __init__(self, base_url, timeout=30):
+        import requests
+        self._requests = requests
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def send(self, entry, headers):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+            session.trust_env = False
+        response = session.request(
+            entry['method'], self.base_url + entry['path'],
+            params=[tuple(p) for p in entry.get('args') or []],
+            data=[tuple(p) for p in entry['form']] if entry.get('form') else None,
+            json=entry.get('json') if 'json' in entry else None,
+            headers=headers, timeout=self.timeout)
+        return response.status_code, response.headers.get('ETag'), len(response.content)
+
+
+@contextlib.contextmanager
+def local_gunicorn(workers, threads=1):
+    """启动临时的本地 gunicorn，返回其地址"""
+    executable = shutil.which('gunicorn')
+    if executable is None:
+        raise SystemExit("未找到 gunicorn，请先安装（pip install gunicorn）或使用 --target 指定已运行的服务")
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen(
+        [executable, '-w', str(workers), '--threads', str(threads), '-b', f'127.0.0.1:{port}',
+         '--preload', 'app:create_app()'],
+        cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            if process.poll() is not None:
+                raise SystemExit("gunicorn 启动失败")
+            with socket.socket() as s:
+                if s.connect_ex(('127.0.0.1', port)) == 0:
+                    break
+            time.sleep(0.2)
+        else:
+            raise SystemExit("等待 gunicorn 启动超时")
+        yield f'http://127.0.0.1:{port}'
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def replay(entries, sender, concurrency=4, total=None, duration=None, revalidate=False):
+    """
+    闭环回放：concurrency 个线程循环取下一条请求发送，直到发完 total 条或到达 duration 秒
+
+    返回:
+        (按接口分组的原始样本, 总耗时秒数)
+    """
+    if total is None and duration is None:
+        total = len(entries)
+    source = itertools.cycle(entries)
+    lock = threading.Lock()
+    counter = itertools.count()
+    etags = {}
+    samples = defaultdict(list)  # endpoint -> [(latency_ms, status, bytes)]
+    deadline = time.perf_counter() + duration if duration else None
+
+    def worker():
+        while True:
+            with lock:
+                index = next(counter)
+                entry = next(source)
+            if total is not None and index >= total:
+                return
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            headers = {'Accept-Encoding': 'gzip, br'}
+            key = _request_key(entry) if revalidate else None
+            if key is not None and key in etags:
+                headers['If-None-Match'] = etags[key]
+            start = time.perf_counter()
+            try:
+                status, etag, size = sender.send(entry, headers)
+            except Exception:
+                status, etag, size = 599, None, 0
+            latency = (time.perf_counter() - start) * 1000
+            if key is not None and etag:
+                etags[key] = etag
+            endpoint = entry.get('endpoint') or entry['path']
+            with lock:
+                samples[f"{entry['method']} {endpoint}"].append((latency, status, size))
+
+    # stdout 重定向是进程级的，只在主线程做一次
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    started = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    """汇总每个接口及全部请求的吞吐、延迟分位数、错误率"""
+    def _stats(rows):
+        latency = np.array([r[0] for r in rows])
+        status = np.array([r[1] for r in rows])
+        return {
+            'requests': len(rows),
+            'rps': round(len(rows) / elapsed, 2) if elapsed else 0.0,
+            'p50_ms': round(float(np.percentile(latency, 50)), 2),
+            'p95_ms': round(float(np.percentile(latency, 95)), 2),
+            'p99_ms': round(float(np.percentile(latency, 99)), 2),
+            'max_ms': round(float(latency.max()), 2),
+            'error_rate': round(float((status >= 500).mean()), 4),
+            'client_error_rate': round(float(((status >= 400) & (status < 500)).mean()), 4),
+            'not_modified_rate': round(float((status == 304).mean()), 4),
+            'avg_bytes': int(np.mean([r[2] for r in rows])),
+        }
+
+    endpoints = {name: _stats(rows) for name, rows in sorted(samples.items())}
+    all_rows = [r for rows in samples.values() for r in rows]
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'total': _stats(all_rows) if all_rows else {},
+        'endpoints': endpoints,
+    }
+
+
+def print_summary(summary):
+    header = f"{'接口':<48}{'请求数':>8}{'RPS':>9}{'P50':>9}{'P95':>9}{'P99':>9}{'错误率':>8}{'304率':>8}"
+    print(header)
+    print('-' * 110)
+    rows = list(summary['endpoints'].items()) + [('总计', summary['total'])]
+    for name, s in rows:
+        if not s:
+            continue
+        print(f"{name[:48]:<48}{s['requests']:>8}{s['rps']:>9.1f}{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}"
+              f"{s['p99_ms']:>9.1f}{s['error_rate'] * 100:>7.2f}%{s['not_modified_rate'] * 100:>7.1f}%")
+    print(f"\n耗时 {summary['elapsed_s']}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='回放录制的请求进行压测')
+    parser.add_argument('log', help='请求记录文件（JSON Lines）')
+    parser.add_argument('--target', default='wsgi', help="'wsgi' 或服务地址，如 http://127.0.0.1:8000")
+    parser.add_argument('--gunicorn', type=int, metavar='WORKERS', help='临时启动指定worker数的本地gunicorn')
+    parser.add_argument('--gunicorn-threads', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, help='总请求数（默认回放一遍日志）')
+    parser.add_argument('--duration', type=float, help='持续时间（秒），与 --requests 同时给出时先到为止')
+    parser.add_argument('--include', help='只回放这些路径前缀，逗号分隔')
+    parser.add_argument('--exclude', help='跳过这些路径前缀，逗号分隔')
+    parser.add_argument('--revalidate', action='store_true', help='记住ETag并带 If-None-Match 重发，用于验证缓存')
+    parser.add_argument('--json', dest='json_path', help='汇总结果写入JSON文件')
+    args = parser.parse_args()
+
+    entries = load_requests(
+        args.log,
+        include=args.include.split(',') if args.include else None,
+        exclude=args.exclude.split(',') if args.exclude else None)
+    if not entries:
+        print("没有可回放的请求")
+        return
+
+    with contextlib.ExitStack() as stack:
+        if args.gunicorn:
+            target = stack.enter_context(local_gunicorn(args.gunicorn, args.gunicorn_threads))
+        else:
+            target = args.target
+        sender = WSGISender() if target == 'wsgi' else HTTPSender(target)
+        print(f"回放 {len(entries)} 条请求描述 -> {target}，并发 {args.concurrency}", file=sys.stderr)
+        samples, elapsed = replay(entries, sender, args.concurrency, args.requests, args.duration, args.revalidate)
+
+    summary = summarize(samples, elapsed)
+    summary.update({'target': target, 'concurrency': args.concurrency, 'log': args.log})
+    print_summary(summary)
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.json_path}")
+
+
+if __name__ == '__main__':
+    main()
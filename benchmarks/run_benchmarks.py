@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+性能基准测试
+
+在合成数据库上通过 Flask 测试客户端和 Database API 计时核心路径，输出 P50/P95，
+并可写出 JSON 供不同提交之间对比。
+
+用法:
+    python -m benchmarks.run_benchmarks                      # 默认规模，临时目录生成数据库
+    python -m benchmarks.run_benchmarks --etfs 3000 --days 250 --repeat 30
+    python -m benchmarks.run_benchmarks --json bench.json    # 保存结果
+    python -m benchmarks.run_benchmarks --compare bench.json # 与之前的结果对比
+    python -m benchmarks.run_benchmarks --only search_code,recommendations
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.synthetic_data import SyntheticConfig, build_database, configure_paths
+
+# 导入类基准会重写表，放在最后执行
+IMPORT_CASES = ('import_etf_info', 'import_etf_price', 'import_etf_attention', 'import_etf_holders')
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def _measure(func, repeat, warmup=1):
+    """执行 warmup 次预热后计时 repeat 次，返回毫秒统计"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(warmup):
+            func()
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - start) * 1000)
+    values = np.array(samples)
+    return {
+        'n': repeat,
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p95_ms': round(float(np.percentile(values, 95)), 3),
+        'mean_ms': round(float(values.mean()), 3),
+        'min_ms': round(float(values.min()), 3),
+        'max_ms': round(float(values.max()), 3),
+    }
+
+
+def _check(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.path} 返回 {response.status_code}")
+    return response
+
+
+def build_cases(config):
+    """构造基准用例，返回 [(名称, 可调用对象)]，数据库路径须已配置"""
+    from unittest import mock
+
+    from app import app
+    from database.models import Database
+    from benchmarks.synthetic_data import generate_frames
+
+    frames = generate_frames(config)
+    latest = frames['dates'][-1]
+    client = app.test_client()
+    db = Database()
+
+    etf_info = frames['etf_info']
+    sample_code = etf_info['证券代码'].iloc[len(etf_info) // 2]
+    # 跟踪产品最多的指数和产品最多的公司，代表最重的搜索
+    sample_index = etf_info['跟踪指数名称'].value_counts().index[0]
+    sample_company = frames['companies'].set_index('fund_manager').loc[
+        etf_info['基金管理人'].value_counts().index[0], 'short']
+    batch_codes = etf_info['证券代码'].head(50).tolist()
+
+    # 推广统计的数据源是飞书接口，这里用合成库中的推广记录代替
+    poster_data = frames['promo'].assign(expiry_date='').to_dict('records')
+
+    def promotion_stats():
+        with mock.patch('blueprints.feishu_routes.get_feishu_poster_data', return_value=poster_data):
+            db.get_promotion_effect_stats()
+
+    price, attention, holders = frames['price'], frames['attention'], frames['holders']
+    latest_price = price[price['date'] == latest]
+    latest_attention = attention[attention['date'] == latest]
+    latest_holders = holders[holders['date'] == latest]
+
+    return [
+        ('search_code', lambda: _check(client.post('/search', data={'code': sample_code}))),
+        ('search_index', lambda: _check(client.post('/search', data={'code': sample_index}))),
+        ('search_company', lambda: _check(client.post('/search', data={'code': sample_company}))),
+        ('api_search', lambda: _check(client.get('/api/search', query_string={'query': sample_code}))),
+        ('recommendations', lambda: _check(client.get('/recommendations'))),
+        ('batch_info', lambda: _check(client.post('/api/etf/batch_info', json={'codes': batch_codes}))),
+        ('update_company_analytics_data', db.update_company_analytics_data),
+        ('promotion_effect_stats', promotion_stats),
+        ('import_etf_info', lambda: db.save_etf_info(etf_info.copy())),
+        ('import_etf_price', lambda: db.save_etf_price(latest_price.copy())),
+        ('import_etf_attention', lambda: db.save_etf_attention(latest_attention.copy())),
+        ('import_etf_holders', lambda: db.save_etf_holders(latest_holders.copy())),
+    ]
+
+
+def print_results(results, baseline=None):
+    header = f"{'用例':<32}{'P50(ms)':>12}{'P95(ms)':>12}{'均值(ms)':>12}"
+    if baseline:
+        header += f"{'P50对比':>12}"
+    print(header)
+    print('-' * 80)
+    for name, stats in results.items():
+        line = f"{name:<32}{stats['p50_ms']:>12.2f}{stats['p95_ms']:>12.2f}{stats['mean_ms']:>12.2f}"
+        old = (baseline or {}).get(name)
+        if old and old.get('p50_ms'):
+            change = (stats['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100
+            line += f"{change:>+11.1f}%"
+        print(line)
+
+
+def main():
+    defaults = SyntheticConfig()
+    parser = argparse.ArgumentParser(description='ETF系统性能基准测试')
+    parser.add_argument('--db', help='使用已有的合成数据库（不重新生成）')
+    parser.add_argument('--etfs', type=int, default=defaults.etfs)
+    parser.add_argument('--companies', type=int, default=defaults.companies)
+    parser.add_argument('--indices', type=int, default=defaults.indices)
+    parser.add_argument('--days', type=int, default=defaults.days)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--repeat', type=int, default=20, help='每个用例的计时次数')
+    parser.add_argument('--only', help='只运行指定用例，逗号分隔')
+    parser.add_argument('--json', dest='json_path', help='结果写入JSON文件')
+    parser.add_argument('--compare', help='与之前保存的JSON结果对比')
+    args = parser.parse_args()
+
+    config = SyntheticConfig(args.etfs, args.companies, args.indices, args.days, args.seed)
+    workdir = None
+    if args.db:
+        db_path = configure_paths(args.db)
+        build_info = None
+    else:
+        workdir = tempfile.mkdtemp(prefix='etf_bench_')
+        db_path = os.path.join(workdir, 'etf_data.db')
+        print(f"生成合成数据库: {db_path}")
+        build_info = build_database(db_path, config)
+        print('  ' + ', '.join(f"{k}={v:.2f}s" for k, v in build_info['timings'].items()))
+
+    # 基准测试不需要逐请求的DEBUG日志
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    cases = build_cases(config)
+    only = set(args.only.split(',')) if args.only else None
+
+    results = {}
+    for name, func in cases:
+        if only and name not in only:
+            continue
+        repeat = max(3, args.repeat // 4) if name in IMPORT_CASES else args.repeat
+        results[name] = _measure(func, repeat)
+        print(f"  {name}: P50 {results[name]['p50_ms']:.2f}ms", file=sys.stderr)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f).get('results')
+
+    print()
+    print_results(results, baseline)
+
+    if args.json_path:
+        payload = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'config': asdict(config),
+            'database': db_path,
+            'build': build_info,
+            'results': results,
+        }
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json_path}")
+
+    if workdir:
+        print(f"合成数据库保留在 {workdir}，可用 --db 复用")
+
+
+if __name__ == '__main__':
+    main()
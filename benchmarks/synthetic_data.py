@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+合成数据生成器
+
+按给定规模（ETF数、基金公司数、指数数、历史交易日数）生成一个完整的SQLite数据库，
+用于基准测试和本地调试。相同的参数和随机种子总是生成相同的数据。
+
+数据分布:
+- 基金公司的产品数、指数的跟踪产品数服从长尾（Zipf）分布，少数头部公司/宽基指数占大头
+- 基金规模、成交额、自选人数、持有人数服从对数正态分布
+- 价格由指数公共因子加个券噪声的随机游走生成，同一指数下的ETF走势高度相关
+- 约三成产品为商务品，约5%的产品有飞书推广记录
+
+用法:
+    python -m benchmarks.synthetic_data --out /tmp/etf_bench.db --etfs 1000 --days 120
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+from dataclasses import dataclass, asdict
+
+import numpy as np
+import pandas as pd
+
+COMPANY_CHARS = list('华南易博嘉广富国汇添招鹏银工建景顺天弘万家融通申泰平安兴中信海东方红财长城永赢大成前')
+INDEX_THEMES = [
+    '沪深300', '中证500', '中证1000', '创业板', '科创50', '半导体', '医药', '消费', '新能源', '证券',
+    '银行', '军工', '红利', '黄金', '恒生科技', '纳斯达克', '光伏', '芯片', '传媒', '农业',
+    '有色', '煤炭', '地产', '通信', '人工智能', '机器人', '汽车', '化工', '钢铁', '稀土',
+]
+PROMO_CHANNELS = ['APP首页', '理财频道', '社区', '短信', '推送']
+
+
+@dataclass
+class SyntheticConfig:
+    etfs: int = 1000
+    companies: int = 60
+    indices: int = 300
+    days: int = 120
+    seed: int = 20250606
+    end_date: str = '2025-06-06'
+
+
+def configure_paths(db_path):
+    """
+    让项目代码指向合成数据库，必须在导入 database.models 之前调用
+
+    时间序列存储放在数据库同目录的 timeseries 子目录下。
+    """
+    db_path = os.path.abspath(db_path)
+    os.environ['ETF_DATABASE_PATH'] = db_path
+    os.environ['ETF_TIMESERIES_DIR'] = os.path.join(os.path.dirname(db_path), 'timeseries')
+    models = sys.modules.get('database.models')
+    if models is not None and os.path.abspath(models.DATABASE_PATH) != db_path:
+        raise RuntimeError(f"database.models 已指向 {models.DATABASE_PATH}，请在导入项目模块前调用 configure_paths")
+    return db_path
+
+
+def _zipf_weights(n, s, rng):
+    weights = 1.0 / np.arange(1, n + 1) ** s
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def _company_names(n, rng):
+    names = set()
+    while len(names) < n:
+        a, b = rng.choice(COMPANY_CHARS, 2, replace=False)
+        names.add(a + b)
+    return sorted(names)
+
+
+def generate_frames(config):
+    """生成所有源数据表，返回 {名称: DataFrame}"""
+    rng = np.random.default_rng(config.seed)
+    dates = pd.bdate_range(end=config.end_date, periods=config.days).strftime('%Y-%m-%d').tolist()
+
+    # 基金公司
+    shorts = _company_names(config.companies, rng)
+    companies = pd.DataFrame({
+        'short': shorts,
+        'fund_manager': [f'{s}基金管理有限公司' for s in shorts],
+    })
+
+    # 指数
+    index_codes = [f'{930000 + i:06d}.CSI' for i in range(config.indices)]
+    index_names = [
+        INDEX_THEMES[i] if i < len(INDEX_THEMES) else f'中证{INDEX_THEMES[i % len(INDEX_THEMES)]}{i // len(INDEX_THEMES)}'
+        for i in range(config.indices)
+    ]
+    market_index = pd.DataFrame({
+        'index_code': index_codes,
+        'index_name': index_names,
+        'index_intro': [f'{name}指数反映相关证券的整体表现' for name in index_names],
+        'publisher': '中证指数有限公司',
+        'components_count': rng.integers(30, 1000, config.indices),
+        'weight_method': '自由流通市值加权',
+        'base_date': '2004-12-31',
+        'base_point': 1000.0,
+        'currency': '人民币',
+    })
+
+    # ETF
+    n = config.etfs
+    codes = [f'{510000 + i:06d}' if i % 2 == 0 else f'{159000 + i:06d}' for i in range(n)]
+    company_idx = rng.choice(config.companies, n, p=_zipf_weights(config.companies, 1.1, rng))
+    index_idx = rng.choice(config.indices, n, p=_zipf_weights(config.indices, 0.9, rng))
+    fund_size = np.round(rng.lognormal(1.5, 1.4, n), 4)  # 亿元
+    fee = rng.choice([0.15, 0.2, 0.5], n, p=[0.45, 0.15, 0.4])
+    etf_info = pd.DataFrame({
+        '证券代码': codes,
+        '证券简称': [f'{shorts[c]}{index_names[i]}ETF' for c, i in zip(company_idx, index_idx)],
+        '基金管理人': companies['fund_manager'].to_numpy()[company_idx],
+        '基金规模(亿元)': fund_size,
+        '跟踪指数代码': np.array(index_codes)[index_idx],
+        '跟踪指数名称': np.array(index_names)[index_idx],
+        '管理费率': fee,
+        '托管费率': np.where(fee > 0.3, 0.1, 0.05),
+        '年化跟踪误差': np.round(rng.gamma(2.0, 0.3, n), 4),
+        '基金份额持有人户数': rng.lognormal(9, 1.5, n).astype(int),
+        '日均成交额': np.round(fund_size * rng.lognormal(-3, 1, n) * 1e4, 2),  # 万元
+        '成交额': np.round(fund_size * rng.lognormal(-3, 1, n) * 1e4, 2),
+        '换手率': np.round(rng.lognormal(0.5, 1, n), 4),
+        '基金上市地点': ['上海证券交易所' if c.startswith('5') else '深圳证券交易所' for c in codes],
+        'date': dates[-1],
+    })
+
+    # 价格：指数公共因子 + 个券噪声
+    index_returns = rng.normal(0.0003, 0.013, (config.days, config.indices))
+    returns = index_returns[:, index_idx] + rng.normal(0, 0.002, (config.days, n))
+    close = rng.lognormal(0.3, 0.6, n) * np.cumprod(1 + returns, axis=0)
+    amount = fund_size * 1e8 * rng.lognormal(-3.5, 0.8, (config.days, n))
+    turnover = amount / (fund_size * 1e8) * 100
+
+    # 自选与持有：以对数正态为基数的缓慢漂移
+    attention_base = rng.lognormal(7, 1.6, n) * np.sqrt(fund_size)
+    attention = attention_base * np.cumprod(1 + rng.normal(0.002, 0.01, (config.days, n)), axis=0)
+    holder_base = rng.lognormal(6, 1.5, n) * np.sqrt(fund_size)
+    holders = holder_base * np.cumprod(1 + rng.normal(0.001, 0.006, (config.days, n)), axis=0)
+    per_holder = rng.lognormal(9, 0.8, n)
+    holding_amount = holders * per_holder
+
+    day_idx = np.repeat(np.arange(config.days), n)
+    etf_idx = np.tile(np.arange(n), config.days)
+    code_col = np.array(codes)[etf_idx]
+    date_col = np.array(dates)[day_idx]
+
+    price = pd.DataFrame({
+        'code': code_col,
+        'date': date_col,
+        'change_rate': np.round(returns.ravel() * 100, 4),
+        'turnover_rate': np.round(turnover.ravel(), 4),
+        'amount': np.round(amount.ravel(), 2),
+        'close_price': np.round(close.ravel(), 4),
+        'open_price': np.round((close / (1 + returns)).ravel(), 4),
+        'high_price': np.round((close * (1 + np.abs(returns) / 2)).ravel(), 4),
+        'low_price': np.round((close * (1 - np.abs(returns) / 2)).ravel(), 4),
+    })
+    attention_df = pd.DataFrame({
+        'code': code_col,
+        'attention_count': np.maximum(attention.ravel(), 0).astype(int),
+        'date': date_col,
+    })
+    holders_df = pd.DataFrame({
+        'code': code_col,
+        'holder_count': np.maximum(holders.ravel(), 0).astype(int),
+        'holding_amount': np.round(holding_amount.ravel(), 2),
+        'holding_value': np.round((holding_amount * close).ravel(), 2),
+        'date': date_col,
+    })
+
+    # 商务品：约三成，偏向中小公司
+    company_rank = pd.Series(company_idx).map(pd.Series(company_idx).value_counts()).to_numpy()
+    business_p = np.clip(0.45 - 0.25 * company_rank / company_rank.max(), 0.05, 0.6)
+    is_business = rng.random(n) < business_p
+    business = pd.DataFrame({
+        '证券代码': np.array(codes)[is_business],
+        '产品名称': etf_info['证券简称'].to_numpy()[is_business],
+        '基金公司简称': np.array(shorts)[company_idx[is_business]],
+        '开始日期': dates[0],
+        '结束日期': '2026-12-31',
+        '管理费率': fee[is_business],
+        '托管费率': etf_info['托管费率'].to_numpy()[is_business],
+        '规模': fund_size[is_business],
+    })
+
+    # 飞书推广记录
+    promo_count = max(1, n // 20)
+    promo_etfs = rng.choice(n, promo_count, replace=False)
+    starts = rng.integers(1, max(2, config.days - 10), promo_count)
+    lengths = rng.integers(3, 15, promo_count)
+    promo = pd.DataFrame({
+        'code': np.array(codes)[promo_etfs],
+        'name': etf_info['证券简称'].to_numpy()[promo_etfs],
+        'publish_date': np.array(dates)[starts],
+        'offline_date': [dates[min(s + l, config.days - 1)] if l < 12 else '' for s, l in zip(starts, lengths)],
+        'publish_channel': rng.choice(PROMO_CHANNELS, promo_count),
+        'remarks': [f'主题推广{i}' for i in range(promo_count)],
+        'banner_url': '',
+        'long_image_url': '',
+    })
+
+    return {
+        'dates': dates,
+        'companies': companies,
+        'market_index': market_index,
+        'etf_info': etf_info,
+        'price': price,
+        'attention': attention_df,
+        'holders': holders_df,
+        'business': business,
+        'promo': promo,
+    }
+
+
+def _append_history(conn, table, frame, columns):
+    placeholders = ', '.join('?' for _ in columns)
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+        frame[columns].itertuples(index=False, name=None))
+
+
+def build_database(db_path, config=None, quiet=True):
+    """
+    生成合成数据库，已存在的同名文件会被覆盖
+
+    最新一天的数据通过 Database.save_* 写入（与导入流程相同的表结构），
+    之前的历史直接批量写入历史表，最后重建所有派生表和时间序列存储。
+
+    返回:
+        dict，各阶段耗时（秒）及数据规模
+    """
+    config = config or SyntheticConfig()
+    db_path = configure_paths(db_path)
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    from database.models import Database
+    from database.timeseries_store import get_store
+
+    timings = {}
+    start = time.perf_counter()
+    frames = generate_frames(config)
+    timings['generate'] = time.perf_counter() - start
+    latest = frames['dates'][-1]
+
+    output = io.StringIO() if quiet else sys.stdout
+    with contextlib.redirect_stdout(output):
+        db = Database()
+        conn = db.connect()
+
+        start = time.perf_counter()
+        frames['market_index'].to_sql('market_index', conn, if_exists='replace', index=False)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS feishu_promo_data (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                code TEXT,
+                name TEXT,
+                publish_date TEXT,
+                offline_date TEXT,
+                publish_channel TEXT,
+                remarks TEXT,
+                banner_url TEXT,
+                long_image_url TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        frames['promo'].to_sql('feishu_promo_data', conn, if_exists='append', index=False)
+        conn.commit()
+
+        db.save_etf_info(frames['etf_info'].copy())
+        db.save_business_etf(frames['business'].copy())
+        price, attention, holders = frames['price'], frames['attention'], frames['holders']
+        db.save_etf_price(price[price['date'] == latest].copy())
+        db.save_etf_attention(attention[attention['date'] == latest].copy())
+        db.save_etf_holders(holders[holders['date'] == latest].copy())
+        timings['save_latest'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _append_history(conn, 'etf_price_history', price[price['date'] < latest],
+                        ['code', 'date', 'change_rate', 'turnover_rate', 'amount',
+                         'close_price', 'open_price', 'high_price', 'low_price'])
+        _append_history(conn, 'etf_attention_history', attention[attention['date'] < latest],
+                        ['code', 'attention_count', 'date'])
+        _append_history(conn, 'etf_holders_history', holders[holders['date'] < latest],
+                        ['code', 'holder_count', 'holding_amount', 'holding_value', 'date'])
+        conn.commit()
+        timings['history'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        db.refresh_company_daily_metrics(full=True)
+        db.update_company_analytics_data()
+        db.update_company_analytics_history(full=True)
+        get_store().rebuild_from_db(conn)
+        timings['derived'] = time.perf_counter() - start
+        db.close()
+
+    return {
+        'path': db_path,
+        'config': asdict(config),
+        'rows': {name: len(frames[name]) for name in ('etf_info', 'price', 'attention', 'holders', 'business', 'promo')},
+        'timings': timings,
+    }
+
+
+def main():
+    defaults = SyntheticConfig()
+    parser = argparse.ArgumentParser(description='生成合成ETF数据库')
+    parser.add_argument('--out', required=True, help='输出数据库路径（会覆盖已有文件）')
+    parser.add_argument('--etfs', type=int, default=defaults.etfs)
+    parser.add_argument('--companies', type=int, default=defaults.companies)
+    parser.add_argument('--indices', type=int, default=defaults.indices)
+    parser.add_argument('--days', type=int, default=defaults.days)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--end-date', default=defaults.end_date)
+    parser.add_argument('--verbose', action='store_true', help='显示导入过程的输出')
+    args = parser.parse_args()
+
+    config = SyntheticConfig(args.etfs, args.companies, args.indices, args.days, args.seed, args.end_date)
+    result = build_database(args.out, config, quiet=not args.verbose)
+    print(f"已生成 {result['path']}")
+    for name, count in result['rows'].items():
+        print(f"  {name}: {count} 行")
+    for name, seconds in result['timings'].items():
+        print(f"  {name}: {seconds:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,7 @@
 from flask import Blueprint, jsonify
-import matplotlib
-matplotlib.use('Agg')  # 非交互式后端
-import matplotlib.pyplot as plt
 import io
 import base64
 import pandas as pd
-from docx import Document
 import os
 import logging # 添加导入
 import numpy as np # 需要导入 numpy 来检查 np.isnan
@@ -16,16 +12,23 @@ logger = logging.getLogger(__name__) # 添加 logger 初始化
 # 创建蓝图
 analysis_bp = Blueprint('analysis', __name__)
 
-# 从数据蓝图导入全局变量
-from blueprints.data_routes import etf_data, business_etfs, current_date_str
+# 数据蓝图的全局变量会被重新加载（如快照重载）替换，须在请求时通过模块读取
+from blueprints import data_routes
+from services.response_service import cached_json
 
 @analysis_bp.route('/overview')
 def overview():
     """ETF市场概览"""
+    etf_data, business_etfs = data_routes.etf_data, data_routes.business_etfs
     if etf_data is None:
         return jsonify({"error": "数据未加载，请先加载数据"})
     
     try:
+        # matplotlib 导入较慢，只在生成图表时导入
+        import matplotlib
+        matplotlib.use('Agg')  # 非交互式后端
+        import matplotlib.pyplot as plt
+
         # 生成饼图 - 按基金管理人分布
         plt.figure(figsize=(10, 6))
 
@@ -113,6 +116,7 @@ def overview():
 @analysis_bp.route('/business_analysis')
 def business_analysis():
     """商务品分析"""
+    etf_data, business_etfs = data_routes.etf_data, data_routes.business_etfs
     if etf_data is None:
         return jsonify({"error": "数据未加载，请先加载数据"})
     
@@ -180,10 +184,13 @@ def business_analysis():
 @analysis_bp.route('/generate_report')
 def generate_report():
     """生成报告"""
+    etf_data, business_etfs, current_date_str = data_routes.etf_data, data_routes.business_etfs, data_routes.current_date_str
     if etf_data is None:
         return jsonify({"error": "数据未加载，请先加载数据"})
     
     try:
+        from docx import Document
+
         # 创建一个简单的Word文档
         doc = Document()
         
@@ -202,19 +209,10 @@ def generate_report():
         business_by_company = business_df.groupby('基金管理人').size().sort_values(ascending=False)
         
         # 添加表格
-        table = doc.add_table(rows=1, cols=2)
-        table.style = 'Table Grid'
-        
-        # 添加表头
-        header_cells = table.rows[0].cells
-        header_cells[0].text = '基金管理人'
-        header_cells[1].text = '商务品数量'
-        
-        # 添加数据行
-        for company, count in business_by_company.items():
-            row_cells = table.add_row().cells
-            row_cells[0].text = company
-            row_cells[1].text = str(count)
+        from utils.docx_table import add_dataframe_table
+        add_dataframe_table(doc, business_by_company.rename('商务品数量').reset_index(),
+                            [('基金管理人', '基金管理人', None), ('商务品数量', '商务品数量', None)],
+                            style='Table Grid', bold_header=False)
         
         # 保存文档
         from flask import current_app
@@ -232,7 +230,39 @@ def generate_report():
         traceback.print_exc()
         return jsonify({"error": f"生成报告出错：{str(e)}"})
 
+@analysis_bp.route('/generate_best_etf')
+def generate_best_etf():
+    """生成优选ETF工作簿（同一数据版本只生成一次）"""
+    try:
+        from flask import current_app
+        from services.best_etf_service import DEFAULT_OUTPUT, build_workbook
+
+        build_workbook(os.path.join(current_app.config['UPLOAD_FOLDER'], DEFAULT_OUTPUT))
+        return jsonify({
+            "success": True,
+            "message": "优选ETF工作簿生成成功",
+            "report_url": f"/download_report/{DEFAULT_OUTPUT}"
+        })
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": f"生成优选ETF工作簿出错：{str(e)}"})
+
+@analysis_bp.route('/api/index_grading')
+@cached_json()
+def index_grading():
+    """跟踪指数分级（一级到九级）结果"""
+    try:
+        from services.best_etf_service import get_grading
+
+        result, _ = get_grading()
+        return jsonify(result.astype(object).where(result.notna(), None).to_dict(orient='records'))
+    except Exception as e:
+        logger.error(f"跟踪指数分级出错: {str(e)}")
+        return jsonify({"error": f"跟踪指数分级出错：{str(e)}"}), 500
+
 @analysis_bp.route('/api/business_data')
+@cached_json()
 def api_business_data():
     """提供商务品分析散点图所需的数据。
 
@@ -1,6 +1,5 @@
 from flask import Blueprint, jsonify, request, send_file, current_app
 import os
-from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
 import pandas as pd
 import glob
@@ -8,6 +7,11 @@ import glob
 # 导入数据加载函数
 from services.data_service import load_latest_data
 from database.models import Database # 确保导入Database
+from services.history_service import parse_history_args, shape_history, filter_records
+from services.response_service import cached_json
+from services.period_service import get_period_comparison, weekly_dates
+from services import ingest_service
+from database.period_merge import to_wide
 
 # 创建蓝图
 data_bp = Blueprint('data', __name__)
@@ -44,7 +48,7 @@ def load_data_route():
 
 @data_bp.route('/upload_data', methods=['GET', 'POST'])
 def upload_data():
-    """上传数据文件"""
+    """上传数据文件，保存后提交后台增量导入任务"""
     if request.method == 'POST':
         # 检查是否有文件
         if 'file' not in request.files:
@@ -57,22 +61,40 @@ def upload_data():
             return jsonify({"error": "未选择文件"})
         
         if file:
-            # 安全地获取文件名
-            filename = secure_filename(file.filename)
-            
-            # 保存文件
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+            # 按任务分目录保存（secure_filename 会去掉中文，不同文件可能同名）
+            job_id = ingest_service.new_job_id()
+            file_path = ingest_service.upload_path(current_app.config['UPLOAD_FOLDER'], job_id, file.filename)
             file.save(file_path)
             
+            # 按原始文件名/表头识别数据类型并提交导入
+            job = ingest_service.submit(file_path, filename=os.path.basename(file.filename), job_id=job_id)
+            
             return jsonify({
                 "success": True,
-                "message": f"文件 {filename} 上传成功",
-                "file_path": file_path
+                "message": f"文件 {file.filename} 上传成功" + ("，已提交导入" if job.sources else f"，{job.error}"),
+                "file_path": file_path,
+                "job_id": job.id,
+                "job_url": f"/api/ingest_jobs/{job.id}",
+                "sources": job.sources
             })
     
     from flask import render_template
     return render_template('upload.html')
 
+@data_bp.route('/api/ingest_jobs')
+def ingest_jobs():
+    """最近的上传导入任务"""
+    limit = request.args.get('limit', default=20, type=int)
+    return jsonify([job.to_dict() for job in ingest_service.list_jobs(limit)])
+
+@data_bp.route('/api/ingest_jobs/<job_id>')
+def ingest_job(job_id):
+    """上传导入任务状态"""
+    job = ingest_service.get_job(job_id)
+    if job is None:
+        return jsonify({"error": f"任务不存在: {job_id}"}), 404
+    return jsonify(job.to_dict())
+
 @data_bp.route('/download_report/<filename>')
 def download_report(filename):
     """下载报告"""
@@ -80,38 +102,67 @@ def download_report(filename):
 
 @data_bp.route('/fund_company_attention_history', methods=['GET'])
 def fund_company_attention_history():
-    """获取基金公司自选历史数据"""
+    """获取基金公司自选历史数据，支持 start/end/max_points/rollup/format 参数"""
     company_name = request.args.get('name')
     if not company_name:
         return jsonify({"error": "缺少基金公司名称参数 (name)"}), 400
     
     try:
+        options = parse_history_args(request.args)
         db = Database()
-        # 注意：get_fund_company_attention_history 方法需要在Database模型中实现
-        data = db.get_fund_company_attention_history(company_name)
+        data = db.get_fund_company_attention_history(company_name, start=options['start'], end=options['end'])
         current_app.logger.info(f"基金公司自选历史查询: 公司={company_name}, 记录数={len(data)}")
-        for record in data[:5]: # 打印前5条记录用于调试
-            current_app.logger.debug(f"处理基金公司自选历史记录: {record}")
-        return jsonify(data)
+        if options['format'] == 'records':
+            return jsonify(filter_records(data, options['start'], options['end']))
+        return jsonify(shape_history(data, ['attention_count'], options['start'], options['end'],
+                                     options['max_points'], options['rollup']))
     except Exception as e:
         current_app.logger.error(f"查询基金公司 {company_name} 自选历史数据失败: {str(e)}")
         return jsonify({"error": f"查询基金公司自选历史数据失败: {str(e)}"}), 500
 
 @data_bp.route('/fund_company_holders_history', methods=['GET'])
 def fund_company_holders_history():
-    """获取基金公司持有人和持仓价值历史数据"""
+    """获取基金公司持有人和持仓价值历史数据，支持 start/end/max_points/rollup/format 参数"""
     company_name = request.args.get('name')
     if not company_name:
         return jsonify({"error": "缺少基金公司名称参数 (name)"}), 400
     
     try:
+        options = parse_history_args(request.args)
         db = Database()
-        # 注意：get_fund_company_holders_history 方法需要在Database模型中实现
-        data = db.get_fund_company_holders_history(company_name)
+        data = db.get_fund_company_holders_history(company_name, start=options['start'], end=options['end'])
         current_app.logger.info(f"基金公司持有人历史查询: 公司={company_name}, 记录数={len(data)}")
-        for record in data[:5]: # 打印前5条记录用于调试
-            current_app.logger.debug(f"处理基金公司持有人历史记录: {record}")
-        return jsonify(data)
+        if options['format'] == 'records':
+            return jsonify(filter_records(data, options['start'], options['end']))
+        return jsonify(shape_history(data, ['holder_count', 'holding_value'], options['start'], options['end'],
+                                     options['max_points'], options['rollup']))
     except Exception as e:
         current_app.logger.error(f"查询基金公司 {company_name} 持有人历史数据失败: {str(e)}")
-        return jsonify({"error": f"查询基金公司持有人历史数据失败: {str(e)}"}), 500
\ No newline at end of file
+        return jsonify({"error": f"查询基金公司持有人历史数据失败: {str(e)}"}), 500
+
+@data_bp.route('/api/period_comparison', methods=['GET'])
+@cached_json()
+def period_comparison():
+    """
+    多周期ETF对比：dates 为逗号分隔的两个及以上日期（默认最新数据日期与一周前），
+    format=long（默认，每个 代码×周期 一行）或 wide（每只ETF一行，列名同原合并CSV），
+    codes 为逗号分隔的ETF代码，不传表示全部
+    """
+    dates = [d for d in request.args.get('dates', '').split(',') if d.strip()]
+    output = request.args.get('format', 'long')
+    codes = {c.strip() for c in request.args.get('codes', '').split(',') if c.strip()}
+    if output not in ('long', 'wide'):
+        return jsonify({"error": "format 参数只支持 long 或 wide"}), 400
+
+    try:
+        frame = get_period_comparison(dates or weekly_dates())
+        if codes:
+            frame = frame[frame['code'].isin(codes)]
+        if output == 'wide':
+            frame = to_wide(frame)
+        return jsonify(frame.astype(object).where(frame.notna(), None).to_dict(orient='records'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"周期对比查询失败: {str(e)}")
+        return jsonify({"error": f"周期对比查询失败: {str(e)}"}), 500
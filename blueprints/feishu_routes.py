@@ -1,10 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, send_file
 import json
 import logging
 from database.models import Database
+from database import dataset_versions
+from database.writer_lock import write_lock
+from services import feishu_image_service
+from services.response_service import cached_json, mark_error
 import pandas as pd
 from datetime import datetime, timedelta
-import requests
 
 # 创建蓝图
 feishu_bp = Blueprint('feishu', __name__)
@@ -20,6 +23,7 @@ FEISHU_BITABLE_TABLE_ID = "tblFJwYk8uIM9cBu"  # 多维表格 Table ID (从用户
 
 
 def get_tenant_token():
+    import requests  # 仅在调用飞书API时导入，缩短服务启动时间
     url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"
     payload = {"app_id": FEISHU_APP_ID, "app_secret": FEISHU_APP_SECRET}
     # 禁用任何代理设置，直接连接
@@ -36,6 +40,7 @@ def get_tenant_token():
 
 def get_feishu_poster_data():
     """从飞书多维表格获取海报库数据"""
+    import requests
     try:
         access_token = get_tenant_token()
         if not access_token:
@@ -88,12 +93,10 @@ def get_feishu_poster_data():
                 publish_channel_str = ", ".join(publish_channel_list) if isinstance(
                     publish_channel_list, list) else publish_channel_list
 
-                # 提取附件URL的辅助函数
+                # 提取附件URL的辅助函数：登记到本地图片缓存，返回代理地址（见 services/feishu_image_service.py）
                 def get_first_attachment_url(field_value):
                     if isinstance(field_value, list) and field_value:
-                        # 优先尝试 tmp_url，如果无效或不存在，则用 url
-                        # 实际应用中可能需要更复杂的逻辑来确认URL的有效性或进行下载代理
-                        return field_value[0].get('tmp_url') or field_value[0].get('url', '')
+                        return feishu_image_service.register(field_value[0])
                     return ''  # 如果不是列表或列表为空，返回空字符串
 
                 banner_url_to_use = get_first_attachment_url(
@@ -149,6 +152,86 @@ def get_feishu_poster_data():
         return None
 
 
+def sync_feishu_promo_data():
+    """
+    从飞书全量同步推广数据到 feishu_promo_data 表（原 app.py 启动时的同步逻辑）
+
+    返回:
+        成功写入的记录数，无法获取飞书数据时返回 None
+    """
+    print("正在同步飞书推广数据...")
+    poster_data = get_feishu_poster_data()
+    if not poster_data:
+        print("无法获取飞书推广数据，请检查网络连接或API配置")
+        return None
+
+    db = Database()
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+
+        # 确保表存在
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS feishu_promo_data (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                code TEXT NOT NULL,
+                name TEXT,
+                publish_date TEXT,
+                offline_date TEXT,
+                publish_channel TEXT,
+                remarks TEXT,
+                banner_url TEXT,
+                long_image_url TEXT,
+                expiry_date TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # 检查表结构，确保expiry_date字段存在
+        cursor.execute("PRAGMA table_info(feishu_promo_data)")
+        columns = [column[1] for column in cursor.fetchall()]
+        if 'expiry_date' not in columns:
+            print("正在更新表结构，添加expiry_date字段...")
+            cursor.execute("ALTER TABLE feishu_promo_data ADD COLUMN expiry_date TEXT")
+
+        rows = []
+        for poster in poster_data:
+            code = poster.get('code', '')
+            if not code:  # 跳过没有代码的记录
+                print("跳过一条没有证券代码的记录")
+                continue
+            rows.append((
+                code,
+                poster.get('name', ''),
+                poster.get('publish_date', ''),
+                poster.get('offline_date', ''),
+                poster.get('publish_channel', ''),
+                poster.get('remarks', ''),
+                poster.get('banner_url', ''),
+                poster.get('long_image_url', ''),
+                poster.get('expiry_date', '')
+            ))
+
+        # 清空后全量重建，放在同一事务中，读请求不会看到空表
+        cursor.execute("DELETE FROM feishu_promo_data")
+        cursor.executemany("""
+            INSERT INTO feishu_promo_data
+            (code, name, publish_date, offline_date, publish_channel, remarks,
+             banner_url, long_image_url, expiry_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
+        dataset_versions.refresh(conn, ['feishu_promo'])
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    print(f"成功同步 {len(rows)}/{len(poster_data)} 条飞书推广数据")
+    return len(rows)
+
+
 @feishu_bp.route('/api/template/feishu', methods=['GET'])
 def get_feishu_template():
     """获取飞书数据模板"""
@@ -300,7 +383,36 @@ def show_feishu_posters():
         return jsonify({"success": True, "data": [], "message": f"获取数据时发生错误: {str(e)}"})
 
 
+@feishu_bp.route('/api/feishu/images/<key>', methods=['GET'])
+def get_feishu_image(key):
+    """
+    飞书海报图片代理：?w=宽度 返回缩略图（WebP 或 JPEG，按 Accept 选择，可用 ?fmt= 指定），不带 w 返回原图
+
+    同一地址的内容不会变化（附件更换后 file_token 也会变化），响应可长期缓存。
+    """
+    if not feishu_image_service.valid_key(key):
+        return jsonify({"success": False, "message": "无效的图片标识"}), 404
+    width = request.args.get('w', type=int)
+    fmt = request.args.get('fmt')
+    if fmt is None:
+        fmt = 'webp' if 'image/webp' in request.accept_mimetypes.values() else 'jpeg'
+    try:
+        path, mimetype = feishu_image_service.resolve(key, width, fmt)
+    except LookupError:
+        return jsonify({"success": False, "message": "未登记的图片"}), 404
+    except Exception as e:
+        logger.error(f"获取飞书图片 {key} 失败: {e}")
+        return jsonify({"success": False, "message": "暂时无法获取图片"}), 502
+
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=True)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    if 'fmt' not in request.args:
+        response.vary.add('Accept')
+    return response
+
+
 @feishu_bp.route('/api/feishu/promotion-stats', methods=['GET'])
+@cached_json(daily=True)
 def get_promotion_stats():
     """获取推广效果统计数据"""
     try:
@@ -319,6 +431,8 @@ def get_promotion_stats():
         table_exists = cursor.fetchone() is not None
 
         stats_data = []
+        # 数据取自飞书接口时不可缓存
+        from_api = False
 
         if table_exists:
             # 如果表存在，尝试从数据库获取数据
@@ -478,6 +592,7 @@ def get_promotion_stats():
         if not stats_data:
             logger.info("数据库中没有推广数据，尝试使用API获取")
             stats_data = db.get_promotion_effect_stats(code)
+            from_api = True
             logger.info(f"从API获取到推广效果统计数据: {len(stats_data)} 条记录")
 
         # 记录一些数据示例以便调试
@@ -499,13 +614,17 @@ def get_promotion_stats():
             else:
                 logger.warning("API无法获取任何推广数据")
 
-        return jsonify({
+        response = jsonify({
             "success": True,
             "data": stats_data,
             "total": len(stats_data)
         })
+        if from_api:
+            response.headers['Cache-Control'] = 'no-store'
+        return response
     except Exception as e:
         logger.error(f"获取推广效果统计数据时出错: {str(e)}")
+        mark_error()
         import traceback
         traceback.print_exc()
         return jsonify({
@@ -536,75 +655,78 @@ def save_promo_data():
                 }), 400
             data = {"posters": poster_data}
 
-        # 创建数据库连接
-        db = Database()
-        conn = db.connect()
-        cursor = conn.cursor()
-
-        # 保存数据
-        if "posters" in data and isinstance(data["posters"], list):
-            posters = data["posters"]
-            saved_count = 0
+        # 持有写锁：数据导入在暂存库中构建期间，这里的写入不会被随后发布的新库覆盖
+        with write_lock.hold('feishu_save'):
+            # 创建数据库连接
+            db = Database()
+            conn = db.connect()
+            cursor = conn.cursor()
 
-            for poster in posters:
-                try:
-                    # 检查是否已经存在相同代码和推广时间的记录
-                    cursor.execute("""
-                        SELECT id FROM feishu_promo_data
-                        WHERE code = ? AND publish_date = ?
-                    """, (poster.get('code', ''), poster.get('publish_date', '')))
+            # 保存数据
+            if "posters" in data and isinstance(data["posters"], list):
+                posters = data["posters"]
+                saved_count = 0
 
-                    existing_record = cursor.fetchone()
-
-                    if existing_record:
-                        # 更新现有记录
-                        cursor.execute("""
-                            UPDATE feishu_promo_data
-                            SET name = ?, offline_date = ?, publish_channel = ?, remarks = ?,
-                                banner_url = ?, long_image_url = ?
-                            WHERE id = ?
-                        """, (
-                            poster.get('name', ''),
-                            poster.get('offline_date', ''),
-                            poster.get('publish_channel', ''),
-                            poster.get('remarks', ''),
-                            poster.get('banner_url', ''),
-                            poster.get('long_image_url', ''),
-                            existing_record[0]
-                        ))
-                    else:
-                        # 插入新记录
+                for poster in posters:
+                    try:
+                        # 检查是否已经存在相同代码和推广时间的记录
                         cursor.execute("""
-                            INSERT INTO feishu_promo_data
-                            (code, name, publish_date, offline_date, publish_channel, remarks, banner_url, long_image_url)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        """, (
-                            poster.get('code', ''),
-                            poster.get('name', ''),
-                            poster.get('publish_date', ''),
-                            poster.get('offline_date', ''),
-                            poster.get('publish_channel', ''),
-                            poster.get('remarks', ''),
-                            poster.get('banner_url', ''),
-                            poster.get('long_image_url', '')
-                        ))
-
-                    saved_count += 1
-                except Exception as e:
-                    logger.error(f"保存推广记录时出错: {str(e)}")
-
-            conn.commit()
+                            SELECT id FROM feishu_promo_data
+                            WHERE code = ? AND publish_date = ?
+                        """, (poster.get('code', ''), poster.get('publish_date', '')))
+
+                        existing_record = cursor.fetchone()
+
+                        if existing_record:
+                            # 更新现有记录
+                            cursor.execute("""
+                                UPDATE feishu_promo_data
+                                SET name = ?, offline_date = ?, publish_channel = ?, remarks = ?,
+                                    banner_url = ?, long_image_url = ?
+                                WHERE id = ?
+                            """, (
+                                poster.get('name', ''),
+                                poster.get('offline_date', ''),
+                                poster.get('publish_channel', ''),
+                                poster.get('remarks', ''),
+                                poster.get('banner_url', ''),
+                                poster.get('long_image_url', ''),
+                                existing_record[0]
+                            ))
+                        else:
+                            # 插入新记录
+                            cursor.execute("""
+                                INSERT INTO feishu_promo_data
+                                (code, name, publish_date, offline_date, publish_channel, remarks, banner_url, long_image_url)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                            """, (
+                                poster.get('code', ''),
+                                poster.get('name', ''),
+                                poster.get('publish_date', ''),
+                                poster.get('offline_date', ''),
+                                poster.get('publish_channel', ''),
+                                poster.get('remarks', ''),
+                                poster.get('banner_url', ''),
+                                poster.get('long_image_url', '')
+                            ))
+
+                        saved_count += 1
+                    except Exception as e:
+                        logger.error(f"保存推广记录时出错: {str(e)}")
+
+                conn.commit()
+                dataset_versions.refresh(conn, ['feishu_promo'])
 
-            return jsonify({
-                "success": True,
-                "message": f"成功保存 {saved_count}/{len(posters)} 条推广记录",
-                "saved_count": saved_count
-            })
-        else:
-            return jsonify({
-                "success": False,
-                "message": "数据格式错误，无法保存推广记录"
-            }), 400
+                return jsonify({
+                    "success": True,
+                    "message": f"成功保存 {saved_count}/{len(posters)} 条推广记录",
+                    "saved_count": saved_count
+                })
+            else:
+                return jsonify({
+                    "success": False,
+                    "message": "数据格式错误，无法保存推广记录"
+                }), 400
     except Exception as e:
         logger.error(f"保存推广数据时出错: {str(e)}")
         import traceback
@@ -616,6 +738,7 @@ def save_promo_data():
 
 
 @feishu_bp.route('/api/feishu/promotion-overview', methods=['GET'])
+@cached_json()
 def get_promotion_overview():
     """获取推广效果总览数据"""
     try:
@@ -814,10 +937,12 @@ def get_promotion_overview():
         
     except Exception as e:
         logger.error(f"获取推广效果总览数据时出错: {str(e)}")
+        mark_error()
         return jsonify({"success": False, "error": str(e)})
 
 
 @feishu_bp.route('/api/feishu/promotion-rankings', methods=['GET'])
+@cached_json()
 def get_promotion_rankings():
     """获取推广效果排行榜数据"""
     try:
@@ -980,6 +1105,7 @@ def get_promotion_rankings():
         
     except Exception as e:
         logger.error(f"获取推广效果排行榜时出错: {str(e)}")
+        mark_error()
         return jsonify({"success": False, "error": str(e)})
 
 
@@ -3,7 +3,13 @@ import pandas as pd
 import traceback
 from datetime import datetime
 from services.index_service import get_index_intro, get_index_info
-from database.models import Database
+from services.history_service import parse_history_args, shape_history, filter_records
+from services.response_service import cached_json, mark_error
+from services.keyword_index import get_keyword_checker
+from services.price_recommendation_service import get_price_recommendations
+from etf_price_recommendation import DEFAULT_HORIZON, DEFAULT_TOP_N, HORIZONS
+from database.models import Database, DATABASE_PATH
+from database import dataset_versions, instrumentation
 import re
 import json
 import traceback  # 确保导入traceback模块
@@ -11,11 +17,7 @@ import sqlite3
 import base64
 import io
 import sys  # 添加sys模块导入
-try:
-    from PIL import Image
-    import pytesseract
-except ImportError:
-    pass  # 避免导入错误，如果需要OCR功能，用户需安装这些依赖
+import importlib.util
 
 # 创建蓝图
 search_bp = Blueprint('search', __name__)
@@ -45,6 +47,7 @@ def get_current_date_format():
     return current_date_str
 
 @search_bp.route('/search', methods=['POST', 'GET'])
+@cached_json()
 def search():
     """搜索ETF"""
     try:
@@ -111,7 +114,7 @@ def search():
             code = keyword.split('.')[0] if '.' in keyword else keyword
             print(f"检查ETF代码是否存在: {keyword} -> {code}")
             
-            if db.check_etf_code_exists(code):
+            if get_keyword_checker().check_etf_code_exists(code):
                 print("搜索类型: ETF基金代码")
                 print(f"搜索ETF代码: {code}")
                 
@@ -322,6 +325,7 @@ def search():
     except Exception as e:
         print(f"搜索出错: {str(e)}")
         traceback.print_exc()
+        mark_error()
         response = jsonify({'error': f'搜索出错: {str(e)}'})
         return add_cors_headers(response)
 
@@ -370,23 +374,13 @@ def normalize_etf_results(results):
             'holding_value': round(holding_value, 2),  # 持仓价值（万元）
             'attention_count': attention_count,  # 使用历史表中的最新数据
             
-            # 变化相关字段 - 同时保留原字段名和前端期望的字段名
-            'attention_daily_change': result.get('attention_daily_change', 0),
-            'attention_five_day_change': result.get('attention_five_day_change', 0),
-            'attention_day_change': result.get('attention_daily_change', 0),  # 前端期望的字段名
-            'attention_5day_change': result.get('attention_five_day_change', 0),  # 前端期望的字段名
-            
-            'holder_daily_change': result.get('holder_daily_change', 0),
-            'holder_five_day_change': result.get('holder_five_day_change', 0),
-            'holders_day_change': result.get('holder_daily_change', 0),  # 前端期望的字段名
-            'holders_5day_change': result.get('holder_five_day_change', 0),  # 前端期望的字段名
-            
-            'holding_value_daily_change': round(holding_value_daily_change, 2),  # 持仓价值日变化（万元）
-            'holding_value_five_day_change': round(holding_value_five_day_change, 2),  # 持仓价值五日变化（万元）
-            
-            # 添加前端期望的持仓价值变化字段名
-            'holding_day_change': round(holding_value_daily_change, 2),  # 持仓价值日变化（万元）（前端期望的字段名）
-            'holding_5day_change': round(holding_value_five_day_change, 2),  # 持仓价值五日变化（万元）（前端期望的字段名）
+            # 变化相关字段 - 只输出前端使用的字段名，避免每个字段重复序列化两次
+            'attention_day_change': result.get('attention_daily_change', 0),
+            'attention_5day_change': result.get('attention_five_day_change', 0),
+            'holders_day_change': result.get('holder_daily_change', 0),
+            'holders_5day_change': result.get('holder_five_day_change', 0),
+            'holding_day_change': round(holding_value_daily_change, 2),  # 持仓价值日变化（万元）
+            'holding_5day_change': round(holding_value_five_day_change, 2),  # 持仓价值五日变化（万元）
         }
         
         normalized_results.append(etf_data)
@@ -404,12 +398,12 @@ def normalize_etf_results(results):
             print(f"管理人: {first_result['manager']}")
             print(f"管理人简称: {first_result['manager_short']}")
             
-            print(f"关注度日变化: {first_result['attention_daily_change']}")
-            print(f"关注度五日变化: {first_result['attention_five_day_change']}")
-            print(f"持仓客户数日变化: {first_result['holder_daily_change']}")
-            print(f"持仓客户数五日变化: {first_result['holder_five_day_change']}")
-            print(f"持仓价值日变化(万元): {first_result['holding_value_daily_change']}")
-            print(f"持仓价值五日变化(万元): {first_result['holding_value_five_day_change']}")
+            print(f"关注度日变化: {first_result['attention_day_change']}")
+            print(f"关注度五日变化: {first_result['attention_5day_change']}")
+            print(f"持仓客户数日变化: {first_result['holders_day_change']}")
+            print(f"持仓客户数五日变化: {first_result['holders_5day_change']}")
+            print(f"持仓价值日变化(万元): {first_result['holding_day_change']}")
+            print(f"持仓价值五日变化(万元): {first_result['holding_5day_change']}")
         except Exception as e:
             print(f"打印结果详情出错: {e}")
     
@@ -417,8 +411,8 @@ def normalize_etf_results(results):
 
 def determine_search_type(keyword):
     """判断搜索类型"""
-    # 创建数据库连接
-    db = Database()
+    # 内存关键词索引，避免逐个执行 LIKE 全表扫描
+    db = get_keyword_checker()
     
     # 处理可能带有后缀的ETF代码
     etf_code = keyword
@@ -551,6 +545,7 @@ def safe_float(value, default=0.0):
         return default
 
 @search_bp.route('/recommendations', methods=['GET'])
+@cached_json()
 def get_recommendations():
     """获取ETF推荐数据"""
     # 导入所需模块
@@ -575,9 +570,8 @@ def get_recommendations():
             "date_for_title": ""
         }
         
-        # 获取最新的交易日期
-        cursor.execute("SELECT MAX(date) FROM etf_price")
-        latest_date = cursor.fetchone()[0]
+        # 获取最新的交易日期（数据集版本登记，见 database/dataset_versions.py）
+        latest_date = dataset_versions.registry.latest_date('price')
         
         if latest_date:
             # 直接使用最新数据的日期，而不是当前日期
@@ -611,7 +605,7 @@ def get_recommendations():
                 FROM etf_price p
                 JOIN etf_info i ON p.code = i.code
                 LEFT JOIN etf_business b ON p.code = b.code
-                WHERE p.date = (SELECT MAX(date) FROM etf_price)
+                WHERE p.date = ?
                 ORDER BY i.tracking_index_code, p.change_rate DESC
             ),
             business_etfs AS (
@@ -628,7 +622,7 @@ def get_recommendations():
                 FROM grouped_etfs g
                 JOIN etf_price p ON g.code = p.code
                 WHERE g.is_business = 1
-                AND p.date = (SELECT MAX(date) FROM etf_price)
+                AND p.date = ?
             ),
             best_volume_business AS (
                 -- 对每个指数，找出交易量最大的"商务品"
@@ -643,7 +637,7 @@ def get_recommendations():
                     FROM grouped_etfs g
                     JOIN etf_price p ON g.code = p.code
                     LEFT JOIN etf_business b ON g.code = b.code
-                    WHERE p.date = (SELECT MAX(date) FROM etf_price)
+                    WHERE p.date = ?
                 ),
                 business_etfs_by_index AS (
                     -- 仅商务品
@@ -673,7 +667,7 @@ def get_recommendations():
                         p1.amount AS rank_one_amount
                     FROM grouped_etfs g1
                     JOIN etf_price p1 ON g1.code = p1.code
-                    WHERE p1.date = (SELECT MAX(date) FROM etf_price)
+                    WHERE p1.date = ?
                     AND NOT EXISTS (
                         SELECT 1 FROM grouped_etfs g2
                         JOIN etf_price p2 ON g2.code = p2.code
@@ -738,7 +732,7 @@ def get_recommendations():
             LIMIT 20
             """
             
-            cursor.execute(query)
+            cursor.execute(query, (latest_date,) * 4)
             results = cursor.fetchall()
             
             # 使用字段名创建结果字典
@@ -760,6 +754,7 @@ def get_recommendations():
             
         except Exception as e:
             print(f"获取涨幅数据出错: {str(e)}")
+            mark_error()
             import traceback
             traceback.print_exc()
         
@@ -803,6 +798,7 @@ def get_recommendations():
             print(f"成功加载ETF关注推荐数据，共{len(recommendations['attention'])}条记录")
         except Exception as e:
             print(f"获取关注数据出错: {str(e)}")
+            mark_error()
             import traceback
             traceback.print_exc()
         
@@ -846,6 +842,7 @@ def get_recommendations():
             print(f"成功加载ETF持有人推荐数据，共{len(recommendations['holders'])}条记录")
         except Exception as e:
             print(f"获取持有人数据出错: {str(e)}")
+            mark_error()
             import traceback
             traceback.print_exc()
 
@@ -930,6 +927,7 @@ def get_recommendations():
                                 }
                     except Exception as e:
                         print(f"查询替补商务品或低费率商务品时出错: {str(e)}")
+                        mark_error()
                         import traceback
                         traceback.print_exc()
                 
@@ -944,6 +942,7 @@ def get_recommendations():
                             etf_volume = float(volume_result[0])
                     except Exception as e:
                         print(f"获取ETF交易量时出错 ({item['code']}): {str(e)}")
+                        mark_error()
                     
                     # 添加替补商务品数据
                     tracking_index_code = item.get('tracking_index_code', '')
@@ -999,6 +998,7 @@ def get_recommendations():
                 print("没有获取到ETF加自选排行榜数据")
         except Exception as e:
             print(f"获取加自选排行榜数据出错: {str(e)}")
+            mark_error()
             import traceback
             traceback.print_exc()
             
@@ -1006,66 +1006,52 @@ def get_recommendations():
         
     except Exception as e:
         print(f"获取ETF推荐数据出错: {str(e)}")
+        mark_error()
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)})
 
-# 添加一个新函数来获取数据截止日期
 def get_data_cutoff_date():
-    """从ETF数据文件名获取最新的数据截止日期"""
+    """数据截止日期（YYYY.MM.DD）：基本信息、价格、自选、持有人数据集中最新的数据日期"""
     try:
-        import os
-        import re
-        import datetime
-        
-        # 定义可能的数据文件路径模式
-        data_file_patterns = [
-            'data/ETF_DATA_*.xlsx',
-            'data/客户ETF自选人数*.xlsx',
-            'data/客户ETF保有量*.xlsx',
-            'data/ETF单产品商务协议*.xlsx'
-        ]
-        
-        latest_date = None
-        
-        # 遍历所有可能的文件模式
-        for pattern in data_file_patterns:
-            # 使用glob查找匹配的文件
-            import glob
-            files = glob.glob(pattern)
-            
-            for file_path in files:
-                # 从文件名中提取日期
-                date_match = re.search(r'(\d{8})', file_path)
-                if date_match:
-                    date_str = date_match.group(1)
-                    try:
-                        file_date = datetime.datetime.strptime(date_str, '%Y%m%d').date()
-                        if latest_date is None or file_date > latest_date:
-                            latest_date = file_date
-                    except ValueError:
-                        # 日期格式不正确，忽略
-                        continue
-        
-        # 如果找到有效日期，格式化为YYYY.MM.DD
+        latest_date = dataset_versions.registry.latest_date('info', 'price', 'attention', 'holders')
         if latest_date:
-            return latest_date.strftime('%Y.%m.%d')
-        else:
-            # 如果没有找到有效日期，返回当前日期
-            return datetime.datetime.now().strftime('%Y.%m.%d')
+            return datetime.strptime(latest_date, '%Y-%m-%d').strftime('%Y.%m.%d')
     except Exception as e:
         print(f"获取数据截止日期出错: {str(e)}")
-        # 出错时返回当前日期
-        import datetime
-        return datetime.datetime.now().strftime('%Y.%m.%d')
+    # 没有数据或出错时返回当前日期
+    return datetime.now().strftime('%Y.%m.%d')
 
 def get_db_connection():
     """获取数据库连接"""
-    conn = sqlite3.connect('data/etf_data.db')
+    conn = instrumentation.connect(DATABASE_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
+@search_bp.route('/api/recommendations/price', methods=['GET'])
+@cached_json()
+def api_price_recommendations():
+    """
+    价格涨幅推荐：每个跟踪指数取涨幅最大的一只ETF
+
+    参数: horizon（1d/5d/20d/60d/ytd，默认1d）、business_only（1/true 只看商务品）、
+          min_size（最小基金规模，亿元）、top（返回数量，默认20）
+    """
+    horizon = request.args.get('horizon', DEFAULT_HORIZON)
+    if horizon not in HORIZONS:
+        return jsonify({"error": f"不支持的周期: {horizon}，可选: {', '.join(HORIZONS)}"}), 400
+    business_only = request.args.get('business_only', '').lower() in ('1', 'true', 'yes')
+    min_size = request.args.get('min_size', type=float)
+    top_n = request.args.get('top', DEFAULT_TOP_N, type=int)
+    try:
+        return jsonify(get_price_recommendations(horizon, top_n, business_only, min_size))
+    except Exception as e:
+        print(f"获取价格推荐数据出错: {str(e)}")
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
 @search_bp.route('/api/search', methods=['GET'])
+@cached_json()
 def api_search():
     """API搜索ETF（GET方法）"""
     try:
@@ -1269,7 +1255,15 @@ def api_company_search():
 
 @search_bp.route('/etf_attention_history', methods=['GET'])
 def etf_attention_history():
-    """返回ETF自选历史数据"""
+    """返回ETF自选历史数据
+
+    查询参数:
+        code: ETF代码
+        start/end: 日期范围（含端点），格式 YYYY-MM-DD
+        max_points: LTTB降采样的目标点数
+        rollup: week / month，按周/月汇总为开高低收
+        format: columnar（默认，列式数组）/ records（逐点字典列表）
+    """
     code = request.args.get('code', '')
     
     if not code:
@@ -1277,39 +1271,31 @@ def etf_attention_history():
         return jsonify({"error": "请提供ETF代码"}), 400
     
     try:
-        # 记录查询参数
-        current_app.logger.info(f"ETF自选历史查询: 代码={code}")
+        options = parse_history_args(request.args)
+        current_app.logger.info(f"ETF自选历史查询: 代码={code}, 参数={options}")
         
         # 获取历史数据
         db = Database()
-        results = db.get_etf_attention_history(code)
+        results = db.get_etf_attention_history(code, start=options['start'], end=options['end'])
         
-        # 记录结果信息
-        current_app.logger.info(f"ETF自选历史查询结果: 代码={code}, 记录数={len(results) if results else 0}")
-        
-        # 格式化为API响应
-        records = []
-        for row in results:
-            # 记录详细日志以便调试
-            current_app.logger.debug(f"处理ETF自选历史记录: {row}")
-            
-            # 确保记录有效，含有date和attention_count字段
-            if row and 'date' in row and 'attention_count' in row:
-                records.append({
-                    'date': row['date'],
-                    'attention_count': row['attention_count']
-                })
-            else:
-                current_app.logger.warning(f"ETF自选历史: 跳过无效记录 {row}")
+        # 确保记录有效，含有date和attention_count字段
+        records = [
+            {'date': row['date'], 'attention_count': row['attention_count']}
+            for row in results if row and 'date' in row and 'attention_count' in row
+        ]
+        current_app.logger.info(f"ETF自选历史查询结果: 代码={code}, 记录数={len(records)}")
         
-        return jsonify(records)
+        if options['format'] == 'records':
+            return jsonify(filter_records(records, options['start'], options['end']))
+        return jsonify(shape_history(records, ['attention_count'], options['start'], options['end'],
+                                     options['max_points'], options['rollup']))
     except Exception as e:
         current_app.logger.exception(f"ETF自选历史API错误: {str(e)}")
         return jsonify({"error": f"获取数据失败: {str(e)}"}), 500
 
 @search_bp.route('/etf_holders_history', methods=['GET'])
 def etf_holders_history():
-    """返回ETF持有人历史数据"""
+    """返回ETF持有人历史数据，查询参数同 /etf_attention_history"""
     code = request.args.get('code', '')
     
     if not code:
@@ -1317,33 +1303,24 @@ def etf_holders_history():
         return jsonify({"error": "请提供ETF代码"}), 400
     
     try:
-        # 记录查询参数
-        current_app.logger.info(f"ETF持有人历史查询: 代码={code}")
+        options = parse_history_args(request.args)
+        current_app.logger.info(f"ETF持有人历史查询: 代码={code}, 参数={options}")
         
         # 获取历史数据
         db = Database()
-        results = db.get_etf_holders_history(code)
-        
-        # 记录结果信息
-        current_app.logger.info(f"ETF持有人历史查询结果: 代码={code}, 记录数={len(results) if results else 0}")
+        results = db.get_etf_holders_history(code, start=options['start'], end=options['end'])
         
-        # 格式化为API响应
-        records = []
-        for row in results:
-            # 记录详细日志以便调试
-            current_app.logger.debug(f"处理ETF持有人历史记录: {row}")
-            
-            # 确保记录有效，含有必要字段，直接返回原始数据
-            if row and 'date' in row and 'holder_count' in row and 'holding_value' in row:
-                records.append({
-                    'date': row['date'],
-                    'holder_count': row['holder_count'],
-                    'holding_value': row['holding_value']  # 直接返回原始值，不做转换
-                })
-            else:
-                current_app.logger.warning(f"ETF持有人历史: 跳过无效记录 {row}")
+        # 确保记录有效，含有必要字段，直接返回原始数据
+        records = [
+            {'date': row['date'], 'holder_count': row['holder_count'], 'holding_value': row['holding_value']}
+            for row in results if row and 'date' in row and 'holder_count' in row and 'holding_value' in row
+        ]
+        current_app.logger.info(f"ETF持有人历史查询结果: 代码={code}, 记录数={len(records)}")
         
-        return jsonify(records)
+        if options['format'] == 'records':
+            return jsonify(filter_records(records, options['start'], options['end']))
+        return jsonify(shape_history(records, ['holder_count', 'holding_value'], options['start'], options['end'],
+                                     options['max_points'], options['rollup']))
     except Exception as e:
         current_app.logger.exception(f"ETF持有人历史API错误: {str(e)}")
         return jsonify({"error": f"获取数据失败: {str(e)}"}), 500
@@ -1653,6 +1630,9 @@ def ocr_recognize():
             
             # 尝试打开和识别图片
             try:
+                # OCR依赖在首次识别时才导入，缩短服务启动时间；未安装时按打开图片失败处理
+                from PIL import Image
+                import pytesseract
                 image = Image.open(io.BytesIO(image_bytes))
                 print(f"成功打开图片，尺寸: {image.size}, 格式: {image.format}")
                 
@@ -1767,8 +1747,8 @@ def ocr_status():
     """
     try:
         # 检查是否安装了pytesseract和PIL
-        has_pil = 'PIL' in sys.modules
-        has_pytesseract = 'pytesseract' in sys.modules
+        has_pil = importlib.util.find_spec('PIL') is not None
+        has_pytesseract = importlib.util.find_spec('pytesseract') is not None
         
         # 检查是否可以导入pytesseract
         try:
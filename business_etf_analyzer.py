@@ -1,7 +1,7 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-import glob
+from services.period_service import get_period_comparison_wide, weekly_dates
 from datetime import datetime, timedelta
 import os
 from docx import Document
@@ -20,28 +20,19 @@ def show_version():
 
 def load_data():
     """加载并预处理数据"""
-    # 动态获取最新数据文件
-    files = glob.glob('ETF_基础数据合并_*.csv')
-    if not files:
-        raise FileNotFoundError("未找到ETF基础数据文件")
-    
-    # 提取最新文件日期
-    filename = sorted(files)[-1]
-    date_str = filename.split('_')[-1].split('.')[0]
-    
-    try:
-        current_date = datetime.strptime(date_str, "%Y%m%d")
-    except ValueError:
-        raise ValueError("文件名日期格式应为ETF_基础数据合并_YYYYMMDD.csv")
-    
+    # 从历史表合并最新一周与上周的数据（不再读取 ETF_基础数据合并_*.csv）
+    previous_iso, current_iso = weekly_dates()
+    current_date = datetime.strptime(current_iso, "%Y-%m-%d")
     previous_date = current_date - timedelta(days=7)
+    date_str = current_date.strftime("%Y%m%d")
     
     # 修正日期格式（保留前导零）
     current_str = current_date.strftime("%m月%d日")
     previous_str = previous_date.strftime("%m月%d日")
 
-    # 读取数据
-    result = pd.read_csv(filename, encoding='utf-8-sig')
+    # 读取数据（与原合并脚本一致，数值列的缺失值按0处理）
+    result = get_period_comparison_wide([previous_iso, current_iso])
+    result = result.fillna({col: 0 for col in result.select_dtypes('number').columns})
     
     # 读取ETF指数分类数据
     classification_path = f'/Users/admin/Downloads/ETF-Index-Classification_{date_str}.xlsx'
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+基金公司分析历史
+
+一次性按 (基金公司, 日期) 计算 etf_company_analytics 的全部指标，
+结果按日期分区写入 etf_company_analytics_history 表，供仪表盘查看
+任意历史日期的排名、名次变化和周环比变化，无需重跑整条流水线。
+
+各来源表的日期并不完全一致，对每个分析日期按"不晚于该日期的最近一个
+来源日期"取值（as-of），与最新快照中各表分别取 MAX(date) 的口径一致。
+"""
+
+import numpy as np
+import pandas as pd
+
+from database.retention import history_source
+
+HISTORY_TABLE = 'etf_company_analytics_history'
+
+# 历史表列定义（列名 -> SQL类型），顺序即建表顺序
+HISTORY_COLUMNS = {
+    'date': 'TEXT NOT NULL',
+    'company_name': 'TEXT NOT NULL',
+    'company_short_name': 'TEXT',
+    'product_count': 'INTEGER',
+    'total_fund_size': 'REAL',
+    'avg_fund_size': 'REAL',
+    'total_holder_count_info': 'REAL',
+    'total_amount': 'REAL',
+    'avg_turnover_rate': 'REAL',
+    'total_attention_count': 'INTEGER',
+    'total_shares_holders': 'REAL',
+    'total_holder_count_holders': 'INTEGER',
+    'holder_attention_ratio': 'REAL',
+    'total_holding_value': 'REAL',
+    'business_agreement_count': 'INTEGER',
+    'business_agreement_ratio': 'REAL',
+    'business_agreement_total_size': 'REAL',
+    'business_agreement_avg_mgmt_fee': 'REAL',
+    'business_agreement_avg_cust_fee': 'REAL',
+    'business_total_holding_value': 'REAL',
+    'business_holding_value_ratio': 'REAL',
+    # 当日排名（1为最高）
+    'total_holding_value_rank': 'INTEGER',
+    'total_attention_count_rank': 'INTEGER',
+    'total_holder_count_holders_rank': 'INTEGER',
+    # 相对一周前的名次变化（正数表示名次上升）
+    'total_holding_value_rank_change': 'INTEGER',
+    'total_attention_count_rank_change': 'INTEGER',
+    'total_holder_count_holders_rank_change': 'INTEGER',
+    # 相对一周前的数值变化
+    'total_holding_value_wow_change': 'REAL',
+    'total_attention_count_wow_change': 'INTEGER',
+    'total_holder_count_holders_wow_change': 'INTEGER',
+    'compare_date': 'TEXT',
+}
+
+RANKED_METRICS = ['total_holding_value', 'total_attention_count', 'total_holder_count_holders']
+
+INT_COLUMNS = [c for c, t in HISTORY_COLUMNS.items() if t.startswith('INTEGER')]
+FLOAT_COLUMNS = [c for c, t in HISTORY_COLUMNS.items() if t.startswith('REAL')]
+
+# 周环比比较的自然日间隔
+WOW_DAYS = 7
+
+
+def create_history_table(conn):
+    """创建分析历史表（按日期分区，主键为 日期+公司）"""
+    columns_sql = ',\n    '.join(f'{c} {t}' for c, t in HISTORY_COLUMNS.items())
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {HISTORY_TABLE} (
+            {columns_sql},
+            PRIMARY KEY (date, company_name)
+        )
+    """)
+    cursor.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_{HISTORY_TABLE}_company_date
+        ON {HISTORY_TABLE} (company_name, date)
+    """)
+    conn.commit()
+    cursor.close()
+
+
+def _table_columns(conn, table):
+    cursor = conn.cursor()
+    cursor.execute(f"PRAGMA table_info({table})")
+    columns = {row[1] for row in cursor.fetchall()}
+    cursor.close()
+    return columns
+
+
+def _read_source(conn, candidates, columns, start=None):
+    """
+    从候选表中读取第一个存在且有数据（不早于 start）的来源表，缺少的列补为NaN
+
+    start 早于主库最早日期（或为 None）时同时读取归档库中的快照
+    """
+    for table in candidates:
+        existing = _table_columns(conn, table)
+        if not existing or 'date' not in existing:
+            continue
+        present = [c for c in columns if c in existing]
+        frame = pd.read_sql_query(
+            f"SELECT code, date, {', '.join(present)} FROM {history_source(conn, table, start)} "
+            f"WHERE ? IS NULL OR date >= ?", conn, params=(start, start))
+        if frame.empty:
+            continue
+        for column in columns:
+            if column not in frame.columns:
+                frame[column] = np.nan
+        frame['date'] = frame['date'].astype(str).str[:10]
+        return frame
+    return None
+
+
+def axis_dates(conn, start=None):
+    """
+    分析日期轴上不早于 start 的日期（自选、持有人、价格各来源日期的并集），只查主库
+
+    用于增量更新时确定需要重算的日期，再作为 dates 传给 compute_company_analytics_history。
+    """
+    dates = set()
+    for candidates in (['etf_attention_history'], ['etf_holders_history'], ['etf_price_history', 'etf_price']):
+        for table in candidates:
+            if 'date' not in _table_columns(conn, table):
+                continue
+            rows = conn.execute(
+                f"SELECT DISTINCT date FROM {table} WHERE ? IS NULL OR date >= ?", (start, start)).fetchall()
+            if rows:
+                dates.update(str(row[0])[:10] for row in rows)
+                break
+    return sorted(dates)
+
+
+def _asof_dates(axis, source_dates):
+    """为分析日期轴上的每个日期找到不晚于它的最近来源日期"""
+    source_dates = np.sort(np.unique(source_dates))
+    pos = np.searchsorted(source_dates, axis, side='right') - 1
+    mapped = np.where(pos >= 0, source_dates[np.clip(pos, 0, None)], None)
+    return pd.Series(mapped, index=axis)
+
+
+def _aggregate_source(frame, company_map, axis, aggregations, business_codes=None):
+    """按 (公司, 来源日期) 聚合，再映射回分析日期轴"""
+    frame = frame.merge(company_map, on='code', how='inner')
+    if business_codes is not None:
+        frame = frame[frame['code'].isin(business_codes)]
+    if frame.empty:
+        return None
+    grouped = frame.groupby(['company_name', 'date']).agg(**aggregations).reset_index()
+    grouped = grouped.rename(columns={'date': 'source_date'})
+
+    mapping = _asof_dates(axis, frame['date'].to_numpy())
+    mapping = mapping.dropna().rename_axis('date').reset_index(name='source_date')
+    return mapping.merge(grouped, on='source_date', how='inner').drop(columns='source_date')
+
+
+def compute_company_analytics_history(conn, dates=None):
+    """
+    计算所有日期的基金公司分析指标
+
+    参数:
+        conn: sqlite3连接
+        dates: 只返回这些日期的结果（计算周环比仍会用到更早的日期），默认全部
+
+    返回:
+        DataFrame，列与 HISTORY_COLUMNS 一致；没有数据时返回空DataFrame
+    """
+    info = pd.read_sql_query("""
+        SELECT code, fund_manager AS company_name, manager_short AS company_short_name,
+               fund_size, total_holder_count
+        FROM etf_info
+        WHERE fund_manager IS NOT NULL AND fund_manager != ''
+    """, conn)
+    if info.empty:
+        return pd.DataFrame(columns=list(HISTORY_COLUMNS))
+    company_map = info[['code', 'company_name']]
+
+    # 只计算部分日期时，主库中的近期数据已足够计算周环比，不必读取归档库
+    start = None
+    if dates is not None and len(dates):
+        start = (pd.Timestamp(min(dates)) - pd.Timedelta(days=31)).strftime('%Y-%m-%d')
+    attention = _read_source(conn, ['etf_attention_history'], ['attention_count'], start)
+    holders = _read_source(conn, ['etf_holders_history'],
+                           ['holder_count', 'holding_amount', 'holding_value'], start)
+    price = _read_source(conn, ['etf_price_history', 'etf_price'], ['amount', 'turnover_rate'], start)
+    fund_size = _read_source(conn, ['etf_fund_size_history'], ['fund_size'], start)
+
+    # 分析日期轴：各日度来源日期的并集
+    axis_dates = set()
+    for frame in (attention, holders, price):
+        if frame is not None:
+            axis_dates.update(frame['date'].unique())
+    if not axis_dates:
+        return pd.DataFrame(columns=list(HISTORY_COLUMNS))
+    axis = np.array(sorted(axis_dates), dtype=object)
+
+    # 公司静态信息（产品数、持有人数(info)、简称）
+    static = info.groupby('company_name').agg(
+        company_short_name=('company_short_name', 'first'),
+        product_count=('code', 'count'),
+        info_fund_size=('fund_size', 'sum'),
+        info_avg_fund_size=('fund_size', 'mean'),
+        total_holder_count_info=('total_holder_count', 'sum'),
+    ).reset_index()
+
+    business = pd.read_sql_query("""
+        SELECT code, fund_size, management_fee_rate, custody_fee_rate FROM etf_business
+    """, conn) if _table_columns(conn, 'etf_business') else pd.DataFrame(
+        columns=['code', 'fund_size', 'management_fee_rate', 'custody_fee_rate'])
+    business_codes = set(business['code'].astype(str))
+    business_stats = business.merge(company_map, on='code', how='inner').groupby('company_name').agg(
+        business_agreement_count=('code', 'count'),
+        business_agreement_total_size=('fund_size', 'sum'),
+        business_agreement_avg_mgmt_fee=('management_fee_rate', 'mean'),
+        business_agreement_avg_cust_fee=('custody_fee_rate', 'mean'),
+    ).reset_index()
+
+    # 日期 × 公司 骨架
+    result = pd.MultiIndex.from_product(
+        [axis, static['company_name']], names=['date', 'company_name']).to_frame(index=False)
+    result = result.merge(static, on='company_name', how='left')
+    result = result.merge(business_stats, on='company_name', how='left')
+
+    parts = []
+    if price is not None:
+        parts.append(_aggregate_source(price, company_map, axis, {
+            'total_amount': ('amount', 'sum'),
+            'avg_turnover_rate': ('turnover_rate', 'mean'),
+        }))
+    if attention is not None:
+        parts.append(_aggregate_source(attention, company_map, axis, {
+            'total_attention_count': ('attention_count', 'sum'),
+        }))
+    if holders is not None:
+        parts.append(_aggregate_source(holders, company_map, axis, {
+            'total_shares_holders': ('holding_amount', 'sum'),
+            'total_holder_count_holders': ('holder_count', 'sum'),
+            'total_holding_value': ('holding_value', 'sum'),
+        }))
+        parts.append(_aggregate_source(holders, company_map, axis, {
+            'business_total_holding_value': ('holding_value', 'sum'),
+        }, business_codes=business_codes))
+    if fund_size is not None:
+        parts.append(_aggregate_source(fund_size, company_map, axis, {
+            'total_fund_size': ('fund_size', 'sum'),
+            'avg_fund_size': ('fund_size', 'mean'),
+        }))
+    for part in parts:
+        if part is not None:
+            result = result.merge(part, on=['date', 'company_name'], how='left')
+
+    # 没有规模历史时使用 etf_info 当前规模
+    if 'total_fund_size' not in result.columns:
+        result['total_fund_size'] = np.nan
+        result['avg_fund_size'] = np.nan
+    result['total_fund_size'] = result['total_fund_size'].fillna(result['info_fund_size'])
+    result['avg_fund_size'] = result['avg_fund_size'].fillna(result['info_avg_fund_size'])
+
+    for column in HISTORY_COLUMNS:
+        if column not in result.columns:
+            result[column] = np.nan
+
+    numeric = FLOAT_COLUMNS + INT_COLUMNS
+    result[numeric] = result[numeric].apply(pd.to_numeric, errors='coerce')
+    zero_fill = ['business_agreement_count', 'total_holding_value', 'business_total_holding_value']
+    result[zero_fill] = result[zero_fill].fillna(0)
+
+    # 比例指标
+    pc = result['product_count'].fillna(0)
+    result['business_agreement_ratio'] = np.where(
+        pc > 0, result['business_agreement_count'] * 100.0 / pc.where(pc > 0, 1), 0.0).round(2)
+    att = result['total_attention_count'].fillna(0)
+    result['holder_attention_ratio'] = np.where(
+        att > 0, result['total_holder_count_holders'].fillna(0) * 100.0 / att.where(att > 0, 1), 0.0).round(2)
+    hv = result['total_holding_value']
+    result['business_holding_value_ratio'] = np.where(
+        hv > 0, result['business_total_holding_value'] * 100.0 / hv.where(hv > 0, 1), 0.0).round(1)
+
+    # 当日排名
+    for metric in RANKED_METRICS:
+        result[f'{metric}_rank'] = result.groupby('date')[metric].rank(
+            ascending=False, method='min', na_option='keep')
+
+    # 周环比：比较不晚于 (日期 - 7天) 的最近分析日期
+    axis_ts = pd.to_datetime(pd.Series(axis))
+    compare_pos = np.searchsorted(
+        axis_ts.to_numpy(), (axis_ts - pd.Timedelta(days=WOW_DAYS)).to_numpy(), side='right') - 1
+    compare_map = pd.DataFrame({
+        'date': axis,
+        'compare_date': np.where(compare_pos >= 0, axis[np.clip(compare_pos, 0, None)], None),
+    })
+    result = result.drop(columns='compare_date').merge(compare_map, on='date', how='left')
+    previous_cols = RANKED_METRICS + [f'{m}_rank' for m in RANKED_METRICS]
+    previous = result[['date', 'company_name'] + previous_cols].rename(
+        columns={'date': 'compare_date', **{c: f'prev_{c}' for c in previous_cols}})
+    result = result.merge(previous, on=['compare_date', 'company_name'], how='left')
+    for metric in RANKED_METRICS:
+        result[f'{metric}_wow_change'] = result[metric] - result[f'prev_{metric}']
+        result[f'{metric}_rank_change'] = result[f'prev_{metric}_rank'] - result[f'{metric}_rank']
+
+    if dates is not None:
+        result = result[result['date'].isin(set(dates))]
+
+    result = result[list(HISTORY_COLUMNS)].sort_values(['date', 'company_name']).reset_index(drop=True)
+    for column in INT_COLUMNS:
+        result[column] = result[column].round().astype('Int64')
+    return result
+
+
+def write_history(conn, frame):
+    """按日期分区写入：先删除涉及日期的分区，再整体插入"""
+    if frame.empty:
+        return 0
+    create_history_table(conn)
+    columns = list(HISTORY_COLUMNS)
+    rows = frame[columns].astype(object).where(frame[columns].notna(), None).values.tolist()
+    cursor = conn.cursor()
+    cursor.executemany(f"DELETE FROM {HISTORY_TABLE} WHERE date = ?",
+                       [(d,) for d in frame['date'].unique()])
+    cursor.executemany(
+        f"INSERT INTO {HISTORY_TABLE} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+        rows)
+    conn.commit()
+    cursor.close()
+    return len(rows)
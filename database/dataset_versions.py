@@ -0,0 +1,330 @@
+"""
+数据集版本登记
+
+各数据集的新鲜度原先散落在各处临时计算：搜索接口每次 glob data/ 下的文件名取日期，
+首页和推荐榜单反复 SELECT MAX(date) FROM etf_price，自选日变化再单独查前一个日期。
+现在由写库方在写入提交后调用 refresh()（Database 的各个 save_*/apply_*/update_* 方法自动调用），把每个数据集的最新日期、前一个数据日期、行数和内容摘要
+记录在 dataset_versions 表中；读取方通过进程内的 registry 读取，数据库文件不变时不访问数据库。
+
+内容摘要只覆盖数据本身（不含自增ID和更新时间列），重新导入相同的文件不会改变版本。
+response_service.data_version() 及各内存缓存用 version() 作为失效键：
+只有数据真正变化时才重建，只登记导入状态之类的写入不会让缓存失效。
+
+不经过 Database 的写入（归档、飞书同步）各自调用 refresh()。
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from dataclasses import asdict, dataclass
+from datetime import datetime
+
+from database import instrumentation
+
+logger = logging.getLogger(__name__)
+
+TABLE = 'dataset_versions'
+
+# 计算内容摘要时忽略的列：自增ID和写入时间每次导入都会变化
+IGNORED_COLUMNS = {'id', 'update_time', 'update_timestamp', 'created_at', 'updated_at'}
+
+
+@dataclass(frozen=True)
+class Dataset:
+    # 读取方使用的表（内容摘要取自该表）
+    table: str
+    # 提供日期序列的历史表，None 表示按 table 自身的 date 列（没有 date 列的数据集不记日期）
+    history: str = None
+    # table 本身按日期累积时只对最新日期的数据计算摘要
+    partitioned: bool = False
+
+
+DATASETS = {
+    'info': Dataset('etf_info'),
+    'price': Dataset('etf_price', 'etf_price_history'),
+    'price_metrics': Dataset('price_metrics', partitioned=True),
+    'holders': Dataset('etf_holders', 'etf_holders_history'),
+    'attention': Dataset('etf_attention', 'etf_attention_history'),
+    'fund_size': Dataset('etf_fund_size_history', partitioned=True),
+    'classification': Dataset('etf_index_classification'),
+    'business': Dataset('etf_business'),
+    'company_analytics': Dataset('etf_company_analytics', 'etf_company_analytics_history'),
+    'feishu_promo': Dataset('feishu_promo_data'),
+}
+
+
+@dataclass
+class DatasetVersion:
+    dataset: str
+    table_name: str
+    latest_date: str = None
+    previous_date: str = None
+    row_count: int = 0
+    content_hash: str = None
+    updated_at: str = None
+
+
+def create_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABLE} (
+            dataset TEXT PRIMARY KEY,
+            table_name TEXT,
+            latest_date TEXT,
+            previous_date TEXT,
+            row_count INTEGER,
+            content_hash TEXT,
+            updated_at TEXT
+        )
+    """)
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+
+
+def _count(conn, name, known=None):
+    """
+    数据集的行数、最新日期和前一个日期（不含内容摘要），表不存在时返回 (None, None)
+
+    known 为之前的版本且最新日期未变时沿用其前一个日期，少扫描一次日期。
+    """
+    spec = DATASETS[name]
+    columns = _columns(conn, spec.table)
+    if not columns:
+        return None, None
+    dated = spec.history if spec.history and _columns(conn, spec.history) else (
+        spec.table if 'date' in columns else None)
+
+    entry = DatasetVersion(name, spec.table)
+    if dated is not None:
+        entry.row_count, entry.latest_date = conn.execute(
+            f"SELECT COUNT(*), MAX(date) FROM main.{dated}").fetchone()
+        if known is not None and known.latest_date == entry.latest_date:
+            entry.previous_date = known.previous_date
+        elif entry.latest_date is not None:
+            entry.previous_date = conn.execute(
+                f"SELECT MAX(date) FROM main.{dated} WHERE date < ?", (entry.latest_date,)).fetchone()[0]
+    else:
+        entry.row_count = conn.execute(f"SELECT COUNT(*) FROM main.{spec.table}").fetchone()[0]
+    return entry, columns
+
+
+def probe(conn, name, salt='', known=None):
+    """
+    只统计行数和日期的快速版本（不扫描表内容），表不存在时返回 None
+
+    读请求路径上使用：内容摘要由 salt（如数据库文件状态）和行数、日期合成，
+    salt 变化即视为新版本，准确的内容摘要留给写库方 refresh()。known 见 _count()。
+    """
+    entry, _ = _count(conn, name, known)
+    if entry is None:
+        return None
+    entry.content_hash = hashlib.sha1(
+        f"probe|{salt}|{entry.row_count}|{entry.latest_date}|{entry.previous_date}".encode('utf-8')).hexdigest()
+    return entry
+
+
+def measure(conn, name):
+    """从数据表计算一个数据集的当前版本（按全部列排序计算内容摘要，写库方使用），表不存在时返回 None"""
+    spec = DATASETS[name]
+    entry, columns = _count(conn, name)
+    if entry is None:
+        return None
+
+    hashed = [c for c in columns if c not in IGNORED_COLUMNS]
+    where, params = '', ()
+    if spec.partitioned and entry.latest_date is not None:
+        where, params = 'WHERE date = ?', (entry.latest_date,)
+    digest = hashlib.sha1(f"{entry.row_count}|{entry.latest_date}|{entry.previous_date}".encode('utf-8'))
+    # 按全部列排序，整表重建后行的物理顺序变化不影响摘要
+    cursor = conn.execute(f"SELECT {', '.join(hashed)} FROM main.{spec.table} {where} "
+                          f"ORDER BY {', '.join(hashed)}", params)
+    for row in cursor:
+        digest.update(repr(row).encode('utf-8'))
+    entry.content_hash = digest.hexdigest()
+    return entry
+
+
+def refresh(conn, datasets=None):
+    """
+    重新计算并登记数据集版本（写库方在写入提交后调用），内容未变化的数据集保持原 updated_at
+
+    参数:
+        conn: 写入所用数据库的连接
+        datasets: 数据集名称列表，默认全部（见 DATASETS）
+
+    返回:
+        dict: 数据集名称 -> DatasetVersion（表不存在的数据集不包含在内）
+    """
+    create_table(conn)
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    entries = {}
+    for name in datasets or DATASETS:
+        entry = measure(conn, name)
+        if entry is None:
+            conn.execute(f"DELETE FROM {TABLE} WHERE dataset = ?", (name,))
+            continue
+        entry.updated_at = now
+        conn.execute(f"""
+            INSERT INTO {TABLE} (dataset, table_name, latest_date, previous_date, row_count, content_hash,
+                                 updated_at)
+            VALUES (:dataset, :table_name, :latest_date, :previous_date, :row_count, :content_hash, :updated_at)
+            ON CONFLICT(dataset) DO UPDATE SET table_name = excluded.table_name,
+                latest_date = excluded.latest_date, previous_date = excluded.previous_date,
+                row_count = excluded.row_count, content_hash = excluded.content_hash,
+                updated_at = excluded.updated_at
+            WHERE content_hash IS NOT excluded.content_hash
+        """, asdict(entry))
+        entries[name] = entry
+    conn.commit()
+    return entries
+
+
+def _registered(conn):
+    """登记表中的数据集版本（不含未登记的数据集）"""
+    if not _columns(conn, TABLE):
+        return {}
+    return {row[0]: DatasetVersion(*row) for row in conn.execute(f"""
+        SELECT dataset, table_name, latest_date, previous_date, row_count, content_hash, updated_at
+        FROM {TABLE}
+    """) if row[0] in DATASETS}
+
+
+def read(conn, registered=None, remeasure=False, salt=''):
+    """
+    读取已登记的数据集版本；从未登记过的数据集（旧库或新建的表）当场用 probe() 统计，不写入数据库
+
+    参数:
+        registered: 已读取的登记表内容，None 时从 conn 读取
+        remeasure: 全部数据集都当场统计（不信任登记表）
+        salt: 传给 probe() 的数据库文件状态
+
+    返回:
+        dict: 数据集名称 -> DatasetVersion
+    """
+    if registered is None:
+        registered = _registered(conn)
+    entries = {} if remeasure else dict(registered)
+    for name in DATASETS:
+        if name not in entries:
+            entry = probe(conn, name, salt, registered.get(name))
+            if entry is not None:
+                entries[name] = entry
+    return entries
+
+
+def lookup(conn, name):
+    """conn 所在数据库中一个数据集的登记版本，未登记时当场计算；表不存在时返回 None"""
+    if _columns(conn, TABLE):
+        row = conn.execute(f"""
+            SELECT dataset, table_name, latest_date, previous_date, row_count, content_hash, updated_at
+            FROM {TABLE} WHERE dataset = ?
+        """, (name,)).fetchone()
+        if row is not None:
+            return DatasetVersion(*row)
+    return measure(conn, name)
+
+
+def file_key(path):
+    """数据库文件（含WAL）的inode、修改时间和大小，任何写入或整库替换都会改变它"""
+    parts = []
+    for item in (path, path + '-wal'):
+        try:
+            stat = os.stat(item)
+        except OSError:
+            continue
+        parts.append(f'{stat.st_ino}:{stat.st_mtime_ns}:{stat.st_size}')
+    return '|'.join(parts)
+
+
+def combine(entries, datasets=()):
+    """datasets（默认全部）的内容摘要合成的版本号"""
+    digest = hashlib.sha1()
+    for name in sorted(datasets or entries):
+        entry = entries.get(name)
+        digest.update(f"{name}={entry.content_hash if entry else ''};".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class Registry:
+    """
+    正式库的数据集版本，数据库文件变化（写入或整库替换）后下次访问时重新读取
+
+    文件变化而登记表没有变化时，说明有写入没有登记（如直接写库的旧脚本），
+    此时不信任登记表，当场用 probe() 重新统计各数据集（只查行数和日期，不写入数据库）。
+    probe 的版本随数据库文件状态变化，未登记的写入总会使缓存失效，只是可能多失效几次；
+    load() 在读请求路径上执行，不做整表排序计算内容摘要。
+    """
+
+    def __init__(self, path=None):
+        self._path = path
+        self.key = None
+        self.entries = {}
+        self._registered = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        if self._path is None:
+            from database.models import DATABASE_PATH
+            return DATABASE_PATH
+        return self._path
+
+    def load(self, force=False):
+        key = file_key(self.path)
+        if not force and key == self.key:
+            return self.entries
+        with self._lock:
+            if not force and key == self.key:
+                return self.entries
+            if not key:
+                # 数据库不存在
+                self.entries, self._registered = {}, None
+            else:
+                conn = instrumentation.connect(self.path)
+                try:
+                    registered = _registered(conn)
+                    remeasure = self._registered is not None and registered == self._registered
+                    if remeasure:
+                        logger.info("数据库已变化但数据集版本未重新登记，重新计算版本")
+                    self.entries = read(conn, registered, remeasure, salt=key)
+                    self._registered = registered
+                finally:
+                    conn.close()
+            self.key = key
+        return self.entries
+
+    def get(self, name):
+        return self.load().get(name)
+
+    def latest_date(self, *datasets):
+        """datasets 中最新的数据日期（'YYYY-MM-DD'），都没有日期时返回 None"""
+        dates = [entry.latest_date for entry in map(self.get, datasets) if entry and entry.latest_date]
+        return max(dates) if dates else None
+
+    def previous_date(self, name):
+        entry = self.get(name)
+        return entry.previous_date if entry else None
+
+    def version(self, *datasets):
+        """datasets（默认全部）的数据版本；数据库不存在时退回文件状态"""
+        entries = self.load()
+        if not entries:
+            return self.key or ''
+        return combine(entries, datasets)
+
+
+registry = Registry()
+
+
+if __name__ == '__main__':
+    from database.models import DATABASE_PATH
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    connection = instrumentation.connect(DATABASE_PATH)
+    try:
+        for item in refresh(connection).values():
+            print(asdict(item))
+    finally:
+        connection.close()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+跟踪指数分级（优选ETF）
+
+按跟踪指数对全部ETF分组，找出每个指数下综合费率最低（同费率取月成交额最大）、
+月成交额最大、规模最大的基金，并按这三只基金是否为商务品把指数分为一级到九级。
+
+整个计算是一次排序 + 去重和 groupby 聚合，不再逐个指数循环；
+数据来自 etf_info、etf_business 和 etf_index_classification（未导入分类时分类列为空）。
+"""
+
+import numpy as np
+import pandas as pd
+
+LEVELS = ['一级', '二级', '三级', '四级', '五级', '六级', '七级', '八级', '九级']
+
+LEVEL_DESCRIPTIONS = {
+    '一级': '最高交易量基金、最低费率基金、最大规模基金均为商务品',
+    '二级': '最高交易量基金、最低费率基金为商务品，最大规模基金非商务品',
+    '三级': '最高交易量基金、最大规模基金为商务品，最低费率基金非商务品',
+    '四级': '最低费率基金、最大规模基金为商务品，最高交易量基金非商务品',
+    '五级': '仅最高交易量基金为商务品',
+    '六级': '仅最大规模基金为商务品',
+    '七级': '仅最低费率基金为商务品',
+    '八级': '有商务品，但不是最高交易量/最低费率/最大规模基金',
+    '九级': '无商务品',
+}
+
+# 一级分类的展示顺序，其余分类排在最后
+CATEGORY_ORDER = ['宽基规模', '主题行业', '策略风格', '商品债券', '跨境', '空白']
+
+SCALE_BINS = [0, 5, 10, 20, 50, 100, 300, 1000, float('inf')]
+SCALE_LABELS = ['<5亿', '5-10亿', '10-20亿', '20-50亿', '50-100亿', '100-300亿', '300-1000亿', '>=1000亿']
+
+# 三类代表基金：结果列前缀 -> 选取依据
+PICKS = {
+    '综合费率最低的基金': 'lowest_fee',
+    '日均交易量最大的基金': 'highest_volume',
+    '规模合计最大的基金': 'largest_scale',
+}
+
+RESULT_COLUMNS = [
+    '跟踪指数代码', '跟踪指数名称', '跟踪指数分级', '跟踪ETF数量', '商务品数量', '商务品合计规模', '合计规模',
+    '一级分类', '二级分类', '二级分类合计', '三级分类', '三级分类合计',
+    '综合费率最低的基金', '综合费率最低的基金代码', '综合费率最低的基金公司',
+    '日均交易量最大的基金', '日均交易量最大的基金代码', '日均交易量最大的基金公司',
+    '规模合计最大的基金', '规模合计最大的基金代码', '规模合计最大的基金公司',
+]
+
+
+def _classification_select(conn):
+    """etf_index_classification 由 to_sql 整表替换，旧库中可能没有该表或没有 level 列"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(etf_index_classification)")}
+    if {'index_code', 'level1', 'level2', 'level3'} <= columns:
+        return ("c.level1, c.level2, c.level3",
+                "LEFT JOIN (SELECT index_code, MAX(level1) AS level1, MAX(level2) AS level2, "
+                "MAX(level3) AS level3 FROM etf_index_classification GROUP BY index_code) c "
+                "ON i.tracking_index_code = c.index_code")
+    return "NULL AS level1, NULL AS level2, NULL AS level3", ""
+
+
+def load_grading_universe(conn):
+    """读取分级所需的全部ETF，每只一行"""
+    select, join = _classification_select(conn)
+    query = f"""
+        SELECT i.code, i.name, i.fund_manager, i.tracking_index_code, i.tracking_index_name,
+               i.management_fee_rate + i.custody_fee_rate AS fee,
+               i.monthly_volume AS volume, i.fund_size AS scale,
+               CASE WHEN b.code IS NOT NULL THEN 1 ELSE 0 END AS is_business,
+               {select}
+        FROM etf_info i
+        LEFT JOIN (SELECT DISTINCT code FROM etf_business) b ON i.code = b.code
+        {join}
+        WHERE i.tracking_index_code IS NOT NULL AND i.tracking_index_code != ''
+    """
+    universe = pd.read_sql_query(query, conn)
+    universe['is_business'] = universe['is_business'].astype(bool)
+    return universe
+
+
+def simplify_fund_company_name(names):
+    """截取"基金"之前的部分作为公司简称"""
+    names = names.astype(object)
+    short = names.str.split('基金', n=1).str[0]
+    return short.where(names.notna() & (short != ''), names)
+
+
+def _pick(frame, by, ascending):
+    """每个指数按 by 排序后取第一只（稳定排序，与 idxmax 取第一个最大值一致，缺失值排在最后）"""
+    ordered = frame.sort_values(by, ascending=ascending, kind='stable', na_position='last')
+    return ordered.drop_duplicates('tracking_index_code').set_index('tracking_index_code')
+
+
+def grade_indexes(universe):
+    """
+    对全部跟踪指数分级
+
+    返回:
+        pandas.DataFrame: 每个跟踪指数一行，列为 RESULT_COLUMNS，已按分类排序
+    """
+    groups = universe.groupby('tracking_index_code', sort=True)
+    business_scale = universe['scale'].where(universe['is_business'], 0)
+    result = pd.DataFrame({
+        '跟踪指数名称': groups['tracking_index_name'].first(),
+        '跟踪ETF数量': groups.size(),
+        '商务品数量': groups['is_business'].sum(),
+        '商务品合计规模': business_scale.groupby(universe['tracking_index_code']).sum().round(1),
+        '合计规模': groups['scale'].sum().round(1),
+        '一级分类': groups['level1'].first(),
+        '二级分类': groups['level2'].first(),
+        '三级分类': groups['level3'].first(),
+    })
+
+    min_fee = groups['fee'].transform('min')
+    picks = {
+        'lowest_fee': _pick(universe[universe['fee'] == min_fee], 'volume', False),
+        'highest_volume': _pick(universe, 'volume', False),
+        'largest_scale': _pick(universe, 'scale', False),
+    }
+    flags = {}
+    for prefix, key in PICKS.items():
+        pick = picks[key].reindex(result.index)
+        result[prefix] = pick['name']
+        result[f'{prefix}代码'] = pick['code']
+        result[f'{prefix}公司'] = simplify_fund_company_name(pick['fund_manager'])
+        flags[key] = pick['is_business'].fillna(False).astype(bool).to_numpy()
+
+    volume, fee, scale = flags['highest_volume'], flags['lowest_fee'], flags['largest_scale']
+    result['跟踪指数分级'] = np.select(
+        [volume & fee & scale,
+         volume & fee & ~scale,
+         volume & scale & ~fee,
+         fee & scale & ~volume,
+         volume,
+         scale,
+         fee,
+         result['商务品数量'].to_numpy() > 0],
+        LEVELS[:8], default=LEVELS[8])
+
+    result = result.rename_axis('跟踪指数代码').reset_index()
+    return sort_by_category(add_category_totals(result))[RESULT_COLUMNS]
+
+
+def add_category_totals(result):
+    """二级、三级分类的合计规模（未分类的指数归入"未分类"）"""
+    result['二级分类'] = result['二级分类'].fillna('未分类')
+    result['三级分类'] = result['三级分类'].fillna('未分类')
+    result['二级分类合计'] = result.groupby('二级分类')['合计规模'].transform('sum').round(1)
+    result['三级分类合计'] = result.groupby('三级分类')['合计规模'].transform('sum').round(1)
+    return result
+
+
+def sort_by_category(result):
+    """一级分类按 CATEGORY_ORDER，其后二级、三级分类合计规模降序"""
+    order = {name: i for i, name in enumerate(CATEGORY_ORDER)}
+    sort_key = result['一级分类'].map(order).fillna(len(CATEGORY_ORDER))
+    return (result.assign(_sort_key=sort_key)
+            .sort_values(['_sort_key', '二级分类合计', '三级分类合计'], ascending=[True, False, False],
+                         kind='stable')
+            .drop(columns='_sort_key')
+            .reset_index(drop=True))
+
+
+def scale_quality_table(result):
+    """各规模分层下一级到九级指数的个数（含行列合计）"""
+    layers = pd.cut(result['合计规模'], bins=SCALE_BINS, labels=SCALE_LABELS, right=False)
+    table = pd.crosstab(layers, result['跟踪指数分级'])
+    table = table.reindex(index=SCALE_LABELS, columns=LEVELS, fill_value=0)
+    table['合计'] = table.sum(axis=1)
+    table.loc['合计'] = table.sum(axis=0)
+    return table.rename_axis(index='指数规模分层', columns='跟踪指数分级')
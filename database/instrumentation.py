@@ -0,0 +1,209 @@
+"""
+SQL执行计量
+
+通过 sqlite3 的 connection/cursor 子类统计每条语句的执行次数和耗时，
+按当前请求（contextvars）累计，供请求计时中间件输出 Server-Timing 和 /metrics。
+也可以注册语句监听器，在每条语句执行（查询语句为取完结果）后拿到 SQL、参数和耗时。
+"""
+
+import contextvars
+import sqlite3
+import time
+
+_current_stats = contextvars.ContextVar('request_stats', default=None)
+
+# 语句监听器：callable(connection, sql, params, elapsed_seconds)
+_listeners = []
+
+
+class RequestStats:
+    """单个请求内的SQL次数、SQL耗时及其他分段耗时"""
+
+    __slots__ = ('started', 'sql_count', 'sql_time', 'timings')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.timings = {}
+
+    def add_timing(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def start_request_stats():
+    """为当前上下文开始一份新的统计，返回 (stats, token)"""
+    stats = RequestStats()
+    return stats, _current_stats.set(stats)
+
+
+def stop_request_stats(token):
+    _current_stats.reset(token)
+
+
+def current_stats():
+    """当前请求的统计对象，不在请求中时返回 None"""
+    return _current_stats.get()
+
+
+def record_timing(name, seconds):
+    """给当前请求累计一段命名耗时（如 json 编码），不在请求中时忽略"""
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.add_timing(name, seconds)
+
+
+def add_query_listener(listener):
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def remove_query_listener(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def _record(connection, sql, params, elapsed, count=1):
+    _record_stats(elapsed, count)
+    _notify(connection, sql, params, elapsed)
+
+
+def _record_stats(elapsed, count=1):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.sql_count += count
+        stats.sql_time += elapsed
+
+
+def _notify(connection, sql, params, elapsed):
+    for listener in list(_listeners):
+        try:
+            listener(connection, sql, params, elapsed)
+        except Exception:
+            pass
+
+
+def _record_fetch(elapsed):
+    # 逐行取数同样在 SQLite 内部执行，只计入耗时不计入语句数
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.sql_time += elapsed
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    计时的游标，execute 与 fetch 的耗时都计入SQL时间
+
+    有语句监听器时，返回结果集的语句等结果取完（fetchall、fetchone 返回 None、fetchmany 不足一批）
+    或游标再次执行、关闭、释放时才通知监听器，耗时为 execute 加各次 fetch 的时间。
+    直接迭代游标（for row in cursor）逐行取数的时间不计入：为每行计时的开销比取数本身还大。
+    """
+
+    # 等待通知监听器的语句 [sql, params, 累计耗时]
+    _pending = None
+
+    def _flush(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            _notify(self.connection, *pending)
+
+    def _add_fetch(self, elapsed, exhausted):
+        _record_fetch(elapsed)
+        if self._pending is not None:
+            self._pending[2] += elapsed
+            if exhausted:
+                self._flush()
+
+    def execute(self, sql, parameters=()):
+        self._flush()
+        start = time.perf_counter()
+        done = False
+        try:
+            result = super().execute(sql, parameters)
+            done = True
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            _record_stats(elapsed)
+            if _listeners:
+                if done and self.description is not None:
+                    self._pending = [sql, parameters, elapsed]
+                else:
+                    _notify(self.connection, sql, parameters, elapsed)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._flush()
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record(self.connection, sql, None, time.perf_counter() - start)
+
+    def executescript(self, sql_script):
+        self._flush()
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            _record(self.connection, sql_script, None, time.perf_counter() - start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = None
+        try:
+            row = super().fetchone()
+            return row
+        finally:
+            self._add_fetch(time.perf_counter() - start, row is None)
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = []
+        try:
+            rows = super().fetchmany(size)
+            return rows
+        finally:
+            self._add_fetch(time.perf_counter() - start, len(rows) < size)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._add_fetch(time.perf_counter() - start, True)
+
+    def close(self):
+        self._flush()
+        return super().close()
+
+    def __del__(self):
+        try:
+            self._flush()
+        except Exception:
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """默认创建 InstrumentedCursor 的连接，connection.execute 快捷方式也走计时游标"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def connect(database, **kwargs):
+    """与 sqlite3.connect 相同，但返回带计量的连接"""
+    kwargs.setdefault('factory', InstrumentedConnection)
+    return sqlite3.connect(database, **kwargs)
@@ -12,20 +12,39 @@ from datetime import datetime, timedelta
 from utils.etf_code import normalize_etf_code
 from typing import List, Dict
 from services.index_service import get_index_intro  # 导入get_index_intro函数
-
-# 数据库路径
-DATABASE_PATH = os.path.join(os.path.dirname(
+from database.timeseries_store import get_store, append_history
+from database import company_analytics_history
+from database import price_metrics
+from database import row_diff
+from database.retention import attach_archive, history_source
+from database import dataset_versions, instrumentation, query_profiler
+
+# 数据库路径，可用 ETF_DATABASE_PATH 指向其他数据库（如基准测试生成的合成库）
+DATABASE_PATH = os.getenv('ETF_DATABASE_PATH') or os.path.join(os.path.dirname(
     os.path.dirname(__file__)), 'data/etf_data.db')
 
+# ETF_SQL_PROFILE=1 时记录慢查询及其查询计划
+query_profiler.enable_from_env()
+
+
+def _file_id(path):
+    """文件的 (设备, inode)，文件被 os.replace 替换后会变化"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_dev, stat.st_ino
+
 
 class Database:
     """
     数据库操作类
     """
 
-    def __init__(self):
-        """初始化数据库连接"""
-        self.db_file = DATABASE_PATH
+    def __init__(self, db_file=None):
+        """初始化数据库连接，db_file 默认为 DATABASE_PATH（分阶段构建时为暂存库，见 database/staging.py）"""
+        self.db_file = db_file or DATABASE_PATH
+        self._file_id = None
         os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
         self.conn = None
 
@@ -50,9 +69,12 @@ class Database:
             print(f"检查数据库表时出错: {str(e)}")
 
     def connect(self):
-        """创建数据库连接"""
+        """创建数据库连接；数据库文件被整体替换（发布新数据版本）后重新打开"""
+        if self.conn is not None and not self.conn.in_transaction and self._file_id != _file_id(self.db_file):
+            self.close()
         if self.conn is None:
-            self.conn = sqlite3.connect(self.db_file)
+            self.conn = instrumentation.connect(self.db_file)
+            self._file_id = _file_id(self.db_file)
         return self.conn
 
     def close(self):
@@ -61,6 +83,37 @@ class Database:
             self.conn.close()
             self.conn = None
 
+    def _register_versions(self, *datasets):
+        """写入提交后登记数据集版本（见 database/dataset_versions.py），登记失败不影响写入结果"""
+        try:
+            dataset_versions.refresh(self.connect(), datasets)
+        except Exception as e:
+            print(f"登记数据集版本失败: {str(e)}")
+
+    def dataset_version(self, name):
+        """
+        数据集的登记版本（最新日期、前一个数据日期等，见 database/dataset_versions.py），表不存在时返回 None
+
+        正式库读取进程内缓存；暂存库等其他库直接查询登记表。
+        """
+        if self.db_file == DATABASE_PATH:
+            return dataset_versions.registry.get(name)
+        return dataset_versions.lookup(self.connect(), name)
+
+    def _timeseries_store(self, dataset, code):
+        """
+        可以读取 code 历史的时间序列存储，不可用时返回 None
+
+        只用于正式库，且存储须与正式库的登记版本一致（见 TimeSeriesStore.is_current），
+        否则回退查询数据库。
+        """
+        if self.db_file != DATABASE_PATH:
+            return None
+        store = get_store()
+        if store.is_current(dataset, dataset_versions.registry.get(dataset)) and store.has_code(dataset, code):
+            return store
+        return None
+
     def execute_query(self, query, params=None):
         """执行SQL查询"""
         try:
@@ -78,7 +131,19 @@ class Database:
             return []
 
     def get_etf_price_recommendations(self):
-        """获取ETF价格推荐数据"""
+        """获取ETF价格推荐数据（最新交易日涨幅前10），价格面板指标表为空时按基金规模取前10"""
+        ranking = self.get_price_metric_ranking('return_1d', limit=10)
+        if ranking:
+            return [
+                {
+                    'code': row['code'],
+                    'name': row['name'],
+                    'price_change_rate': round(row['return_1d'], 2),
+                    'amount': float(row['amount']) if row['amount'] else 0,
+                    'turnover_rate': float(row['turnover_rate']) if row['turnover_rate'] else 0.0
+                }
+                for row in ranking
+            ]
         try:
             query = """
             SELECT i.code, i.name, i.fund_size, i.total_holder_count
@@ -151,31 +216,19 @@ class Database:
     def get_etf_favorites_recommendations(self):
         """获取ETF加自选排行榜数据"""
         try:
-            # 查询最新日期
-            date_query = """
-            SELECT MAX(date) FROM etf_attention_history
-            """
-            latest_date_result = self.execute_query(date_query)
-            if not latest_date_result or not latest_date_result[0][0]:
+            # 最新日期和前一天日期取自数据集版本登记
+            attention = self.dataset_version('attention')
+            if attention is None or not attention.latest_date:
                 print("未找到最新日期")
                 return []
 
-            latest_date = latest_date_result[0][0]
-
-            # 查询前一天日期
-            prev_date_query = """
-            SELECT DISTINCT date FROM etf_attention_history
-            WHERE date < ?
-            ORDER BY date DESC
-            LIMIT 1
-            """
-            prev_date_result = self.execute_query(
-                prev_date_query, (latest_date,))
-            if not prev_date_result or not prev_date_result[0][0]:
+            latest_date = attention.latest_date
+            prev_date = attention.previous_date
+            if not prev_date:
                 print("未找到前一天日期")
                 return []
-
-            prev_date = prev_date_result[0][0]
+            price = self.dataset_version('price')
+            latest_price_date = price.latest_date if price else None
 
             print(f"计算自选日变化数据：最新日期={latest_date}，前一天日期={prev_date}")
 
@@ -225,10 +278,10 @@ class Database:
                     price_query = """
                     SELECT change_rate
                     FROM etf_price
-                    WHERE code = ? AND date = (SELECT MAX(date) FROM etf_price)
+                    WHERE code = ? AND date = ?
                     LIMIT 1
                     """
-                    price_result = self.execute_query(price_query, (row[0],))
+                    price_result = self.execute_query(price_query, (row[0], latest_price_date))
                     if price_result and price_result[0] and price_result[0][0] is not None:
                         item['price_change_rate'] = float(price_result[0][0])
                     else:
@@ -567,22 +620,14 @@ class Database:
 
             df_info = df_info.set_index('company_name')
 
-            # 2. 获取各项数据的最新日期
-            def get_latest_data_date(table_name, date_column='date'):
-                try:
-                    query = f"SELECT MAX({date_column}) FROM {table_name}"
-                    cursor = conn.cursor()
-                    cursor.execute(query)
-                    latest_date = cursor.fetchone()[0]
-                    cursor.close()
-                    return latest_date
-                except Exception as e:
-                    print(f"获取表 {table_name} 的最新日期失败: {e}")
-                    return None
+            # 2. 获取各项数据的最新日期（数据集版本登记，见 database/dataset_versions.py）
+            def get_latest_data_date(dataset):
+                entry = self.dataset_version(dataset)
+                return entry.latest_date if entry else None
 
-            latest_price_date = get_latest_data_date('etf_price')
-            latest_attention_date = get_latest_data_date('etf_attention')
-            latest_holders_date = get_latest_data_date('etf_holders')
+            latest_price_date = get_latest_data_date('price')
+            latest_attention_date = get_latest_data_date('attention')
+            latest_holders_date = get_latest_data_date('holders')
 
             print(
                 f"最新价格日期: {latest_price_date}, 最新关注日期: {latest_attention_date}, 最新持有人日期: {latest_holders_date}")
@@ -1651,6 +1696,7 @@ class Database:
             # 重置索引，使 company_name 成为一列
             all_company_data = all_company_data.reset_index()
 
+            self._register_versions('company_analytics')
             return True
 
         except sqlite3.Error as e:
@@ -2008,6 +2054,9 @@ class Database:
             # 删除现有表并重新创建
             conn = self.connect()
             cursor = conn.cursor()
+            # 原有的基金管理人归属，变化后需重建基金公司日汇总
+            old_managers = dict(cursor.execute("SELECT code, fund_manager FROM etf_info").fetchall()) \
+                if self._table_exists('etf_info') else {}
             cursor.execute("DROP TABLE IF EXISTS etf_info")
             cursor.execute("""
                 CREATE TABLE etf_info (
@@ -2047,6 +2096,11 @@ class Database:
             conn.commit()
 
             print(f"\n成功保存ETF基本信息，共{len(final_df)}条记录")
+            new_managers = dict(cursor.execute("SELECT code, fund_manager FROM etf_info").fetchall())
+            if new_managers != old_managers and self._table_exists('company_daily_metrics_state'):
+                print("基金管理人归属发生变化，重建基金公司日汇总")
+                self.refresh_company_daily_metrics(full=True)
+            self._register_versions('info')
             return True
 
         except Exception as e:
@@ -2057,14 +2111,84 @@ class Database:
                 self.conn.rollback()
             return False
 
+    # ETF价格表字段（不含主键 code/date）。etf_price 保存最新交易日，etf_price_history 保存全部历史；
+    # 新增字段在这里登记，migrate_etf_price_tables 会为已有表补齐
+    ETF_PRICE_COLUMNS = {
+        'change_rate': 'REAL',
+        'turnover_rate': 'REAL',
+        'amount': 'REAL',
+        'transaction_count': 'REAL',
+        'total_market_value': 'REAL',
+        'close_price': 'REAL',
+        'open_price': 'REAL',
+        'high_price': 'REAL',
+        'low_price': 'REAL',
+        'amplitude': 'REAL',
+        'premium_discount': 'REAL',
+        'premium_discount_rate': 'REAL',
+        'update_time': 'TIMESTAMP',
+    }
+
+    def migrate_etf_price_tables(self, conn):
+        """
+        价格表结构迁移：建表、补齐 ETF_PRICE_COLUMNS 中缺少的列，并确保 (code, date) 有唯一约束
+
+        旧版本每次导入都重建表，表中可能只有部分列；其他脚本用 to_sql 建的表可能没有唯一约束，
+        这种情况下先按 (code, date) 去重（保留最后写入的一行）再建唯一索引。
+        """
+        cursor = conn.cursor()
+        columns_sql = ', '.join(f"{c} {t}" for c, t in self.ETF_PRICE_COLUMNS.items())
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS etf_price (
+                code TEXT NOT NULL, date TEXT NOT NULL, {columns_sql},
+                PRIMARY KEY (code, date)
+            )
+        """)
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS etf_price_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                code TEXT NOT NULL, date TEXT NOT NULL, {columns_sql},
+                UNIQUE(code, date)
+            )
+        """)
+
+        for table in ('etf_price', 'etf_price_history'):
+            cursor.execute(f"PRAGMA table_info({table})")
+            existing = {row[1] for row in cursor.fetchall()}
+            for column, column_type in self.ETF_PRICE_COLUMNS.items():
+                if column not in existing:
+                    print(f"迁移 {table}: 添加字段 {column} {column_type}")
+                    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+            cursor.execute(f"PRAGMA index_list({table})")
+            unique_indexes = [row[1] for row in cursor.fetchall() if row[2]]
+            has_unique = False
+            for index_name in unique_indexes:
+                cursor.execute(f"PRAGMA index_info('{index_name}')")
+                if sorted(row[2] for row in cursor.fetchall()) == ['code', 'date']:
+                    has_unique = True
+                    break
+            if not has_unique:
+                print(f"迁移 {table}: 去重并添加 (code, date) 唯一索引")
+                cursor.execute(f"""
+                    DELETE FROM {table} WHERE rowid NOT IN (
+                        SELECT MAX(rowid) FROM {table} GROUP BY code, date
+                    )
+                """)
+                cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_code_date ON {table} (code, date)")
+        cursor.close()
+
     def save_etf_price(self, df: pd.DataFrame) -> bool:
-        """保存ETF价格数据"""
+        """
+        保存ETF价格数据
+
+        当天数据按 (code, date) upsert 到 etf_price_history，历史只追加不清空；
+        etf_price 只保留最新交易日：写入的日期不早于表中最新日期时，删除更早的行并 upsert 当天数据。
+        输入中只更新实际提供的列，未登记在 ETF_PRICE_COLUMNS 中的列会被忽略。
+        """
         try:
             print("开始处理ETF价格数据...")
 
-            # 导入normalize_etf_code函数用于标准化ETF代码
-            from utils.etf_code import normalize_etf_code
-
             # 显示原始数据信息
             print("原始列名：", df.columns.tolist())
             print("原始数据形状：", df.shape)
@@ -2079,6 +2203,8 @@ class Database:
                 current_date = datetime.now().strftime('%Y-%m-%d')
                 df['date'] = current_date
                 print(f"未发现日期字段，使用当前日期：{current_date}")
+            elif pd.api.types.is_datetime64_any_dtype(df['date']):
+                df['date'] = df['date'].dt.strftime('%Y-%m-%d')
 
             if 'update_time' not in df.columns:
                 current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -2087,20 +2213,18 @@ class Database:
 
             # 转换数据类型 - 对所有可能的数值列进行处理
             numeric_columns = [
-                'change_rate', 'turnover_rate', 'amount', 'transaction_count', 'total_market_value',
-                'close_price', 'open_price', 'high_price', 'low_price', 'amplitude',
-                'premium_discount', 'premium_discount_rate'
-            ]
-
-            # 仅处理存在的列
-            numeric_columns = [
-                col for col in numeric_columns if col in df.columns]
+                col for col, col_type in self.ETF_PRICE_COLUMNS.items()
+                if col_type == 'REAL' and col in df.columns]
+            ignored = [col for col in df.columns
+                       if col not in self.ETF_PRICE_COLUMNS and col not in ('code', 'date')]
+            if ignored:
+                print(f"以下列不在价格表结构中，已忽略（如需保存请在 ETF_PRICE_COLUMNS 中登记）: {ignored}")
 
             # 转换数值类型
             for col in numeric_columns:
                 try:
                     # 如果列是字符串类型，尝试清理和转换
-                    if df[col].dtype == 'object':
+                    if not pd.api.types.is_numeric_dtype(df[col]):
                         # 移除非数字字符（如%、,等）
                         df[col] = df[col].astype(str).str.replace(
                             '%', '').str.replace(',', '').str.strip()
@@ -2110,65 +2234,51 @@ class Database:
                     print(f"转换列 {col} 时出错: {str(e)}")
                     df[col] = 0.0  # 转换失败时设为默认值
 
+            save_columns = ['code', 'date'] + numeric_columns + ['update_time']
+            save_df = df[save_columns].dropna(subset=['code', 'date'])
+            save_df = save_df.drop_duplicates(subset=['code', 'date'], keep='last')
+            print(f"保存到数据库的列: {save_columns}")
+
+            # NaN 写为 NULL
+            rows = list(save_df.astype(object).where(save_df.notna(), None).itertuples(index=False, name=None))
+            placeholders = ', '.join('?' for _ in save_columns)
+            update_exprs = ', '.join(f"{c} = excluded.{c}" for c in save_columns[2:])
+
+            def _upsert_sql(table):
+                return f"""
+                    INSERT INTO {table} ({', '.join(save_columns)}) VALUES ({placeholders})
+                    ON CONFLICT(code, date) DO UPDATE SET {update_exprs}
+                """
+
             # 保存到数据库
             conn = self.connect()
             try:
-                # 创建或替换现有表
+                self.migrate_etf_price_tables(conn)
                 cursor = conn.cursor()
-                cursor.execute("DROP TABLE IF EXISTS etf_price")
-
-                # 动态创建表字段列表
-                fields = ["code TEXT", "date TEXT"]
-                for col in numeric_columns:
-                    fields.append(f"{col} REAL")
-                fields.append("update_time TIMESTAMP")
-                fields.append("PRIMARY KEY (code, date)")
-
-                # 创建表
-                create_table_sql = f"CREATE TABLE etf_price ({', '.join(fields)})"
-                print(f"创建表SQL: {create_table_sql}")
-                cursor.execute(create_table_sql)
-
-                # 同时删除并重新创建历史表，确保结构一致
-                cursor.execute("DROP TABLE IF EXISTS etf_price_history")
-
-                # 创建历史表，结构与主表相同，但主键改为ID
-                history_fields = [
-                    "id INTEGER PRIMARY KEY AUTOINCREMENT", "code TEXT", "date TEXT"]
-                for col in numeric_columns:
-                    history_fields.append(f"{col} REAL")
-                history_fields.append("update_time TIMESTAMP")
-                history_fields.append("UNIQUE(code, date)")
-
-                create_history_sql = f"CREATE TABLE etf_price_history ({', '.join(history_fields)})"
-                print(f"创建历史表SQL: {create_history_sql}")
-                cursor.execute(create_history_sql)
-
-                # 选择要保存的列 - 只保存表中定义的列
-                save_columns = ['code', 'date'] + \
-                    numeric_columns + ['update_time']
-                # 确保所有列都存在于DataFrame中
-                for col in save_columns:
-                    if col not in df.columns:
-                        print(f"添加缺失的列 {col}")
-                        df[col] = None
-
-                # 只保存定义的列
-                save_df = df[save_columns].copy()
-                print(f"保存到数据库的列: {save_df.columns.tolist()}")
-                print(f"保存的数据样本:\n{save_df.head(2)}")
-
-                # 保存数据到主表
-                save_df.to_sql('etf_price', conn,
-                               if_exists='append', index=False)
-
-                # 保存数据到历史表 - 使用与主表相同的列
-                save_df.to_sql('etf_price_history', conn,
-                               if_exists='append', index=False)
+
+                # 历史表：只追加/更新本批数据
+                cursor.executemany(_upsert_sql('etf_price_history'), rows)
+
+                # 最新表：本批最新日期不早于表中已有最新日期时才更新
+                batch_latest = save_df['date'].max() if not save_df.empty else None
+                cursor.execute("SELECT MAX(date) FROM etf_price")
+                current_latest = cursor.fetchone()[0]
+                latest_count = 0
+                if batch_latest is not None and (current_latest is None or batch_latest >= current_latest):
+                    cursor.execute("DELETE FROM etf_price WHERE date < ?", (batch_latest,))
+                    latest_rows = [row for row in rows if row[1] == batch_latest]
+                    cursor.executemany(_upsert_sql('etf_price'), latest_rows)
+                    latest_count = len(latest_rows)
+                else:
+                    print(f"本批数据日期 {batch_latest} 早于最新价格日期 {current_latest}，只写入历史表")
 
                 conn.commit()
-                print(f"成功保存ETF价格数据，共{len(df)}条记录")
-                print(f"同时保存了{len(df)}条价格历史记录到etf_price_history表")
+                print(f"成功保存ETF价格数据，最新价格表写入{latest_count}条记录")
+                print(f"同时保存了{len(rows)}条价格历史记录到etf_price_history表")
+                # 从本批最早日期起重算面板指标；失败不影响价格数据的保存结果
+                if batch_latest is not None:
+                    self.update_price_metrics(start=save_df['date'].min())
+                self._register_versions('price', 'price_metrics')
                 return True
             except Exception as e:
                 print(f"保存ETF价格数据失败: {str(e)}")
@@ -2182,6 +2292,59 @@ class Database:
             traceback.print_exc()
             return False
 
+    def update_price_metrics(self, start: str = None, full: bool = False) -> bool:
+        """
+        更新价格面板指标表 price_metrics
+
+        默认从表中已有的最后日期起重算（表为空时全量计算），指定 start 时从该日期起重算，
+        full=True 时重算全部日期。
+        """
+        try:
+            conn = self.connect()
+            if start is None and not full and self._table_exists(price_metrics.METRICS_TABLE):
+                result = self.execute_query(f"SELECT MAX(date) FROM {price_metrics.METRICS_TABLE}")
+                start = result[0][0] if result else None
+            if full:
+                start = None
+
+            frame = price_metrics.compute_price_metrics(conn, start=start)
+            count = price_metrics.write_metrics(conn, frame)
+            print(f"价格面板指标更新完成: {frame['date'].nunique()} 个日期, {count} 条记录")
+            self._register_versions('price_metrics')
+            return True
+        except Exception as e:
+            print(f"更新价格面板指标失败: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+    def get_price_metric_ranking(self, metric: str = 'return_1d', limit: int = 10,
+                                 ascending: bool = False, date: str = None) -> List[Dict]:
+        """
+        按面板指标排序，返回指定日期（默认最新日期）的前 limit 只ETF
+
+        metric 须为 price_metrics.METRICS_COLUMNS 中的列；指标表不存在时返回空列表。
+        """
+        if metric not in price_metrics.METRICS_COLUMNS:
+            raise ValueError(f"不支持的指标: {metric}")
+        try:
+            if not self._table_exists(price_metrics.METRICS_TABLE):
+                return []
+            query = f"""
+                SELECT m.*, i.name
+                FROM {price_metrics.METRICS_TABLE} m
+                LEFT JOIN etf_info i ON m.code = i.code
+                WHERE m.date = COALESCE(?, (SELECT MAX(date) FROM {price_metrics.METRICS_TABLE}))
+                  AND m.{metric} IS NOT NULL
+                ORDER BY m.{metric} {'ASC' if ascending else 'DESC'}
+                LIMIT ?
+            """
+            df = pd.read_sql_query(query, self.connect(), params=(date, limit))
+            return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+        except Exception as e:
+            print(f"获取价格指标排行失败: {str(e)}")
+            return []
+
     def save_etf_attention(self, df: pd.DataFrame) -> bool:
         """保存ETF自选数据"""
         try:
@@ -2282,6 +2445,13 @@ class Database:
 
             print(f"成功保存ETF自选数据，共{len(df)}条记录")
             print(f"同时保存了{len(df)}条历史记录到etf_attention_history表")
+
+            # 增量写入时间序列存储
+            append_history('attention', df, conn)
+
+            # 增量更新基金公司日汇总
+            self.refresh_company_daily_metrics(start=df['date'].min(), source='attention')
+            self._register_versions('attention')
             return True
 
         except Exception as e:
@@ -2413,6 +2583,13 @@ class Database:
 
             print(f"成功保存ETF持有人数据，共{len(df)}条记录")
             print(f"同时保存了{len(df)}条历史记录到etf_holders_history表")
+
+            # 增量写入时间序列存储
+            append_history('holders', df, conn)
+
+            # 增量更新基金公司日汇总
+            self.refresh_company_daily_metrics(start=df['date'].min(), source='holders')
+            self._register_versions('holders')
             return True
 
         except Exception as e:
@@ -2424,6 +2601,100 @@ class Database:
                     pass
             return False
 
+    # 增量保存的数据集：名称 -> (最新表, 历史表, 值列, 全量保存方法)
+    INCREMENTAL_HISTORY = {
+        'attention': ('etf_attention', 'etf_attention_history', ['attention_count'], 'save_etf_attention'),
+        'holders': ('etf_holders', 'etf_holders_history',
+                    ['holder_count', 'holding_amount', 'holding_value'], 'save_etf_holders'),
+    }
+
+    def apply_history_changes(self, dataset: str, df: pd.DataFrame) -> int:
+        """
+        增量保存自选/持有人数据：只写入与库中同日期记录不同的行（见 database/row_diff.py）
+
+        历史表按 (code, date) upsert；本批日期晚于最新表日期时，用历史表中该日期的全部行替换最新表，
+        与最新表日期相同时只 upsert 变化的行，更早的日期只写历史表。文件中缺少的行不会被删除。
+        表尚未创建时退回全量保存。
+
+        返回:
+            int: 写入的行数
+        """
+        latest_table, history_table, value_columns, full_save = self.INCREMENTAL_HISTORY[dataset]
+        if not (self._table_exists(latest_table) and self._table_exists(history_table)):
+            if not getattr(self, full_save)(df):
+                raise RuntimeError(f"{dataset} 全量保存失败")
+            return len(df)
+
+        frame = df.copy()
+        frame['code'] = frame['code'].astype(str).str.strip().str.extract(r'(\d{6})', expand=False)
+        frame = frame.dropna(subset=['code']).drop_duplicates(subset=['code', 'date'], keep='last')
+        for col in value_columns:
+            if col not in frame.columns:
+                frame[col] = 0
+            frame[col] = pd.to_numeric(frame[col], errors='coerce').fillna(0)
+        frame['update_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        columns = ['code'] + value_columns + ['date', 'update_time']
+
+        conn = self.connect()
+        changed = row_diff.changed_rows(conn, history_table, frame[columns], value_columns)
+        if changed.empty:
+            print(f"{dataset} 数据与库中一致，无需写入")
+            return 0
+
+        rows = list(changed.astype(object).where(changed.notna(), None).itertuples(index=False, name=None))
+        placeholders = ', '.join('?' for _ in columns)
+        updates = ', '.join(f"{c} = excluded.{c}" for c in columns if c not in ('code', 'date'))
+        try:
+            conn.executemany(f"""
+                INSERT INTO {history_table} ({', '.join(columns)}) VALUES ({placeholders})
+                ON CONFLICT(code, date) DO UPDATE SET {updates}
+            """, rows)
+
+            batch_earliest, batch_latest = changed['date'].min(), changed['date'].max()
+            current_latest = conn.execute(f"SELECT MAX(date) FROM {latest_table}").fetchone()[0]
+            if current_latest is None or batch_latest > current_latest:
+                conn.execute(f"DELETE FROM {latest_table}")
+                conn.execute(f"""
+                    INSERT INTO {latest_table} ({', '.join(columns)})
+                    SELECT {', '.join(columns)} FROM {history_table} WHERE date = ?
+                """, (batch_latest,))
+            elif batch_latest == current_latest:
+                latest_rows = [row for row in rows if row[columns.index('date')] == batch_latest]
+                conn.executemany(f"""
+                    INSERT INTO {latest_table} ({', '.join(columns)}) VALUES ({placeholders})
+                    ON CONFLICT(code) DO UPDATE SET {updates}
+                """, latest_rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        print(f"{dataset} 增量写入 {len(changed)} 条记录（共 {len(frame)} 条）")
+        append_history(dataset, changed, conn)
+        self.refresh_company_daily_metrics(start=batch_earliest, source=dataset)
+        self._register_versions(dataset)
+        return len(changed)
+
+    def apply_price_changes(self, df: pd.DataFrame) -> int:
+        """
+        增量保存价格数据：只把与 etf_price_history 中同日期记录不同的行交给 save_etf_price
+
+        返回:
+            int: 写入的行数
+        """
+        value_columns = [col for col, col_type in self.ETF_PRICE_COLUMNS.items()
+                         if col_type == 'REAL' and col in df.columns]
+        if self._table_exists('etf_price_history') and value_columns:
+            changed = row_diff.changed_rows(self.connect(), 'etf_price_history', df, value_columns)
+        else:
+            changed = df
+        if changed.empty:
+            print("价格数据与库中一致，无需写入")
+            return 0
+        if not self.save_etf_price(changed.copy()):
+            raise RuntimeError("价格数据保存失败")
+        return len(changed)
+
     def save_etf_index_classification(self, df: pd.DataFrame) -> bool:
         """保存ETF指数分类数据"""
         try:
@@ -2463,6 +2734,7 @@ class Database:
                 df.to_sql('etf_index_classification', conn,
                           if_exists='replace', index=False)
                 print(f"成功保存ETF指数分类数据，共{len(df)}条记录")
+                self._register_versions('classification')
                 return True
             except Exception as e:
                 print(f"保存ETF指数分类数据失败: {str(e)}")
@@ -2539,6 +2811,7 @@ class Database:
             cursor.close()  # 只关闭游标，不关闭连接
 
             print(f"成功保存ETF商务协议数据，共{len(df)}条记录")
+            self._register_versions('business')
             return True
 
         except Exception as e:
@@ -3456,23 +3729,30 @@ class Database:
             print(f"获取指定指数代码的ETF时出错: {str(e)}")
             return []
 
-    def get_etf_attention_history(self, etf_code):
-        """获取ETF自选人数历史数据"""
+    def get_etf_attention_history(self, etf_code, start=None, end=None):
+        """获取ETF自选人数历史数据，可选按日期范围（含端点）过滤"""
         try:
             # 标准化ETF代码
             etf_code = normalize_etf_code(etf_code)
 
+            # 优先从时间序列存储读取
+            store = self._timeseries_store('attention', etf_code)
+            if store is not None:
+                return store.get_history('attention', etf_code, start=start, end=end)
+
             # 连接数据库
             conn = self.connect()
             cursor = conn.cursor()
 
             # 查询指定ETF的历史自选人数
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT date, attention_count
-                FROM etf_attention_history
+                FROM {history_source(conn, 'etf_attention_history', start)}
                 WHERE code LIKE ?
+                  AND (? IS NULL OR date >= ?)
+                  AND (? IS NULL OR date <= ?)
                 ORDER BY date
-            """, (f"%{etf_code}%",))
+            """, (f"%{etf_code}%", start, start, end, end))
 
             history = cursor.fetchall()
 
@@ -3488,23 +3768,30 @@ class Database:
             traceback.print_exc()
             return []
 
-    def get_etf_holders_history(self, etf_code):
-        """获取ETF持有人历史数据"""
+    def get_etf_holders_history(self, etf_code, start=None, end=None):
+        """获取ETF持有人历史数据，可选按日期范围（含端点）过滤"""
         try:
             # 标准化ETF代码
             etf_code = normalize_etf_code(etf_code)
 
+            # 优先从时间序列存储读取
+            store = self._timeseries_store('holders', etf_code)
+            if store is not None:
+                return store.get_history('holders', etf_code, start=start, end=end)
+
             # 连接数据库
             conn = self.connect()
             cursor = conn.cursor()
 
             # 查询指定ETF的历史持有人数据
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT date, holder_count, holding_amount, holding_value
-                FROM etf_holders_history
+                FROM {history_source(conn, 'etf_holders_history', start)}
                 WHERE code LIKE ?
+                  AND (? IS NULL OR date >= ?)
+                  AND (? IS NULL OR date <= ?)
                 ORDER BY date
-            """, (f"%{etf_code}%",))
+            """, (f"%{etf_code}%", start, start, end, end))
 
             history = cursor.fetchall()
 
@@ -3527,6 +3814,21 @@ class Database:
             traceback.print_exc()
             return []
 
+    def get_etf_fund_size_history(self, etf_code):
+        """获取ETF规模历史数据"""
+        try:
+            # 标准化ETF代码
+            etf_code = normalize_etf_code(etf_code)
+
+            # 优先从时间序列存储读取
+            store = self._timeseries_store('fund_size', etf_code)
+            if store is not None:
+                return store.get_history('fund_size', etf_code)
+
+            # 连接数据库
+            conn = self.connect()
+            cursor = conn.cursor()
+
             # 如果存在历史规模表，查询历史规模数据
             cursor.execute("""
                 SELECT count(*)
@@ -3535,9 +3837,9 @@ class Database:
             """)
 
             if cursor.fetchone()[0] > 0:
-                cursor.execute("""
+                cursor.execute(f"""
                     SELECT date, fund_size
-                    FROM etf_fund_size_history
+                    FROM {history_source(conn, 'etf_fund_size_history')}
                     WHERE code LIKE ?
                     ORDER BY date
                 """, (f"%{etf_code}%",))
@@ -3602,23 +3904,206 @@ class Database:
             print(f"获取ETF最新自选数据出错: {str(e)}")
             return 0
 
-    def get_fund_company_attention_history(self, company_name: str) -> List[Dict]:
-        """获取基金公司自选历史汇总数据"""
+    # 公司日汇总表的来源定义：来源历史表 -> 汇总列表达式
+    COMPANY_DAILY_SOURCES = {
+        'attention': {
+            'table': 'etf_attention_history',
+            'columns': {
+                'total_attention_count': 'SUM(h.attention_count)',
+            },
+        },
+        'holders': {
+            'table': 'etf_holders_history',
+            'columns': {
+                'total_holder_count': 'SUM(h.holder_count)',
+                'total_holding_value': 'SUM(h.holding_value)',
+                'total_holding_amount': 'SUM(h.holding_amount)',
+            },
+        },
+    }
+
+    def create_company_daily_metrics_table(self, conn):
+        """创建基金公司日汇总表及其增量水位表"""
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS company_daily_metrics (
+                company_id TEXT NOT NULL,  -- 基金管理人全称（etf_info.fund_manager）
+                date TEXT NOT NULL,
+                total_attention_count INTEGER,
+                total_holder_count INTEGER,
+                total_holding_value REAL,
+                total_holding_amount REAL,
+                PRIMARY KEY (company_id, date)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS company_daily_metrics_state (
+                source TEXT PRIMARY KEY,
+                last_date TEXT,
+                update_time TIMESTAMP
+            )
+        """)
+        conn.commit()
+        cursor.close()
+
+    def refresh_company_daily_metrics(self, full: bool = False, start: str = None, source: str = None) -> bool:
+        """
+        增量更新基金公司日汇总表 company_daily_metrics
+
+        每个来源表记录已汇总的最后日期，只重新汇总该日期及之后的数据
+        （最后一天也重算，以覆盖同日重复导入）。写入方传入本批数据的最早日期 start，
+        早于已汇总的最后日期时（回补历史）从 start 起重算；source 指定 start 只对哪个来源
+        （attention / holders）生效，默认所有来源。full=True 时清空重建，
+        用于 etf_info 中基金管理人归属发生变化后（见 save_etf_info）。
+        """
         try:
-            # 使用 LIKE 匹配基金公司名称
-            # 这将汇总所有基金管理人名称包含所提供 company_name 字符串的ETF的自选数据
-            query = """
-            SELECT
-                eah.date,
-                SUM(eah.attention_count) as total_attention_count
-            FROM etf_attention_history eah
-            JOIN etf_info ei ON eah.code = ei.code
-            WHERE ei.fund_manager LIKE ?
-            GROUP BY eah.date
-            ORDER BY eah.date ASC;
-            """
-            params = (f'%{company_name}%',)
-            result = self.execute_query(query, params)
+            conn = self.connect()
+            self.create_company_daily_metrics_table(conn)
+            # 在开始写入前挂载归档库，全量重建和回补较早日期时读主库与归档库的联合视图
+            attach_archive(conn)
+            cursor = conn.cursor()
+            if full:
+                cursor.execute("DELETE FROM company_daily_metrics")
+                cursor.execute("DELETE FROM company_daily_metrics_state")
+
+            for name, spec in self.COMPANY_DAILY_SOURCES.items():
+                cursor.execute(
+                    "SELECT name FROM sqlite_master WHERE type='table' AND name=?", (spec['table'],))
+                if cursor.fetchone() is None:
+                    continue
+
+                cursor.execute(
+                    "SELECT last_date FROM company_daily_metrics_state WHERE source = ?", (name,))
+                row = cursor.fetchone()
+                last_date = row[0] if row else None
+                if start is not None and last_date is not None and source in (None, name):
+                    last_date = min(str(start)[:10], last_date)
+
+                columns = list(spec['columns'])
+                select_exprs = ', '.join(spec['columns'][c] for c in columns)
+                update_exprs = ', '.join(f"{c} = excluded.{c}" for c in columns)
+                cursor.execute(f"""
+                    INSERT INTO company_daily_metrics (company_id, date, {', '.join(columns)})
+                    SELECT i.fund_manager, h.date, {select_exprs}
+                    FROM {history_source(conn, spec['table'], last_date)} h
+                    JOIN etf_info i ON h.code = i.code
+                    WHERE i.fund_manager IS NOT NULL AND i.fund_manager != ''
+                      AND (? IS NULL OR h.date >= ?)
+                    GROUP BY i.fund_manager, h.date
+                    ON CONFLICT(company_id, date) DO UPDATE SET {update_exprs}
+                """, (last_date, last_date))
+                updated = cursor.rowcount
+
+                cursor.execute(f"SELECT MAX(date) FROM {spec['table']}")
+                new_last_date = cursor.fetchone()[0]
+                cursor.execute("""
+                    INSERT INTO company_daily_metrics_state (source, last_date, update_time)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(source) DO UPDATE SET last_date = excluded.last_date,
+                                                      update_time = excluded.update_time
+                """, (name, new_last_date, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+                print(f"基金公司日汇总 {name}: 从 {last_date or '最早日期'} 起更新 {updated} 行，最新日期 {new_last_date}")
+
+            conn.commit()
+            cursor.close()
+            return True
+        except Exception as e:
+            print(f"更新基金公司日汇总表失败: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            if self.conn:
+                self.conn.rollback()
+            return False
+
+    def resolve_company_ids(self, company_name: str) -> List[str]:
+        """
+        将页面传入的基金公司名称解析为 company_daily_metrics 的公司键
+
+        优先精确匹配管理人全称或简称，找不到时再按包含关系匹配（与原 LIKE 查询语义一致）。
+        """
+        rows = self.execute_query("""
+            SELECT DISTINCT fund_manager FROM etf_info
+            WHERE fund_manager = ? OR manager_short = ?
+        """, (company_name, company_name))
+        if not rows:
+            rows = self.execute_query("""
+                SELECT DISTINCT fund_manager FROM etf_info
+                WHERE fund_manager LIKE ?
+            """, (f'%{company_name}%',))
+        return [row[0] for row in rows if row[0]]
+
+    def company_daily_metrics_ready(self, source=None):
+        """基金公司日汇总表是否已为 source（默认全部来源）建立"""
+        if not self._table_exists('company_daily_metrics_state'):
+            return False
+        built = {row[0] for row in self.execute_query("SELECT source FROM company_daily_metrics_state")}
+        return set([source] if source else self.COMPANY_DAILY_SOURCES) <= built
+
+    def _get_company_daily_metrics(self, company_name, columns, start=None, end=None):
+        """
+        按公司键从日汇总表读取指定列，多个公司键时按日期求和
+
+        日汇总表由写库方维护（导入时增量更新，旧库在启动预热时构建，见
+        scheduler_service.build_company_daily_metrics），读请求不写库；
+        尚未建立时直接从历史表按日聚合。
+        """
+        company_ids = self.resolve_company_ids(company_name)
+        if not company_ids:
+            return []
+
+        source = next(name for name, spec in self.COMPANY_DAILY_SOURCES.items() if columns[0] in spec['columns'])
+        if not self.company_daily_metrics_ready(source):
+            return self._aggregate_company_daily_metrics(source, company_ids, columns, start, end)
+
+        placeholders = ', '.join('?' for _ in company_ids)
+        if len(company_ids) == 1:
+            select_exprs = ', '.join(columns)
+            group_by = ''
+        else:
+            select_exprs = ', '.join(f"SUM({c})" for c in columns)
+            group_by = 'GROUP BY date'
+        query = f"""
+            SELECT date, {select_exprs}
+            FROM company_daily_metrics
+            WHERE company_id IN ({placeholders})
+              AND (? IS NULL OR date >= ?)
+              AND (? IS NULL OR date <= ?)
+              AND {columns[0]} IS NOT NULL
+            {group_by}
+            ORDER BY date ASC
+        """
+        return self.execute_query(query, (*company_ids, start, start, end, end))
+
+    def _aggregate_company_daily_metrics(self, source, company_ids, columns, start=None, end=None):
+        """日汇总表尚未建立时从来源历史表按日聚合，结果格式与 _get_company_daily_metrics 相同"""
+        spec = self.COMPANY_DAILY_SOURCES[source]
+        if not self._table_exists(spec['table']):
+            return []
+        conn = self.connect()
+        placeholders = ', '.join('?' for _ in company_ids)
+        query = f"""
+            SELECT h.date, {', '.join(spec['columns'][c] for c in columns)}
+            FROM {history_source(conn, spec['table'], start)} h
+            JOIN etf_info i ON h.code = i.code
+            WHERE i.fund_manager IN ({placeholders})
+              AND (? IS NULL OR h.date >= ?)
+              AND (? IS NULL OR h.date <= ?)
+            GROUP BY h.date
+            ORDER BY h.date ASC
+        """
+        return self.execute_query(query, (*company_ids, start, start, end, end))
+
+    def _table_exists(self, table_name):
+        """检查表是否存在"""
+        result = self.execute_query(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
+        return bool(result)
+
+    def get_fund_company_attention_history(self, company_name: str, start: str = None, end: str = None) -> List[Dict]:
+        """获取基金公司自选历史汇总数据（读取 company_daily_metrics 日汇总表）"""
+        try:
+            result = self._get_company_daily_metrics(
+                company_name, ['total_attention_count'], start, end)
             return [
                 {
                     'date': row[0],
@@ -3630,23 +4115,11 @@ class Database:
             print(f"获取基金公司 {company_name} 自选历史汇总数据失败: {str(e)}")
             return []
 
-    def get_fund_company_holders_history(self, company_name: str) -> List[Dict]:
-        """获取基金公司持有人和持仓价值历史汇总数据"""
+    def get_fund_company_holders_history(self, company_name: str, start: str = None, end: str = None) -> List[Dict]:
+        """获取基金公司持有人和持仓价值历史汇总数据（读取 company_daily_metrics 日汇总表）"""
         try:
-            # 使用 LIKE 匹配基金公司名称
-            query = """
-            SELECT
-                ehh.date,
-                SUM(ehh.holder_count) as total_holder_count,
-                SUM(ehh.holding_value) as total_holding_value
-            FROM etf_holders_history ehh
-            JOIN etf_info ei ON ehh.code = ei.code
-            WHERE ei.fund_manager LIKE ?
-            GROUP BY ehh.date
-            ORDER BY ehh.date ASC;
-            """
-            params = (f'%{company_name}%',)
-            result = self.execute_query(query, params)
+            result = self._get_company_daily_metrics(
+                company_name, ['total_holder_count', 'total_holding_value'], start, end)
             return [
                 {
                     'date': row[0],
@@ -3702,6 +4175,18 @@ class Database:
                 print("未从 'etf_company_analytics' 获取到基金公司分析数据。")
                 return []
 
+            # 合并最新日期的排名变化和周环比变化（来自分析历史表）
+            if self._table_exists(company_analytics_history.HISTORY_TABLE):
+                movement_cols = [c for c in company_analytics_history.HISTORY_COLUMNS
+                                 if c.endswith(('_rank', '_rank_change', '_wow_change')) or c == 'compare_date']
+                movement = pd.read_sql_query(f"""
+                    SELECT company_name, {', '.join(movement_cols)}
+                    FROM {company_analytics_history.HISTORY_TABLE}
+                    WHERE date = (SELECT MAX(date) FROM {company_analytics_history.HISTORY_TABLE})
+                """, conn)
+                df = df.merge(movement, on='company_name', how='left')
+                df = df.astype(object).where(df.notna(), None)
+
             # 将DataFrame转换为字典列表
             results = df.to_dict(orient='records')
             print(f"成功获取 {len(results)} 条基金公司分析数据。")
@@ -3720,6 +4205,88 @@ class Database:
         # finally:
             # self.close() # 保持连接由调用者管理
 
+    def update_company_analytics_history(self, full: bool = False, start: str = None) -> bool:
+        """
+        更新基金公司分析历史表 etf_company_analytics_history
+
+        默认只计算并重写已有最后日期及之后的分区，指定 start 时从该日期起重算（回补历史），
+        历史表不存在或 full=True 时计算并重写全部日期。
+        """
+        try:
+            conn = self.connect()
+            dates = None
+            if not full and self._table_exists(company_analytics_history.HISTORY_TABLE):
+                result = self.execute_query(
+                    f"SELECT MAX(date) FROM {company_analytics_history.HISTORY_TABLE}")
+                last_date = result[0][0] if result else None
+                if last_date and start:
+                    last_date = min(str(start)[:10], last_date)
+                if last_date:
+                    dates = company_analytics_history.axis_dates(conn, last_date)
+                    if not dates:
+                        print("基金公司分析历史无需更新")
+                        return True
+
+            frame = company_analytics_history.compute_company_analytics_history(conn, dates)
+            count = company_analytics_history.write_history(conn, frame)
+            print(f"基金公司分析历史更新完成: {frame['date'].nunique()} 个日期, {count} 条记录")
+            self._register_versions('company_analytics')
+            return True
+        except Exception as e:
+            print(f"更新基金公司分析历史失败: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+    def get_company_analytics_history(self, company_name: str, start: str = None, end: str = None) -> List[Dict]:
+        """获取单个基金公司的分析指标历史（含排名和周环比变化）"""
+        try:
+            if not self._table_exists(company_analytics_history.HISTORY_TABLE):
+                return []
+            company_ids = self.resolve_company_ids(company_name)
+            if not company_ids:
+                return []
+            placeholders = ', '.join('?' for _ in company_ids)
+            query = f"""
+                SELECT * FROM {company_analytics_history.HISTORY_TABLE}
+                WHERE company_name IN ({placeholders})
+                  AND (? IS NULL OR date >= ?)
+                  AND (? IS NULL OR date <= ?)
+                ORDER BY company_name, date
+            """
+            df = pd.read_sql_query(query, self.connect(), params=(*company_ids, start, start, end, end))
+            return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+        except Exception as e:
+            print(f"获取基金公司 {company_name} 分析历史失败: {str(e)}")
+            return []
+
+    def get_company_analytics_on_date(self, date: str = None, sort_by: str = 'total_holding_value',
+                                      ascending: bool = False) -> List[Dict]:
+        """获取指定日期（默认最新）所有基金公司的分析指标快照"""
+        try:
+            table = company_analytics_history.HISTORY_TABLE
+            if not self._table_exists(table):
+                return []
+            if sort_by not in company_analytics_history.HISTORY_COLUMNS:
+                sort_by = 'total_holding_value'
+            if date is None:
+                result = self.execute_query(f"SELECT MAX(date) FROM {table}")
+                date = result[0][0] if result else None
+            else:
+                # 取不晚于指定日期的最近一个分析日期
+                result = self.execute_query(f"SELECT MAX(date) FROM {table} WHERE date <= ?", (date,))
+                date = result[0][0] if result else None
+            if not date:
+                return []
+            order_direction = "ASC" if ascending else "DESC"
+            df = pd.read_sql_query(
+                f"SELECT * FROM {table} WHERE date = ? ORDER BY {sort_by} {order_direction}",
+                self.connect(), params=(date,))
+            return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+        except Exception as e:
+            print(f"获取 {date} 基金公司分析快照失败: {str(e)}")
+            return []
+
     def update_company_analytics(self, company_name, total_fund_size=None, product_count=None,
                                  business_agreement_count=None, total_holding_value=None,
                                  business_total_holding_value=None, total_amount=None,
@@ -3855,6 +4422,7 @@ class Database:
 
             # 提交更改
             conn.commit()
+            self._register_versions('company_analytics')
             return True
 
         except Exception as e:
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+多周期ETF数据对比
+
+直接从历史表（etf_attention_history、etf_holders_history）按任意两个及以上日期
+生成每只ETF的周期对比，取代 基础数据合并.py 读取 etf保有量*.csv / etf自选人数*.csv /
+ETF_DATA_*.xlsx 再写 ETF_基础数据合并_*.csv 的流程。
+
+各来源表的日期不一定与请求的日期重合，对每个请求日期用 merge_asof 按代码取
+"不晚于该日期且相差不超过 tolerance_days 天的最近一条记录"，与公司分析历史的 as-of 口径一致。
+
+结果为整洁长表（每个 代码 × 周期 一行），to_wide 可转为原合并CSV的宽表列名，
+如 关注人数（02月14日）、关注人数变动，供周报脚本直接使用。
+"""
+
+import pandas as pd
+
+from database.retention import history_source
+
+# 周期指标：列名 -> (来源历史表, 宽表中文名)
+PERIOD_METRICS = {
+    'attention_count': ('etf_attention_history', '关注人数'),
+    'holder_count': ('etf_holders_history', '持仓客户数'),
+    'holding_amount': ('etf_holders_history', '保有份额'),
+    'holding_value': ('etf_holders_history', '保有金额'),
+}
+
+# etf_info 中的静态信息：列名 -> 宽表列名（与原合并CSV中万得导出的列名一致）
+INFO_COLUMNS = {
+    'name': '证券名称',
+    'fund_manager': '基金管理人',
+    'manager_short': '基金管理人简称',
+    'tracking_index_code': '跟踪指数代码',
+    'tracking_index_name': '跟踪指数名称',
+    'management_fee_rate': '管理费率[单位]%',
+    'custody_fee_rate': '托管费率[单位]%',
+    'fund_size': '基金规模(合计)[交易日期]S_cal_date(now(),0,D,0)[单位]亿元',
+    'monthly_volume': '月成交额[交易日期]最新收盘日[单位]百万元',
+}
+
+# 来源日期与请求日期最多相差的天数，超过则视为缺失
+ASOF_TOLERANCE_DAYS = 7
+
+WIDE_DATE_FORMAT = '%m月%d日'
+
+
+def normalize_periods(dates):
+    """去重、排序并统一为 YYYY-MM-DD，至少需要两个日期"""
+    periods = sorted({pd.Timestamp(d).strftime('%Y-%m-%d') for d in dates})
+    if len(periods) < 2:
+        raise ValueError("周期对比至少需要两个不同的日期")
+    return periods
+
+
+def _source_tables():
+    """来源表 -> 该表提供的指标列"""
+    tables = {}
+    for metric, (table, _) in PERIOD_METRICS.items():
+        tables.setdefault(table, []).append(metric)
+    return tables
+
+
+def _asof_join(conn, table, metrics, periods, codes, tolerance_days):
+    """对单个来源表按代码做 as-of 连接，返回 code, period, 指标列, <table>_date"""
+    since = (pd.Timestamp(periods[0]) - pd.Timedelta(days=tolerance_days)).strftime('%Y-%m-%d')
+    history = pd.read_sql_query(
+        f"SELECT code, date, {', '.join(metrics)} FROM {history_source(conn, table, since)} "
+        f"WHERE date >= ? AND date <= ?",
+        conn, params=(since, periods[-1]))
+    history = history.drop_duplicates(subset=['code', 'date'], keep='last')
+    history['source_ts'] = pd.to_datetime(history['date'])
+    history = history.sort_values('source_ts')
+
+    left = pd.MultiIndex.from_product([codes, periods], names=['code', 'period']).to_frame(index=False)
+    left['period_ts'] = pd.to_datetime(left['period'])
+    left = left.sort_values('period_ts')
+
+    joined = pd.merge_asof(left, history.drop(columns='date'), left_on='period_ts', right_on='source_ts',
+                           by='code', direction='backward',
+                           tolerance=pd.Timedelta(days=tolerance_days))
+    joined[f'{table}_date'] = joined['source_ts'].dt.strftime('%Y-%m-%d')
+    return joined.drop(columns=['period_ts', 'source_ts'])
+
+
+def merge_periods(conn, dates, codes=None, tolerance_days=ASOF_TOLERANCE_DAYS):
+    """
+    生成多周期对比整洁表
+
+    参数:
+        conn: 数据库连接
+        dates: 两个及以上日期（任意可被 pandas 解析的格式）
+        codes: 只包含这些ETF代码，None 表示窗口内出现过的全部代码
+        tolerance_days: as-of 连接允许的最大天数差
+
+    返回:
+        pandas.DataFrame: 每个 (code, period) 一行，包含 PERIOD_METRICS 指标、
+        相对上一周期的变化 <指标>_change、各来源的实际日期 <表名>_date 和 INFO_COLUMNS 信息
+    """
+    periods = normalize_periods(dates)
+    tables = _source_tables()
+
+    if codes is None:
+        since = (pd.Timestamp(periods[0]) - pd.Timedelta(days=tolerance_days)).strftime('%Y-%m-%d')
+        union = ' UNION '.join(f"SELECT code FROM {history_source(conn, table, since)} WHERE date >= ? AND date <= ?"
+                               for table in tables)
+        codes = pd.read_sql_query(union, conn, params=[since, periods[-1]] * len(tables))['code']
+    codes = sorted(set(codes))
+
+    frame = None
+    for table, metrics in tables.items():
+        joined = _asof_join(conn, table, metrics, periods, codes, tolerance_days)
+        frame = joined if frame is None else frame.merge(joined, on=['code', 'period'], how='outer')
+
+    frame = frame.sort_values(['code', 'period']).reset_index(drop=True)
+    changes = frame.groupby('code')[list(PERIOD_METRICS)].diff()
+    for metric in PERIOD_METRICS:
+        frame[f'{metric}_change'] = changes[metric]
+
+    info = pd.read_sql_query(f"SELECT code, {', '.join(INFO_COLUMNS)} FROM etf_info", conn)
+    return frame.merge(info.drop_duplicates(subset='code'), on='code', how='left')
+
+
+def to_wide(frame, date_format=WIDE_DATE_FORMAT):
+    """
+    转为原 ETF_基础数据合并_*.csv 的宽表：每只ETF一行
+
+    指标列名为 <中文名>（<日期>），<中文名>变动 为最后一个周期相对第一个周期的变化，
+    两个周期时与原合并脚本的"本期 - 上期"一致。
+    """
+    periods = sorted(frame['period'].unique())
+    labels = {p: pd.Timestamp(p).strftime(date_format) for p in periods}
+    latest = labels[periods[-1]]
+
+    wide = frame.pivot(index='code', columns='period', values=list(PERIOD_METRICS))
+    columns = {}
+    for metric, (_, label) in PERIOD_METRICS.items():
+        for period in periods:
+            columns[f'{label}（{labels[period]}）'] = wide[(metric, period)]
+        columns[f'{label}变动'] = wide[(metric, periods[-1])] - wide[(metric, periods[0])]
+    result = pd.DataFrame(columns, index=wide.index)
+
+    info = frame.drop_duplicates(subset='code').set_index('code')[list(INFO_COLUMNS)]
+    result.insert(0, f'证券名称（{latest}）', info['name'])
+    result = result.join(info.drop(columns='name').rename(columns=INFO_COLUMNS))
+    return result.rename_axis('证券代码').reset_index()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+ETF价格面板指标
+
+把价格历史转成 日期 × 代码 的收盘价矩阵，一次性计算全部ETF的多周期涨跌幅
+（1日/5日/20日/60日/年初至今）、20日年化波动率、年内最大回撤和换手率排名，
+结果按日期分区写入 price_metrics 表，排行榜和推荐直接读表，不再逐只ETF计算。
+
+停牌日按前一交易日收盘价填充，只输出当天有收盘价的 (代码, 日期)。
+涨跌幅、波动率和回撤均以百分比表示，与 etf_price.change_rate 的口径一致。
+"""
+
+import numpy as np
+import pandas as pd
+
+from database.retention import history_source
+
+METRICS_TABLE = 'price_metrics'
+
+# 指标表列定义（列名 -> SQL类型），顺序即建表顺序
+METRICS_COLUMNS = {
+    'date': 'TEXT NOT NULL',
+    'code': 'TEXT NOT NULL',
+    'close': 'REAL',
+    'return_1d': 'REAL',
+    'return_5d': 'REAL',
+    'return_20d': 'REAL',
+    'return_60d': 'REAL',
+    # 相对当年第一个交易日收盘价
+    'return_ytd': 'REAL',
+    # 近20个交易日日收益率的年化标准差
+    'volatility_20d': 'REAL',
+    # 当年以来的最大回撤（负数）
+    'max_drawdown_ytd': 'REAL',
+    'turnover_rate': 'REAL',
+    # 当日换手率排名（1为最高）
+    'turnover_rank': 'INTEGER',
+    'amount': 'REAL',
+}
+
+RETURN_HORIZONS = {'return_1d': 1, 'return_5d': 5, 'return_20d': 20, 'return_60d': 60}
+VOLATILITY_WINDOW = 20
+TRADING_DAYS_PER_YEAR = 252
+
+# 增量计算时，起始日期之前需要读取的交易日数（最长收益率周期）
+LOOKBACK_ROWS = max(RETURN_HORIZONS.values())
+
+
+def create_metrics_table(conn):
+    columns_sql = ',\n            '.join(f"{c} {t}" for c, t in METRICS_COLUMNS.items())
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {METRICS_TABLE} (
+            {columns_sql},
+            PRIMARY KEY (date, code)
+        )
+    """)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{METRICS_TABLE}_code ON {METRICS_TABLE} (code, date)")
+    conn.commit()
+
+
+def _shifted_return(values, periods):
+    """values[t] / values[t - periods] - 1，前 periods 行为 NaN"""
+    result = np.full(values.shape, np.nan)
+    if periods < len(values):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result[periods:] = values[periods:] / values[:-periods] - 1
+    return result
+
+
+def compute_panel_metrics(history, start=None):
+    """
+    对长表价格历史一次性计算面板指标
+
+    参数:
+        history: 包含 code、date、close 列的DataFrame，可选 turnover_rate、amount 列；
+                 date 为可按字符串排序的日期（YYYY-MM-DD 或 YYYYMMDD）
+        start: 只返回不早于该日期的行，None 表示全部日期
+
+    返回:
+        pandas.DataFrame: 列为 METRICS_COLUMNS，每个 (date, code) 一行
+    """
+    if history.empty:
+        return pd.DataFrame(columns=list(METRICS_COLUMNS))
+
+    history = history.dropna(subset=['close']).drop_duplicates(subset=['date', 'code'], keep='last')
+    raw_close = history.pivot(index='date', columns='code', values='close').sort_index()
+    dates = raw_close.index.to_numpy()
+    close = raw_close.ffill().to_numpy(dtype=float)
+
+    metrics = {name: _shifted_return(close, periods) for name, periods in RETURN_HORIZONS.items()}
+
+    # 年初至今：相对各年第一个收盘价（当年上市的ETF取上市后第一个收盘价）
+    years = pd.Series(dates).astype(str).str[:4].to_numpy()
+    grouped = pd.DataFrame(close).groupby(years)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        metrics['return_ytd'] = close / grouped.transform('first').to_numpy() - 1
+
+    # 年内最大回撤：按年分组的累计最高价
+    drawdown = close / grouped.cummax().to_numpy() - 1
+    metrics['max_drawdown_ytd'] = pd.DataFrame(drawdown).groupby(years).cummin().to_numpy()
+
+    daily = pd.DataFrame(metrics['return_1d'])
+    metrics['volatility_20d'] = (
+        daily.rolling(VOLATILITY_WINDOW, min_periods=VOLATILITY_WINDOW // 2).std().to_numpy()
+        * np.sqrt(TRADING_DAYS_PER_YEAR))
+
+    percent = {name: values * 100 for name, values in metrics.items()}
+    percent['close'] = close
+
+    # 宽表 -> 长表，只保留当天实际有收盘价的格子
+    traded = raw_close.notna().to_numpy()
+    if start is not None:
+        traded = traded & (dates >= start)[:, None]
+    rows, cols = np.nonzero(traded)
+    frame = pd.DataFrame({'date': dates[rows], 'code': raw_close.columns.to_numpy()[cols]})
+    for name, values in percent.items():
+        frame[name] = values[rows, cols]
+
+    for column in ('turnover_rate', 'amount'):
+        if column in history.columns:
+            frame = frame.merge(history[['date', 'code', column]], on=['date', 'code'], how='left')
+        else:
+            frame[column] = np.nan
+    frame['turnover_rank'] = (frame.groupby('date')['turnover_rate']
+                              .rank(ascending=False, method='min').astype('Int64'))
+    return frame[list(METRICS_COLUMNS)].sort_values(['date', 'code']).reset_index(drop=True)
+
+
+def load_price_history(conn, start=None):
+    """
+    读取 etf_price_history；指定 start 时额外读取之前 LOOKBACK_ROWS 个交易日和当年全部数据，
+    保证起始日期的各周期指标完整
+    """
+    since = None
+    if start is not None:
+        row = conn.execute(f"""
+            SELECT MIN(date) FROM (
+                SELECT DISTINCT date FROM etf_price_history
+                WHERE date < ? ORDER BY date DESC LIMIT {LOOKBACK_ROWS}
+            )
+        """, (start,)).fetchone()
+        since = min(d for d in (row[0], f"{start[:4]}-01-01") if d)
+    # 早于主库最早日期的部分从归档库读取（见 database/retention.py）
+    return pd.read_sql_query(f"""
+        SELECT code, date, close_price AS close, turnover_rate, amount
+        FROM {history_source(conn, 'etf_price_history', since)}
+        WHERE close_price IS NOT NULL AND (? IS NULL OR date >= ?)
+    """, conn, params=(since, since))
+
+
+def compute_price_metrics(conn, start=None):
+    """从 etf_price_history 计算不早于 start 的各日期指标，start 为 None 时计算全部日期"""
+    return compute_panel_metrics(load_price_history(conn, start), start=start)
+
+
+def write_metrics(conn, frame):
+    """按日期分区写入：先删除涉及日期的分区，再整体插入"""
+    if frame.empty:
+        return 0
+    create_metrics_table(conn)
+    columns = list(METRICS_COLUMNS)
+    rows = frame[columns].astype(object).where(frame[columns].notna(), None).values.tolist()
+    cursor = conn.cursor()
+    cursor.executemany(f"DELETE FROM {METRICS_TABLE} WHERE date = ?",
+                       [(d,) for d in frame['date'].unique()])
+    cursor.executemany(
+        f"INSERT INTO {METRICS_TABLE} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+        rows)
+    conn.commit()
+    cursor.close()
+    return len(rows)
@@ -0,0 +1,194 @@
+"""
+慢查询分析器
+
+挂在 database.instrumentation 的语句监听器上，默认关闭，通过环境变量开启:
+    ETF_SQL_PROFILE=1            开启
+    ETF_SLOW_QUERY_MS=100        慢查询阈值（毫秒）
+    ETF_SLOW_QUERY_LOG=...       JSON Lines 日志路径，默认项目根目录 slow_queries.log
+    ETF_LARGE_TABLE_ROWS=10000   行数超过该值的表被全表扫描时标记为 large_scan
+
+每条慢查询记录 SQL、参数、耗时、归一化指纹以及 EXPLAIN QUERY PLAN 结果，
+汇总报告见 slow_query_report.py。耗时包括 execute 和取完结果的时间（见 instrumentation 的语句监听器）。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from database import instrumentation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'slow_queries.log')
+
+# 表行数缓存的有效期（秒），避免每条慢查询都去数表
+ROW_COUNT_TTL = 300
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+# 旧版 SQLite 输出 "SCAN TABLE 表 AS 别名"，3.36 起只输出 "SCAN 别名"
+_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?')
+_TABLE_ALIAS_RE = re.compile(r'\b(?:FROM|JOIN)\s+"?(\w+)"?(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+# 紧跟在表名后面、不是别名的关键字
+_NOT_ALIAS = {'WHERE', 'ON', 'USING', 'JOIN', 'LEFT', 'RIGHT', 'FULL', 'INNER', 'OUTER', 'CROSS', 'NATURAL',
+              'GROUP', 'ORDER', 'LIMIT', 'HAVING', 'UNION', 'EXCEPT', 'INTERSECT', 'WINDOW', 'INDEXED', 'NOT',
+              'SET', 'VALUES', 'RETURNING'}
+
+
+def normalize_sql(sql):
+    """去掉字面量和多余空白，IN 列表折叠为一个占位符，得到可聚合的SQL形态"""
+    text = _STRING_RE.sub('?', sql)
+    text = _NUMBER_RE.sub('?', text)
+    text = _IN_LIST_RE.sub('IN (?)', text)
+    return _SPACE_RE.sub(' ', text).strip()
+
+
+def table_aliases(sql):
+    """SQL中 FROM/JOIN 子句的 别名 -> 表名 映射（表名自身也映射到自己）"""
+    aliases = {}
+    for table, alias in _TABLE_ALIAS_RE.findall(sql):
+        aliases.setdefault(table, table)
+        if alias and alias.upper() not in _NOT_ALIAS:
+            aliases[alias] = table
+    return aliases
+
+
+def fingerprint(sql):
+    """归一化SQL的短哈希"""
+    return hashlib.sha1(normalize_sql(sql).encode('utf-8')).hexdigest()[:12]
+
+
+class QueryProfiler:
+    """记录超过阈值的语句及其查询计划"""
+
+    def __init__(self, threshold_ms=100, log_path=DEFAULT_LOG_PATH, large_table_rows=10000):
+        self.threshold = threshold_ms / 1000.0
+        self.log_path = log_path
+        self.large_table_rows = large_table_rows
+        self._row_counts = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, connection, sql, params, elapsed):
+        if elapsed < self.threshold or not isinstance(sql, str):
+            return
+        plan, scans = self._explain(connection, sql, params)
+        entry = {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'elapsed_ms': round(elapsed * 1000, 2),
+            'fingerprint': fingerprint(sql),
+            'sql': normalize_sql(sql),
+            'params': _jsonable(params),
+            'plan': plan,
+            'large_scans': scans,
+        }
+        logger.warning(f"慢查询 {entry['elapsed_ms']}ms [{entry['fingerprint']}]"
+                       f"{' 全表扫描: ' + ','.join(scans) if scans else ''}")
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+    def _explain(self, connection, sql, params):
+        """在同一连接上执行 EXPLAIN QUERY PLAN，只针对查询语句"""
+        head = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+        if head not in ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT', 'REPLACE'):
+            return [], []
+        if params is None and '?' in sql:
+            # executemany 的批量参数无法代入单条计划
+            return [], []
+        try:
+            # 使用原生游标，避免计划查询本身再次触发监听器
+            cursor = connection.cursor(sqlite3.Cursor)
+            rows = cursor.execute('EXPLAIN QUERY PLAN ' + sql, params or ()).fetchall()
+            cursor.close()
+        except Exception as e:
+            return [f'EXPLAIN 失败: {e}'], []
+
+        plan, scans = [], []
+        aliases = None
+        for row in rows:
+            detail = row[-1]
+            plan.append(detail)
+            match = _SCAN_RE.match(detail)
+            if match:
+                table = match.group(1)
+                if match.group(2) is None:
+                    # 新版计划中的名称可能是别名
+                    if aliases is None:
+                        aliases = table_aliases(sql)
+                    table = aliases.get(table, table)
+                rows_in_table = self._row_count(connection, table)
+                if rows_in_table is not None and rows_in_table >= self.large_table_rows:
+                    scans.append(f'{table}({rows_in_table})')
+        return plan, scans
+
+    def _row_count(self, connection, table):
+        now = time.monotonic()
+        cached = self._row_counts.get(table)
+        if cached and now - cached[1] < ROW_COUNT_TTL:
+            return cached[0]
+        try:
+            cursor = connection.cursor(sqlite3.Cursor)
+            count = cursor.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+            cursor.close()
+        except Exception:
+            count = None
+        self._row_counts[table] = (count, now)
+        return count
+
+
+def _jsonable(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: _jsonable_value(v) for k, v in params.items()}
+    try:
+        return [_jsonable_value(v) for v in params]
+    except TypeError:
+        return str(params)
+
+
+def _jsonable_value(value):
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    if isinstance(value, bytes):
+        return f'<{len(value)} bytes>'
+    return str(value)
+
+
+_profiler = None
+
+
+def enable(threshold_ms=100, log_path=DEFAULT_LOG_PATH, large_table_rows=10000):
+    """开启慢查询记录，重复调用会替换原有配置"""
+    global _profiler
+    disable()
+    _profiler = QueryProfiler(threshold_ms, log_path, large_table_rows)
+    instrumentation.add_query_listener(_profiler)
+    return _profiler
+
+
+def disable():
+    global _profiler
+    if _profiler is not None:
+        instrumentation.remove_query_listener(_profiler)
+        _profiler = None
+
+
+def enable_from_env():
+    """按环境变量开启，ETF_SQL_PROFILE 未设置时什么也不做"""
+    if os.getenv('ETF_SQL_PROFILE', '').lower() not in ('1', 'true', 'yes', 'on'):
+        return None
+    return enable(
+        threshold_ms=float(os.getenv('ETF_SLOW_QUERY_MS', '100')),
+        log_path=os.getenv('ETF_SLOW_QUERY_LOG', DEFAULT_LOG_PATH),
+        large_table_rows=int(os.getenv('ETF_LARGE_TABLE_ROWS', '10000')),
+    )
@@ -0,0 +1,291 @@
+"""
+历史表分层保留
+
+etf_attention_history / etf_holders_history / etf_price_history / etf_fund_size_history
+每只ETF每天一行且永久保留，而大部分读取（5日变化、近期图表、排行榜）只用到最近几周。
+按数据日期分三层:
+- 热数据：最新日期往前 HOT_DAYS 天内保持日度，留在主库
+- 温数据：更早、但在 WEEKLY_DAYS 天内的只保留每周最后一个数据日期，移入归档库
+- 冷数据：WEEKLY_DAYS 天之前的只保留每月最后一个数据日期
+
+归档库与主库同目录，文件名为 <主库名>_archive.db，以 ATTACH 方式挂载为 archive 模式。
+需要较早日期的读取通过 history_source() 选表：起始日期落在热数据范围内时直接读主库表，
+否则读主库表与归档表的联合临时视图（<表名>_all），调用方的SQL不需要关心数据在哪个库。
+归档库不随分阶段发布替换，移入的行在新主库发布前就已提交，视图中归档部分只取早于主库最早日期的行，
+发布前后、发布失败时同一日期都不会出现两次。
+
+用法:
+    python -m database.retention              # 按 ETF_HOT_DAYS / ETF_WEEKLY_DAYS 归档
+    python -m database.retention --dry-run    # 只统计，不修改
+"""
+
+import argparse
+import logging
+import os
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+TABLES = ('etf_attention_history', 'etf_holders_history', 'etf_price_history', 'etf_fund_size_history')
+
+HOT_DAYS = int(os.getenv('ETF_HOT_DAYS', '400'))
+WEEKLY_DAYS = int(os.getenv('ETF_WEEKLY_DAYS', str(3 * 365)))
+
+ARCHIVE_SCHEMA = 'archive'
+ALL_SUFFIX = '_all'
+
+# 各历史表所属的数据集（database/dataset_versions.py），归档后重新登记版本
+DATASETS = ('price', 'holders', 'attention', 'fund_size')
+
+# 分阶段构建的暂存库、待发布库的文件名标记（见 database/staging.py），与正式库共用同一个归档库
+STAGE_TAGS = ('.staging', '.next')
+
+
+def _databases(conn):
+    """已挂载的数据库：模式名 -> 文件路径"""
+    return {row[1]: row[2] for row in conn.execute("PRAGMA database_list")}
+
+
+def archive_path(conn):
+    """主库对应的归档库路径，内存数据库返回 None"""
+    main = _databases(conn).get('main')
+    if not main:
+        return None
+    base, ext = os.path.splitext(main)
+    for tag in STAGE_TAGS:
+        base = base.removesuffix(tag)
+    return f"{base}_archive{ext or '.db'}"
+
+
+def attach_archive(conn, create=False):
+    """挂载归档库（已挂载时直接返回 True），归档库不存在且 create=False 或连接处于事务中时返回 False"""
+    if ARCHIVE_SCHEMA in _databases(conn):
+        return True
+    path = archive_path(conn)
+    if path is None or (not create and not os.path.exists(path)):
+        return False
+    if conn.in_transaction:
+        # 事务中不能 ATTACH（如写入后在同一连接上增量刷新指标），此时只读主库
+        return False
+    conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (path,))
+    return True
+
+
+def _columns(conn, schema, table):
+    """表的列名，表或模式不存在时为空列表"""
+    if schema not in _databases(conn) and schema != 'temp':
+        return []
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+
+
+def hot_start(conn, table):
+    """主库表中最早的日期"""
+    return conn.execute(f"SELECT MIN(date) FROM main.{table}").fetchone()[0]
+
+
+def history_source(conn, table, start=None):
+    """
+    读取 table 中不早于 start 的数据时应使用的表名
+
+    start 为 None（全部历史）或早于主库最早日期，且归档库中有该表时，
+    返回主库表与归档表的联合临时视图；否则返回 table 本身。
+    视图只取归档库中早于主库最早日期的行（主库为空时取全部），已移入归档但主库仍保留的日期以主库为准。
+    """
+    if table not in TABLES or not attach_archive(conn):
+        return table
+    archived = _columns(conn, ARCHIVE_SCHEMA, table)
+    if not archived:
+        return table
+    if start is not None:
+        first = hot_start(conn, table)
+        if first is not None and str(start) >= first:
+            return table
+
+    view = f"{table}{ALL_SUFFIX}"
+    columns = _columns(conn, 'main', table)
+    # 主库表后来新增的列在归档表中可能没有，补为 NULL
+    archive_select = ', '.join(c if c in archived else f"NULL AS {c}" for c in columns)
+    conn.execute(f"""
+        CREATE TEMP VIEW IF NOT EXISTS {view} AS
+        SELECT {', '.join(columns)} FROM main.{table}
+        UNION ALL
+        SELECT {archive_select} FROM {ARCHIVE_SCHEMA}.{table}
+        WHERE date < COALESCE((SELECT MIN(date) FROM main.{table}), '9999-12-31')
+    """)
+    return view
+
+
+def snapshot_dates(dates, weekly_cutoff):
+    """
+    dates 中需要保留的快照日期
+
+    不早于 weekly_cutoff 的保留每周最后一个日期，更早的保留每月最后一个日期。
+    """
+    series = pd.Series(pd.to_datetime(sorted(set(dates))))
+    if series.empty:
+        return set()
+    weekly = series[series >= weekly_cutoff]
+    monthly = series[series < weekly_cutoff]
+    keep = pd.concat([weekly.groupby(weekly.dt.to_period('W')).max(),
+                      monthly.groupby(monthly.dt.to_period('M')).max()])
+    return set(keep.dt.strftime('%Y-%m-%d'))
+
+
+def _ensure_archive_table(conn, table):
+    """按主库表结构创建归档表，并补齐主库后来新增的列"""
+    sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()[0]
+    _, body = sql.split('(', 1)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.{table} ({body}")
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {ARCHIVE_SCHEMA}.ux_{table}_code_date ON {table} (code, date)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {ARCHIVE_SCHEMA}.idx_{table}_date ON {table} (date)")
+    archived = set(_columns(conn, ARCHIVE_SCHEMA, table))
+    for row in conn.execute(f"PRAGMA main.table_info({table})").fetchall():
+        if row[1] not in archived:
+            conn.execute(f"ALTER TABLE {ARCHIVE_SCHEMA}.{table} ADD COLUMN {row[1]} {row[2]}")
+
+
+def _distinct_dates(conn, schema, table, before):
+    return [row[0] for row in conn.execute(
+        f"SELECT DISTINCT date FROM {schema}.{table} WHERE date < ?", (before,))]
+
+
+def compact_table(conn, table, hot_days=HOT_DAYS, weekly_days=WEEKLY_DAYS, dry_run=False):
+    """
+    归档单张历史表（不提交事务）
+
+    返回:
+        dict: cutoff（主库保留的最早日期）、moved（移入归档库的行数）、
+        dropped（未保留为快照而删除的行数，含归档库中降为月度的行）
+    """
+    latest = conn.execute(f"SELECT MAX(date) FROM main.{table}").fetchone()[0]
+    if latest is None:
+        return {'table': table, 'cutoff': None, 'moved': 0, 'dropped': 0}
+    latest = pd.Timestamp(latest)
+    cutoff = (latest - pd.Timedelta(days=hot_days)).strftime('%Y-%m-%d')
+    weekly_cutoff = latest - pd.Timedelta(days=weekly_days)
+
+    old_dates = _distinct_dates(conn, 'main', table, cutoff)
+    has_archive = bool(_columns(conn, ARCHIVE_SCHEMA, table))
+    archived_dates = _distinct_dates(conn, ARCHIVE_SCHEMA, table, '9999-12-31') if has_archive else []
+    keep = snapshot_dates(old_dates + archived_dates, weekly_cutoff)
+
+    stats = {'table': table, 'cutoff': cutoff, 'moved': 0, 'dropped': 0}
+    if not old_dates and set(archived_dates) <= keep:
+        return stats
+
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS retention_keep (date TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.retention_keep")
+    conn.executemany("INSERT INTO temp.retention_keep (date) VALUES (?)", [(d,) for d in keep])
+
+    old_rows = conn.execute(f"SELECT COUNT(*) FROM main.{table} WHERE date < ?", (cutoff,)).fetchone()[0]
+    stats['moved'] = conn.execute(f"""
+        SELECT COUNT(*) FROM main.{table}
+        WHERE date < ? AND date IN (SELECT date FROM temp.retention_keep)
+    """, (cutoff,)).fetchone()[0]
+    stats['dropped'] = old_rows - stats['moved']
+    if has_archive:
+        stats['dropped'] += conn.execute(f"""
+            SELECT COUNT(*) FROM {ARCHIVE_SCHEMA}.{table}
+            WHERE date NOT IN (SELECT date FROM temp.retention_keep)
+        """).fetchone()[0]
+    if dry_run:
+        return stats
+
+    _ensure_archive_table(conn, table)
+    columns = ', '.join(_columns(conn, 'main', table))
+    conn.execute(f"""
+        INSERT OR REPLACE INTO {ARCHIVE_SCHEMA}.{table} ({columns})
+        SELECT {columns} FROM main.{table}
+        WHERE date < ? AND date IN (SELECT date FROM temp.retention_keep)
+    """, (cutoff,))
+    conn.execute(f"DELETE FROM main.{table} WHERE date < ?", (cutoff,))
+    conn.execute(f"DELETE FROM {ARCHIVE_SCHEMA}.{table} WHERE date NOT IN (SELECT date FROM temp.retention_keep)")
+    return stats
+
+
+def compact(conn, hot_days=HOT_DAYS, weekly_days=WEEKLY_DAYS, tables=TABLES, dry_run=False):
+    """
+    归档各历史表，全部表处理完后一次提交
+
+    先写归档库再删除主库数据；主库为 WAL 模式时两个库的提交不是原子的，
+    中途失败或暂存库未发布时部分日期在两个库中各有一份，联合视图只读主库中的那份，重新执行即可清理。
+
+    返回:
+        list[dict]: 各表的 compact_table 统计
+    """
+    attach_archive(conn, create=not dry_run)
+    existing = {row[0] for row in conn.execute("SELECT name FROM main.sqlite_master WHERE type='table'")}
+    results = []
+    try:
+        for table in tables:
+            if table in existing:
+                results.append(compact_table(conn, table, hot_days, weekly_days, dry_run))
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    for stats in results:
+        logger.info(f"{stats['table']}: 主库保留 {stats['cutoff']} 之后，移入归档 {stats['moved']} 行，"
+                    f"删除 {stats['dropped']} 行")
+    return results
+
+
+def _rebuild_timeseries(conn):
+    """归档删除了主库中的行，发布后从正式库重建已建立的时间序列存储"""
+    from database.timeseries_store import DATASETS as STORE_DATASETS, get_store
+
+    store = get_store()
+    for name in STORE_DATASETS:
+        if store.has_dataset(name):
+            store.rebuild_from_db(conn, name)
+
+
+def run_retention(hot_days=HOT_DAYS, weekly_days=WEEKLY_DAYS, dry_run=False):
+    """
+    持有写锁执行一次归档（调度任务 retention 使用）
+
+    启用分阶段发布时在暂存库中删除已归档的行，发布时的 VACUUM INTO 同时回收主库空间。
+    """
+    from database import dataset_versions, instrumentation, staging
+    from database.models import DATABASE_PATH
+    from database.writer_lock import write_lock
+
+    if dry_run:
+        with write_lock.hold('retention'):
+            conn = instrumentation.connect(DATABASE_PATH)
+            try:
+                return compact(conn, hot_days, weekly_days, dry_run=True)
+            finally:
+                conn.close()
+
+    results = []
+
+    def build_step(build):
+        conn = instrumentation.connect(build.path)
+        try:
+            results[:] = compact(conn, hot_days, weekly_days)
+            if any(item['moved'] or item['dropped'] for item in results):
+                dataset_versions.refresh(conn, DATASETS)
+        finally:
+            conn.close()
+        build.publish = any(item['moved'] or item['dropped'] for item in results)
+        if build.publish:
+            build.after_publish.append(_rebuild_timeseries)
+
+    staging.run('retention', build_step)
+    return results
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='历史表分层归档')
+    parser.add_argument('--hot-days', type=int, default=HOT_DAYS, help='主库保留日度数据的天数')
+    parser.add_argument('--weekly-days', type=int, default=WEEKLY_DAYS, help='归档库保留周度快照的天数')
+    parser.add_argument('--dry-run', action='store_true', help='只统计，不修改')
+    args = parser.parse_args()
+    for item in run_retention(args.hot_days, args.weekly_days, args.dry_run):
+        print(item)
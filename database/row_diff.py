@@ -0,0 +1,53 @@
+"""
+按行比对待写入数据与库中已有数据
+
+每行按 (code, date) 对齐，用 pandas.util.hash_pandas_object 对值列计算校验和，
+只返回库中不存在或值有变化的行。数值统一转为 float 后再计算，整数列和实数列的相同值校验和一致；
+缺失值与 NULL 视为相同。
+"""
+
+import pandas as pd
+
+KEY_COLUMNS = ['code', 'date']
+
+
+def row_checksums(frame, value_columns):
+    """每行值列的64位校验和（索引与 frame 一致）"""
+    values = frame[value_columns].apply(pd.to_numeric, errors='coerce').astype('float64')
+    return pd.util.hash_pandas_object(values, index=False)
+
+
+def load_rows(conn, table, dates, value_columns):
+    """读取 table 中指定日期的已有行"""
+    dates = list(dates)
+    placeholders = ', '.join('?' for _ in dates)
+    query = f"SELECT {', '.join(KEY_COLUMNS + value_columns)} FROM {table} WHERE date IN ({placeholders})"
+    return pd.read_sql_query(query, conn, params=dates)
+
+
+def changed_rows(conn, table, frame, value_columns):
+    """
+    frame 中相对 table 新增或有变化的行
+
+    参数:
+        conn: 数据库连接
+        table: 以 (code, date) 唯一的历史表
+        frame: 至少包含 code、date 和 value_columns 的DataFrame
+        value_columns: 参与比对的值列
+
+    返回:
+        pandas.DataFrame: frame 的子集（保留原有列）
+    """
+    if frame.empty:
+        return frame
+    existing = load_rows(conn, table, frame['date'].unique(), value_columns)
+    if existing.empty:
+        return frame
+
+    stored = pd.Series(row_checksums(existing, value_columns).to_numpy(), dtype='UInt64',
+                       index=pd.MultiIndex.from_frame(existing[KEY_COLUMNS].astype(str)))
+    previous = stored.reindex(pd.MultiIndex.from_frame(frame[KEY_COLUMNS].astype(str)))
+    current = row_checksums(frame, value_columns).to_numpy()
+    # 库中没有该行时 previous 为缺失值，视为有变化
+    changed = (previous != current).fillna(True).to_numpy(dtype=bool)
+    return frame[changed]
@@ -0,0 +1,259 @@
+"""
+分阶段构建与原子替换数据库
+
+导入和派生表刷新不再直接写正在服务的数据库（save_etf_price 会整表重建、update_company_analytics_data
+会 DROP 后重建，期间读请求会看到空表、半成品或 database is locked）:
+1. 克隆：用 SQLite 备份API把正式库复制为 <库名>.staging<扩展名>（一致的快照，WAL 中已提交的数据也包含在内）
+2. 构建：导入、派生表等写入全部在暂存库中进行，与线上读请求互不竞争
+3. 发布：ANALYZE 更新查询规划统计，VACUUM INTO 生成紧凑的 <库名>.next<扩展名>，
+   再用 os.replace 原子地替换正式库
+4. 读取方：各接口按请求新建连接，Database.connect() 发现文件被替换后重新打开；
+   response_service.data_version() 随之变化，各缓存和多进程快照自动重载
+
+整个过程持有 database.writer_lock.write_lock，构建期间其他取锁的写库任务排队等待。
+不取写锁直接写正式库的程序（旧的命令行脚本等）在构建期间写入的数据会被发布覆盖，因此克隆前在正式库上
+打开一个监视连接记下 PRAGMA data_version，发布时在该连接上 BEGIN IMMEDIATE（挡住其他写入）再比较：
+克隆之后正式库有过其他连接的提交时拒绝发布（LiveChangedError），由 run() 重新克隆并重建。
+命令行脚本也应通过 writer_lock.locked 取锁后再写库，避免反复重建。
+发布的数据库为回滚日志（DELETE）模式，替换前把旧库的 WAL 合并并截断，遗留的空 -wal 不会影响新文件。
+
+时间序列存储（database/timeseries_store.py）保存的是正式库的数据：构建期间的 append_history
+登记到 build.after_publish，发布成功后在正式库连接上执行，未发布时随暂存库一起丢弃。
+
+ETF_STAGED_PUBLISH=0 时关闭，导入直接写正式库（旧行为）。
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from database import instrumentation
+from database.models import DATABASE_PATH
+from database.retention import STAGE_TAGS
+from database.writer_lock import write_lock
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv('ETF_STAGED_PUBLISH', '1') != '0'
+
+STAGING_TAG, NEXT_TAG = STAGE_TAGS
+
+# 发布时发现正式库被修改后最多构建的次数
+PUBLISH_ATTEMPTS = 3
+
+
+class LiveChangedError(RuntimeError):
+    """克隆之后正式库被其他连接修改过，发布会覆盖这些写入"""
+
+
+# 当前线程正在构建的暂存库
+_local = threading.local()
+
+
+def current():
+    """当前线程正在构建（尚未发布）的 StagedBuild，不在分阶段构建中时返回 None"""
+    return getattr(_local, 'build', None)
+
+
+def stage_path(live, tag):
+    base, ext = os.path.splitext(live)
+    return f"{base}{tag}{ext}"
+
+
+def _remove(path):
+    for suffix in ('', '-journal', '-wal', '-shm'):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def clone(source, target):
+    """用备份API复制数据库（源库可以同时被读取）"""
+    _remove(target)
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def optimize_into(source, target):
+    """对 source 执行 ANALYZE，再 VACUUM INTO 到 target（回滚日志模式、无碎片）"""
+    _remove(target)
+    conn = instrumentation.connect(source)
+    try:
+        conn.execute("ANALYZE")
+        conn.commit()
+        conn.execute("VACUUM INTO ?", (target,))
+    finally:
+        conn.close()
+    # 落盘后再替换，避免断电后正式库指向未写完的文件
+    with open(target, 'rb+') as f:
+        os.fsync(f.fileno())
+
+
+def watch(live):
+    """
+    在正式库上打开监视连接，返回 (连接, data_version)
+
+    data_version 只在其他连接提交写入时变化（本连接执行的 WAL 合并不会改变它），
+    发布前比较即可知道克隆之后是否有未经写锁的写入。
+    """
+    conn = sqlite3.connect(live, timeout=30, isolation_level=None)
+    return conn, conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+def swap(next_path, live, watcher=None, version=None):
+    """
+    用 next_path 原子替换正式库
+
+    传入 watch() 的结果时，在监视连接上持有写事务完成比较和替换，
+    正式库在此期间已被修改则抛出 LiveChangedError，不替换。
+    """
+    conn = watcher or sqlite3.connect(live, timeout=30, isolation_level=None)
+    try:
+        try:
+            # 旧库为 WAL 模式时先把 WAL 合并回主文件并截断
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error as e:
+            logger.warning(f"合并WAL失败: {e}")
+        # 持有写事务直到替换完成，比较之后不会再有写入落到旧文件上
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version is not None and conn.execute("PRAGMA data_version").fetchone()[0] != version:
+                raise LiveChangedError(f"数据库 {live} 在克隆后被其他程序修改，放弃发布")
+            os.replace(next_path, live)
+            replaced = True
+        except PermissionError:
+            replaced = False
+        finally:
+            conn.execute("ROLLBACK")
+        if not replaced:
+            # Windows 上正式库被其他进程打开时不能替换，退回到用备份API整体覆盖（覆盖期间读请求短暂等待）
+            logger.warning("无法直接替换数据库文件，改用备份API覆盖")
+            clone(next_path, live)
+            _remove(next_path)
+            return
+    finally:
+        if watcher is None:
+            conn.close()
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(os.path.dirname(os.path.abspath(live)), os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+@dataclass
+class StagedBuild:
+    # 暂存库路径，构建步骤写入这里
+    path: str
+    live: str
+    # 构建结束时为 True 才发布，否则丢弃暂存库
+    publish: bool = False
+    published: bool = False
+    timings: dict = field(default_factory=dict)
+    # 发布后在正式库连接上执行的回调 callback(conn)，如时间序列存储的增量写入
+    after_publish: list = field(default_factory=list)
+
+
+def _run_after_publish(build):
+    """依次执行 build.after_publish，单个回调失败只记录警告"""
+    if not build.after_publish:
+        return
+    conn = instrumentation.connect(build.live)
+    try:
+        for callback in build.after_publish:
+            try:
+                callback(conn)
+            except Exception as e:
+                logger.warning(f"发布后回调执行失败: {e}", exc_info=True)
+    finally:
+        conn.close()
+
+
+@contextmanager
+def staged(live=None, owner='publish'):
+    """
+    持有写锁克隆正式库，with 块内写入 build.path，结束时按 build.publish 发布或丢弃
+
+        with staging.staged() as build:
+            db = Database(build.path)
+            ...
+            build.publish = True
+    """
+    live = live or DATABASE_PATH
+    staging_path = stage_path(live, STAGING_TAG)
+    next_path = stage_path(live, NEXT_TAG)
+    with write_lock.hold(owner):
+        started = time.perf_counter()
+        # 先记下版本再克隆：两者之间的写入已在克隆中，最多多重建一次，不会丢失
+        watcher, version = watch(live)
+        try:
+            clone(live, staging_path)
+        except Exception:
+            watcher.close()
+            raise
+        build = StagedBuild(path=staging_path, live=live)
+        build.timings['clone'] = round(time.perf_counter() - started, 3)
+        _local.build = build
+        try:
+            try:
+                yield build
+            finally:
+                _local.build = None
+            if build.publish:
+                started = time.perf_counter()
+                optimize_into(staging_path, next_path)
+                build.timings['optimize'] = round(time.perf_counter() - started, 3)
+                started = time.perf_counter()
+                swap(next_path, live, watcher, version)
+                build.timings['swap'] = round(time.perf_counter() - started, 3)
+                build.published = True
+                logger.info(f"数据库已发布: {live}，" + '，'.join(f"{k} {v}s" for k, v in build.timings.items()))
+                _run_after_publish(build)
+        finally:
+            watcher.close()
+            _remove(staging_path)
+            _remove(next_path)
+
+
+@contextmanager
+def writing(owner, enabled=None):
+    """
+    写库任务的统一入口：enabled（默认 ENABLED）时等同 staged()，
+    否则持有写锁直接写正式库（build.path 即正式库，build.publish 不起作用）
+    """
+    if ENABLED if enabled is None else enabled:
+        with staged(owner=owner) as build:
+            yield build
+    else:
+        with write_lock.hold(owner):
+            build = StagedBuild(path=DATABASE_PATH, live=DATABASE_PATH)
+            yield build
+            _run_after_publish(build)
+
+
+def run(owner, build_step, enabled=None, attempts=PUBLISH_ATTEMPTS):
+    """
+    在 writing() 中执行 build_step(build)，发布时正式库已被修改（LiveChangedError）则重新克隆并重建
+
+    build_step 需可重复执行，由它设置 build.publish。返回最后一次构建的 StagedBuild。
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            with writing(owner, enabled) as build:
+                build_step(build)
+            return build
+        except LiveChangedError as e:
+            if attempt == attempts:
+                raise
+            logger.warning(f"{e}，重新构建（第{attempt + 1}次）")
@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+"""
+ETF历史时间序列存储
+
+将 etf_attention_history / etf_holders_history / etf_fund_size_history 这类
+按行存储的历史表，转存为"日期 × 代码"的稠密数组文件（numpy.memmap）。
+
+目录结构（默认 data/timeseries/）:
+    <dataset>/meta.json      日期轴、代码→列映射、列容量
+    <dataset>/<metric>.f8    float64 行主序数组，形状为 (日期数, 列容量)，缺失值为 NaN
+
+日期轴是行，新日期的追加只需在文件末尾写入一行；代码列预留容量，
+新增代码在容量内时无需重写文件。读取使用只读 memmap，多个进程通过
+操作系统页缓存共享同一份数据。
+
+数据集必须先从数据库全量建立（meta.json 中 complete 为 true），之后才接受增量写入、
+才供读取；否则读取方视为数据集不存在，回退查询数据库。
+
+meta.json 的 source 记录存储同步时来源表的行数和最新日期（与 database/dataset_versions.py
+登记的 row_count / latest_date 口径相同）。读取方用 is_current() 与正式库当前的登记版本比较，
+不一致（不经 append_history 的写入、归档删除了主库行等）时回退查询数据库，并把数据集标记为
+未完成，下一次带连接的增量写入会从数据库全量重建。
+分阶段构建期间的 append_history 推迟到发布之后执行（见 database/staging.py）。
+
+用法:
+    python -m database.timeseries_store            # 从数据库全量重建
+    python -m database.timeseries_store attention  # 只重建某个数据集
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import threading
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import pandas as pd
+
+from database.retention import history_source
+from utils.etf_code import normalize_etf_code
+
+# 存储目录，可用 ETF_TIMESERIES_DIR 覆盖
+STORE_DIR = os.getenv('ETF_TIMESERIES_DIR') or os.path.join(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))), 'data/timeseries')
+
+# 数据集定义：来源历史表及其指标列
+DATASETS = {
+    'attention': {
+        'table': 'etf_attention_history',
+        'metrics': ['attention_count'],
+    },
+    'holders': {
+        'table': 'etf_holders_history',
+        'metrics': ['holder_count', 'holding_amount', 'holding_value'],
+    },
+    'fund_size': {
+        'table': 'etf_fund_size_history',
+        'metrics': ['fund_size'],
+    },
+}
+
+# 以整数形式返回的指标
+INT_METRICS = {'attention_count', 'holder_count'}
+
+# 代码列容量按此粒度扩展，避免每新增一只ETF就重写文件
+CAPACITY_STEP = 256
+
+DTYPE = np.float64
+
+
+class TimeSeriesStore:
+    """
+    日期 × 代码稠密数组存储
+    """
+
+    def __init__(self, base_dir=None):
+        self.base_dir = base_dir or STORE_DIR
+        self._lock = threading.RLock()
+        # dataset -> (meta文件mtime, meta, date_index, code_index)
+        self._meta_cache = {}
+        # (dataset, metric) -> (meta文件mtime, memmap)
+        self._array_cache = {}
+
+    # ------------------------------------------------------------------
+    # 路径与元数据
+    # ------------------------------------------------------------------
+    def _dataset_dir(self, dataset):
+        if dataset not in DATASETS:
+            raise ValueError(f"未知的时间序列数据集: {dataset}")
+        return os.path.join(self.base_dir, dataset)
+
+    def _meta_path(self, dataset):
+        return os.path.join(self._dataset_dir(dataset), 'meta.json')
+
+    def _data_path(self, dataset, metric):
+        return os.path.join(self._dataset_dir(dataset), f'{metric}.f8')
+
+    def has_dataset(self, dataset):
+        """数据集是否已经从数据库建立"""
+        return self._load_meta(dataset) is not None
+
+    def _load_meta(self, dataset):
+        """读取元数据，按文件修改时间缓存；不是从数据库全量建立的数据集视为不存在"""
+        path = self._meta_path(dataset)
+        if not os.path.exists(path):
+            return None
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._meta_cache.get(dataset)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        with open(path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if not meta.get('complete'):
+            return None
+        meta['_date_index'] = {d: i for i, d in enumerate(meta['dates'])}
+        meta['_code_index'] = {c: i for i, c in enumerate(meta['codes'])}
+        meta['_mtime'] = mtime
+        self._meta_cache[dataset] = (mtime, meta)
+        return meta
+
+    def _save_meta(self, dataset, dates, codes, capacity, source=None, complete=True):
+        """原子写入元数据（先写临时文件再替换）"""
+        path = self._meta_path(dataset)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'dataset': dataset,
+                'metrics': DATASETS[dataset]['metrics'],
+                'dates': list(dates),
+                'codes': list(codes),
+                'capacity': int(capacity),
+                'source': source,
+                'complete': complete,
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._meta_cache.pop(dataset, None)
+        for metric in DATASETS[dataset]['metrics']:
+            self._array_cache.pop((dataset, metric), None)
+
+    def _open(self, dataset, metric, meta):
+        """以只读方式打开指标数组"""
+        key = (dataset, metric)
+        cached = self._array_cache.get(key)
+        if cached and cached[0] == meta['_mtime']:
+            return cached[1]
+
+        n_dates = len(meta['dates'])
+        if n_dates == 0:
+            array = np.empty((0, meta['capacity']), dtype=DTYPE)
+        else:
+            array = np.memmap(self._data_path(dataset, metric), dtype=DTYPE, mode='r',
+                              shape=(n_dates, meta['capacity']))
+        self._array_cache[key] = (meta['_mtime'], array)
+        return array
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+    def _write_full(self, dataset, dates, codes, arrays, source=None):
+        """用完整数组重写数据集"""
+        os.makedirs(self._dataset_dir(dataset), exist_ok=True)
+        capacity = _round_capacity(len(codes))
+        for metric in DATASETS[dataset]['metrics']:
+            full = np.full((len(dates), capacity), np.nan, dtype=DTYPE)
+            values = arrays.get(metric)
+            if values is not None and values.size:
+                full[:, :values.shape[1]] = values
+            tmp_path = self._data_path(dataset, metric) + '.tmp'
+            full.tofile(tmp_path)
+            os.replace(tmp_path, self._data_path(dataset, metric))
+        self._save_meta(dataset, dates, codes, capacity, source)
+
+    def invalidate(self, dataset):
+        """把数据集标记为未完成：读取方回退查询数据库，下一次带连接的增量写入全量重建"""
+        path = self._meta_path(dataset)
+        with self._lock:
+            if not os.path.exists(path):
+                return
+            with open(path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if not meta.get('complete'):
+                return
+            self._save_meta(dataset, meta['dates'], meta['codes'], meta['capacity'], meta.get('source'),
+                            complete=False)
+        print(f"时间序列 {dataset} 与数据库不一致，已标记为需要重建")
+
+    def append_frame(self, dataset, df, conn=None):
+        """
+        将长表格式的历史数据增量写入存储
+
+        参数:
+            dataset: 数据集名称（attention / holders / fund_size）
+            df: 至少包含 code、date 以及该数据集指标列的DataFrame
+            conn: 已提交这批数据的数据库连接，数据集尚未建立时用它全量建立，并用它记录来源版本
+
+        同一日期重复导入时覆盖该日期的值；新日期追加到日期轴末尾。
+        数据集尚未建立且没有 conn 时不写入（只用这一批数据建立会得到残缺的历史）。
+        没有 conn 时不记录来源版本，is_current() 不再成立，读取方回退查询数据库。
+        """
+        metrics = DATASETS[dataset]['metrics']
+        if df is None or df.empty:
+            return 0
+
+        frame = df[['code', 'date'] + [m for m in metrics if m in df.columns]].copy()
+        frame['code'] = frame['code'].map(normalize_etf_code)
+        frame['date'] = frame['date'].astype(str).str[:10]
+        frame = frame.dropna(subset=['code']).drop_duplicates(['code', 'date'], keep='last')
+
+        with self._lock:
+            meta = self._load_meta(dataset)
+            if meta is None:
+                if conn is None:
+                    print(f"时间序列 {dataset} 尚未从数据库建立，跳过增量写入")
+                    return 0
+                # 数据库中已包含这一批数据，全量建立即可
+                return self.rebuild_from_db(conn, dataset).get(dataset, 0)
+
+            source = _source(conn, dataset) if conn is not None else None
+            count = self._merge(dataset, frame, meta, source)
+            if source is not None and not self._matches(dataset, conn, source):
+                # 这一批之前存储就已与数据库不一致（如有写入没有调用 append_history），从数据库全量重建
+                print(f"时间序列 {dataset} 与数据库记录数不一致，从数据库重建")
+                return self.rebuild_from_db(conn, dataset).get(dataset, 0)
+            return count
+
+    def _merge(self, dataset, frame, meta, source):
+        """把 frame 合并进已建立的数据集，返回写入的记录数"""
+        metrics = DATASETS[dataset]['metrics']
+        dates = list(meta['dates'])
+        codes = list(meta['codes'])
+        new_dates = sorted(set(frame['date']) - set(meta['_date_index']))
+        new_codes = sorted(set(frame['code']) - set(meta['_code_index']))
+
+        # 回补早于最后一天的日期或代码超出容量时，整体重写
+        backfill = bool(new_dates) and bool(dates) and new_dates[0] < dates[-1]
+        if backfill or len(codes) + len(new_codes) > meta['capacity']:
+            existing = self._to_frame(dataset, meta)
+            merged = pd.concat([existing, frame], ignore_index=True)
+            merged = merged.drop_duplicates(['code', 'date'], keep='last')
+            return self._build(dataset, merged, source)
+
+        capacity = meta['capacity']
+        # 在文件末尾为新日期追加NaN行
+        if new_dates:
+            blank = np.full((len(new_dates), capacity), np.nan, dtype=DTYPE)
+            for metric in metrics:
+                with open(self._data_path(dataset, metric), 'ab') as f:
+                    blank.tofile(f)
+            dates.extend(new_dates)
+        codes.extend(new_codes)
+
+        date_index = {d: i for i, d in enumerate(dates)}
+        code_index = {c: i for i, c in enumerate(codes)}
+        rows = frame['date'].map(date_index).to_numpy()
+        cols = frame['code'].map(code_index).to_numpy()
+
+        for metric in metrics:
+            if metric not in frame.columns:
+                continue
+            array = np.memmap(self._data_path(dataset, metric), dtype=DTYPE, mode='r+',
+                              shape=(len(dates), capacity))
+            array[rows, cols] = pd.to_numeric(frame[metric], errors='coerce').to_numpy(dtype=DTYPE)
+            array.flush()
+            del array
+
+        self._save_meta(dataset, dates, codes, capacity, source)
+        return len(frame)
+
+    def _matches(self, dataset, conn, source):
+        """存储中主库日期范围内的记录数和最新日期是否与来源表一致（更早的日期来自归档库，不计入）"""
+        meta = self._load_meta(dataset)
+        if meta is None:
+            return False
+        latest = meta['dates'][-1] if meta['dates'] else None
+        if latest != (str(source['latest_date'])[:10] if source['latest_date'] else None):
+            return False
+        first = conn.execute(f"SELECT MIN(date) FROM main.{DATASETS[dataset]['table']}").fetchone()[0]
+        lo = bisect_left(meta['dates'], str(first)[:10]) if first else len(meta['dates'])
+        n_codes = len(meta['codes'])
+        present = np.zeros((len(meta['dates']) - lo, n_codes), dtype=bool)
+        for metric in DATASETS[dataset]['metrics']:
+            present |= ~np.isnan(np.asarray(self._open(dataset, metric, meta)[lo:, :n_codes]))
+        return int(present.sum()) == source['row_count']
+
+    def _build(self, dataset, frame, source=None):
+        """由长表构建完整数据集"""
+        metrics = DATASETS[dataset]['metrics']
+        dates = sorted(frame['date'].unique())
+        codes = sorted(frame['code'].unique())
+        arrays = {}
+        for metric in metrics:
+            if metric not in frame.columns:
+                continue
+            wide = frame.pivot(index='date', columns='code', values=metric)
+            wide = wide.reindex(index=dates, columns=codes)
+            arrays[metric] = wide.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=DTYPE)
+        self._write_full(dataset, dates, codes, arrays, source)
+        return len(frame)
+
+    def _to_frame(self, dataset, meta):
+        """将现有数组还原为长表"""
+        n_codes = len(meta['codes'])
+        data = {}
+        for metric in DATASETS[dataset]['metrics']:
+            array = self._open(dataset, metric, meta)
+            data[metric] = np.asarray(array[:, :n_codes]).ravel()
+        index = pd.MultiIndex.from_product([meta['dates'], meta['codes']], names=['date', 'code'])
+        frame = pd.DataFrame(data, index=index).dropna(how='all').reset_index()
+        return frame
+
+    def rebuild_from_db(self, conn, dataset=None):
+        """从数据库历史表全量重建一个或全部数据集"""
+        datasets = [dataset] if dataset else list(DATASETS)
+        counts = {}
+        for name in datasets:
+            spec = DATASETS[name]
+            cursor = conn.cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (spec['table'],))
+            if cursor.fetchone() is None:
+                print(f"表 {spec['table']} 不存在，跳过 {name}")
+                continue
+            cursor.execute(f"PRAGMA table_info({spec['table']})")
+            columns = {row[1] for row in cursor.fetchall()}
+            metrics = [m for m in spec['metrics'] if m in columns]
+            # 包括归档库中的周度/月度快照
+            frame = pd.read_sql_query(
+                f"SELECT code, date, {', '.join(metrics)} FROM {history_source(conn, spec['table'])}", conn)
+            frame['code'] = frame['code'].map(normalize_etf_code)
+            frame['date'] = frame['date'].astype(str).str[:10]
+            frame = frame.drop_duplicates(['code', 'date'], keep='last')
+            with self._lock:
+                counts[name] = self._build(name, frame, _source(conn, name))
+            print(f"时间序列 {name} 重建完成: {frame['date'].nunique()} 个日期, {frame['code'].nunique()} 只ETF")
+        return counts
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+    def is_current(self, dataset, version):
+        """
+        存储是否与数据库中该数据集的版本一致
+
+        参数:
+            version: 正式库的 DatasetVersion（dataset_versions.registry.get(dataset)），None 表示未登记
+
+        不一致时把数据集标记为未完成（见 invalidate），返回 False。
+        """
+        meta = self._load_meta(dataset)
+        if meta is None:
+            return False
+        source = meta.get('source')
+        if version is not None and source == {'row_count': version.row_count, 'latest_date': version.latest_date}:
+            return True
+        self.invalidate(dataset)
+        return False
+
+    def has_code(self, dataset, code):
+        """数据集中是否包含指定代码"""
+        meta = self._load_meta(dataset)
+        return meta is not None and normalize_etf_code(code) in meta['_code_index']
+
+    def get_dates(self, dataset):
+        """返回日期轴"""
+        meta = self._load_meta(dataset)
+        return list(meta['dates']) if meta else []
+
+    def get_series(self, dataset, metric, code, start=None, end=None):
+        """
+        获取单只ETF某指标的时间序列
+
+        返回:
+            (日期列表, numpy数组)，数组中缺失值为NaN
+        """
+        meta = self._load_meta(dataset)
+        code = normalize_etf_code(code)
+        if meta is None or code not in meta['_code_index']:
+            return [], np.empty(0, dtype=DTYPE)
+        lo, hi = _date_slice(meta['dates'], start, end)
+        array = self._open(dataset, metric, meta)
+        return meta['dates'][lo:hi], np.asarray(array[lo:hi, meta['_code_index'][code]])
+
+    def get_history(self, dataset, code, metrics=None, start=None, end=None):
+        """
+        获取单只ETF的历史记录，格式与数据库查询结果一致
+
+        返回:
+            [{"date": ..., metric: ...}, ...]，跳过所有指标都缺失的日期
+        """
+        metrics = metrics or DATASETS[dataset]['metrics']
+        dates = None
+        columns = {}
+        for metric in metrics:
+            dates, values = self.get_series(dataset, metric, code, start, end)
+            columns[metric] = values
+        if not dates:
+            return []
+
+        present = ~np.all(np.isnan(np.vstack([columns[m] for m in metrics])), axis=0)
+        result = []
+        for i in np.flatnonzero(present):
+            record = {'date': dates[i]}
+            for metric in metrics:
+                record[metric] = _to_python(columns[metric][i], metric)
+            result.append(record)
+        return result
+
+    def as_of(self, dataset, metric, date):
+        """
+        获取所有ETF在指定日期（或之前最近一个日期）的指标值
+
+        返回:
+            (实际日期, {code: value})
+        """
+        meta = self._load_meta(dataset)
+        if meta is None:
+            return None, {}
+        row = bisect_right(meta['dates'], str(date)[:10]) - 1
+        if row < 0:
+            return None, {}
+        array = self._open(dataset, metric, meta)
+        values = np.asarray(array[row, :len(meta['codes'])])
+        mask = ~np.isnan(values)
+        codes = np.asarray(meta['codes'], dtype=object)[mask]
+        return meta['dates'][row], {
+            code: _to_python(value, metric) for code, value in zip(codes, values[mask])
+        }
+
+    def delta(self, dataset, metric, periods=1, date=None):
+        """
+        计算所有ETF在N个日期间隔上的指标变化
+
+        参数:
+            periods: 向前比较的日期个数（1为日变化，5为周变化）
+            date: 截止日期，默认最新日期
+
+        返回:
+            (截止日期, 起始日期, {code: 变化值})
+        """
+        meta = self._load_meta(dataset)
+        if meta is None or not meta['dates']:
+            return None, None, {}
+        end_row = len(meta['dates']) - 1 if date is None else bisect_right(meta['dates'], str(date)[:10]) - 1
+        start_row = end_row - periods
+        if start_row < 0:
+            return None, None, {}
+        n_codes = len(meta['codes'])
+        array = self._open(dataset, metric, meta)
+        change = np.asarray(array[end_row, :n_codes]) - np.asarray(array[start_row, :n_codes])
+        mask = ~np.isnan(change)
+        codes = np.asarray(meta['codes'], dtype=object)[mask]
+        return meta['dates'][end_row], meta['dates'][start_row], {
+            code: _to_python(value, metric) for code, value in zip(codes, change[mask])
+        }
+
+
+def _source(conn, dataset):
+    """来源表（主库）的行数和最新日期，口径与 dataset_versions.measure 一致"""
+    row_count, latest_date = conn.execute(
+        f"SELECT COUNT(*), MAX(date) FROM main.{DATASETS[dataset]['table']}").fetchone()
+    return {'row_count': row_count, 'latest_date': latest_date}
+
+
+def _round_capacity(n_codes):
+    """代码列容量向上取整到 CAPACITY_STEP 的倍数，并预留一档余量"""
+    return (n_codes // CAPACITY_STEP + 1) * CAPACITY_STEP
+
+
+def _date_slice(dates, start=None, end=None):
+    """按日期范围计算行切片"""
+    lo = bisect_left(dates, str(start)[:10]) if start else 0
+    hi = bisect_right(dates, str(end)[:10]) if end else len(dates)
+    return lo, hi
+
+
+def _to_python(value, metric):
+    """将numpy数值转换为可JSON序列化的Python值"""
+    if value is None or np.isnan(value):
+        return None
+    if metric in INT_METRICS:
+        return int(value)
+    return float(value)
+
+
+# 进程内共享的存储实例
+_store = None
+
+
+def get_store():
+    """获取全局时间序列存储实例"""
+    global _store
+    if _store is None:
+        _store = TimeSeriesStore()
+    return _store
+
+
+def append_history(dataset, df, conn=None):
+    """
+    导入程序使用的增量写入入口，须在这批数据提交到数据库之后调用
+
+    在分阶段构建中（conn 指向暂存库）时推迟到发布成功之后，在正式库连接上写入。
+    写入失败只打印警告，不影响数据库导入本身；存储可随时通过全量重建恢复。
+    """
+    from database import staging
+
+    build = staging.current()
+    if build is not None:
+        build.after_publish.append(lambda live_conn: append_history(dataset, df, live_conn))
+        print(f"时间序列存储 {dataset} 的 {len(df)} 条记录将在数据库发布后写入")
+        return True
+    try:
+        count = get_store().append_frame(dataset, df, conn)
+        print(f"时间序列存储 {dataset} 已更新 {count} 条记录")
+        return True
+    except Exception as e:
+        print(f"更新时间序列存储 {dataset} 失败: {str(e)}")
+        return False
+
+
+if __name__ == '__main__':
+    from database.models import DATABASE_PATH
+
+    target = sys.argv[1] if len(sys.argv) > 1 else None
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        get_store().rebuild_from_db(conn, target)
+    finally:
+        conn.close()
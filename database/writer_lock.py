@@ -0,0 +1,114 @@
+"""
+数据库写锁
+
+SQLite 同一时间只允许一个写事务，多个导入/刷新任务同时写库会互相等待甚至报 database is locked。
+所有批量写库的任务（数据导入、上传导入、飞书同步、派生表刷新）都先取得 write_lock:
+- 进程内用可重入锁，同一线程嵌套获取不会死锁（如调度任务内部调用 run_import）
+- 支持 fcntl 的平台（Linux/macOS）同时对 <数据库路径>.lock 加 flock，
+  独立的调度进程、gunicorn worker 中的上传导入和命令行脚本之间也互斥
+直接写正式库的命令行脚本用 @locked('脚本名') 包装写库函数，
+避免写入落在数据库构建（见 database.staging）期间被发布覆盖。
+"""
+
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 只做进程内互斥
+    fcntl = None
+
+from database.models import DATABASE_PATH
+
+
+class WriterLock:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+        self.owner = None
+        self.acquired_at = None
+
+    def _lock_file(self):
+        if fcntl is None:
+            return
+        self._file = open(self.path, 'a')
+        try:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        except Exception:
+            self._file.close()
+            self._file = None
+            raise
+
+    def _unlock_file(self):
+        if self._file is None:
+            return
+        try:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def acquire(self, owner=None):
+        """阻塞直到取得写锁，owner 仅用于状态展示"""
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                self._lock_file()
+            except Exception:
+                self._lock.release()
+                raise
+            self.owner = owner or threading.current_thread().name
+            self.acquired_at = time.time()
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            self.owner = self.acquired_at = None
+            try:
+                self._unlock_file()
+            finally:
+                self._lock.release()
+        else:
+            self._lock.release()
+
+    @contextmanager
+    def hold(self, owner):
+        """with write_lock.hold('任务名'): ... 形式的写锁，记录持有者"""
+        self.acquire(owner)
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+    def status(self):
+        """本进程内的持有情况"""
+        if self.owner is None:
+            return {'held': False}
+        return {'held': True, 'owner': self.owner, 'seconds': round(time.time() - self.acquired_at, 3)}
+
+
+write_lock = WriterLock(DATABASE_PATH + '.lock')
+
+
+def locked(owner):
+    """装饰器：持有 write_lock 执行被装饰的函数"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with write_lock.hold(owner):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -5,8 +5,12 @@ import time
 import akshare as ak
 import requests
 import random
+import sqlite3
+import contextlib
 from functools import wraps
 
+from database.price_metrics import compute_panel_metrics
+
 def retry_on_exception(max_retries=3, delay=2):
     """
     重试装饰器，用于在发生异常时自动重试函数
@@ -32,8 +36,140 @@ def retry_on_exception(max_retries=3, delay=2):
         return wrapper
     return decorator
 
+# 价格缓存中保存的列
+CACHE_COLUMNS = ['open', 'high', 'low', 'close', 'vol']
+
+
+def latest_trading_day(now=None, close_time=datetime.time(15, 30)):
+    """
+    推算最近一个已收盘的交易日（YYYYMMDD）
+
+    收盘前取前一天，并跳过周末；节假日无法离线判断，由水位表的 checked_day 避免对同一目标日重复请求。
+    """
+    now = now or datetime.datetime.now()
+    day = now.date()
+    if now.time() < close_time:
+        day -= datetime.timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= datetime.timedelta(days=1)
+    return day.strftime('%Y%m%d')
+
+
+class PriceCache:
+    """
+    本地ETF日线缓存（SQLite）
+
+    price_cache 按 (code, trade_date) 保存日线，price_watermark 记录每只ETF已缓存的最后交易日（水位）
+    和最后一次请求接口时的目标交易日（checked_day），水位落后于最近交易日、且还没有为该交易日
+    请求过时才需要联网获取。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS price_cache (
+                    code TEXT NOT NULL,
+                    trade_date TEXT NOT NULL,
+                    {', '.join(f'{c} REAL' for c in CACHE_COLUMNS)},
+                    PRIMARY KEY (code, trade_date)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS price_watermark (
+                    code TEXT PRIMARY KEY,
+                    last_date TEXT,
+                    checked_day TEXT
+                )
+            """)
+            # 旧版缓存只有 checked_date 列（记录请求当天的日期），补上 checked_day，旧列不再使用
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(price_watermark)")}
+            if 'checked_day' not in columns:
+                conn.execute("ALTER TABLE price_watermark ADD COLUMN checked_day TEXT")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def watermark(self, code):
+        """返回 (last_date, checked_day)，未缓存时为 (None, None)"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT last_date, checked_day FROM price_watermark WHERE code = ?", (code,)).fetchone()
+        return row if row else (None, None)
+
+    def needs_fetch(self, code, latest_day):
+        """
+        水位落后于最近交易日 latest_day，且还没有为 latest_day 请求过时需要联网
+
+        同一天内目标交易日会变化（收盘前为前一交易日，收盘后为当天），收盘后仍会再请求一次；
+        接口没有返回该日数据（如节假日）时，同一目标日不再重复请求。
+        """
+        last_date, checked_day = self.watermark(code)
+        if last_date is not None and last_date >= latest_day:
+            return False
+        return checked_day != latest_day
+
+    def merge(self, code, df, checked_day=None):
+        """
+        合并新获取的日线，只写入水位之后的行并推进水位，返回新增行数
+
+        df 需包含 trade_date（YYYYMMDD）和 CACHE_COLUMNS 中的列；
+        checked_day 为本次请求的目标交易日，默认 latest_trading_day()。
+        """
+        checked_day = checked_day or latest_trading_day()
+        last_date, _ = self.watermark(code)
+        if df is not None and not df.empty:
+            new_rows = df if last_date is None else df[df['trade_date'] > last_date]
+        else:
+            new_rows = pd.DataFrame(columns=['trade_date'] + CACHE_COLUMNS)
+        columns = ['trade_date'] + CACHE_COLUMNS
+        new_rows = new_rows.reindex(columns=columns)
+        with self._connect() as conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO price_cache (code, {', '.join(columns)}) "
+                f"VALUES (?, {', '.join('?' for _ in columns)})",
+                ((code, *row) for row in new_rows.astype(object).where(new_rows.notna(), None)
+                 .itertuples(index=False, name=None)))
+            if not new_rows.empty:
+                last_date = max(last_date or '', new_rows['trade_date'].max())
+            conn.execute("""
+                INSERT INTO price_watermark (code, last_date, checked_day) VALUES (?, ?, ?)
+                ON CONFLICT(code) DO UPDATE SET last_date = excluded.last_date,
+                                                checked_day = excluded.checked_day
+            """, (code, last_date, checked_day))
+        return len(new_rows)
+
+    def load(self, code, start_date=None, end_date=None):
+        """读取缓存的日线，日期格式 YYYYMMDD，按日期升序"""
+        with self._connect() as conn:
+            df = pd.read_sql_query(
+                f"""
+                SELECT trade_date, {', '.join(CACHE_COLUMNS)} FROM price_cache
+                WHERE code = ? AND (? IS NULL OR trade_date >= ?) AND (? IS NULL OR trade_date <= ?)
+                ORDER BY trade_date
+                """,
+                conn, params=(code, start_date, start_date, end_date, end_date))
+        df['date'] = pd.to_datetime(df['trade_date'], format='%Y%m%d').dt.strftime('%Y-%m-%d')
+        return df
+
+    def load_panel(self, codes, start_date, end_date):
+        """读取多只ETF在日期区间内的收盘价长表（code, date, close），用于一次性计算面板指标"""
+        with self._connect() as conn:
+            panel = pd.read_sql_query("""
+                SELECT code, trade_date AS date, close FROM price_cache
+                WHERE trade_date >= ? AND trade_date <= ?
+            """, conn, params=(start_date, end_date))
+        return panel[panel['code'].isin(set(codes))]
+
+
 class ETFPriceTracker:
-    def __init__(self, token=None, use_proxy=False, proxy_list=None, max_retries=3):
+    def __init__(self, token=None, use_proxy=False, proxy_list=None, max_retries=3, use_cache=True, cache_path=None):
         """
         初始化ETF价格追踪器
         
@@ -42,11 +178,18 @@ class ETFPriceTracker:
             use_proxy: 是否使用代理
             proxy_list: 代理列表，格式为["http://ip:port", ...]
             max_retries: 最大重试次数
+            use_cache: 是否使用本地价格缓存，只增量获取水位之后的数据
+            cache_path: 缓存数据库路径，默认 data/etf_price_cache.db
         """
         # 创建数据目录
         self.data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
         if not os.path.exists(self.data_dir):
             os.makedirs(self.data_dir)
+        
+        # 本地价格缓存
+        self.cache = None
+        if use_cache:
+            self.cache = PriceCache(cache_path or os.path.join(self.data_dir, 'etf_price_cache.db'))
             
         # 代理设置
         self.use_proxy = use_proxy
@@ -144,6 +287,64 @@ class ETFPriceTracker:
                     print(f"不使用代理获取ETF列表也失败: {str(inner_e)}")
             return pd.DataFrame()
     
+    def _download_prices(self, symbol, since=None):
+        """
+        从接口获取日线，返回含 trade_date(YYYYMMDD) 和 CACHE_COLUMNS 的DataFrame
+
+        有水位时优先用支持日期范围的 fund_etf_hist_em 只取水位之后的数据，
+        失败或接口不可用时回退到 fund_etf_hist_sina（返回全部历史）。
+        """
+        if since and hasattr(ak, 'fund_etf_hist_em'):
+            try:
+                df = ak.fund_etf_hist_em(symbol=symbol, period='daily', start_date=since,
+                                         end_date=datetime.datetime.now().strftime('%Y%m%d'), adjust='')
+                df = df.rename(columns={'日期': 'date', '开盘': 'open', '最高': 'high',
+                                        '最低': 'low', '收盘': 'close', '成交量': 'vol'})
+                df['trade_date'] = pd.to_datetime(df['date']).dt.strftime('%Y%m%d')
+                return df
+            except Exception as e:
+                print(f"增量获取ETF {symbol} 价格失败，改为获取全部历史: {str(e)}")
+
+        df = ak.fund_etf_hist_sina(symbol=symbol)
+        
+        # 转换日期格式
+        df['trade_date'] = pd.to_datetime(df['date']).dt.strftime('%Y%m%d')
+        
+        # 重命名列以匹配原有格式
+        df = df.rename(columns={
+            "open": "open",
+            "high": "high",
+            "low": "low",
+            "close": "close",
+            "volume": "vol"
+        })
+        return df
+
+    def refresh_cache(self, symbol):
+        """
+        水位落后于最近交易日时联网获取并只合并新增的行
+        
+        返回:
+            bool: 是否实际请求了接口
+        """
+        latest_day = latest_trading_day()
+        if not self.cache.needs_fetch(symbol, latest_day):
+            return False
+        last_date, _ = self.cache.watermark(symbol)
+        since = None
+        if last_date:
+            since = (datetime.datetime.strptime(last_date, '%Y%m%d') + datetime.timedelta(days=1)).strftime('%Y%m%d')
+        added = self.cache.merge(symbol, self._download_prices(symbol, since), latest_day)
+        print(f"ETF {symbol} 缓存新增 {added} 条日线（原水位 {last_date or '无'}）")
+        return True
+
+    def _get_prices(self, symbol, start_date=None, end_date=None):
+        """获取ETF日线，使用缓存时先增量更新再从缓存读取指定区间（YYYYMMDD）"""
+        if self.cache is None:
+            return self._download_prices(symbol)
+        self.refresh_cache(symbol)
+        return self.cache.load(symbol, start_date, end_date)
+    
     @retry_on_exception(max_retries=3, delay=2)
     def get_etf_daily_price(self, ts_code, start_date=None, end_date=None):
         """
@@ -178,24 +379,12 @@ class ETFPriceTracker:
                 # 转换日期格式从YYYYMMDD到YYYY-MM-DD
                 start_date = f"{start_date[:4]}-{start_date[4:6]}-{start_date[6:8]}"
             
-            # 获取ETF每日价格
-            df = ak.fund_etf_hist_sina(symbol=symbol)
-            
-            # 转换日期格式
-            df['trade_date'] = pd.to_datetime(df['date']).dt.strftime('%Y%m%d')
-            
-            # 重命名列以匹配原有格式
-            df = df.rename(columns={
-                "open": "open",
-                "high": "high",
-                "low": "low",
-                "close": "close",
-                "volume": "vol"
-            })
-            
-            # 筛选日期范围
+            # 获取ETF每日价格（有缓存时只增量获取）
             start_date_fmt = datetime.datetime.strptime(start_date, '%Y-%m-%d').strftime('%Y%m%d')
             end_date_fmt = datetime.datetime.strptime(end_date, '%Y-%m-%d').strftime('%Y%m%d')
+            df = self._get_prices(symbol, start_date_fmt, end_date_fmt)
+            
+            # 筛选日期范围
             df = df[(df['trade_date'] >= start_date_fmt) & (df['trade_date'] <= end_date_fmt)]
             
             # 按日期升序排序
@@ -213,23 +402,11 @@ class ETFPriceTracker:
                     del os.environ['https_proxy']
                 try:
                     # 重新获取ETF每日价格
-                    df = ak.fund_etf_hist_sina(symbol=symbol)
-                    
-                    # 转换日期格式
-                    df['trade_date'] = pd.to_datetime(df['date']).dt.strftime('%Y%m%d')
-                    
-                    # 重命名列以匹配原有格式
-                    df = df.rename(columns={
-                        "open": "open",
-                        "high": "high",
-                        "low": "low",
-                        "close": "close",
-                        "volume": "vol"
-                    })
-                    
-                    # 筛选日期范围
                     start_date_fmt = datetime.datetime.strptime(start_date, '%Y-%m-%d').strftime('%Y%m%d')
                     end_date_fmt = datetime.datetime.strptime(end_date, '%Y-%m-%d').strftime('%Y%m%d')
+                    df = self._get_prices(symbol, start_date_fmt, end_date_fmt)
+                    
+                    # 筛选日期范围
                     df = df[(df['trade_date'] >= start_date_fmt) & (df['trade_date'] <= end_date_fmt)]
                     
                     # 按日期升序排序
@@ -276,6 +453,43 @@ class ETFPriceTracker:
         
         return price_data
     
+    def calculate_cached_returns(self, etfs, end_date):
+        """
+        从缓存读取全部ETF的收盘价，转成 日期 × 代码 矩阵一次性计算最新涨跌幅，不再逐只计算
+        
+        参数:
+            etfs: 字典列表，包含 ts_code、fund_name、symbol
+            end_date: 截止日期，格式YYYYMMDD
+            
+        返回:
+            list: 每只ETF最新交易日的数据字典，字段与 calculate_returns 结果的最后一行一致；
+                  缓存中没有数据的ETF被跳过
+        """
+        # 读取当年数据，并往前多读一个月，保证年初几天也能计算近5日涨跌幅
+        end = datetime.datetime.strptime(end_date, '%Y%m%d')
+        start_date = min(f"{end_date[:4]}0101", (end - datetime.timedelta(days=31)).strftime('%Y%m%d'))
+        panel = self.cache.load_panel([etf['symbol'] for etf in etfs], start_date, end_date)
+        metrics = compute_panel_metrics(panel)
+        if metrics.empty:
+            return []
+        # 每只ETF取自己最后一个交易日
+        latest = metrics.groupby('code').tail(1).set_index('code')
+        
+        results = []
+        for etf in etfs:
+            if etf['symbol'] not in latest.index:
+                continue
+            row = latest.loc[etf['symbol']]
+            results.append({
+                **etf,
+                'trade_date': row['date'],
+                'close': row['close'],
+                'daily_return': row['return_1d'],
+                '5d_return': row['return_5d'],
+                'ytd_return': row['return_ytd'],
+            })
+        return results
+    
     def get_limited_etf_prices(self, limit=5, start_date=None, end_date=None):
         """
         获取指定数量ETF的价格数据并计算涨跌幅
@@ -334,6 +548,7 @@ class ETFPriceTracker:
         """
         # 存储所有ETF的最新数据
         results = []
+        cached = []
         
         # 获取当前日期作为默认结束日期
         if not end_date:
@@ -346,6 +561,22 @@ class ETFPriceTracker:
             
             print(f"正在处理 {i+1}/{len(etfs)}: {fund_name} ({ts_code})")
             
+            if self.cache is not None:
+                # 这里只增量更新缓存（失败时使用已缓存的数据），涨跌幅在循环结束后一次性计算
+                symbol = ts_code.split('.')[0]
+                fetched = False
+                try:
+                    self._set_proxy()
+                    fetched = self.refresh_cache(symbol)
+                except Exception as e:
+                    print(f"更新ETF {ts_code} 价格缓存失败，使用已缓存数据: {str(e)}")
+                cached.append({'ts_code': ts_code, 'fund_name': fund_name, 'symbol': symbol})
+                
+                # 只有实际请求了接口才需要延迟
+                if fetched:
+                    time.sleep(0.5)
+                continue
+            
             # 获取价格数据
             price_data = self.get_etf_daily_price(ts_code, start_date, end_date)
             if price_data.empty:
@@ -367,6 +598,9 @@ class ETFPriceTracker:
             # 添加延迟以避免频繁请求
             time.sleep(0.5)
         
+        if cached:
+            results = self.calculate_cached_returns(cached, end_date)
+        
         # 转换为DataFrame
         if results:
             result_df = pd.DataFrame(results)
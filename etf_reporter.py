@@ -2,7 +2,8 @@ import pandas as pd
 from docx import Document
 from docx.shared import Pt
 from docx.oxml.ns import qn
-import glob
+from services.period_service import get_period_comparison_wide, weekly_dates
+from utils.docx_table import BUSINESS_FILL, add_dataframe_table
 from datetime import datetime, timedelta
 
 # 新增版本信息
@@ -15,28 +16,19 @@ def show_version():
     print("Copyright © 2024 邱超. All rights reserved.")
 
 def preprocess_data():
-    # 动态获取最新数据文件
-    files = glob.glob('ETF_基础数据合并_*.csv')
-    if not files:
-        raise FileNotFoundError("未找到ETF基础数据文件")
-    
-    # 提取最新文件日期
-    filename = sorted(files)[-1]
-    date_str = filename.split('_')[-1].split('.')[0]
-    
-    try:
-        current_date = datetime.strptime(date_str, "%Y%m%d")
-    except ValueError:
-        raise ValueError("文件名日期格式应为ETF_基础数据合并_YYYYMMDD.csv")
-    
+    # 从历史表合并最新一周与上周的数据（不再读取 ETF_基础数据合并_*.csv）
+    previous_iso, current_iso = weekly_dates()
+    current_date = datetime.strptime(current_iso, "%Y-%m-%d")
     previous_date = current_date - timedelta(days=7)
+    date_str = current_date.strftime("%Y%m%d")
     
     # 修正日期格式（保留前导零）
-    current_str = current_date.strftime("%m月%d日")  # 02月14日（保留前导零）
-    previous_str = previous_date.strftime("%m月%d日")  # 02月07日
+    current_str = current_date.strftime("%m月%d日")
+    previous_str = previous_date.strftime("%m月%d日")
 
-    # 读取数据
-    result = pd.read_csv(filename, encoding='utf-8-sig')
+    # 读取数据（与原合并脚本一致，数值列的缺失值按0处理）
+    result = get_period_comparison_wide([previous_iso, current_iso])
+    result = result.fillna({col: 0 for col in result.select_dtypes('number').columns})
     
     # 动态商务协议文件
     商务协议_path = f'/Users/admin/Downloads/ETF单产品商务协议{date_str}.xlsx'
@@ -485,44 +477,34 @@ class ETFReporter:
 
     def _add_table(self, title, data, metric):
         self.doc.add_heading(title, level=2)
-        table = self.doc.add_table(rows=1, cols=7)
-        table.style = 'Light Shading Accent 1'
-
-        headers = ['证券代码', '产品名称', '管理人', '当前值', '上周值', '变动值', '商务属性']
-        
-        for i, header in enumerate(headers):
-            cell = table.rows[0].cells[i]
-            cell.text = header
-            cell.paragraphs[0].runs[0].font.bold = True
-
-        # 初始化序号计数器 (修复点)
-        desc_counter = 1  # 在循环外部初始化
-
-        for _, row in data.iterrows():
-            cells = table.add_row().cells
-            cells[0].text = str(row['证券代码'])
-            cells[1].text = row[f'证券名称（{self.end_date}）']
-            cells[2].text = get_manager_short(row['基金管理人'])
-            cells[3].text = self._format_value(row[f'{metric}（{self.end_date}）'], metric)
-            cells[4].text = self._format_value(row[f'{metric}（{self.start_date}）'], metric)
-            cells[5].text = self._format_delta(row[f'{metric}变动'], '', metric)
-            cells[6].text = row['是否商务品']
-
-            # 针对非商务品，生成描述信息
-            if row['是否商务品'] == '非商务' and title == "关注人数增长Top20":
-                # 处理数值
-                month_avg = row['月成交额[交易日期]最新收盘日[单位]百万元']
-                rounded_month_avg = int(round(month_avg))
-                management_fee = row['管理费率[单位]%']
-                metric_change = int(row[f'{metric}变动'])
-
-                # 添加描述段落
-                para = self.doc.add_paragraph()
-                para.add_run(f"{desc_counter}. ").bold = True
-                para.add_run(f"{get_manager_short(row['基金管理人'])}基金的{row[f'证券名称（{self.end_date}）']}（代码{row['证券代码']}），月日均交易额{rounded_month_avg}，本周新增{metric_change}关注数，管理费率{management_fee}%，非商务品。以下是同跟踪指数产品列表：")
-                
-                self._add_alternative_etfs(row['跟踪指数代码'], metric)
-                desc_counter += 1
+        add_dataframe_table(self.doc, data, [
+            ('证券代码', '证券代码', None),
+            ('产品名称', f'证券名称（{self.end_date}）', None),
+            ('管理人', '基金管理人', get_manager_short),
+            ('当前值', f'{metric}（{self.end_date}）', lambda v: self._format_value(v, metric)),
+            ('上周值', f'{metric}（{self.start_date}）', lambda v: self._format_value(v, metric)),
+            ('变动值', f'{metric}变动', lambda v: self._format_delta(v, '', metric)),
+            ('商务属性', '是否商务品', None),
+        ])
+
+        if title != "关注人数增长Top20":
+            return
+
+        # 针对非商务品，在表格后逐个生成描述信息和同跟踪指数产品列表
+        non_business = data[data['是否商务品'] == '非商务']
+        for desc_counter, row in enumerate(non_business.to_dict('records'), start=1):
+            # 处理数值
+            month_avg = row['月成交额[交易日期]最新收盘日[单位]百万元']
+            rounded_month_avg = int(round(month_avg))
+            management_fee = row['管理费率[单位]%']
+            metric_change = int(row[f'{metric}变动'])
+
+            # 添加描述段落
+            para = self.doc.add_paragraph()
+            para.add_run(f"{desc_counter}. ").bold = True
+            para.add_run(f"{get_manager_short(row['基金管理人'])}基金的{row[f'证券名称（{self.end_date}）']}（代码{row['证券代码']}），月日均交易额{rounded_month_avg}，本周新增{metric_change}关注数，管理费率{management_fee}%，非商务品。以下是同跟踪指数产品列表：")
+
+            self._add_alternative_etfs(row['跟踪指数代码'], metric)
 
     def _add_alternative_etfs(self, tracking_index_code, metric):
         # 获取同跟踪指数的所有ETF产品
@@ -535,27 +517,18 @@ class ETFReporter:
         # 只展示前十个
         alternative_etfs = alternative_etfs.head(10)
         
-        # 生成表格
-        table = self.doc.add_table(rows=1, cols=10)
-        table.style = 'Light Shading Accent 1'
-        
-        headers = ['产品代码', '产品名称', '管理人', '关注数当前值', '关注数变动值', '规模', '管理费率', '月日均交易额', '商务属性']
-        for i, header in enumerate(headers):
-            cell = table.rows[0].cells[i]
-            cell.text = header
-            cell.paragraphs[0].runs[0].font.bold = True
-
-        for _, row in alternative_etfs.iterrows():
-            cells = table.add_row().cells
-            cells[0].text = str(row['证券代码'])
-            cells[1].text = row[f'证券名称（{self.end_date}）']
-            cells[2].text = get_manager_short(row['基金管理人'])
-            cells[3].text = self._format_value(row[f'{metric}（{self.end_date}）'], metric)
-            cells[4].text = self._format_delta(row[f'{metric}变动'], '', metric)
-            cells[5].text = self._format_value(row['基金规模(合计)[交易日期]S_cal_date(now(),0,D,0)[单位]亿元'], '规模')
-            cells[6].text = str(row['管理费率[单位]%'])
-            cells[7].text = self._format_value(row['月成交额[交易日期]最新收盘日[单位]百万元'], '月日均交易额')            
-            cells[8].text = row['是否商务品']
+        # 生成表格，商务品行高亮
+        add_dataframe_table(self.doc, alternative_etfs, [
+            ('产品代码', '证券代码', None),
+            ('产品名称', f'证券名称（{self.end_date}）', None),
+            ('管理人', '基金管理人', get_manager_short),
+            ('关注数当前值', f'{metric}（{self.end_date}）', lambda v: self._format_value(v, metric)),
+            ('关注数变动值', f'{metric}变动', lambda v: self._format_delta(v, '', metric)),
+            ('规模', '基金规模(合计)[交易日期]S_cal_date(now(),0,D,0)[单位]亿元', lambda v: self._format_value(v, '规模')),
+            ('管理费率', '管理费率[单位]%', None),
+            ('月日均交易额', '月成交额[交易日期]最新收盘日[单位]百万元', lambda v: self._format_value(v, '月日均交易额')),
+            ('商务属性', '是否商务品', None),
+        ], row_fills=alternative_etfs['是否商务品'].eq('商务').map({True: BUSINESS_FILL, False: None}))
 
     def add_classification_analysis(self):
         # 按分类统计
@@ -580,24 +553,15 @@ class ETFReporter:
 
             # 添加到报告
             self.doc.add_heading(f"{level}统计", level=2)
-            table = self.doc.add_table(rows=1, cols=7)
-            table.style = 'Light Shading Accent 1'
-
-            headers = [level, '总关注数', '本周关注数变化', '总持仓数', '本周持仓数变化', '总持仓市值', '本周持仓市值变化']
-            for i, header in enumerate(headers):
-                cell = table.rows[0].cells[i]
-                cell.text = header
-                cell.paragraphs[0].runs[0].font.bold = True
-
-            for _, row in grouped.iterrows():
-                cells = table.add_row().cells
-                cells[0].text = str(row[level])
-                cells[1].text = str(int(row[f'关注人数（{self.end_date}）']))  # 总关注数
-                cells[2].text = str(int(row['关注人数变动']))  # 本周关注数变化（取整数）
-                cells[3].text = str(int(row[f'持仓客户数（{self.end_date}）']))  # 总持仓数
-                cells[4].text = str(int(row['持仓客户数变动']))  # 本周持仓数变化（取整数）
-                cells[5].text = self._format_value(row[f'保有金额（{self.end_date}）'], '保有金额')  # 总持仓市值（智能格式化）
-                cells[6].text = self._format_value(row['保有金额变动'], '保有金额')  # 本周持仓价值变化（智能格式化）
+            add_dataframe_table(self.doc, grouped, [
+                (level, level, None),
+                ('总关注数', f'关注人数（{self.end_date}）', int),
+                ('本周关注数变化', '关注人数变动', int),
+                ('总持仓数', f'持仓客户数（{self.end_date}）', int),
+                ('本周持仓数变化', '持仓客户数变动', int),
+                ('总持仓市值', f'保有金额（{self.end_date}）', lambda v: self._format_value(v, '保有金额')),
+                ('本周持仓市值变化', '保有金额变动', lambda v: self._format_value(v, '保有金额')),
+            ])
 
 # 新增商务品分析方法
     def _add_business_analysis(self):
@@ -773,32 +737,13 @@ class ETFReporter:
         # 合并数据
         merged_stats = all_company.merge(biz_company, on='基金管理人', how='left').fillna(0)
         
-        # 计算各项收入（单位：万元）
-        for idx, row in merged_stats.iterrows():
-            # 获取该基金公司的所有产品
-            company_products = self.data[self.data['基金管理人'] == idx]
-            # 获取该基金公司的商务品
-            company_biz = biz_data[biz_data['基金管理人'] == idx]
-            
-            # 计算总收入
-            total_income = 0
-            for _, prod in company_products.iterrows():
-                scale = prod[f'保有金额（{self.end_date}）'] / 1e8  # 转换为亿元
-                fee_rate = prod['管理费率[单位]%'] / 100  # 转换为小数
-                income = scale * fee_rate * 0.35 * 10000  # 转换为万元
-                total_income += income
-            
-            # 计算商务品收入
-            biz_income = 0
-            for _, prod in company_biz.iterrows():
-                scale = prod[f'保有金额（{self.end_date}）'] / 1e8  # 转换为亿元
-                fee_rate = prod['管理费率[单位]%'] / 100  # 转换为小数
-                income = scale * fee_rate * 0.35 * 10000  # 转换为万元
-                biz_income += income
-            
-            merged_stats.at[idx, '所有保有预计收入'] = total_income
-            merged_stats.at[idx, '商务品预计收入'] = biz_income
-            merged_stats.at[idx, '非商务品预计收入'] = total_income - biz_income
+        # 计算各项收入（单位：万元）：规模(亿) × 管理费率 × 0.35 × 10000，按公司汇总
+        income = self.data[f'保有金额（{self.end_date}）'] / 1e8 * self.data['管理费率[单位]%'] / 100 * 0.35 * 10000
+        is_biz = self.data['是否商务品'] == '商务'
+        managers = self.data['基金管理人']
+        merged_stats['所有保有预计收入'] = income.groupby(managers).sum().reindex(merged_stats.index, fill_value=0)
+        merged_stats['商务品预计收入'] = income[is_biz].groupby(managers[is_biz]).sum().reindex(merged_stats.index, fill_value=0)
+        merged_stats['非商务品预计收入'] = merged_stats['所有保有预计收入'] - merged_stats['商务品预计收入']
         
         # 格式化数值
         merged_stats = merged_stats.reset_index()
@@ -809,49 +754,26 @@ class ETFReporter:
         # 新增：过滤掉规模小于1000万(0.1亿)的基金公司
         merged_stats = merged_stats[merged_stats['所有保有规模'] >= 0.1]
         
-        # 生成表格
-        table = self.doc.add_table(rows=1, cols=8)
-        table.style = 'Light Shading Accent 1'
-        
-        # 设置表头
-        headers = ['基金公司', '所有规模(亿)', '商务规模(亿)', '所有产品数', '商务产品数', 
-                 '总预计收入(万)', '商务收入(万)', '非商务收入(万)']
-        for i, header in enumerate(headers):
-            table.rows[0].cells[i].text = header
-            table.rows[0].cells[i].paragraphs[0].runs[0].font.bold = True
-
-        # 填充数据
-        for _, row in merged_stats.iterrows():
-            cells = table.add_row().cells
-            cells[0].text = get_manager_short(row['基金管理人'])
-            cells[1].text = f"{row['所有保有规模']:,.2f}"
-            cells[2].text = f"{row['商务规模']:,.2f}"
-            cells[3].text = f"{int(row['所有产品数量'])}"
-            cells[4].text = f"{int(row['商务产品数量'])}"
-            cells[5].text = f"{row['所有保有预计收入']:,.0f}"
-            cells[6].text = f"{row['商务品预计收入']:,.0f}"
-            cells[7].text = f"{row['非商务品预计收入']:,.0f}"
-        
-        # 添加汇总行
-        total_row = table.add_row().cells
-        total_row[0].text = "总计"
-        total_row[0].paragraphs[0].runs[0].font.bold = True
-        
-        # 计算各列汇总值
-        total_row[1].text = f"{merged_stats['所有保有规模'].sum():,.2f}"
-        total_row[2].text = f"{merged_stats['商务规模'].sum():,.2f}"
-        total_row[3].text = f"{int(merged_stats['所有产品数量'].sum())}"
-        total_row[4].text = f"{int(merged_stats['商务产品数量'].sum())}"
-        total_row[5].text = f"{merged_stats['所有保有预计收入'].sum():,.0f}"
-        total_row[6].text = f"{merged_stats['商务品预计收入'].sum():,.0f}"
-        total_row[7].text = f"{merged_stats['非商务品预计收入'].sum():,.0f}"
-        
-        # 设置汇总行底色
-        from docx.oxml.ns import nsdecls
-        from docx.oxml import parse_xml
-        for cell in total_row:
-            shading_elm = parse_xml(r'<w:shd {} w:fill="D9D9D9"/>'.format(nsdecls('w')))
-            cell._tc.get_or_add_tcPr().append(shading_elm)
+        # 生成表格（末尾为灰底汇总行）
+        add_dataframe_table(self.doc, merged_stats, [
+            ('基金公司', '基金管理人', get_manager_short),
+            ('所有规模(亿)', '所有保有规模', '{:,.2f}'.format),
+            ('商务规模(亿)', '商务规模', '{:,.2f}'.format),
+            ('所有产品数', '所有产品数量', int),
+            ('商务产品数', '商务产品数量', int),
+            ('总预计收入(万)', '所有保有预计收入', '{:,.0f}'.format),
+            ('商务收入(万)', '商务品预计收入', '{:,.0f}'.format),
+            ('非商务收入(万)', '非商务品预计收入', '{:,.0f}'.format),
+        ], total_row=[
+            "总计",
+            f"{merged_stats['所有保有规模'].sum():,.2f}",
+            f"{merged_stats['商务规模'].sum():,.2f}",
+            f"{int(merged_stats['所有产品数量'].sum())}",
+            f"{int(merged_stats['商务产品数量'].sum())}",
+            f"{merged_stats['所有保有预计收入'].sum():,.0f}",
+            f"{merged_stats['商务品预计收入'].sum():,.0f}",
+            f"{merged_stats['非商务品预计收入'].sum():,.0f}",
+        ])
 
 if __name__ == "__main__":
     try:
@@ -861,7 +783,7 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"程序运行出错：{str(e)}")
         print("请检查：")
-        print("1. 数据文件列名是否形如'关注人数（02月14日）'")
-        print("2. 文件命名是否符合ETF_基础数据合并_YYYYMMDD.csv格式")
+        print("1. 数据库中 etf_attention_history / etf_holders_history 是否有最近两周的数据")
+        print("2. 两周日期前后7天内是否都有导入记录")
         print("3. 商务协议文件是否存在且命名正确")
         print("4. 日期是否跨年/跨月（程序自动处理日期范围）")
\ No newline at end of file
@@ -0,0 +1,55 @@
+"""
+gunicorn 生产部署配置（Linux/macOS）
+
+    pip install gunicorn
+    gunicorn -c gunicorn.conf.py
+
+主进程通过 app.create_app() 加载一次数据快照后再 fork worker，各 worker 以写时复制共享快照。
+数据库数据版本变化时主进程自动重载快照并平滑替换 worker（见 services/snapshot_service.py）；
+也可手动执行 kill -HUP <master pid>。
+
+后台任务调度不在 gunicorn 进程中运行（主进程持锁 fork 会把锁状态复制给 worker），另行启动:
+
+    python -m services.scheduler_service
+
+各 worker 的 /api/jobs 读取调度进程写入的状态文件；上传导入与调度任务通过写锁文件互斥。
+
+环境变量:
+    ETF_BIND                    监听地址，默认 0.0.0.0:5007
+    ETF_WORKERS                 worker 进程数，默认 CPU 核数
+    ETF_THREADS                 每个 worker 的线程数，默认 4
+    ETF_SNAPSHOT_POLL_SECONDS   数据版本轮询间隔，默认 30 秒，0 表示不自动重载
+"""
+
+import multiprocessing
+import os
+import signal
+
+bind = os.getenv('ETF_BIND', '0.0.0.0:5007')
+workers = int(os.getenv('ETF_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.getenv('ETF_THREADS', '4'))
+wsgi_app = 'app:create_app()'
+# 在主进程加载应用和数据快照，fork 后共享
+preload_app = True
+timeout = 120
+graceful_timeout = 30
+
+
+def when_ready(server):
+    """主进程就绪后启动数据版本监视线程，版本变化时向自身发送 SIGHUP"""
+    from services import snapshot_service
+
+    interval = float(os.getenv('ETF_SNAPSHOT_POLL_SECONDS', '30'))
+    if interval <= 0:
+        return
+    master_pid = os.getpid()
+    snapshot_service.start_version_watcher(lambda: os.kill(master_pid, signal.SIGHUP), interval)
+    server.log.info(f"数据版本监视已启动，间隔 {interval} 秒")
+
+
+def on_reload(server):
+    """SIGHUP：在主进程重新加载快照，gunicorn 随后用新快照 fork 新 worker"""
+    from app import reload_snapshot
+
+    if reload_snapshot():
+        server.log.info("数据快照已重新加载")
@@ -14,6 +14,8 @@ import logging
 import sys
 import openpyxl
 from utils.etf_code import normalize_etf_code
+from database.timeseries_store import append_history
+from database.writer_lock import locked
 
 # 配置日志
 logging.basicConfig(
@@ -208,6 +210,9 @@ def process_etf_info_file(file_path, date, db):
         
         db.conn.commit()
         logger.info(f"成功导入 {len(valid_data)} 条 {date} 的ETF规模历史数据")
+        
+        # 增量写入时间序列存储
+        append_history('fund_size', valid_data.assign(date=date), db.conn)
     
     except Exception as e:
         logger.error(f"处理ETF基本信息文件 {file_path} 时出错: {str(e)}")
@@ -305,6 +310,9 @@ def process_etf_attention_file(file_path, date, db):
         
         db.conn.commit()
         logger.info(f"成功导入 {len(valid_data)} 条 {date} 的ETF自选历史数据")
+        
+        # 增量写入时间序列存储
+        append_history('attention', valid_data, db.conn)
     
     except Exception as e:
         logger.error(f"处理ETF自选数据文件 {file_path} 时出错: {str(e)}")
@@ -412,12 +420,16 @@ def process_etf_holders_file(file_path, date, db):
         
         db.conn.commit()
         logger.info(f"成功导入 {len(valid_data)} 条 {date} 的ETF持有人历史数据")
+        
+        # 增量写入时间序列存储
+        append_history('holders', valid_data, db.conn)
     
     except Exception as e:
         logger.error(f"处理ETF持有人数据文件 {file_path} 时出错: {str(e)}")
         import traceback
         traceback.print_exc()
 
+@locked('import_history_data')
 def import_all_history_data():
     """导入所有历史数据"""
     logger.info("开始导入所有历史数据...")
@@ -478,6 +490,11 @@ def import_all_history_data():
     for file_path, date in data_files['etf_holders']:
         process_etf_holders_file(file_path, date, db)
     
+    # 增量更新基金公司日汇总（历史文件可能早于已汇总的日期）
+    imported_dates = [date for _, date in data_files['etf_attention'] + data_files['etf_holders'] if date]
+    db.refresh_company_daily_metrics(start=min(imported_dates) if imported_dates else None)
+    db._register_versions('fund_size', 'attention', 'holders')
+    
     # 查询并显示导入结果
     cursor.execute("SELECT date, COUNT(*) FROM etf_fund_size_history GROUP BY date ORDER BY date")
     fund_size_dates = cursor.fetchall()
@@ -12,7 +12,10 @@ import glob
 import pandas as pd
 import xlwings as xw
 from datetime import datetime
+from database import dataset_versions
 from database.models import Database
+from database.timeseries_store import append_history
+from database.writer_lock import locked
 import re
 import traceback
 
@@ -40,6 +43,7 @@ def extract_date_from_filename(filename):
         print(f"从文件名提取日期时出错: {str(e)}")
         return None
 
+@locked('import_holders_data_xlwings')
 def import_holders_data_with_xlwings():
     """使用xlwings导入ETF持仓数据"""
     try:
@@ -204,6 +208,8 @@ def import_holders_data_with_xlwings():
                         print(f"处理记录出错 {row['code']}: {str(e)}")
                 
                 conn.commit()
+                append_history('holders', df_filtered, conn)
+                dataset_versions.refresh(conn, ['holders'])
                 print(f"成功保存 {len(df_filtered)} 条记录到 etf_holders_history 表")
                 
             except Exception as e:
@@ -11,7 +11,10 @@ import os
 import glob
 import pandas as pd
 from datetime import datetime
+from database import dataset_versions
 from database.models import Database
+from database.timeseries_store import append_history
+from database.writer_lock import locked
 import re
 import traceback
 
@@ -70,6 +73,7 @@ def read_data_file(file_path):
         print(f"读取文件失败: {str(e)}")
         return pd.DataFrame()
 
+@locked('import_holding_value')
 def import_holding_value():
     """导入ETF持仓市值数据"""
     try:
@@ -231,6 +235,8 @@ def import_holding_value():
                         traceback.print_exc()
                 
                 conn.commit()
+                append_history('holders', df_filtered, conn)
+                dataset_versions.refresh(conn, ['holders'])
                 
                 print(f"成功更新 {updated_count} 条持仓市值数据，日期: {date}")
                 
@@ -6,6 +6,8 @@ import matplotlib.pyplot as plt
 import numpy as np
 import json
 
+from utils.docx_table import add_dataframe_table
+
 class ReportGenerator:
     def __init__(self, output_dir, date_range, summary_stats):
         self.output_dir = output_dir
@@ -444,19 +446,9 @@ class ReportGenerator:
                     
                     # 添加指数表现表格
                     performance_data = index_stats['指数表现']
-                    table = doc.add_table(rows=1, cols=len(performance_data.columns))
-                    table.style = 'Table Grid'
-                    
-                    # 设置表头
-                    header_cells = table.rows[0].cells
-                    for i, col in enumerate(performance_data.columns):
-                        header_cells[i].text = col
-                    
-                    # 添加数据行（只显示前10个）
-                    for _, row in performance_data.head(10).iterrows():
-                        cells = table.add_row().cells
-                        for i, col in enumerate(performance_data.columns):
-                            cells[i].text = str(row[col])
+                    # 只显示前10个
+                    add_dataframe_table(doc, performance_data.head(10),
+                                        [(col, col, None) for col in performance_data.columns], style='Table Grid', bold_header=False)
                     
                     # 添加图表
                     doc.add_paragraph('')
@@ -491,21 +483,8 @@ class ReportGenerator:
             next_index += 1
             
             # 添加分类分布表格
-            table = doc.add_table(rows=1, cols=3)
-            table.style = 'Table Grid'
-            
-            # 设置表头
-            header_cells = table.rows[0].cells
-            header_cells[0].text = category
-            header_cells[1].text = 'ETF数量'
-            header_cells[2].text = '占比'
-            
-            # 添加数据行
-            for _, row in data.iterrows():
-                cells = table.add_row().cells
-                cells[0].text = str(row[category])
-                cells[1].text = str(row['ETF数量'])
-                cells[2].text = str(row['占比'])
+            add_dataframe_table(doc, data, [(category, category, None), ('ETF数量', 'ETF数量', None),
+                                            ('占比', '占比', None)], style='Table Grid', bold_header=False)
             
             # 添加图表
             doc.add_paragraph('')
@@ -528,19 +507,9 @@ class ReportGenerator:
             
             # 添加指数表现表格
             performance_data = index_stats['指数表现']
-            table = doc.add_table(rows=1, cols=len(performance_data.columns))
-            table.style = 'Table Grid'
-            
-            # 设置表头
-            header_cells = table.rows[0].cells
-            for i, col in enumerate(performance_data.columns):
-                header_cells[i].text = col
-            
-            # 添加数据行（只显示前10个）
-            for _, row in performance_data.head(10).iterrows():
-                cells = table.add_row().cells
-                for i, col in enumerate(performance_data.columns):
-                    cells[i].text = str(row[col])
+            # 只显示前10个
+            add_dataframe_table(doc, performance_data.head(10),
+                                [(col, col, None) for col in performance_data.columns], style='Table Grid', bold_header=False)
             
             # 添加图表
             doc.add_paragraph('')
@@ -0,0 +1,191 @@
+"""
+优选ETF工作簿
+
+跟踪指数分级结果（database.index_grading）按所依赖数据集的版本（response_service.data_version）缓存在内存中；
+工作簿用 xlsxwriter 的 constant_memory 模式逐行写出，字体颜色等格式按列预先计算、
+每种格式只创建一次，不再逐个单元格用 openpyxl 设置样式。
+同一数据版本已生成过的工作簿直接复用（版本记录在同名 .version 文件中）。
+"""
+
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from database import instrumentation
+from database.index_grading import (LEVEL_DESCRIPTIONS, PICKS, grade_indexes, load_grading_universe,
+                                    scale_quality_table)
+from database.models import DATABASE_PATH
+from services.response_service import data_version
+
+logger = logging.getLogger(__name__)
+
+# 分级结果依赖的数据集（见 database/dataset_versions.py）
+DATASETS = ('info', 'business', 'classification')
+
+DEFAULT_OUTPUT = 'THE_BEST_ETF_FINAL.xlsx'
+MAIN_SHEET = '优选ETF'
+SCALE_SHEET = 'Tracking_Index_Scale&Quality'
+
+NUMBER_COLUMNS = ['商务品合计规模', '合计规模', '二级分类合计', '三级分类合计']
+CODE_COLUMNS = [f'{prefix}代码' for prefix in PICKS]
+
+# 商务品合计规模的字体颜色：(下限, 颜色)，从高到低匹配
+SCALE_COLORS = [(1000, '#8B0000'), (500, '#FFA500'), (200, '#FFD700'), (100, '#008000'), (50, '#00FFFF'),
+                (20, '#0000FF'), (10, '#800080'), (5, '#000000'), (2, '#A9A9A9'), (-np.inf, '#808080')]
+# 跟踪ETF数量的字体颜色
+COUNT_COLORS = [(20, '#8B0000'), (16, '#FFA500'), (10, '#FFD700'), (7, '#008000'), (5, '#00FFFF'),
+                (3, '#0000FF'), (2, '#800080'), (-np.inf, '#000000')]
+# 跟踪指数代码的字体颜色：按（最低费率, 最大交易量, 最大规模）三只基金是否为商务品
+BUSINESS_PATTERN_COLORS = [
+    ((True, True, True), '#8B0000'),
+    ((True, True, None), '#FFA500'),
+    ((None, True, True), '#FFD700'),
+    ((True, None, True), '#008000'),
+    ((None, True, None), '#00FFFF'),
+    ((True, None, None), '#0000FF'),
+    ((None, None, True), '#800080'),
+]
+BUSINESS_CODE_COLOR = '#FF0000'
+
+SCALE_NOTE = ("有些指数只有一个跟踪的ETF产品，如果该ETF是我司商务品，则会体现为一级。"
+              "但跟踪少往往代表指数规模较小，这样的一级含金量不算高。比如小于5亿规模的指数往往是这种情况。")
+
+_cache = {'version': None, 'result': None, 'business_codes': None}
+_lock = threading.Lock()
+
+
+def get_grading():
+    """
+    返回 (分级结果, 商务品代码集合)，数据版本变化时重新计算
+
+    调用方不应修改返回的DataFrame。
+    """
+    version = data_version(*DATASETS)
+    with _lock:
+        if _cache['version'] == version:
+            return _cache['result'], _cache['business_codes']
+    conn = instrumentation.connect(DATABASE_PATH)
+    try:
+        universe = load_grading_universe(conn)
+    finally:
+        conn.close()
+    result = grade_indexes(universe)
+    business_codes = frozenset(universe.loc[universe['is_business'], 'code'])
+    with _lock:
+        _cache.update(version=version, result=result, business_codes=business_codes)
+    logger.info(f"跟踪指数分级完成: {len(result)}个指数")
+    return result, business_codes
+
+
+def _threshold_color(values, thresholds):
+    """按从高到低的 (下限, 颜色) 为每个值选颜色，缺失值按0处理"""
+    values = pd.to_numeric(values, errors='coerce').fillna(0).to_numpy()
+    return np.select([values >= low for low, _ in thresholds], [color for _, color in thresholds],
+                     default=thresholds[-1][1])
+
+
+def _code_colors(result, business_codes):
+    flags = [result[col].isin(business_codes).to_numpy() for col in CODE_COLUMNS]
+    conditions = [np.logical_and.reduce([flag for flag, need in zip(flags, pattern) if need])
+                  for pattern, _ in BUSINESS_PATTERN_COLORS]
+    return np.select(conditions, [color for _, color in BUSINESS_PATTERN_COLORS], default='#000000')
+
+
+def _cell_value(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _write_main_sheet(workbook, result, business_codes):
+    worksheet = workbook.add_worksheet(MAIN_SHEET)
+    header = workbook.add_format({'bold': True})
+    number = workbook.add_format({'num_format': '0.0'})
+    formats = {}
+
+    def colored(color, num_format=None):
+        key = (color, num_format)
+        if key not in formats:
+            props = {'bold': True, 'font_color': color}
+            if num_format:
+                props['num_format'] = num_format
+            formats[key] = workbook.add_format(props)
+        return formats[key]
+
+    # 逐列预先确定每个单元格的格式，写入时只查表
+    columns = list(result.columns)
+    column_formats = {col: [number] * len(result) for col in NUMBER_COLUMNS}
+    column_formats['商务品合计规模'] = [colored(c, '0.0')
+                                    for c in _threshold_color(result['商务品合计规模'], SCALE_COLORS)]
+    column_formats['跟踪ETF数量'] = [colored(c) for c in _threshold_color(result['跟踪ETF数量'], COUNT_COLORS)]
+    column_formats['跟踪指数代码'] = [colored(c) for c in _code_colors(result, business_codes)]
+    business_format = colored(BUSINESS_CODE_COLOR)
+    for col in CODE_COLUMNS:
+        column_formats[col] = [business_format if is_business else None
+                               for is_business in result[col].isin(business_codes)]
+    row_formats = [column_formats.get(col) for col in columns]
+
+    worksheet.write_row(0, 0, columns, header)
+    for row_idx, row in enumerate(result.itertuples(index=False, name=None)):
+        for col_idx, value in enumerate(row):
+            fmt = row_formats[col_idx][row_idx] if row_formats[col_idx] is not None else None
+            worksheet.write(row_idx + 1, col_idx, _cell_value(value), fmt)
+    worksheet.freeze_panes(1, 0)
+
+
+def _write_scale_sheet(workbook, table):
+    worksheet = workbook.add_worksheet(SCALE_SHEET)
+    bold = workbook.add_format({'bold': True})
+    title = workbook.add_format({'bold': True, 'font_size': 12})
+    italic = workbook.add_format({'italic': True})
+
+    worksheet.write_row(0, 0, [table.index.name] + list(table.columns), bold)
+    for row_idx, (label, values) in enumerate(table.iterrows(), start=1):
+        worksheet.write(row_idx, 0, label, bold)
+        worksheet.write_row(row_idx, 1, [int(v) for v in values])
+
+    # 统计表下方留出空行写分级说明
+    row = len(table) + 2
+    worksheet.write(row, 0, "跟踪指数分级逻辑说明", title)
+    for offset, (level, description) in enumerate(LEVEL_DESCRIPTIONS.items(), start=2):
+        worksheet.write(row + offset, 0, level, bold)
+        worksheet.write(row + offset, 1, description)
+    row += len(LEVEL_DESCRIPTIONS) + 3
+    worksheet.write(row, 0, "注意事项", bold)
+    worksheet.write(row, 1, SCALE_NOTE, italic)
+
+
+def build_workbook(path=DEFAULT_OUTPUT, force=False):
+    """
+    生成优选ETF工作簿，返回文件路径
+
+    文件已存在且由当前数据版本生成时直接返回（force=True 时总是重新生成）。
+    先写临时文件再替换，生成过程中不会留下半个文件。
+    """
+    import xlsxwriter
+
+    version = data_version(*DATASETS)
+    version_path = path + '.version'
+    if not force and os.path.exists(path) and os.path.exists(version_path):
+        with open(version_path, 'r', encoding='utf-8') as f:
+            if f.read() == version:
+                return path
+
+    result, business_codes = get_grading()
+    tmp_path = path + '.tmp'
+    workbook = xlsxwriter.Workbook(tmp_path, {'constant_memory': True})
+    try:
+        _write_main_sheet(workbook, result, business_codes)
+        _write_scale_sheet(workbook, scale_quality_table(result))
+    finally:
+        workbook.close()
+    os.replace(tmp_path, path)
+    with open(version_path, 'w', encoding='utf-8') as f:
+        f.write(version)
+    logger.info(f"优选ETF工作簿已生成: {path}")
+    return path
@@ -52,7 +52,7 @@ def load_latest_data():
         # 清理NaN值：遍历所有列，如果是数值类型，则用0填充NaN
         for col in etf_df.columns:
             if pd.api.types.is_numeric_dtype(etf_df[col]):
-                etf_df[col].fillna(0, inplace=True)
+                etf_df[col] = etf_df[col].fillna(0)
 
         # 添加是否商务品标记 (确保 business_etfs_set 是最新的)
         etf_df['is_business'] = etf_df['code'].apply(lambda x: '商务' if x in business_etfs_set else '非商务')
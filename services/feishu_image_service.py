@@ -0,0 +1,343 @@
+"""
+飞书海报图片缓存
+
+飞书多维表格附件（BANNER、长图、切图）的 tmp_url 是短期有效的临时链接，长图原图又很大，
+原先直接交给浏览器，每次查看都从飞书拉取原图。现在:
+- 同步飞书数据时为每个附件登记来源（register），页面拿到的是本地代理地址 /api/feishu/images/<key>
+  （key 为附件的 file_token，临时链接过期后仍可用永久下载地址重新获取）
+- 每个附件只下载一次，原图按内容 SHA-256 存放在 IMAGE_DIR 下，并在进程池中用 PIL 生成
+  THUMB_WIDTHS 各宽度的 WebP/JPEG 缩略图（prefetch，由调度任务 feishu_images 执行）
+- 代理接口优先返回缩略图；未预取的附件在首次请求时下载，文件内容不再变化，响应带长期缓存头
+
+目录结构（IMAGE_DIR，默认数据库同目录下的 feishu_images，可用 ETF_IMAGE_CACHE_DIR 覆盖）:
+    sources/<key>.json            附件来源（下载地址、文件名）
+    refs/<key>.json               已下载附件对应的原图摘要、尺寸
+    originals/<sha前两位>/<sha>.<扩展名>
+    thumbs/<sha前两位>/<sha>_<宽度>.<webp|jpg>
+
+所有文件先写临时文件再 os.replace，多个进程同时下载同一附件时结果相同，互不影响。
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlparse
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - 可选依赖，未安装时只缓存原图
+    Image = ImageOps = None
+
+from database.models import DATABASE_PATH
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DIR = os.getenv('ETF_IMAGE_CACHE_DIR') or os.path.join(os.path.dirname(DATABASE_PATH), 'feishu_images')
+
+URL_PREFIX = '/api/feishu/images/'
+
+# 缩略图宽度（像素），请求的宽度向上取最接近的一档；原图更窄时不放大
+THUMB_WIDTHS = (240, 480, 960)
+# 缩略图格式 -> (文件扩展名, MIME类型)
+THUMB_FORMATS = {'webp': ('webp', 'image/webp'), 'jpeg': ('jpg', 'image/jpeg')}
+THUMB_QUALITY = 80
+
+# 单个附件的大小上限
+MAX_BYTES = 50 * 1024 * 1024
+FETCH_TIMEOUT = 30
+# 下载失败后在这段时间内不再重试，避免每次页面请求都访问飞书
+RETRY_SECONDS = 300
+# 需要附带 tenant_access_token 的下载域名
+FEISHU_HOSTS = ('feishu.cn', 'larksuite.com')
+TOKEN_TTL = 30 * 60
+
+CONTENT_TYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'gif': 'image/gif', 'webp': 'image/webp',
+                 'bmp': 'image/bmp'}
+_PIL_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp', 'BMP': 'bmp'}
+
+_KEY_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,128}$')
+
+_key_locks = {}
+_failures = {}
+_token = {'value': None, 'expires': 0}
+_lock = threading.Lock()
+
+
+def _path(*parts):
+    return os.path.join(IMAGE_DIR, *parts)
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, value):
+    _write_atomic(path, json.dumps(value, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+
+
+def valid_key(key):
+    return bool(key) and _KEY_PATTERN.match(key) is not None
+
+
+def attachment_key(attachment):
+    """附件的缓存键：飞书 file_token，没有时取下载地址的摘要"""
+    token = attachment.get('file_token')
+    if valid_key(token):
+        return token
+    url = attachment.get('url') or attachment.get('tmp_url')
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()[:32] if url else None
+
+
+def register(attachment):
+    """
+    登记一个飞书附件的来源，返回页面使用的代理地址；附件没有下载地址时返回空字符串
+
+    参数:
+        attachment: 多维表格附件字段中的一项（file_token、url、tmp_url、name 等）
+    """
+    key = attachment_key(attachment)
+    if key is None:
+        return ''
+    # url 是需要鉴权的永久下载地址，tmp_url 过期后仍可用它重新获取
+    source = {'urls': [u for u in (attachment.get('url'), attachment.get('tmp_url')) if u],
+              'name': attachment.get('name', '')}
+    path = _path('sources', f"{key}.json")
+    if _read_json(path) != source:
+        _write_json(path, source)
+    return URL_PREFIX + key
+
+
+def _auth_headers(url):
+    """飞书域名的下载地址附带 tenant_access_token"""
+    host = urlparse(url).hostname or ''
+    if not any(host == h or host.endswith('.' + h) for h in FEISHU_HOSTS):
+        return {}
+    with _lock:
+        if _token['value'] is None or _token['expires'] <= time.time():
+            from blueprints.feishu_routes import get_tenant_token
+
+            _token['value'] = get_tenant_token()
+            _token['expires'] = time.time() + TOKEN_TTL
+        token = _token['value']
+    return {'Authorization': f"Bearer {token}"} if token else {}
+
+
+def _get(url):
+    """下载 url，返回 (内容, Content-Type)；飞书临时下载接口返回的JSON中再取真实地址"""
+    import requests  # 仅在下载图片时导入，缩短服务启动时间
+
+    proxies = {"http": None, "https": None}
+    response = requests.get(url, headers=_auth_headers(url), proxies=proxies, timeout=FETCH_TIMEOUT,
+                            stream=True)
+    response.raise_for_status()
+    content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+    if content_type == 'application/json':
+        body = response.json()
+        urls = (body.get('data') or {}).get('tmp_download_urls') or []
+        if not urls or not urls[0].get('tmp_download_url'):
+            raise ValueError(f"飞书未返回下载地址: {body.get('msg')}")
+        return _get(urls[0]['tmp_download_url'])
+    chunks, size = [], 0
+    for chunk in response.iter_content(1 << 16):
+        size += len(chunk)
+        if size > MAX_BYTES:
+            raise ValueError(f"图片超过 {MAX_BYTES} 字节")
+        chunks.append(chunk)
+    return b''.join(chunks), content_type
+
+
+def _inspect(data, content_type):
+    """识别图片格式和尺寸，返回 (扩展名, 宽, 高)；不是图片时抛出 ValueError"""
+    if Image is None:
+        if not content_type.startswith('image/'):
+            raise ValueError(f"不是图片: {content_type}")
+        ext = {v: k for k, v in CONTENT_TYPES.items()}.get(content_type, 'bin')
+        return ext, None, None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return _PIL_EXTENSIONS.get(image.format, 'bin'), image.width, image.height
+    except Exception as e:
+        raise ValueError(f"无法识别的图片: {e}") from e
+
+
+def original_path(ref):
+    sha = ref['sha256']
+    return _path('originals', sha[:2], f"{sha}.{ref['ext']}")
+
+
+def thumbnail_path(sha, width, fmt):
+    return _path('thumbs', sha[:2], f"{sha}_{width}.{THUMB_FORMATS[fmt][0]}")
+
+
+def fetch(key):
+    """
+    下载附件并按内容保存原图，返回 refs 记录；已下载过时直接返回
+
+    异常:
+        LookupError: 没有登记过该附件
+        其他异常: 各个下载地址都失败
+    """
+    ref = _read_json(_path('refs', f"{key}.json"))
+    if ref is not None:
+        return ref
+    source = _read_json(_path('sources', f"{key}.json"))
+    if source is None:
+        raise LookupError(key)
+
+    with _lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        ref = _read_json(_path('refs', f"{key}.json"))
+        if ref is not None:
+            return ref
+        failed_at = _failures.get(key)
+        if failed_at is not None and time.time() - failed_at < RETRY_SECONDS:
+            raise RuntimeError(f"图片 {key} 最近下载失败，稍后重试")
+
+        error = None
+        for url in source['urls']:
+            try:
+                data, content_type = _get(url)
+                ext, width, height = _inspect(data, content_type)
+                break
+            except Exception as e:
+                logger.warning(f"下载飞书图片 {key} 失败（{urlparse(url).hostname}）: {e}")
+                error = e
+        else:
+            _failures[key] = time.time()
+            raise error or RuntimeError(f"图片 {key} 没有下载地址")
+
+        ref = {'sha256': hashlib.sha256(data).hexdigest(), 'ext': ext, 'bytes': len(data),
+               'width': width, 'height': height, 'name': source.get('name', ''),
+               'fetched_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        path = original_path(ref)
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+        _write_json(_path('refs', f"{key}.json"), ref)
+        _failures.pop(key, None)
+        return ref
+
+
+def render_thumbnails(source_path, sha, widths=THUMB_WIDTHS, formats=tuple(THUMB_FORMATS)):
+    """
+    由原图生成缩略图（可在子进程中执行），已存在的跳过，返回新生成的个数
+
+    原图比某档宽度更窄时按原宽度输出；JPEG 不支持透明，透明区域铺白底。
+    """
+    todo = [(w, f) for w in widths for f in formats if not os.path.exists(thumbnail_path(sha, w, f))]
+    if not todo or Image is None:
+        return 0
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        for width, fmt in todo:
+            if width < image.width:
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.LANCZOS)
+            else:
+                resized = image
+            buffer = io.BytesIO()
+            resized.save(buffer, format=fmt.upper(), quality=THUMB_QUALITY, optimize=True)
+            _write_atomic(thumbnail_path(sha, width, fmt), buffer.getvalue())
+    return len(todo)
+
+
+def snap_width(width):
+    """请求的宽度对应的缩略图档位"""
+    for candidate in THUMB_WIDTHS:
+        if width <= candidate:
+            return candidate
+    return THUMB_WIDTHS[-1]
+
+
+def resolve(key, width=None, fmt='jpeg'):
+    """
+    代理接口要返回的文件，返回 (路径, MIME类型)
+
+    width 为 None 时返回原图；缩略图缺失（未预取）时当场生成所需的那一张。
+    未安装 Pillow 时总是返回原图。
+    """
+    ref = fetch(key)
+    path = original_path(ref)
+    if width is None or Image is None or fmt not in THUMB_FORMATS:
+        return path, CONTENT_TYPES.get(ref['ext'], 'application/octet-stream')
+    width = snap_width(width)
+    thumb = thumbnail_path(ref['sha256'], width, fmt)
+    if not os.path.exists(thumb):
+        render_thumbnails(path, ref['sha256'], (width,), (fmt,))
+    return thumb, THUMB_FORMATS[fmt][1]
+
+
+def registered_keys():
+    try:
+        names = os.listdir(_path('sources'))
+    except FileNotFoundError:
+        return []
+    return sorted(name[:-len('.json')] for name in names if name.endswith('.json'))
+
+
+def _fetch_quietly(key):
+    try:
+        return fetch(key)
+    except Exception as e:
+        logger.warning(f"缓存飞书图片 {key} 失败: {e}")
+        return None
+
+
+def prefetch(keys=None, workers=None):
+    """
+    下载已登记但未缓存的附件，并在进程池中生成缺失的缩略图（调度任务 feishu_images）
+
+    参数:
+        keys: 附件键列表，默认全部已登记的附件
+        workers: 生成缩略图的进程数，默认取CPU数；0 表示在当前进程中依次生成
+
+    返回:
+        dict: 附件数、下载失败数、新生成的缩略图数
+    """
+    keys = registered_keys() if keys is None else list(keys)
+    refs, failed = {}, 0
+    # 下载以网络等待为主，用线程并发
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        for key, result in zip(keys, pool.map(_fetch_quietly, keys)):
+            if result is None:
+                failed += 1
+            else:
+                refs[result['sha256']] = original_path(result)
+
+    rendered = 0
+    if refs and Image is not None:
+        if workers is None:
+            workers = min(len(refs), os.cpu_count() or 1)
+        if workers > 0:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                rendered = sum(executor.map(render_thumbnails, refs.values(), refs.keys()))
+        else:
+            rendered = sum(render_thumbnails(path, sha) for sha, path in refs.items())
+    logger.info(f"飞书图片缓存: {len(keys)} 个附件，下载失败 {failed} 个，新生成缩略图 {rendered} 张")
+    return {'images': len(keys), 'failed': failed, 'thumbnails': rendered}
@@ -0,0 +1,173 @@
+"""
+历史曲线数据整形服务
+
+为历史图表接口提供日期范围过滤、LTTB降采样、周/月汇总以及列式JSON输出。
+"""
+
+import numpy as np
+import pandas as pd
+
+# 未指定 max_points 时的默认返回点数上限，0 表示不降采样
+DEFAULT_MAX_POINTS = 0
+# 允许的最大点数，防止客户端传入过大的值
+MAX_POINTS_LIMIT = 5000
+
+ROLLUP_RULES = {
+    'week': 'W-FRI',   # 以周五为周末
+    'month': 'M',      # 自然月
+}
+
+
+def parse_history_args(args):
+    """
+    解析历史接口的查询参数
+
+    参数:
+        args: request.args
+
+    返回:
+        dict，包含 start、end、max_points、rollup、format
+    """
+    def _date(value):
+        value = (value or '').strip()
+        return value[:10] if value else None
+
+    try:
+        max_points = int(args.get('max_points', DEFAULT_MAX_POINTS) or 0)
+    except (TypeError, ValueError):
+        max_points = DEFAULT_MAX_POINTS
+    max_points = max(0, min(max_points, MAX_POINTS_LIMIT))
+
+    rollup = (args.get('rollup') or '').strip().lower() or None
+    if rollup not in ROLLUP_RULES:
+        rollup = None
+
+    return {
+        'start': _date(args.get('start')),
+        'end': _date(args.get('end')),
+        'max_points': max_points,
+        'rollup': rollup,
+        'format': 'records' if args.get('format') == 'records' else 'columnar',
+    }
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets 降采样，返回保留点的下标
+
+    参数:
+        x: 单调递增的横坐标数组
+        y: 纵坐标数组（NaN按0处理）
+        threshold: 目标点数
+
+    每个桶内的三角形面积一次性向量化计算，只在桶之间循环。
+    """
+    n = len(x)
+    if threshold <= 0 or threshold >= n or n <= 2:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1])
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+
+    # 首尾点固定，中间 n-2 个点均分到 threshold-2 个桶
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    # 预先计算每个桶的平均点，供前一个桶作为第三个顶点
+    bucket_avg_x = np.empty(threshold - 2)
+    bucket_avg_y = np.empty(threshold - 2)
+    for i in range(threshold - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        bucket_avg_x[i] = x[lo:hi].mean()
+        bucket_avg_y[i] = y[lo:hi].mean()
+
+    prev = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        if i + 1 < threshold - 2:
+            cx, cy = bucket_avg_x[i + 1], bucket_avg_y[i + 1]
+        else:
+            cx, cy = x[n - 1], y[n - 1]
+        ax, ay = x[prev], y[prev]
+        area = np.abs((ax - cx) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (cy - ay))
+        prev = lo + int(np.argmax(area))
+        selected[i + 1] = prev
+
+    return selected
+
+
+def _rollup(frame, fields, rule):
+    """按周/月汇总为开高低收四个值，日期取周期内最后一个实际日期"""
+    periods = pd.to_datetime(frame['date']).dt.to_period(rule)
+    grouped = frame.groupby(periods, sort=True)
+    out = pd.DataFrame({'date': grouped['date'].last()})
+    for field in fields:
+        out[f'{field}_open'] = grouped[field].first()
+        out[f'{field}_high'] = grouped[field].max()
+        out[f'{field}_low'] = grouped[field].min()
+        out[f'{field}_close'] = grouped[field].last()
+    out = out.reset_index(drop=True)
+    columns = ['date'] + [f'{f}_{k}' for f in fields for k in ('open', 'high', 'low', 'close')]
+    return out, columns
+
+
+def _column_values(series):
+    """转换为JSON友好的列表，NaN输出为null"""
+    values = series.astype(object).where(series.notna(), None).tolist()
+    return [v.item() if hasattr(v, 'item') else v for v in values]
+
+
+def shape_history(records, fields, start=None, end=None, max_points=0, rollup=None):
+    """
+    对历史记录做范围过滤、降采样或汇总，输出列式结构
+
+    参数:
+        records: [{"date": ..., field: ...}, ...]，按日期升序
+        fields: 需要输出的指标字段，第一个字段作为降采样的依据
+        start/end: 日期范围（含端点），格式 YYYY-MM-DD
+        max_points: LTTB降采样目标点数，0表示不降采样
+        rollup: None / 'week' / 'month'
+
+    返回:
+        {"columns": [...], "data": {列名: [...]}, "total_points": N,
+         "returned_points": n, "method": "raw"/"lttb"/"week"/"month"}
+    """
+    frame = pd.DataFrame.from_records(records or [], columns=['date'] + list(fields))
+    frame['date'] = frame['date'].astype(str).str[:10]
+    if start:
+        frame = frame[frame['date'] >= start]
+    if end:
+        frame = frame[frame['date'] <= end]
+    frame = frame.sort_values('date').reset_index(drop=True)
+    total = len(frame)
+
+    columns = ['date'] + list(fields)
+    method = 'raw'
+    if rollup and total:
+        frame, columns = _rollup(frame, fields, ROLLUP_RULES[rollup])
+        method = rollup
+    elif max_points and total > max_points:
+        x = pd.to_datetime(frame['date']).to_numpy(dtype='datetime64[D]').astype(np.int64)
+        keep = lttb_indices(x, frame[fields[0]].to_numpy(dtype=np.float64, na_value=np.nan), max_points)
+        frame = frame.iloc[keep].reset_index(drop=True)
+        method = 'lttb'
+
+    return {
+        'columns': columns,
+        'data': {column: _column_values(frame[column]) for column in columns},
+        'total_points': total,
+        'returned_points': len(frame),
+        'method': method,
+    }
+
+
+def filter_records(records, start=None, end=None):
+    """按日期范围过滤记录列表，供 format=records 的兼容输出使用"""
+    return [
+        r for r in records
+        if (not start or str(r['date'])[:10] >= start) and (not end or str(r['date'])[:10] <= end)
+    ]
@@ -0,0 +1,329 @@
+"""
+数据导入编排
+
+把 import_excel_data 的各个数据源建模为依赖图:
+- 解析：各数据源的Excel互不依赖，在进程池中并行解析（import_excel_data.parse_*，不访问数据库）
+- 写入：由当前进程按 SOURCES 顺序串行写入，每个数据源一次 Database.save_* 调用（各自一个事务）
+- 派生：只重算依赖的数据源本次实际写入过的派生表（DERIVED）
+- 发布：写入和派生都在正式库的暂存副本中进行，完成后 ANALYZE、VACUUM INTO 并原子替换正式库
+  （database/staging.py），线上读请求不会看到导入中途的数据
+
+价格面板指标、基金公司日汇总由对应的 save_* 在写入后增量刷新，数据集版本也由 save_* 在写入后登记
+（database/dataset_versions.py）；内存快照、排行榜等随 response_service.data_version() 变化自动重载，不在这里处理。
+
+文件内容的 SHA-256（连同文件名中的数据日期）记录在 import_state 表中，内容未变的数据源跳过解析和写入（force=True 时总是导入）。
+incremental=True 时价格、持有人、自选数据只写入与库中同日期记录不同的行（上传导入使用，见 ingest_service）。
+"""
+
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+
+from database import instrumentation, staging
+from database.models import DATABASE_PATH, Database
+from database.writer_lock import write_lock
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Source:
+    name: str
+    label: str
+    pattern: str
+    # import_excel_data 中的解析函数名（按名称查找，子进程中才导入该模块）
+    parse: str
+    # Database 的保存方法名
+    save: str
+
+
+SOURCES = [
+    Source('info', 'ETF基本信息', 'ETF_DATA_*.xlsx', 'parse_etf_info', 'save_etf_info'),
+    Source('price', 'ETF价格数据', 'ETF_DATA_*.xlsx', 'parse_etf_price', 'save_etf_price'),
+    Source('holders', 'ETF持有人数据', '客户ETF保有量*.xlsx', 'parse_etf_holders', 'save_etf_holders'),
+    Source('attention', 'ETF自选数据', '客户ETF自选人数*.xlsx', 'parse_etf_attention', 'save_etf_attention'),
+    Source('classification', 'ETF指数分类数据', 'ETF-Index-Classification_*.xlsx',
+           'parse_etf_index_classification', 'save_etf_index_classification'),
+    Source('business', 'ETF商务协议数据', 'ETF单产品商务协议*.xlsx', 'parse_etf_business', 'save_business_etf'),
+]
+
+SOURCE_MAP = {source.name: source for source in SOURCES}
+
+# 派生表：名称 -> (依赖的数据源或派生表, Database 方法名)，按依赖顺序排列
+DERIVED = {
+    'company_analytics': (('info', 'price', 'holders', 'attention', 'business'), 'update_company_analytics_data'),
+    'company_analytics_history': (('company_analytics',), 'update_company_analytics_history'),
+}
+
+# 支持按行增量写入的数据源：名称 -> (Database 方法名, 附加参数)，其余数据源总是整表保存
+INCREMENTAL_WRITERS = {
+    'price': ('apply_price_changes', ()),
+    'holders': ('apply_history_changes', ('holders',)),
+    'attention': ('apply_history_changes', ('attention',)),
+}
+
+STATE_TABLE = 'import_state'
+
+
+@dataclass
+class StageResult:
+    name: str
+    # parse / write / derive / publish
+    stage: str
+    # done / skipped / failed / missing
+    status: str
+    seconds: float = 0.0
+    rows: int = None
+    detail: str = None
+
+
+@dataclass
+class ImportReport:
+    started_at: str
+    seconds: float = 0.0
+    stages: list = field(default_factory=list)
+    written: list = field(default_factory=list)
+
+    @property
+    def success(self):
+        return not any(stage.status == 'failed' for stage in self.stages)
+
+    def to_dict(self):
+        result = asdict(self)
+        result['success'] = self.success
+        return result
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def create_state_table(conn):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            source TEXT PRIMARY KEY,
+            path TEXT,
+            sha256 TEXT,
+            rows INTEGER,
+            imported_at TEXT
+        )
+    """)
+
+
+def load_state(database=None):
+    conn = instrumentation.connect(database or DATABASE_PATH)
+    try:
+        create_state_table(conn)
+        return {row[0]: row[1] for row in conn.execute(f"SELECT source, sha256 FROM {STATE_TABLE}")}
+    finally:
+        conn.close()
+
+
+def record_state(name, path, digest, rows, database=None):
+    conn = instrumentation.connect(database or DATABASE_PATH)
+    try:
+        create_state_table(conn)
+        conn.execute(f"""
+            INSERT INTO {STATE_TABLE} (source, path, sha256, rows, imported_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(source) DO UPDATE SET path = excluded.path, sha256 = excluded.sha256,
+                rows = excluded.rows, imported_at = excluded.imported_at
+        """, (name, path, digest, rows, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _parse_source(parse_name, path):
+    """在子进程中执行：解析一个数据源，返回 (DataFrame, 耗时)"""
+    import import_excel_data
+
+    started = time.perf_counter()
+    frame = getattr(import_excel_data, parse_name)(path)
+    return frame, time.perf_counter() - started
+
+
+class _InlineFuture:
+    """workers=0 时在写入阶段按需同步解析，接口与 concurrent.futures.Future 一致"""
+
+    def __init__(self, func, *args):
+        self._call = (func, args)
+
+    def result(self):
+        func, args = self._call
+        return func(*args)
+
+
+def resolve_files(names, paths=None):
+    """各数据源使用的文件：paths 中指定的优先，否则取 data 目录下日期最新的文件"""
+    from import_excel_data import find_latest_file
+
+    paths = paths or {}
+    return {name: paths.get(name) or find_latest_file(SOURCE_MAP[name].pattern) for name in names}
+
+
+def _derived_to_run(written):
+    """按依赖顺序返回需要重算的派生表"""
+    affected = set(written)
+    to_run = []
+    for name, (depends, _) in DERIVED.items():
+        if affected.intersection(depends):
+            to_run.append(name)
+            affected.add(name)
+    return to_run
+
+
+def _write_source(db, source, frame, incremental):
+    """写入一个数据源，返回写入的行数；失败返回 None"""
+    if incremental and source.name in INCREMENTAL_WRITERS:
+        method, args = INCREMENTAL_WRITERS[source.name]
+        return getattr(db, method)(*args, frame)
+    return len(frame) if getattr(db, source.save)(frame) else None
+
+
+def _plan(names, files, state, report):
+    """计算各文件摘要，返回 (摘要, 需要导入的数据源)；缺失和未变化的数据源记入 report"""
+    from import_excel_data import extract_file_date
+
+    digests = {}
+    pending = []
+    for name in names:
+        path = files[name]
+        if not path or not os.path.exists(path):
+            report.stages.append(StageResult(name, 'parse', 'missing',
+                                             detail=f"未找到文件: {SOURCE_MAP[name].pattern}"))
+            continue
+        if path not in digests:
+            # 数据日期取自文件名，内容相同但日期不同的文件仍需导入
+            digests[path] = f"{file_digest(path)}:{extract_file_date(path)}"
+        if state.get(name) == digests[path]:
+            report.stages.append(StageResult(name, 'parse', 'skipped', detail=f"文件未变化: {path}"))
+            continue
+        pending.append(name)
+    return digests, pending
+
+
+def _build(database, pending, files, digests, workers, incremental, report):
+    """解析、写入 pending 中的数据源并刷新派生表，写入 database"""
+    if workers is None:
+        workers = min(len(pending), os.cpu_count() or 1)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+    db = Database(database)
+    try:
+        if executor is not None:
+            futures = {name: executor.submit(_parse_source, SOURCE_MAP[name].parse, files[name])
+                       for name in pending}
+        else:
+            futures = {name: _InlineFuture(_parse_source, SOURCE_MAP[name].parse, files[name])
+                       for name in pending}
+
+        # 串行写入：按 SOURCES 顺序，等待各自的解析结果
+        for name in pending:
+            source = SOURCE_MAP[name]
+            try:
+                frame, parse_seconds = futures[name].result()
+            except Exception as e:
+                logger.error(f"解析{source.label}失败: {e}", exc_info=True)
+                report.stages.append(StageResult(name, 'parse', 'failed', detail=str(e)))
+                continue
+            report.stages.append(StageResult(name, 'parse', 'done', round(parse_seconds, 3), len(frame),
+                                             files[name]))
+
+            write_started = time.perf_counter()
+            try:
+                written = _write_source(db, source, frame, incremental)
+            except Exception as e:
+                logger.error(f"写入{source.label}失败: {e}", exc_info=True)
+                written = None
+            seconds = round(time.perf_counter() - write_started, 3)
+            if written is None:
+                report.stages.append(StageResult(name, 'write', 'failed', seconds, len(frame)))
+                continue
+            record_state(name, files[name], digests[files[name]], len(frame), database)
+            report.stages.append(StageResult(name, 'write', 'done', seconds, written,
+                                             f"共{len(frame)}行" if written != len(frame) else None))
+            # 增量写入没有变化的行时，不触发派生表
+            if written:
+                report.written.append(name)
+
+        for name in _derived_to_run(report.written):
+            derive_started = time.perf_counter()
+            try:
+                ok = getattr(db, DERIVED[name][1])()
+            except Exception as e:
+                logger.error(f"更新派生表 {name} 失败: {e}", exc_info=True)
+                ok = False
+            report.stages.append(StageResult(name, 'derive', 'done' if ok else 'failed',
+                                             round(time.perf_counter() - derive_started, 3)))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        db.close()
+
+
+def run_import(sources=None, force=False, workers=None, paths=None, incremental=False, staged=None):
+    """
+    导入数据源并刷新受影响的派生表
+
+    参数:
+        sources: 要导入的数据源名称列表，默认全部（见 SOURCES）
+        force: 文件内容未变化时也重新导入
+        workers: 解析进程数，默认取数据源个数与CPU数中较小者；0 表示在当前进程中依次解析
+        paths: {数据源名称: 文件路径}，指定时不再按文件名查找最新文件
+        incremental: 支持的数据源（INCREMENTAL_WRITERS）只写入与库中同日期记录不同的行
+        staged: 在暂存库中构建后整体发布（见 database/staging.py），None 表示取 staging.ENABLED
+
+    返回:
+        ImportReport
+    """
+    names = [source.name for source in SOURCES if sources is None or source.name in sources]
+    unknown = set(sources or []) - set(SOURCE_MAP)
+    if unknown:
+        raise ValueError(f"未知的数据源: {sorted(unknown)}")
+
+    report = ImportReport(started_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    started = time.perf_counter()
+
+    # 同一时间只允许一个任务写数据库（见 database/writer_lock.py）
+    with write_lock.hold('import'):
+        files = resolve_files(names, paths)
+        state = {} if force else load_state()
+        digests, pending = _plan(names, files, state, report)
+
+        # 全部数据源没有变化时不克隆数据库
+        if pending:
+            mark = len(report.stages)
+
+            def build_step(build):
+                # 正式库被修改后重建时丢弃上一次构建的阶段记录
+                del report.stages[mark:]
+                report.written.clear()
+                _build(build.path, pending, files, digests, workers, incremental, report)
+                # 有写入成功的数据源（含导入状态）时才发布
+                build.publish = any(stage.stage == 'write' and stage.status == 'done' for stage in report.stages)
+
+            build = staging.run('import', build_step, staged)
+            if build.published:
+                report.stages.append(StageResult('database', 'publish', 'done',
+                                                 round(sum(build.timings.values()), 3),
+                                                 detail='，'.join(f"{k} {v}s" for k, v in build.timings.items())))
+
+    report.seconds = round(time.perf_counter() - started, 3)
+    log_report(report)
+    return report
+
+
+def log_report(report):
+    logger.info("=== 导入各阶段耗时 ===")
+    for stage in report.stages:
+        rows = f"，{stage.rows}行" if stage.rows is not None else ''
+        detail = f"（{stage.detail}）" if stage.detail and (stage.status != 'done' or stage.stage in ('write', 'publish')) else ''
+        logger.info(f"{stage.stage:<6} {stage.name:<26} {stage.status:<7} {stage.seconds:>8.3f}s{rows}{detail}")
+    logger.info(f"合计 {report.seconds:.3f}s，写入: {', '.join(report.written) or '无'}")
@@ -5,10 +5,12 @@ import sqlite3
 from datetime import datetime
 import traceback
 
+from database import instrumentation
+
 # 全局变量
 index_info_map = {}
 # 数据库路径
-DATABASE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data/etf_data.db')
+DATABASE_PATH = os.getenv('ETF_DATABASE_PATH') or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data/etf_data.db')
 
 def load_index_info():
     """加载最新的市场可交易指数数据"""
@@ -21,7 +23,7 @@ def load_index_info():
         print("尝试从数据库加载指数数据...")
         
         # 连接数据库
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = instrumentation.connect(DATABASE_PATH)
         cursor = conn.cursor()
         
         # 查询数据库中的指数数据
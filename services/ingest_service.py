@@ -0,0 +1,159 @@
+"""
+上传文件增量导入
+
+/upload_data 保存文件后提交导入任务，由后台单线程依次执行（写入始终串行）:
+1. 按原始文件名（见 import_pipeline.SOURCES 的文件名模式）或表头识别数据源
+2. 文件内容哈希与上次导入相同则跳过；否则解析并只写入与库中同日期记录不同的行
+   （价格、持有人、自选数据按行比对，其余为小型参考表，整表保存）
+3. 刷新受影响的派生表；数据版本变化后各缓存自动失效，看板随即显示新数据
+
+任务状态保存在进程内存中（最近 MAX_JOBS 个），通过 /api/ingest_jobs 查询。
+"""
+
+import fnmatch
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+
+import pandas as pd
+from werkzeug.utils import secure_filename
+
+from services.import_pipeline import SOURCES, run_import
+
+logger = logging.getLogger(__name__)
+
+MAX_JOBS = 100
+
+# 按表头识别：(数据源, 必须同时包含的列)，依次匹配，先匹配到的优先
+HEADER_SIGNATURES = [
+    (('holders',), {'标的代码', '持仓客户数', '持仓市值'}),
+    (('attention',), {'标的代码', '加自选人数'}),
+    (('classification',), {'跟踪指数代码', '一级分类', '二级分类', '三级分类'}),
+    (('business',), {'证券代码', '产品名称', '基金公司简称'}),
+    (('info', 'price'), {'证券代码', '证券简称'}),
+]
+
+
+@dataclass
+class IngestJob:
+    id: str
+    filename: str
+    path: str
+    sources: list = field(default_factory=list)
+    # queued / running / done / failed / unrecognized
+    status: str = 'queued'
+    created_at: str = None
+    started_at: str = None
+    finished_at: str = None
+    seconds: float = None
+    report: dict = None
+    error: str = None
+
+    def to_dict(self):
+        return asdict(self)
+
+
+_jobs = OrderedDict()
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest')
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def new_job_id():
+    return uuid.uuid4().hex[:12]
+
+
+def upload_path(folder, job_id, filename):
+    """
+    上传文件的保存路径：<folder>/<任务ID>/<安全文件名>
+
+    secure_filename 会去掉中文，不同文件可能得到相同的名字，按任务分目录保存；
+    文件名中的日期（导入时从文件名提取）和扩展名保持不变。
+    """
+    name = secure_filename(filename)
+    ext = os.path.splitext(filename)[1].lower()
+    if not name or not name.lower().endswith(ext):
+        name = f"upload{ext}"
+    directory = os.path.join(folder, job_id)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, name)
+
+
+def classify_by_name(filename):
+    """按文件名模式识别，同一文件可对应多个数据源（如 ETF_DATA 同时包含基本信息和价格）"""
+    return [source.name for source in SOURCES if fnmatch.fnmatch(filename, source.pattern)]
+
+
+def classify_by_headers(path):
+    try:
+        columns = {str(col).strip() for col in pd.read_excel(path, nrows=0, engine='openpyxl').columns}
+    except Exception as e:
+        logger.warning(f"读取表头失败: {path}: {e}")
+        return []
+    for sources, required in HEADER_SIGNATURES:
+        if required <= columns:
+            return list(sources)
+    return []
+
+
+def classify_upload(path, filename=None):
+    """识别上传文件对应的数据源，filename 为上传时的原始文件名"""
+    names = classify_by_name(filename) if filename else []
+    return names or classify_by_headers(path)
+
+
+def _remember(job):
+    with _lock:
+        _jobs[job.id] = job
+        while len(_jobs) > MAX_JOBS:
+            _jobs.popitem(last=False)
+
+
+def _run(job):
+    job.status = 'running'
+    job.started_at = _now()
+    started = time.perf_counter()
+    try:
+        report = run_import(sources=job.sources, paths={name: job.path for name in job.sources},
+                            workers=0, incremental=True)
+        job.report = report.to_dict()
+        job.status = 'done' if report.success else 'failed'
+    except Exception as e:
+        logger.error(f"导入上传文件 {job.filename} 失败: {e}", exc_info=True)
+        job.status = 'failed'
+        job.error = str(e)
+    job.seconds = round(time.perf_counter() - started, 3)
+    job.finished_at = _now()
+
+
+def submit(path, filename=None, job_id=None):
+    """识别文件并提交后台导入任务，返回 IngestJob（无法识别时不导入，状态为 unrecognized）"""
+    job = IngestJob(id=job_id or new_job_id(), filename=filename or path, path=path, created_at=_now())
+    job.sources = classify_upload(path, filename)
+    _remember(job)
+    if not job.sources:
+        job.status = 'unrecognized'
+        job.error = "无法根据文件名或表头识别数据类型，文件已保存但未导入"
+        return job
+    _executor.submit(_run, job)
+    return job
+
+
+def get_job(job_id):
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def list_jobs(limit=20):
+    """最近提交的任务，新任务在前"""
+    with _lock:
+        return list(reversed(_jobs.values()))[:limit]
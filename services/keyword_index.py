@@ -0,0 +1,92 @@
+"""
+搜索关键词索引
+
+把 etf_info 中的基金代码、基金管理人和跟踪指数名称缓存在内存中，
+determine_search_type 判断搜索类型时不再逐个执行 LIKE '%...%' 全表扫描。
+索引按 etf_info 的数据版本（response_service.data_version('info')）失效，基本信息变化后下次查询自动重建。
+"""
+
+import logging
+import threading
+
+from database import instrumentation
+from database.models import Database, DATABASE_PATH
+from services.response_service import data_version
+
+logger = logging.getLogger(__name__)
+
+# 索引依赖的数据集（见 database/dataset_versions.py）
+DATASETS = ('info',)
+
+
+class KeywordIndex:
+    """基金代码/公司/指数名称的内存索引，匹配语义与 Database.check_*_exists 的 LIKE 查询一致"""
+
+    def __init__(self):
+        self.version = None
+        self.codes = ()
+        self.companies = ()
+        self.index_names = ()
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """数据版本变化（或 force）时从数据库重建索引"""
+        version = data_version(*DATASETS)
+        if not force and version == self.version:
+            return self
+        with self._lock:
+            if not force and version == self.version:
+                return self
+            conn = instrumentation.connect(DATABASE_PATH)
+            try:
+                rows = conn.execute(
+                    "SELECT code, fund_manager, tracking_index_name FROM etf_info").fetchall()
+            finally:
+                conn.close()
+            # LIKE 对ASCII字母不区分大小写，这里统一转小写比较
+            self.codes = tuple({str(r[0]).lower() for r in rows if r[0]})
+            self.companies = tuple({str(r[1]).lower() for r in rows if r[1]})
+            self.index_names = tuple({str(r[2]).lower() for r in rows if r[2]})
+            self.version = version
+            logger.info(f"搜索关键词索引已重建: {len(self.codes)}个代码, {len(self.companies)}家公司, "
+                        f"{len(self.index_names)}个指数")
+        return self
+
+    @staticmethod
+    def _contains(values, keyword):
+        keyword = str(keyword).lower()
+        return any(keyword in value for value in values)
+
+    def check_etf_code_exists(self, code):
+        base_code = code
+        if '.' in code:
+            base_code = code.split('.')[0]
+        elif code.startswith('sh') or code.startswith('sz'):
+            base_code = code[2:]
+        return self._contains(self.codes, base_code.zfill(6))
+
+    def check_company_exists(self, company_name):
+        return self._contains(self.companies, company_name)
+
+    def check_index_name_exists(self, index_name):
+        return self._contains(self.index_names, index_name)
+
+
+_index = KeywordIndex()
+
+
+def get_keyword_index():
+    """返回与当前数据版本一致的索引"""
+    return _index.refresh()
+
+
+def get_keyword_checker():
+    """
+    返回提供 check_etf_code_exists/check_company_exists/check_index_name_exists 的对象：
+    优先使用内存索引，索引构建失败时回退到 Database 的 LIKE 查询
+    """
+    try:
+        return get_keyword_index()
+    except Exception as e:
+        logger.warning(f"关键词索引不可用，改为查询数据库: {e}")
+        return Database()
@@ -0,0 +1,203 @@
+"""
+请求计时与指标服务
+
+- 请求中间件：记录每个接口的总耗时、SQL次数和SQL耗时
+- /metrics：以 Prometheus 文本格式输出直方图
+- Server-Timing 响应头：sql / json / app 三段耗时，浏览器开发者工具可直接查看
+- 详细 print 输出开关：ETF_VERBOSE_LOG=print（默认，原样输出）/ sample（按比例采样为结构化日志）/ off
+"""
+
+import io
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import contextvars
+from bisect import bisect_left
+
+from flask import g, request
+
+from database.instrumentation import start_request_stats, stop_request_stats
+
+logger = logging.getLogger('etf.requests')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# 采样模式下，超过该耗时的请求总是记录
+SLOW_REQUEST_SECONDS = 1.0
+# 结构化日志中最多保留的 print 行数
+MAX_CAPTURED_LINES = 200
+
+
+class Histogram:
+    """按标签分组的累积直方图"""
+
+    def __init__(self, name, help_text, buckets, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._series.items())
+        for labels, (counts, total, count) in items:
+            label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, labels))
+            sep = ',' if label_text else ''
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label_text}{sep}le="{bound:g}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label_text}{sep}le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total:.6f}')
+            lines.append(f'{self.name}_count{{{label_text}}} {count}')
+        return '\n'.join(lines)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_DURATION = Histogram(
+    'etf_http_request_duration_seconds', '请求总耗时', DURATION_BUCKETS, ('endpoint', 'method', 'status'))
+SQL_DURATION = Histogram(
+    'etf_http_request_sql_duration_seconds', '单个请求内SQL执行耗时', DURATION_BUCKETS, ('endpoint',))
+SQL_COUNT = Histogram(
+    'etf_http_request_sql_queries', '单个请求内执行的SQL语句数', COUNT_BUCKETS, ('endpoint',))
+JSON_DURATION = Histogram(
+    'etf_http_request_json_duration_seconds', '单个请求内JSON编码与压缩耗时', DURATION_BUCKETS, ('endpoint',))
+
+HISTOGRAMS = (REQUEST_DURATION, SQL_DURATION, SQL_COUNT, JSON_DURATION)
+
+
+def render_metrics():
+    """所有直方图的 Prometheus 文本格式"""
+    return '\n'.join(h.render() for h in HISTOGRAMS) + '\n'
+
+
+class _StdoutRouter(io.TextIOBase):
+    """按上下文分流的 stdout：请求开启捕获时写入缓冲，否则写入原始 stdout"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._buffer = contextvars.ContextVar('captured_stdout', default=None)
+
+    def write(self, text):
+        buffer = self._buffer.get()
+        if buffer is None:
+            return self._stream.write(text)
+        buffer.append(text)
+        return len(text)
+
+    def flush(self):
+        self._stream.flush()
+
+    def begin(self):
+        return self._buffer.set([])
+
+    def end(self, token):
+        lines = ''.join(self._buffer.get() or []).splitlines()
+        self._buffer.reset(token)
+        return lines
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def _endpoint_label():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def init_app(app):
+    """注册计时中间件和 /metrics 接口"""
+    mode = app.config.setdefault('VERBOSE_LOG_MODE', os.getenv('ETF_VERBOSE_LOG', 'print'))
+    sample_rate = float(app.config.setdefault('LOG_SAMPLE_RATE', os.getenv('ETF_LOG_SAMPLE_RATE', '0.01')))
+
+    router = None
+    if mode in ('sample', 'off'):
+        router = sys.stdout if isinstance(sys.stdout, _StdoutRouter) else _StdoutRouter(sys.stdout)
+        sys.stdout = router
+
+    def _skip():
+        return request.path == '/metrics' or request.path.startswith('/static/')
+
+    @app.before_request
+    def _start_timing():
+        if _skip():
+            return
+        g._request_stats, g._request_stats_token = start_request_stats()
+        if router is not None:
+            g._stdout_token = router.begin()
+
+    @app.after_request
+    def _finish_timing(response):
+        stats = g.pop('_request_stats', None)
+        if stats is None:
+            return response
+
+        total = stats.elapsed()
+        json_time = stats.timings.get('json', 0.0)
+        app_time = max(total - stats.sql_time - json_time, 0.0)
+        endpoint = _endpoint_label()
+
+        REQUEST_DURATION.observe(total, endpoint, request.method, str(response.status_code))
+        SQL_DURATION.observe(stats.sql_time, endpoint)
+        SQL_COUNT.observe(stats.sql_count, endpoint)
+        JSON_DURATION.observe(json_time, endpoint)
+
+        response.headers['Server-Timing'] = ', '.join([
+            f'sql;dur={stats.sql_time * 1000:.1f};desc="{stats.sql_count} queries"',
+            f'json;dur={json_time * 1000:.1f}',
+            f'app;dur={app_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+        token = g.pop('_stdout_token', None)
+        if router is not None and token is not None:
+            lines = router.end(token)
+            sampled = mode == 'sample' and (
+                response.status_code >= 500 or total >= SLOW_REQUEST_SECONDS or random.random() < sample_rate)
+            if sampled:
+                logger.info(json.dumps({
+                    'endpoint': endpoint,
+                    'method': request.method,
+                    'path': request.full_path.rstrip('?'),
+                    'status': response.status_code,
+                    'total_ms': round(total * 1000, 1),
+                    'sql_ms': round(stats.sql_time * 1000, 1),
+                    'sql_count': stats.sql_count,
+                    'json_ms': round(json_time * 1000, 1),
+                    'output': lines[:MAX_CAPTURED_LINES],
+                }, ensure_ascii=False))
+        return response
+
+    @app.teardown_request
+    def _reset_timing(exc):
+        token = g.pop('_request_stats_token', None)
+        if token is not None:
+            stop_request_stats(token)
+        token = g.pop('_stdout_token', None)
+        if router is not None and token is not None:
+            router.end(token)
+
+    def metrics():
+        return app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics)
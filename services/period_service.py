@@ -0,0 +1,77 @@
+"""
+多周期对比缓存
+
+database.period_merge 的结果按日期组合缓存在内存中，自选、持有人和基本信息的数据版本
+（response_service.data_version）变化后整体失效。周报和接口对同一组日期的重复查询直接复用已合并的结果。
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+import pandas as pd
+
+from database import dataset_versions, instrumentation
+from database.models import DATABASE_PATH
+from database.period_merge import merge_periods, normalize_periods, to_wide
+from services.response_service import data_version
+
+logger = logging.getLogger(__name__)
+
+# 周期对比依赖的数据集（见 database/dataset_versions.py）
+DATASETS = ('attention', 'holders', 'info')
+
+# 最多缓存的日期组合数
+MAX_ENTRIES = 16
+
+_cache = OrderedDict()
+_cache_version = None
+_lock = threading.Lock()
+
+
+def get_period_comparison(dates):
+    """返回 merge_periods 的整洁表（调用方不应修改返回的DataFrame）"""
+    global _cache_version
+    periods = tuple(normalize_periods(dates))
+    version = data_version(*DATASETS)
+    with _lock:
+        if version != _cache_version:
+            _cache.clear()
+            _cache_version = version
+        if periods in _cache:
+            _cache.move_to_end(periods)
+            return _cache[periods]
+
+    conn = instrumentation.connect(DATABASE_PATH)
+    try:
+        frame = merge_periods(conn, periods)
+    finally:
+        conn.close()
+    logger.info(f"周期对比已合并: {', '.join(periods)}，{frame['code'].nunique()}只ETF")
+
+    with _lock:
+        if version == _cache_version:
+            _cache[periods] = frame
+            while len(_cache) > MAX_ENTRIES:
+                _cache.popitem(last=False)
+    return frame
+
+
+def get_period_comparison_wide(dates):
+    return to_wide(get_period_comparison(dates))
+
+
+def latest_history_date():
+    """历史表中最新的数据日期（取自选和持有人两者中较早的那个，保证两者都有数据）"""
+    dates = [date for date in map(dataset_versions.registry.latest_date, ('attention', 'holders')) if date]
+    return min(dates) if dates else None
+
+
+def weekly_dates(end_date=None, weeks=1):
+    """周报使用的日期：end_date（默认最新数据日期）及之前每隔7天的日期，共 weeks+1 个"""
+    end_date = end_date or latest_history_date()
+    if end_date is None:
+        raise ValueError("历史表中没有数据")
+    end = pd.Timestamp(end_date)
+    return [(end - timedelta(days=7 * i)).strftime('%Y-%m-%d') for i in range(weeks, -1, -1)]
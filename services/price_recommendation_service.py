@@ -0,0 +1,61 @@
+"""
+价格涨幅推荐
+
+最新交易日的涨幅全集（price_metrics + etf_info，每只ETF一行）缓存在内存中，
+按所依赖数据集的版本（response_service.data_version）失效；每次请求只在内存里做筛选和分组 idxmax，
+不再读写当天的推荐JSON文件。
+"""
+
+import logging
+import threading
+
+from database import instrumentation
+from database.models import DATABASE_PATH
+from etf_price_recommendation import (DEFAULT_HORIZON, DEFAULT_TOP_N, format_recommendations,
+                                      get_top_etfs_by_return, load_return_universe)
+from services.response_service import data_version
+
+logger = logging.getLogger(__name__)
+
+# 涨幅全集依赖的数据集（见 database/dataset_versions.py）
+DATASETS = ('price_metrics', 'info', 'business')
+
+
+class ReturnUniverse:
+    """最新交易日的涨幅全集"""
+
+    def __init__(self):
+        self.version = None
+        self.frame = None
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """数据版本变化（或 force）时重新读取"""
+        version = data_version(*DATASETS)
+        if not force and version == self.version:
+            return self
+        with self._lock:
+            if not force and version == self.version:
+                return self
+            conn = instrumentation.connect(DATABASE_PATH)
+            try:
+                self.frame = load_return_universe(conn)
+            finally:
+                conn.close()
+            self.version = version
+            logger.info(f"涨幅推荐数据已加载: {len(self.frame)}只ETF")
+        return self
+
+
+_universe = ReturnUniverse()
+
+
+def get_return_universe():
+    return _universe.refresh().frame
+
+
+def get_price_recommendations(horizon=DEFAULT_HORIZON, top_n=DEFAULT_TOP_N,
+                              business_only=False, min_size=None):
+    """每个跟踪指数取涨幅最大的一只ETF，按涨幅取前 top_n 只；horizon 不支持时抛出 ValueError"""
+    top_etfs = get_top_etfs_by_return(get_return_universe(), horizon, top_n, business_only, min_size)
+    return format_recommendations(top_etfs, horizon)
@@ -0,0 +1,115 @@
+"""
+请求记录器
+
+把请求描述（方法、路径、查询参数、表单/JSON请求体）追加写入 JSON Lines 文件，
+供 benchmarks/replay.py 回放压测。默认关闭，通过环境变量开启:
+    ETF_RECORD_REQUESTS=requests.jsonl   记录文件路径
+    ETF_RECORD_SAMPLE_RATE=1.0           记录比例
+
+记录前会脱敏：名称中包含 token/secret/password 等字样的字段值被替换，
+上传文件只记录字段名和文件名，不记录内容。
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+from flask import g, request
+
+SENSITIVE_KEYWORDS = ('token', 'secret', 'password', 'passwd', 'authorization', 'cookie', 'signature', 'app_id')
+REDACTED = '***'
+# 单个字符串字段的最大记录长度
+MAX_VALUE_LENGTH = 2000
+
+
+def _is_sensitive(key):
+    key = str(key).lower()
+    return any(word in key for word in SENSITIVE_KEYWORDS)
+
+
+def sanitize(value):
+    """递归脱敏：敏感字段替换为 ***，超长字符串截断"""
+    if isinstance(value, dict):
+        return {k: (REDACTED if _is_sensitive(k) else sanitize(v)) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [sanitize(v) for v in value]
+    if isinstance(value, str) and len(value) > MAX_VALUE_LENGTH:
+        return value[:MAX_VALUE_LENGTH]
+    return value
+
+
+def _pairs(multidict):
+    return [[k, REDACTED if _is_sensitive(k) else sanitize(v)] for k, v in multidict.items(multi=True)]
+
+
+def describe_request():
+    """当前请求的可回放描述"""
+    descriptor = {
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.url_rule.rule if request.url_rule is not None else None,
+        'args': _pairs(request.args),
+    }
+    if request.method in ('POST', 'PUT', 'PATCH', 'DELETE'):
+        if request.is_json:
+            descriptor['json'] = sanitize(request.get_json(silent=True))
+        elif request.form:
+            descriptor['form'] = _pairs(request.form)
+        if request.files:
+            descriptor['files'] = [[k, f.filename] for k, f in request.files.items(multi=True)]
+    return descriptor
+
+
+class RequestRecorder:
+    """线程安全的 JSON Lines 追加写入"""
+
+    def __init__(self, path, sample_rate=1.0):
+        self.path = path
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+
+    def write(self, entry):
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+def init_app(app, path=None, sample_rate=None):
+    """按参数或环境变量注册请求记录钩子，未配置路径时不做任何事"""
+    path = path or app.config.get('RECORD_REQUESTS_PATH') or os.getenv('ETF_RECORD_REQUESTS')
+    if not path:
+        return None
+    if sample_rate is None:
+        sample_rate = float(os.getenv('ETF_RECORD_SAMPLE_RATE', '1.0'))
+    recorder = RequestRecorder(path, sample_rate)
+
+    def _skip():
+        return (request.path.startswith('/static/') or request.path in ('/metrics', '/favicon.ico')
+                or request.method in ('OPTIONS', 'HEAD'))
+
+    @app.before_request
+    def _record_start():
+        if not _skip() and random.random() < recorder.sample_rate:
+            g._record_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop('_record_started', None)
+        if started is None:
+            return response
+        try:
+            entry = describe_request()
+            entry['time'] = datetime.now().isoformat(timespec='milliseconds')
+            entry['status'] = response.status_code
+            entry['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            recorder.write(entry)
+        except Exception as e:
+            app.logger.warning(f"记录请求失败: {e}")
+        return response
+
+    app.logger.info(f"请求记录已开启: {path}（比例 {sample_rate}）")
+    return recorder
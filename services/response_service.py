@@ -0,0 +1,175 @@
+"""
+接口响应层
+
+为数据量较大的JSON接口提供:
+- 基于 orjson 的快速JSON编码（未安装时回退到标准库）
+- 按 Accept-Encoding 协商的 brotli/gzip 压缩
+- 由数据版本和请求参数计算的强 ETag，数据未变化时直接返回 304
+"""
+
+import functools
+import gzip
+import hashlib
+import time
+from datetime import date
+
+from flask import current_app, g, request
+from flask.json.provider import DefaultJSONProvider, _default
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 可选依赖
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 可选依赖
+    brotli = None
+
+from database import dataset_versions
+from database.instrumentation import record_timing
+
+# 小于该字节数的响应不压缩，压缩收益抵不过CPU开销
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """使用 orjson 编码的 JSON Provider，日期等类型仍按 Flask 默认规则输出"""
+
+    if orjson is not None:
+        _options = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+                    | orjson.OPT_PASSTHROUGH_DATETIME)
+
+        def _encode(self, obj):
+            options = self._options
+            if self.sort_keys:
+                options |= orjson.OPT_SORT_KEYS
+            start = time.perf_counter()
+            try:
+                return orjson.dumps(obj, default=_default, option=options)
+            finally:
+                record_timing('json', time.perf_counter() - start)
+
+        def dumps(self, obj, **kwargs):
+            if kwargs:
+                return super().dumps(obj, **kwargs)
+            try:
+                return self._encode(obj).decode('utf-8')
+            except TypeError:
+                # 超出64位的整数等 orjson 不支持的情况
+                return super().dumps(obj)
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            if self.compact is False or (self.compact is None and self._app.debug):
+                return super().response(obj)
+            try:
+                body = self._encode(obj) + b'\n'
+            except TypeError:
+                return super().response(obj)
+            return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def data_version(*datasets):
+    """
+    当前数据版本：datasets（默认全部）的登记内容摘要（见 database/dataset_versions.py），
+    数据真正变化或整库替换为不同内容时才改变
+    """
+    return dataset_versions.registry.version(*datasets)
+
+
+def request_etag(version=None):
+    """由数据版本、请求方法、路径、查询参数和请求体计算强 ETag"""
+    digest = hashlib.sha1()
+    digest.update((version if version is not None else data_version()).encode('utf-8'))
+    digest.update(f'\0{request.method}\0{request.path}\0'.encode('utf-8'))
+    for key, value in sorted(request.args.items(multi=True)):
+        digest.update(f'{key}={value}&'.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def _choose_encoding():
+    accept = request.accept_encodings
+    if brotli is not None and accept['br']:
+        return 'br'
+    if accept['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response):
+    """按客户端 Accept-Encoding 压缩响应体，已压缩或过小的响应原样返回"""
+    response.vary.add('Accept-Encoding')
+    if (response.direct_passthrough or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_SIZE:
+        return response
+
+    encoding = _choose_encoding()
+    start = time.perf_counter()
+    if encoding == 'br':
+        body = brotli.compress(body, quality=BROTLI_QUALITY)
+    elif encoding == 'gzip':
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+    else:
+        return response
+    record_timing('json', time.perf_counter() - start)
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def mark_error():
+    """
+    视图以 HTTP 200 返回错误或不完整的结果（{"error": ...}、{"success": false}、部分数据源查询失败等）时调用，
+    cached_json 不为本次响应加 ETag，下次请求重新计算
+    """
+    g.response_error = True
+
+
+def cached_json(max_age=0, daily=False):
+    """
+    数据接口装饰器：ETag命中时跳过视图直接返回304，否则为成功的JSON响应加上
+    ETag/Cache-Control 并压缩。
+
+    非200响应、视图调用了 mark_error() 的响应和视图自行设置了 Cache-Control 的响应不加 ETag，
+    视图可以用 Cache-Control: no-store 表示本次结果不可缓存（如取自外部接口的数据）。
+    不解析响应体判断是否出错，大响应不会被重复解析。
+
+    参数:
+        max_age: 浏览器可直接复用缓存的秒数，0 表示每次都需要用 ETag 重新验证
+        daily: 结果与当天日期有关（如以今天作为默认截止日），ETag 包含日期，跨天后失效
+    """
+    cache_control = f'private, max-age={max_age}' if max_age else 'private, no-cache'
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            version = data_version()
+            if daily:
+                version += date.today().isoformat()
+            etag = request_etag(version)
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = cache_control
+                response.vary.add('Accept-Encoding')
+                return response
+
+            response = current_app.make_response(view(*args, **kwargs))
+            # 只缓存成功结果，出错时返回的响应下次仍需重新计算
+            if (response.status_code == 200 and response.is_json
+                    and 'Cache-Control' not in response.headers and not g.get('response_error')):
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = cache_control
+            return compress_response(response)
+        return wrapper
+    return decorator
@@ -0,0 +1,467 @@
+"""
+后台任务调度
+
+原先手工或由外部 cron 执行的写库任务（价格抓取、数据目录导入、飞书同步、基金公司分析刷新）
+以及历史表分层归档，改为在服务进程内按计划运行:
+- 计划：every:<N>s|m|h（固定间隔）、daily:HH:MM、weekdays:HH:MM（周一至周五）、off；
+  默认值见 JOBS，可用环境变量 ETF_SCHEDULE_<任务名大写> 覆盖，如 ETF_SCHEDULE_FEISHU_SYNC=every:2h
+- 执行：单个执行线程按触发顺序依次运行，写库任务持有 database.writer_lock.write_lock
+  （与上传导入共用），重型刷新不会重叠；导入、分析刷新和归档在暂存库中构建后整体发布
+  （database/staging.py），关闭分阶段发布时启动时把数据库切换为 WAL 日志，写入期间读请求不被阻塞
+- 合并：任务已在排队或运行时再次触发只计数（coalesced），不重复排队
+- 记录：每次运行的触发方式、排队等待、耗时和结果保存在内存中（每个任务最近 HISTORY_SIZE 次），
+  并写入 STATUS_PATH，其他进程（如 gunicorn worker）的 /api/jobs 从该文件读取
+
+开发服务器（python app.py）默认启动调度（ETF_SCHEDULER=0 关闭）；gunicorn 部署时不要在主进程中运行，
+单独启动一个调度进程:
+
+    python -m services.scheduler_service
+"""
+
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+
+from flask import jsonify
+
+from database import instrumentation
+from database.models import DATABASE_PATH
+from database.writer_lock import write_lock
+
+logger = logging.getLogger(__name__)
+
+HISTORY_SIZE = 20
+STATUS_PATH = os.getenv('ETF_SCHEDULER_STATUS') or os.path.join(os.path.dirname(DATABASE_PATH),
+                                                                'scheduler_status.json')
+
+
+def update_prices():
+    """抓取全部ETF最新价格（增量更新本地价格缓存）并保存为 data/ 下的CSV"""
+    from etf_price_tracker import ETFPriceTracker
+
+    tracker = ETFPriceTracker()
+    prices = tracker.get_all_etf_prices()
+    if prices.empty:
+        raise RuntimeError("未能获取ETF价格数据")
+    return tracker.save_data(prices)
+
+
+def import_data():
+    """导入 data/ 目录下各数据源的最新文件，内容未变化的数据源自动跳过"""
+    from services.import_pipeline import run_import
+
+    report = run_import()
+    if not report.success:
+        failed = [f"{stage.name}/{stage.stage}" for stage in report.stages if stage.status == 'failed']
+        raise RuntimeError(f"导入失败: {', '.join(failed)}")
+    return {'written': report.written, 'seconds': report.seconds}
+
+
+def sync_feishu():
+    """从飞书全量同步推广数据"""
+    from blueprints.feishu_routes import sync_feishu_promo_data
+
+    rows = sync_feishu_promo_data()
+    if rows is None:
+        raise RuntimeError("无法获取飞书推广数据")
+    # 海报图片下载不访问数据库，另起任务执行，不占用写锁
+    if scheduler.running:
+        scheduler.trigger('feishu_images', trigger='feishu_sync')
+    else:
+        cache_feishu_images()
+    return rows
+
+
+def cache_feishu_images():
+    """下载新登记的飞书海报图片并生成缩略图"""
+    from services.feishu_image_service import prefetch
+
+    return prefetch()
+
+
+def refresh_company_analytics():
+    """重算基金公司聚合分析表及其历史（分析表会先 DROP 再重建，在暂存库中进行后发布）"""
+    from database import staging
+    from database.models import Database
+
+    def build_step(build):
+        db = Database(build.path)
+        try:
+            if not db.update_company_analytics_data():
+                raise RuntimeError("更新基金公司分析数据失败")
+            if not db.update_company_analytics_history():
+                raise RuntimeError("更新基金公司分析历史失败")
+        finally:
+            db.close()
+        build.publish = True
+
+    staging.run('company_analytics', build_step)
+
+
+def build_company_daily_metrics():
+    """基金公司日汇总表尚未建立时（旧库）在暂存库中全量构建后发布，已建立时直接返回"""
+    from database import staging
+    from database.models import Database
+
+    db = Database()
+    try:
+        if db.company_daily_metrics_ready():
+            return False
+    finally:
+        db.close()
+
+    def build_step(build):
+        db = Database(build.path)
+        try:
+            if not db.refresh_company_daily_metrics():
+                raise RuntimeError("构建基金公司日汇总失败")
+        finally:
+            db.close()
+        build.publish = True
+
+    staging.run('company_daily_metrics', build_step)
+    return True
+
+
+def compact_history():
+    """把超出热数据窗口的历史行压缩为周度/月度快照并移入归档库"""
+    from database.retention import run_retention
+
+    return {item['table']: {'moved': item['moved'], 'dropped': item['dropped']} for item in run_retention()}
+
+
+@dataclass
+class Job:
+    name: str
+    label: str
+    func: object
+    schedule: str = 'off'
+    # 运行期间持有数据库写锁
+    writes: bool = True
+
+
+JOBS = [
+    Job('price_update', 'ETF价格抓取', update_prices, 'weekdays:16:00', writes=False),
+    Job('import_data', '数据目录导入', import_data, 'every:10m'),
+    Job('feishu_sync', '飞书推广数据同步', sync_feishu, 'daily:09:00'),
+    Job('feishu_images', '飞书海报图片缓存', cache_feishu_images, 'off', writes=False),
+    Job('company_analytics', '基金公司分析刷新', refresh_company_analytics, 'weekdays:17:30'),
+    Job('company_daily_metrics', '基金公司日汇总构建', build_company_daily_metrics, 'off'),
+    Job('retention', '历史数据分层归档', compact_history, 'daily:02:30'),
+]
+
+
+@dataclass
+class JobRun:
+    # schedule / manual / startup / cli
+    trigger: str
+    queued_at: str
+    started_at: str = None
+    finished_at: str = None
+    wait_seconds: float = None
+    seconds: float = None
+    # ok / failed
+    status: str = None
+    result: object = None
+    error: str = None
+
+
+@dataclass
+class JobState:
+    schedule: str
+    next_run: str = None
+    # idle / queued / running
+    status: str = 'idle'
+    runs: int = 0
+    failures: int = 0
+    coalesced: int = 0
+    history: deque = field(default_factory=lambda: deque(maxlen=HISTORY_SIZE))
+    pending: JobRun = None
+
+    def to_dict(self):
+        result = asdict(self)
+        result['history'] = [asdict(run) for run in reversed(self.history)]
+        result['pending'] = asdict(self.pending) if self.pending else None
+        return result
+
+
+_SCHEDULE_PATTERN = re.compile(r'^(?:every:(\d+)([smh])|(daily|weekdays):(\d{1,2}):(\d{2})|off)$')
+_UNITS = {'s': 1, 'm': 60, 'h': 3600}
+
+
+def schedule_for(job):
+    """任务的计划：环境变量 ETF_SCHEDULE_<任务名大写> 优先"""
+    return os.getenv(f'ETF_SCHEDULE_{job.name.upper()}', job.schedule).strip().lower()
+
+
+def validate_schedule(spec):
+    if not _SCHEDULE_PATTERN.match(spec):
+        raise ValueError(f"无法识别的计划: {spec}（应为 every:30m、daily:HH:MM、weekdays:HH:MM 或 off）")
+    return spec
+
+
+def next_run_time(spec, now):
+    """计划 spec 在 now 之后的下一次运行时间，off 返回 None"""
+    match = _SCHEDULE_PATTERN.match(spec)
+    if match is None or spec == 'off':
+        return None
+    amount, unit, kind, hour, minute = match.groups()
+    if amount:
+        return now + timedelta(seconds=int(amount) * _UNITS[unit])
+    moment = now.replace(hour=int(hour), minute=int(minute), second=0, microsecond=0)
+    while moment <= now or (kind == 'weekdays' and moment.weekday() >= 5):
+        moment += timedelta(days=1)
+    return moment
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _result_value(value):
+    """运行结果只保留可JSON序列化的简单值"""
+    try:
+        json.dumps(value)
+        return value
+    except (TypeError, ValueError):
+        return str(value)
+
+
+class Scheduler:
+    def __init__(self, jobs):
+        self.jobs = {job.name: job for job in jobs}
+        self.states = {job.name: JobState(schedule=validate_schedule(schedule_for(job))) for job in jobs}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._next = {}
+        self._threads = []
+        self.started_at = None
+
+    @property
+    def running(self):
+        return bool(self._threads) and not self._stopped.is_set()
+
+    def trigger(self, name, trigger='manual'):
+        """
+        把任务加入执行队列
+
+        返回:
+            (JobRun, 是否新排队)：任务已在排队或运行时合并到该次运行，返回 False
+        """
+        if name not in self.jobs:
+            raise KeyError(name)
+        with self._lock:
+            state = self.states[name]
+            if state.status != 'idle':
+                state.coalesced += 1
+                return state.pending, False
+            state.status = 'queued'
+            state.pending = JobRun(trigger=trigger, queued_at=_now())
+            run = state.pending
+        self._queue.put((name, run, time.perf_counter()))
+        return run, True
+
+    def run_job(self, name, trigger='manual'):
+        """
+        在当前线程同步执行任务（命令行、启动预热使用），返回 JobRun
+
+        任务已在排队或运行时同样合并，返回进行中的那次运行。
+        """
+        if name not in self.jobs:
+            raise KeyError(name)
+        with self._lock:
+            state = self.states[name]
+            if state.status != 'idle':
+                state.coalesced += 1
+                return state.pending
+            state.status = 'queued'
+            state.pending = run = JobRun(trigger=trigger, queued_at=_now())
+        self._execute(name, run, time.perf_counter())
+        return run
+
+    def _execute(self, name, run, queued):
+        job = self.jobs[name]
+        state = self.states[name]
+        started = time.perf_counter()
+        try:
+            # 写库任务等待写锁的时间计入排队等待
+            with write_lock.hold(name) if job.writes else nullcontext():
+                run.started_at = _now()
+                run.wait_seconds = round(time.perf_counter() - queued, 3)
+                started = time.perf_counter()
+                with self._lock:
+                    state.status = 'running'
+                run.result = _result_value(job.func())
+            run.status = 'ok'
+        except Exception as e:
+            logger.error(f"任务 {job.label}（{name}）失败: {e}", exc_info=True)
+            run.status = 'failed'
+            run.error = str(e)
+        run.seconds = round(time.perf_counter() - started, 3)
+        run.finished_at = _now()
+        with self._lock:
+            state.runs += 1
+            state.failures += run.status == 'failed'
+            state.history.append(run)
+            state.status = 'idle'
+            state.pending = None
+        logger.info(f"任务 {job.label}（{name}）{run.status}，等待 {run.wait_seconds}s，耗时 {run.seconds}s")
+        if self.running:
+            self.save_status()
+
+    def _worker(self):
+        while not self._stopped.is_set():
+            try:
+                name, run, queued = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            self._execute(name, run, queued)
+
+    def _timer(self):
+        now = datetime.now()
+        with self._lock:
+            for name, state in self.states.items():
+                self._next[name] = next_run_time(state.schedule, now)
+        while not self._stopped.is_set():
+            now = datetime.now()
+            for name, moment in list(self._next.items()):
+                if moment is not None and moment <= now:
+                    self.trigger(name, 'schedule')
+                    self._next[name] = next_run_time(self.states[name].schedule, now)
+            with self._lock:
+                for name, moment in self._next.items():
+                    self.states[name].next_run = moment.strftime('%Y-%m-%d %H:%M:%S') if moment else None
+            upcoming = [moment for moment in self._next.values() if moment is not None]
+            timeout = (min(upcoming) - datetime.now()).total_seconds() if upcoming else 60
+            self._wake.wait(min(max(timeout, 0.5), 60))
+            self._wake.clear()
+
+    def start(self):
+        self._stopped.clear()
+        self.started_at = _now()
+        for target, name in ((self._timer, 'etf-scheduler'), (self._worker, 'etf-jobs')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("任务调度已启动: " + ', '.join(f"{name}={state.schedule}" for name, state in self.states.items()))
+        self.save_status()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        self._threads = []
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'running': self.running,
+                'started_at': self.started_at,
+                'updated_at': _now(),
+                'write_lock': write_lock.status(),
+                'jobs': {name: {'label': self.jobs[name].label, 'writes': self.jobs[name].writes, **state.to_dict()}
+                         for name, state in self.states.items()},
+            }
+
+    def save_status(self):
+        """写入状态文件（先写临时文件再替换，读取方不会读到半个文件）"""
+        try:
+            body = json.dumps(self.snapshot(), ensure_ascii=False, default=str)
+            temp = f"{STATUS_PATH}.{os.getpid()}.tmp"
+            with open(temp, 'w', encoding='utf-8') as f:
+                f.write(body)
+            os.replace(temp, STATUS_PATH)
+        except Exception as e:
+            logger.warning(f"写入任务状态文件失败: {e}")
+
+
+scheduler = Scheduler(JOBS)
+
+
+def enable_wal():
+    """切换为 WAL 日志（持久设置）：写事务进行中读请求仍可读取已提交的数据"""
+    conn = instrumentation.connect(DATABASE_PATH)
+    try:
+        mode = conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+        logger.info(f"数据库日志模式: {mode}")
+    finally:
+        conn.close()
+
+
+def start():
+    """启动调度线程（重复调用无效果）"""
+    from database import staging
+
+    if scheduler.running:
+        return scheduler
+    # 分阶段发布时导入不写正式库，发布的数据库为回滚日志模式，不需要 WAL
+    if not staging.ENABLED:
+        try:
+            enable_wal()
+        except Exception as e:
+            logger.warning(f"切换WAL日志失败: {e}")
+    scheduler.start()
+    # 旧库尚未建立基金公司日汇总表时构建（gunicorn 部署时读请求进程不写库）
+    scheduler.trigger('company_daily_metrics', trigger='startup')
+    return scheduler
+
+
+def run_job(name, trigger='manual'):
+    return scheduler.run_job(name, trigger)
+
+
+def status():
+    """本进程运行调度时返回内存状态，否则读取调度进程写入的状态文件"""
+    if scheduler.running:
+        return {'source': 'local', **scheduler.snapshot()}
+    try:
+        with open(STATUS_PATH, encoding='utf-8') as f:
+            return {'source': 'file', **json.load(f)}
+    except (OSError, ValueError):
+        return {'source': 'local', **scheduler.snapshot()}
+
+
+def init_app(app):
+    """注册 /api/jobs 状态和手动触发接口"""
+
+    @app.route('/api/jobs')
+    def api_jobs():
+        return jsonify(status())
+
+    @app.route('/api/jobs/<name>')
+    def api_job(name):
+        body = status()
+        if name not in body['jobs']:
+            return jsonify({'error': f"未知任务: {name}"}), 404
+        return jsonify({'name': name, **body['jobs'][name]})
+
+    @app.route('/api/jobs/<name>/run', methods=['POST'])
+    def api_run_job(name):
+        if name not in scheduler.jobs:
+            return jsonify({'error': f"未知任务: {name}"}), 404
+        if not scheduler.running:
+            return jsonify({'error': "本进程未运行任务调度，请在调度进程中触发"}), 409
+        run, queued = scheduler.trigger(name)
+        return jsonify({'name': name, 'queued': queued, 'coalesced': not queued,
+                        'run': asdict(run) if run else None}), 202
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO),
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        scheduler.stop()
@@ -0,0 +1,101 @@
+"""
+只读数据快照（多进程部署）
+
+gunicorn 以 preload_app 方式在主进程调用 app.create_app()，只加载一次:
+ETF全集（data_routes.etf_data / business_etfs）、指数简介（index_service.index_info_map）、
+排行榜（app.config['*_RECOMMENDATIONS']）和搜索关键词索引，fork 后各 worker 以写时复制共享，
+不再每个进程各自加载一份。
+
+数据版本变化时由主进程统一重载：监视线程发现 response_service.data_version() 变化且已稳定后
+给主进程发送 SIGHUP，gunicorn.conf.py 的 on_reload 钩子重新加载快照，随后 gunicorn 用新快照
+fork 新的 worker 并平滑关闭旧 worker。手动 kill -HUP <master pid> 效果相同。
+"""
+
+import gc
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from services import startup_service
+from services.response_service import data_version
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SnapshotState:
+    version: str = None
+    loaded_at: float = None
+    seconds: float = None
+    loads: int = 0
+
+
+state = SnapshotState()
+
+
+def load_etf_universe():
+    """加载ETF全集和商务品集合到 data_routes 的模块变量"""
+    import pandas as pd
+    from blueprints import data_routes
+    from services.data_service import load_latest_data
+
+    result = load_latest_data()
+    if result['status'] != 'success':
+        raise RuntimeError(result['message'])
+    data_routes.etf_data = pd.DataFrame(result['message']['etf_data'])
+    data_routes.business_etfs = {item['code'] for item in result['message']['business_etfs']}
+
+
+def load(steps):
+    """
+    执行加载步骤并记录数据版本
+
+    版本号在加载前读取：加载期间若有新写入，版本不一致，监视线程会再触发一次重载。
+    加载完成后冻结GC：快照对象移入永久代，fork 后 worker 的垃圾回收不再触碰这些对象，减少写时复制。
+    """
+    version = data_version()
+    started = time.perf_counter()
+    startup_service.run_warmup(steps)
+    state.version = version
+    state.loaded_at = time.time()
+    state.seconds = round(time.perf_counter() - started, 3)
+    state.loads += 1
+    gc.collect()
+    gc.freeze()
+    logger.info(f"数据快照已加载（第{state.loads}次），耗时 {state.seconds} 秒")
+    return state
+
+
+def is_stale():
+    return state.version is None or data_version() != state.version
+
+
+def start_version_watcher(on_change, interval=None):
+    """
+    后台轮询数据版本，版本变化且连续两次轮询一致（导入已结束）时调用 on_change
+
+    导入过程中版本会持续变化，等稳定后再重载，避免一次导入触发多次重载。
+    """
+    if interval is None:
+        interval = float(os.getenv('ETF_SNAPSHOT_POLL_SECONDS', '30'))
+
+    def _watch():
+        previous = signaled = None
+        while True:
+            time.sleep(interval)
+            try:
+                current = data_version()
+                # 同一版本只通知一次，重载失败时不反复触发
+                if current != state.version and current == previous and current != signaled:
+                    logger.info("数据版本已变化，触发快照重载")
+                    signaled = current
+                    on_change()
+                previous = current
+            except Exception:
+                logger.exception("检查数据版本失败")
+
+    thread = threading.Thread(target=_watch, name='etf-snapshot-watcher', daemon=True)
+    thread.start()
+    return thread
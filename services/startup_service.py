@@ -0,0 +1,151 @@
+"""
+启动与就绪状态
+
+快速启动模式（python app.py --fast-start 或 ETF_FAST_START=1）下，服务先绑定端口，
+预热步骤（导入重型模块、预加载推荐数据、指数简介、搜索关键词索引、同步飞书数据）在后台线程执行:
+- /healthz：进程存活即返回 200
+- /ready：预热中返回 503，必需步骤完成后返回 200，响应体包含各步骤耗时和错误
+- 预热未完成时，其他请求最多等待 ETF_READY_WAIT_SECONDS 秒（默认30）再处理
+
+未调用 start_warmup 时（普通启动、gunicorn、测试客户端）服务视为已就绪。
+"""
+
+import importlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+
+from flask import jsonify, request
+
+logger = logging.getLogger(__name__)
+
+# 进程内最早的时间点，app.py 导入本模块时记录
+PROCESS_STARTED = time.perf_counter()
+
+# 就绪检查类接口，不受预热等待影响
+EXEMPT_PATHS = ('/healthz', '/ready', '/metrics', '/favicon.ico')
+
+
+@dataclass
+class WarmupStep:
+    name: str
+    func: object
+    # 必需步骤全部完成后才标记就绪；非必需步骤（如飞书同步）在就绪后继续执行
+    required: bool = True
+
+
+@dataclass
+class StartupState:
+    app_loaded: float = None
+    bound_at: float = None
+    ready_at: float = None
+    finished_at: float = None
+    warming: bool = False
+    steps: dict = field(default_factory=dict)
+    ready: threading.Event = field(default_factory=threading.Event)
+
+    def __post_init__(self):
+        # 没有后台预热时视为已就绪
+        self.ready.set()
+
+    def _since_start(self, moment):
+        return round(moment - PROCESS_STARTED, 3) if moment is not None else None
+
+    def snapshot(self):
+        return {
+            'ready': self.ready.is_set(),
+            'warming': self.warming and self.finished_at is None,
+            'app_loaded_seconds': self._since_start(self.app_loaded),
+            'bound_seconds': self._since_start(self.bound_at),
+            'ready_seconds': self._since_start(self.ready_at),
+            'warmup_finished_seconds': self._since_start(self.finished_at),
+            'steps': dict(self.steps),
+        }
+
+
+state = StartupState()
+
+
+def mark_app_loaded():
+    """app.py 模块导入完成（蓝图已注册）"""
+    state.app_loaded = time.perf_counter()
+    return state.app_loaded - PROCESS_STARTED
+
+
+def mark_bound():
+    """即将开始接受连接"""
+    state.bound_at = time.perf_counter()
+
+
+def _run_step(step):
+    started = time.perf_counter()
+    try:
+        step.func()
+        state.steps[step.name] = {'status': 'ok', 'seconds': round(time.perf_counter() - started, 3)}
+    except Exception as e:
+        logger.exception(f"预热步骤 {step.name} 失败")
+        state.steps[step.name] = {'status': 'error', 'seconds': round(time.perf_counter() - started, 3),
+                                  'error': str(e)}
+
+
+def run_warmup(steps):
+    """
+    依次执行预热步骤：必需步骤完成后标记就绪，再执行其余步骤
+
+    单个步骤失败只记录错误，不阻止就绪，与原先预加载失败仍继续启动的行为一致。
+    """
+    steps = list(steps)
+    for step in steps:
+        state.steps.setdefault(step.name, {'status': 'pending'})
+    for step in [s for s in steps if s.required]:
+        _run_step(step)
+    state.ready_at = time.perf_counter()
+    state.ready.set()
+    logger.info(f"服务就绪，距进程启动 {state.ready_at - PROCESS_STARTED:.2f} 秒")
+    for step in [s for s in steps if not s.required]:
+        _run_step(step)
+    state.finished_at = time.perf_counter()
+
+
+def start_warmup(steps):
+    """在后台线程执行预热，返回线程对象"""
+    state.warming = True
+    state.ready.clear()
+    thread = threading.Thread(target=run_warmup, args=(steps,), name='etf-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def import_heavy_modules(names=('matplotlib.pyplot', 'docx', 'requests')):
+    """预先导入各接口按需导入的较慢模块，首个请求不再承担导入耗时；未安装的模块跳过"""
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning(f"预热导入 {name} 失败: {e}")
+
+
+def init_app(app, wait_seconds=None):
+    """注册 /healthz、/ready 和预热期间的请求等待"""
+    if wait_seconds is None:
+        wait_seconds = float(os.getenv('ETF_READY_WAIT_SECONDS', '30'))
+
+    @app.route('/healthz')
+    def healthz():
+        return jsonify({'status': 'ok'})
+
+    @app.route('/ready')
+    def ready():
+        body = state.snapshot()
+        return jsonify(body), (200 if body['ready'] else 503)
+
+    @app.before_request
+    def _wait_until_ready():
+        if state.ready.is_set() or request.path in EXEMPT_PATHS or request.path.startswith('/static/'):
+            return None
+        # 超时后照常处理，由各接口自身的懒加载兜底
+        state.ready.wait(wait_seconds)
+        return None
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+慢查询汇总报告
+
+读取 database/query_profiler.py 写出的 slow_queries.log，按归一化SQL指纹聚合，
+输出次数、总耗时、P50/P95/最大耗时、全表扫描的大表以及查询计划。
+
+用法:
+    python slow_query_report.py [日志路径] [--top 20] [--json 输出文件]
+"""
+
+import argparse
+import json
+import os
+from collections import defaultdict
+
+from database.query_profiler import DEFAULT_LOG_PATH
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def load_entries(path):
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return entries
+
+
+def aggregate(entries):
+    """按指纹聚合，返回按总耗时降序的汇总列表"""
+    groups = defaultdict(list)
+    for entry in entries:
+        groups[entry['fingerprint']].append(entry)
+
+    report = []
+    for fp, items in groups.items():
+        times = [e['elapsed_ms'] for e in items]
+        slowest = max(items, key=lambda e: e['elapsed_ms'])
+        scans = sorted({s for e in items for s in e.get('large_scans') or []})
+        report.append({
+            'fingerprint': fp,
+            'count': len(items),
+            'total_ms': round(sum(times), 2),
+            'p50_ms': _percentile(times, 50),
+            'p95_ms': _percentile(times, 95),
+            'max_ms': max(times),
+            'large_scans': scans,
+            'sql': slowest['sql'],
+            'example_params': slowest.get('params'),
+            'plan': slowest.get('plan') or [],
+            'last_seen': max(e['time'] for e in items),
+        })
+    report.sort(key=lambda r: r['total_ms'], reverse=True)
+    return report
+
+
+def print_report(report, top):
+    print(f"共 {sum(r['count'] for r in report)} 条慢查询，{len(report)} 种SQL形态\n")
+    for i, r in enumerate(report[:top], 1):
+        flag = ' [全表扫描: ' + ', '.join(r['large_scans']) + ']' if r['large_scans'] else ''
+        print(f"#{i} {r['fingerprint']}  次数={r['count']}  总耗时={r['total_ms']:.1f}ms  "
+              f"P50={r['p50_ms']:.1f}ms  P95={r['p95_ms']:.1f}ms  最大={r['max_ms']:.1f}ms{flag}")
+        sql = r['sql']
+        print(f"    SQL: {sql[:400]}{'...' if len(sql) > 400 else ''}")
+        print(f"    参数示例: {r['example_params']}")
+        for step in r['plan']:
+            print(f"    计划: {step}")
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='慢查询汇总报告')
+    parser.add_argument('log', nargs='?', default=os.getenv('ETF_SLOW_QUERY_LOG', DEFAULT_LOG_PATH),
+                        help='慢查询日志路径')
+    parser.add_argument('--top', type=int, default=20, help='显示前N种SQL')
+    parser.add_argument('--json', dest='json_path', help='同时把完整汇总写入JSON文件')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.log):
+        print(f"错误：找不到慢查询日志 {args.log}，请先以 ETF_SQL_PROFILE=1 运行应用")
+        return
+
+    report = aggregate(load_entries(args.log))
+    print_report(report, args.top)
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"汇总已写入 {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
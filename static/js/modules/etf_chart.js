@@ -5,6 +5,8 @@
  * 版本: 1.0.0 (2025-04-04)
  */
 
+import { columnarToRecords, HISTORY_MAX_POINTS } from './utils.js';
+
 // 初始化模块
 console.log("ETF图表模块已加载 v1.0.0 (2025-04-04)");
 
@@ -208,12 +210,12 @@ export async function fetchETFHistoryData(etfCode) {
         console.log(`获取ETF历史数据: ${etfCode}`);
         
         // 获取自选人数历史数据
-        const attentionResponse = await fetch(`/etf_attention_history?code=${encodeURIComponent(etfCode)}`);
-        const attentionData = await attentionResponse.json();
+        const attentionResponse = await fetch(`/etf_attention_history?code=${encodeURIComponent(etfCode)}&max_points=${HISTORY_MAX_POINTS}`);
+        const attentionData = columnarToRecords(await attentionResponse.json());
         
         // 获取持有人数和持仓价值历史数据
-        const holdersResponse = await fetch(`/etf_holders_history?code=${encodeURIComponent(etfCode)}`);
-        const holdersData = await holdersResponse.json();
+        const holdersResponse = await fetch(`/etf_holders_history?code=${encodeURIComponent(etfCode)}&max_points=${HISTORY_MAX_POINTS}`);
+        const holdersData = columnarToRecords(await holdersResponse.json());
         
         return {
             attention: attentionData,
@@ -230,17 +232,17 @@ export async function fetchFundCompanyHistoryData(companyName) {
     try {
         console.log(`获取基金公司历史数据: ${companyName}`);
         
-        const attentionResponse = await fetch(`/fund_company_attention_history?name=${encodeURIComponent(companyName)}`);
+        const attentionResponse = await fetch(`/fund_company_attention_history?name=${encodeURIComponent(companyName)}&max_points=${HISTORY_MAX_POINTS}`);
         if (!attentionResponse.ok) {
             throw new Error(`获取自选历史失败: ${attentionResponse.status}`);
         }
-        const attentionData = await attentionResponse.json();
+        const attentionData = columnarToRecords(await attentionResponse.json());
         
-        const holdersResponse = await fetch(`/fund_company_holders_history?name=${encodeURIComponent(companyName)}`);
+        const holdersResponse = await fetch(`/fund_company_holders_history?name=${encodeURIComponent(companyName)}&max_points=${HISTORY_MAX_POINTS}`);
         if (!holdersResponse.ok) {
             throw new Error(`获取持有人历史失败: ${holdersResponse.status}`);
         }
-        const holdersData = await holdersResponse.json();
+        const holdersData = columnarToRecords(await holdersResponse.json());
         
         // 后端返回的数据已经是 {date: ..., attention_count: ...} 和 {date: ..., holder_count: ..., holding_value: ...}
         // 无需像单个ETF那样分别包含在 attention 和 holders 键下，直接返回
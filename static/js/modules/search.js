@@ -4,7 +4,7 @@
  * 版本: 2.1.0 (2025-04-04) - 添加ETF历史数据趋势图表
  */
 
-import { showLoading, hideLoading, showAlert, formatNumber, showMessage } from './utils.js';
+import { showLoading, hideLoading, showAlert, formatNumber, showMessage, columnarToRecords, HISTORY_MAX_POINTS } from './utils.js';
 import { displayETFCharts, displayFundCompanyCharts } from './etf_chart.js';
 
 console.log("搜索模块已加载 v2.1.0 (2025-04-04)");
@@ -337,8 +337,6 @@ function generateETFTable(etfs, title = '搜索结果') {
         console.log("第一条ETF数据:", firstETF);
         console.log("持仓人数:", firstETF.holder_count);
         console.log("持仓价值:", firstETF.holding_value);
-        console.log("持仓价值日变化:", firstETF.holding_value_daily_change);
-        console.log("持仓价值5日变化:", firstETF.holding_value_five_day_change);
         console.log("holding_day_change:", firstETF.holding_day_change);
         console.log("holding_5day_change:", firstETF.holding_5day_change);
         // 检查旧的字段名是否存在
@@ -456,8 +454,8 @@ function generateETFTable(etfs, title = '搜索结果') {
                 attention_five_day_change: Number(etf.attention_five_day_change || etf.attention_5day_change || 0),
                 amount_daily_change: Number(etf.amount_daily_change || 0),
                 amount_five_day_change: Number(etf.amount_five_day_change || 0),
-                holding_value_daily_change: Number(etf.holding_value_daily_change || 0),
-                holding_value_five_day_change: Number(etf.holding_value_five_day_change || 0),
+                holding_value_daily_change: Number(etf.holding_value_daily_change || etf.holding_day_change || 0),
+                holding_value_five_day_change: Number(etf.holding_value_five_day_change || etf.holding_5day_change || 0),
                 holding_day_change: Number(etf.holding_day_change || etf.holding_value_daily_change || 0),
                 holding_5day_change: Number(etf.holding_5day_change || etf.holding_value_five_day_change || 0),
                 is_business: Boolean(etf.is_business),
@@ -1018,14 +1016,14 @@ async function loadHistoricalData(code) {
         
         // 并行加载自选和持有人历史数据
         const [attentionResponse, holdersResponse] = await Promise.all([
-            fetch(`/etf_attention_history?code=${encodeURIComponent(code)}`),
-            fetch(`/etf_holders_history?code=${encodeURIComponent(code)}`)
+            fetch(`/etf_attention_history?code=${encodeURIComponent(code)}&max_points=${HISTORY_MAX_POINTS}`),
+            fetch(`/etf_holders_history?code=${encodeURIComponent(code)}&max_points=${HISTORY_MAX_POINTS}`)
         ]);
         
         // 处理自选历史数据
         let attentionData = [];
         if (attentionResponse.ok) {
-            attentionData = await attentionResponse.json();
+            attentionData = columnarToRecords(await attentionResponse.json());
             console.log(`ETF自选历史数据加载成功, 记录数: ${attentionData.length}`, 
                 attentionData.length > 0 ? attentionData[0] : '无记录');
             
@@ -1041,7 +1039,7 @@ async function loadHistoricalData(code) {
         // 处理持有人历史数据
         let holdersData = [];
         if (holdersResponse.ok) {
-            holdersData = await holdersResponse.json();
+            holdersData = columnarToRecords(await holdersResponse.json());
             console.log(`ETF持有人历史数据加载成功, 记录数: ${holdersData.length}`,
                 holdersData.length > 0 ? holdersData[0] : '无记录');
             
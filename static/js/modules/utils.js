@@ -183,4 +183,28 @@ export function formatNumber(value, decimals = 2) {
         return '0.00';
     }
     return Number(value).toFixed(decimals);
-}
\ No newline at end of file
+}
+// 历史图表默认最多请求的数据点数（服务端使用LTTB降采样）
+export const HISTORY_MAX_POINTS = 1000;
+
+// 将历史接口返回的列式数据转换为逐点记录数组
+// 兼容旧的逐点字典列表格式，直接原样返回
+export function columnarToRecords(payload) {
+    if (Array.isArray(payload)) {
+        return payload;
+    }
+    if (!payload || !payload.columns || !payload.data) {
+        return [];
+    }
+    const columns = payload.columns;
+    const length = (payload.data[columns[0]] || []).length;
+    const records = new Array(length);
+    for (let i = 0; i < length; i++) {
+        const record = {};
+        columns.forEach(column => {
+            record[column] = payload.data[column][i];
+        });
+        records[i] = record;
+    }
+    return records;
+}
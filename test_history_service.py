@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试历史曲线整形：LTTB降采样与周/月汇总
+
+python -m pytest -q test_history_service.py
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.history_service import _rollup, lttb_indices, shape_history
+
+
+def reference_lttb(x, y, threshold):
+    """逐点循环的 LTTB 原始算法，作为对照"""
+    n = len(x)
+    if threshold <= 0 or threshold >= n or n <= 2:
+        return list(range(n))
+    every = (n - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        lo = int(math.floor(i * every)) + 1
+        hi = max(int(math.floor((i + 1) * every)) + 1, lo + 1)
+        next_lo = int(math.floor((i + 1) * every)) + 1
+        next_hi = min(max(int(math.floor((i + 2) * every)) + 1, next_lo + 1), n)
+        if i == threshold - 3:
+            cx, cy = x[n - 1], y[n - 1]
+        else:
+            cx = sum(x[next_lo:next_hi]) / (next_hi - next_lo)
+            cy = sum(y[next_lo:next_hi]) / (next_hi - next_lo)
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((x[a] - cx) * (y[j] - y[a]) - (x[a] - x[j]) * (cy - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+@pytest.mark.parametrize('n,threshold', [(100, 10), (365, 50), (1000, 97), (51, 49)])
+def test_lttb_matches_reference(n, threshold):
+    rng = np.random.default_rng(n)
+    x = np.arange(n, dtype=float)
+    y = np.cumsum(rng.normal(size=n))
+    keep = lttb_indices(x, y, threshold)
+    assert list(keep) == reference_lttb(list(x), list(y), threshold)
+
+
+def test_lttb_edges():
+    """点数不超过目标时全部保留；目标小于3时只保留首尾"""
+    x = np.arange(10)
+    y = np.arange(10, dtype=float)
+    assert list(lttb_indices(x, y, 0)) == list(range(10))
+    assert list(lttb_indices(x, y, 10)) == list(range(10))
+    assert list(lttb_indices(x, y, 2)) == [0, 9]
+
+
+def test_lttb_keeps_spike_and_handles_nan():
+    """孤立尖峰必须保留，NaN按0处理不报错"""
+    y = np.zeros(200)
+    y[77] = 100.0
+    y[150] = np.nan
+    keep = lttb_indices(np.arange(200), y, 20)
+    assert len(keep) == 20
+    assert 77 in keep
+    assert keep[0] == 0 and keep[-1] == 199
+    assert np.all(np.diff(keep) > 0)
+
+
+def test_rollup_week():
+    """周汇总：以周五为周末，日期取周期内最后一个实际日期"""
+    frame = pd.DataFrame({
+        'date': ['2024-01-01', '2024-01-02', '2024-01-05', '2024-01-08', '2024-01-10'],
+        'v': [3, 5, 1, 7, 6],
+    })
+    out, columns = _rollup(frame, ['v'], 'W-FRI')
+    assert columns == ['date', 'v_open', 'v_high', 'v_low', 'v_close']
+    assert out['date'].tolist() == ['2024-01-05', '2024-01-10']
+    assert out[['v_open', 'v_high', 'v_low', 'v_close']].values.tolist() == [[3, 5, 1, 1], [7, 7, 6, 6]]
+
+
+def test_rollup_month():
+    frame = pd.DataFrame({
+        'date': ['2024-01-30', '2024-01-31', '2024-02-01', '2024-02-29'],
+        'v': [1.0, 2.0, 4.0, 3.0],
+    })
+    out, _ = _rollup(frame, ['v'], 'M')
+    assert out['date'].tolist() == ['2024-01-31', '2024-02-29']
+    assert out['v_high'].tolist() == [2.0, 4.0]
+    assert out['v_close'].tolist() == [2.0, 3.0]
+
+
+def test_shape_history():
+    """范围过滤后降采样，输出列式结构，缺失值为 null"""
+    dates = pd.bdate_range('2024-01-01', periods=300).strftime('%Y-%m-%d')
+    records = [{'date': d, 'v': float(i), 'w': None if i % 2 else i} for i, d in enumerate(dates)]
+    result = shape_history(records, ['v', 'w'], start=dates[10], max_points=50)
+    assert result['method'] == 'lttb'
+    assert result['total_points'] == 290
+    assert result['returned_points'] == 50
+    assert result['data']['date'][0] == dates[10]
+    assert result['data']['date'][-1] == dates[-1]
+    assert None in result['data']['w']
+
+    raw = shape_history(records, ['v'], end=dates[4])
+    assert raw['method'] == 'raw'
+    assert raw['data']['v'] == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+
+if __name__ == '__main__':
+    pytest.main(['-q', __file__])
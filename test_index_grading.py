@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试跟踪指数分级：向量化实现与原逐指数循环的结果一致
+
+python -m pytest -q test_index_grading.py
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from database.index_grading import LEVELS, grade_indexes
+
+
+def make_universe(seed, n_indexes=60, max_etfs=6):
+    """随机ETF全集，费率、成交额取少量离散值以制造并列"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n_indexes):
+        for j in range(int(rng.integers(1, max_etfs + 1))):
+            rows.append({
+                'code': f'{i:03d}{j:03d}',
+                'name': f'指数{i}ETF{j}',
+                'fund_manager': f'公司{rng.integers(5)}基金管理有限公司',
+                'tracking_index_code': f'IDX{i:03d}',
+                'tracking_index_name': f'指数{i}',
+                'fee': float(rng.choice([0.2, 0.5, 0.6])),
+                'volume': float(rng.choice([10, 20, 30, 40])),
+                'scale': float(rng.integers(1, 200)),
+                'is_business': bool(rng.random() < 0.35),
+                'level1': rng.choice(['宽基规模', '主题行业', '跨境']),
+                'level2': f'二级{i % 4}',
+                'level3': f'三级{i % 7}',
+            })
+    return pd.DataFrame(rows)
+
+
+def reference_grades(universe):
+    """原 THE_BEST_ETF_2.0.py 中逐个指数循环的分级逻辑"""
+    grades = {}
+    for index_code, group in universe.groupby('tracking_index_code'):
+        lowest_fee_group = group[group['fee'] == group['fee'].min()]
+        lowest_fee = lowest_fee_group.loc[lowest_fee_group['volume'].idxmax()]
+        highest_volume = group.loc[group['volume'].idxmax()]
+        largest_scale = group.loc[group['scale'].idxmax()]
+        fee, volume, scale = lowest_fee['is_business'], highest_volume['is_business'], largest_scale['is_business']
+        if volume and fee and scale:
+            level = '一级'
+        elif volume and fee and not scale:
+            level = '二级'
+        elif volume and scale and not fee:
+            level = '三级'
+        elif fee and scale and not volume:
+            level = '四级'
+        elif volume:
+            level = '五级'
+        elif scale:
+            level = '六级'
+        elif fee:
+            level = '七级'
+        elif group['is_business'].sum() > 0:
+            level = '八级'
+        else:
+            level = '九级'
+        grades[index_code] = (level, lowest_fee['code'], highest_volume['code'], largest_scale['code'])
+    return grades
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_matches_reference_loop(seed):
+    universe = make_universe(seed)
+    result = grade_indexes(universe).set_index('跟踪指数代码')
+    expected = reference_grades(universe)
+    assert set(result.index) == set(expected)
+    for index_code, (level, fee_code, volume_code, scale_code) in expected.items():
+        row = result.loc[index_code]
+        assert row['跟踪指数分级'] == level, index_code
+        assert row['综合费率最低的基金代码'] == fee_code
+        assert row['日均交易量最大的基金代码'] == volume_code
+        assert row['规模合计最大的基金代码'] == scale_code
+
+
+def test_all_levels_and_statistics():
+    """随机数据覆盖全部九个分级，统计列与逐组计算一致"""
+    universe = make_universe(7, n_indexes=300)
+    result = grade_indexes(universe).set_index('跟踪指数代码')
+    assert set(result['跟踪指数分级']) == set(LEVELS)
+
+    group = universe[universe['tracking_index_code'] == 'IDX000']
+    row = result.loc['IDX000']
+    assert row['跟踪ETF数量'] == len(group)
+    assert row['商务品数量'] == group['is_business'].sum()
+    assert row['合计规模'] == round(group['scale'].sum(), 1)
+    assert row['商务品合计规模'] == round(group.loc[group['is_business'], 'scale'].sum(), 1)
+    assert row['综合费率最低的基金公司'].startswith('公司')
+    assert not row['综合费率最低的基金公司'].endswith('基金管理有限公司')
+
+
+if __name__ == '__main__':
+    pytest.main(['-q', __file__])
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试多周期对比的 as-of 连接与宽表输出
+
+python -m pytest -q test_period_merge.py
+"""
+
+import math
+import sqlite3
+
+import pytest
+
+from database.period_merge import merge_periods, normalize_periods, to_wide
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE etf_attention_history (code TEXT, date TEXT, attention_count INTEGER)")
+    conn.execute("""
+        CREATE TABLE etf_holders_history (
+            code TEXT, date TEXT, holder_count INTEGER, holding_amount REAL, holding_value REAL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE etf_info (
+            code TEXT, name TEXT, fund_manager TEXT, manager_short TEXT, tracking_index_code TEXT,
+            tracking_index_name TEXT, management_fee_rate REAL, custody_fee_rate REAL,
+            fund_size REAL, monthly_volume REAL
+        )
+    """)
+    conn.executemany("INSERT INTO etf_attention_history VALUES (?, ?, ?)", [
+        ('510300', '2024-01-05', 100),
+        ('510300', '2024-01-12', 130),
+        ('510500', '2024-01-12', 50),
+    ])
+    conn.executemany("INSERT INTO etf_holders_history VALUES (?, ?, ?, ?, ?)", [
+        ('510300', '2024-01-03', 10, 1.0, 2.0),
+        ('510300', '2024-01-11', 12, 1.5, 3.0),
+    ])
+    conn.executemany("INSERT INTO etf_info VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+        ('510300', '沪深300ETF', '华泰柏瑞基金', '华泰柏瑞', '000300', '沪深300', 0.5, 0.1, 1000.0, 5.0),
+        ('510500', '中证500ETF', '南方基金', '南方', '000905', '中证500', 0.5, 0.1, 500.0, 3.0),
+    ])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def row(frame, code, period):
+    return frame[(frame['code'] == code) & (frame['period'] == period)].iloc[0]
+
+
+def test_normalize_periods():
+    assert normalize_periods(['2024/01/12', '20240108', '2024-01-08']) == ['2024-01-08', '2024-01-12']
+    with pytest.raises(ValueError):
+        normalize_periods(['2024-01-08', '2024-01-08'])
+
+
+def test_asof_within_tolerance(conn):
+    """每个请求日期取不晚于它且在容差内的最近一条记录，并记录实际日期"""
+    frame = merge_periods(conn, ['2024-01-08', '2024-01-12'])
+    first = row(frame, '510300', '2024-01-08')
+    assert first['attention_count'] == 100
+    assert first['etf_attention_history_date'] == '2024-01-05'
+    assert first['holder_count'] == 10
+    assert first['etf_holders_history_date'] == '2024-01-03'
+
+    second = row(frame, '510300', '2024-01-12')
+    assert second['attention_count'] == 130
+    assert second['holder_count'] == 12
+    assert second['etf_holders_history_date'] == '2024-01-11'
+    assert second['attention_count_change'] == 30
+    assert second['holding_value_change'] == 1.0
+    assert second['name'] == '沪深300ETF'
+
+
+def test_asof_outside_tolerance(conn):
+    """超出容差或请求日期之前没有记录时为缺失值，不取之后的记录"""
+    frame = merge_periods(conn, ['2024-01-08', '2024-01-12'], tolerance_days=4)
+    first = row(frame, '510300', '2024-01-08')
+    assert first['attention_count'] == 100
+    assert math.isnan(first['holder_count'])
+
+    missing = row(frame, '510500', '2024-01-08')
+    assert math.isnan(missing['attention_count'])
+    assert row(frame, '510500', '2024-01-12')['attention_count'] == 50
+
+
+def test_codes_filter(conn):
+    frame = merge_periods(conn, ['2024-01-08', '2024-01-12'], codes=['510500'])
+    assert set(frame['code']) == {'510500'}
+
+
+def test_to_wide(conn):
+    wide = to_wide(merge_periods(conn, ['2024-01-08', '2024-01-12']))
+    record = wide.set_index('证券代码').loc['510300']
+    assert record['证券名称（01月12日）'] == '沪深300ETF'
+    assert record['关注人数（01月08日）'] == 100
+    assert record['关注人数（01月12日）'] == 130
+    assert record['关注人数变动'] == 30
+    assert record['基金管理人简称'] == '华泰柏瑞'
+
+
+if __name__ == '__main__':
+    pytest.main(['-q', __file__])
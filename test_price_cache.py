@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试本地日线缓存的水位判断与最近交易日推算
+
+etf_price_tracker 依赖 akshare，未安装时跳过。
+
+python -m pytest -q test_price_cache.py
+"""
+
+import datetime
+import sqlite3
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('akshare')
+
+from etf_price_tracker import PriceCache, latest_trading_day
+
+
+@pytest.mark.parametrize('now,expected', [
+    (datetime.datetime(2024, 1, 10, 16, 0), '20240110'),  # 周三收盘后
+    (datetime.datetime(2024, 1, 10, 9, 30), '20240109'),  # 周三收盘前
+    (datetime.datetime(2024, 1, 8, 10, 0), '20240105'),   # 周一收盘前跳过周末
+    (datetime.datetime(2024, 1, 13, 20, 0), '20240112'),  # 周六
+    (datetime.datetime(2024, 1, 14, 20, 0), '20240112'),  # 周日
+])
+def test_latest_trading_day(now, expected):
+    assert latest_trading_day(now) == expected
+
+
+def bars(*dates):
+    return pd.DataFrame({'trade_date': list(dates), 'open': 1.0, 'high': 1.0, 'low': 1.0,
+                         'close': [float(i + 1) for i in range(len(dates))], 'vol': 10.0})
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PriceCache(str(tmp_path / 'price_cache.db'))
+
+
+def test_needs_fetch(cache):
+    """未缓存时需要请求；水位到达目标日后不再请求"""
+    assert cache.needs_fetch('510300', '20240110')
+    assert cache.merge('510300', bars('20240108', '20240109', '20240110'), checked_day='20240110') == 3
+    assert cache.watermark('510300') == ('20240110', '20240110')
+    assert not cache.needs_fetch('510300', '20240110')
+    assert not cache.needs_fetch('510300', '20240109')
+    assert cache.needs_fetch('510300', '20240111')
+
+
+def test_no_repeat_for_same_target_day(cache):
+    """接口没有返回目标日数据（如节假日）时，同一目标日不再重复请求，目标日变化后再请求"""
+    cache.merge('510300', bars('20240208', '20240209'), checked_day='20240209')
+    cache.merge('510300', bars('20240208', '20240209'), checked_day='20240212')
+    assert cache.watermark('510300') == ('20240209', '20240212')
+    assert not cache.needs_fetch('510300', '20240212')
+    assert cache.needs_fetch('510300', '20240213')
+
+
+def test_merge_only_after_watermark(cache):
+    """只写入水位之后的行，已缓存的行不被覆盖"""
+    cache.merge('510300', bars('20240108', '20240109'), checked_day='20240109')
+    added = cache.merge('510300', bars('20240109', '20240110'), checked_day='20240110')
+    assert added == 1
+    loaded = cache.load('510300')
+    assert loaded['trade_date'].tolist() == ['20240108', '20240109', '20240110']
+    assert loaded['close'].tolist() == [1.0, 2.0, 2.0]
+    assert loaded['date'].iloc[-1] == '2024-01-10'
+    assert cache.merge('510300', None, checked_day='20240111') == 0
+    assert cache.watermark('510300') == ('20240110', '20240111')
+
+
+def test_legacy_watermark_upgraded(tmp_path):
+    """旧版缓存只有 checked_date 列，打开时补上 checked_day"""
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE price_watermark (code TEXT PRIMARY KEY, last_date TEXT, checked_date TEXT)")
+    conn.execute("INSERT INTO price_watermark VALUES ('510300', '20240105', '2024-01-06')")
+    conn.commit()
+    conn.close()
+
+    cache = PriceCache(path)
+    assert cache.watermark('510300') == ('20240105', None)
+    assert cache.needs_fetch('510300', '20240108')
+    assert not cache.needs_fetch('510300', '20240105')
+
+
+if __name__ == '__main__':
+    pytest.main(['-q', __file__])
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试价格面板指标：年初至今涨跌幅、年内最大回撤与停牌处理
+
+python -m pytest -q test_price_metrics.py
+"""
+
+import math
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from database.price_metrics import (
+    METRICS_TABLE, compute_panel_metrics, compute_price_metrics, write_metrics,
+)
+
+# A 跨年连续交易；B 2024-01-03 上市，2024-01-04 停牌
+PRICES = [
+    ('A', '2023-12-28', 10.0, 1.0),
+    ('A', '2023-12-29', 12.0, 1.0),
+    ('A', '2024-01-02', 11.0, 1.0),
+    ('A', '2024-01-03', 13.0, 1.0),
+    ('A', '2024-01-04', 9.75, 1.0),
+    ('A', '2024-01-05', 14.0, 1.0),
+    ('B', '2024-01-03', 5.0, 3.0),
+    ('B', '2024-01-05', 6.0, 2.0),
+]
+
+
+@pytest.fixture
+def history():
+    return pd.DataFrame(PRICES, columns=['code', 'date', 'close', 'turnover_rate'])
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("""
+        CREATE TABLE etf_price_history (
+            code TEXT, date TEXT, close_price REAL, turnover_rate REAL, amount REAL
+        )
+    """)
+    conn.executemany("INSERT INTO etf_price_history VALUES (?, ?, ?, ?, 100.0)", PRICES)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def metric(frame, code, date):
+    return frame[(frame['code'] == code) & (frame['date'] == date)].iloc[0]
+
+
+def test_return_ytd(history):
+    """以当年第一个收盘价为基准，跨年重新起算；当年上市的取上市首日"""
+    frame = compute_panel_metrics(history)
+    assert metric(frame, 'A', '2023-12-29')['return_ytd'] == pytest.approx(20.0)
+    assert metric(frame, 'A', '2024-01-02')['return_ytd'] == pytest.approx(0.0)
+    assert metric(frame, 'A', '2024-01-05')['return_ytd'] == pytest.approx((14 / 11 - 1) * 100)
+    assert metric(frame, 'B', '2024-01-05')['return_ytd'] == pytest.approx(20.0)
+    # 日涨跌幅不受年份分组影响
+    assert metric(frame, 'A', '2024-01-02')['return_1d'] == pytest.approx((11 / 12 - 1) * 100)
+
+
+def test_max_drawdown_ytd(history):
+    """回撤相对当年累计最高价，取当年以来最小值，新高后不回升"""
+    frame = compute_panel_metrics(history)
+    assert metric(frame, 'A', '2024-01-02')['max_drawdown_ytd'] == pytest.approx(0.0)
+    assert metric(frame, 'A', '2024-01-04')['max_drawdown_ytd'] == pytest.approx(-25.0)
+    assert metric(frame, 'A', '2024-01-05')['max_drawdown_ytd'] == pytest.approx(-25.0)
+    assert metric(frame, 'A', '2023-12-29')['max_drawdown_ytd'] == pytest.approx(0.0)
+
+
+def test_suspension_and_rank(history):
+    """停牌日不输出，复牌日涨跌幅相对停牌前收盘价；换手率排名按日计算"""
+    frame = compute_panel_metrics(history)
+    assert sorted(frame.loc[frame['code'] == 'B', 'date']) == ['2024-01-03', '2024-01-05']
+    resumed = metric(frame, 'B', '2024-01-05')
+    assert resumed['return_1d'] == pytest.approx(20.0)
+    assert resumed['turnover_rank'] == 1
+    assert metric(frame, 'A', '2024-01-05')['turnover_rank'] == 2
+    assert math.isnan(metric(frame, 'B', '2024-01-03')['return_1d'])
+    assert frame['amount'].isna().all()
+
+
+def test_incremental_matches_full(conn, history):
+    """增量计算读取足够的回看数据，结果与全量计算的同日期部分一致"""
+    full = compute_panel_metrics(history)
+    partial = compute_price_metrics(conn, start='2024-01-04')
+    assert set(partial['date']) == {'2024-01-04', '2024-01-05'}
+    expected = full[full['date'] >= '2024-01-04'].reset_index(drop=True)
+    columns = ['close', 'return_1d', 'return_5d', 'return_ytd', 'max_drawdown_ytd', 'turnover_rank']
+    pd.testing.assert_frame_equal(partial[['date', 'code'] + columns], expected[['date', 'code'] + columns],
+                                  check_dtype=False)
+    assert (partial['amount'] == 100.0).all()
+
+
+def test_write_metrics_replaces_dates(conn):
+    """按日期分区覆盖写入"""
+    assert write_metrics(conn, compute_price_metrics(conn)) == len(PRICES)
+    assert write_metrics(conn, compute_price_metrics(conn, start='2024-01-05')) == 2
+    assert conn.execute(f"SELECT COUNT(*) FROM {METRICS_TABLE}").fetchone()[0] == len(PRICES)
+    value = conn.execute(f"SELECT max_drawdown_ytd FROM {METRICS_TABLE} "
+                         "WHERE code = 'A' AND date = '2024-01-05'").fetchone()[0]
+    assert value == pytest.approx(-25.0)
+
+
+def test_empty_history():
+    frame = compute_panel_metrics(pd.DataFrame(columns=['code', 'date', 'close']))
+    assert frame.empty and 'return_ytd' in frame.columns
+
+
+if __name__ == '__main__':
+    pytest.main(['-q', __file__])
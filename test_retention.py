@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试历史表分层归档：快照日期、单表归档、主库与归档库的联合视图
+
+python -m pytest -q test_retention.py
+"""
+
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from database import retention
+
+TABLE = 'etf_attention_history'
+
+
+def make_db(path, dates, codes=('510300', '159915')):
+    conn = sqlite3.connect(path)
+    conn.execute(f"""
+        CREATE TABLE {TABLE} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code TEXT NOT NULL,
+            date TEXT NOT NULL,
+            attention_count INTEGER
+        )
+    """)
+    conn.execute(f"CREATE UNIQUE INDEX ux_{TABLE}_code_date ON {TABLE} (code, date)")
+    conn.executemany(f"INSERT INTO {TABLE} (code, date, attention_count) VALUES (?, ?, ?)",
+                     [(code, date, i) for i, date in enumerate(dates) for code in codes])
+    conn.commit()
+    return conn
+
+
+def business_days(start, end):
+    return list(pd.bdate_range(start, end).strftime('%Y-%m-%d'))
+
+
+def test_snapshot_dates():
+    """周度范围内保留每周最后一天，更早的保留每月最后一天"""
+    dates = business_days('2024-01-01', '2024-03-31')
+    keep = retention.snapshot_dates(dates, pd.Timestamp('2024-03-01'))
+    # 1、2月各保留月末最后一个交易日
+    assert '2024-01-31' in keep and '2024-02-29' in keep
+    assert not any(d < '2024-03-01' and d not in ('2024-01-31', '2024-02-29') for d in keep)
+    # 3月每周保留周五
+    assert {'2024-03-01', '2024-03-08', '2024-03-15', '2024-03-22', '2024-03-29'} <= keep
+    assert '2024-03-07' not in keep
+    assert retention.snapshot_dates([], pd.Timestamp('2024-03-01')) == set()
+
+
+def test_compact_table(tmp_path):
+    """热数据留在主库，更早的只把快照日期移入归档库"""
+    dates = business_days('2024-01-01', '2024-06-28')
+    conn = make_db(str(tmp_path / 'etf.db'), dates)
+    retention.attach_archive(conn, create=True)
+
+    stats = retention.compact_table(conn, TABLE, hot_days=30, weekly_days=90)
+    conn.commit()
+    cutoff = stats['cutoff']
+    assert cutoff == '2024-05-29'
+    main_dates = [row[0] for row in conn.execute(f"SELECT DISTINCT date FROM main.{TABLE} ORDER BY date")]
+    assert main_dates == [d for d in dates if d >= cutoff]
+    archived = [row[0] for row in conn.execute(f"SELECT DISTINCT date FROM archive.{TABLE} ORDER BY date")]
+    assert archived == sorted(retention.snapshot_dates([d for d in dates if d < cutoff], pd.Timestamp('2024-03-30')))
+    old_rows = 2 * len([d for d in dates if d < cutoff])
+    assert stats['moved'] == 2 * len(archived)
+    assert stats['moved'] + stats['dropped'] == old_rows
+
+    # 再执行一次没有可移动的行
+    again = retention.compact_table(conn, TABLE, hot_days=30, weekly_days=90)
+    assert again['moved'] == 0 and again['dropped'] == 0
+    conn.close()
+
+
+def test_history_source_view(tmp_path):
+    """start 在热数据范围内读主库表，更早时读联合视图，且与全部数据一致"""
+    dates = business_days('2024-01-01', '2024-06-28')
+    conn = make_db(str(tmp_path / 'etf.db'), dates)
+    retention.compact(conn, hot_days=30, weekly_days=90)
+
+    assert retention.history_source(conn, TABLE, '2024-06-01') == TABLE
+    view = retention.history_source(conn, TABLE, '2024-01-01')
+    assert view == TABLE + retention.ALL_SUFFIX
+    main_rows = conn.execute(f"SELECT COUNT(*) FROM main.{TABLE}").fetchone()[0]
+    archive_rows = conn.execute(f"SELECT COUNT(*) FROM archive.{TABLE}").fetchone()[0]
+    assert conn.execute(f"SELECT COUNT(*) FROM {view}").fetchone()[0] == main_rows + archive_rows
+    conn.close()
+
+
+def test_view_skips_unpublished_archive_rows(tmp_path):
+    """
+    归档库与正式库共用：暂存库归档后、发布前（或发布失败），
+    正式库中仍在的日期不能在联合视图中出现两次
+    """
+    dates = business_days('2024-01-01', '2024-06-28')
+    live = str(tmp_path / 'etf.db')
+    make_db(live, dates).close()
+    staging_path = str(tmp_path / 'etf.staging.db')
+    source = sqlite3.connect(live)
+    build = sqlite3.connect(staging_path)
+    source.backup(build)
+    source.close()
+    retention.compact(build, hot_days=30, weekly_days=90)
+    assert retention.archive_path(build) == str(tmp_path / 'etf_archive.db')
+    build.close()
+
+    conn = sqlite3.connect(live)
+    view = retention.history_source(conn, TABLE)
+    duplicated = conn.execute(f"SELECT COUNT(*) FROM (SELECT code, date FROM {view} GROUP BY code, date "
+                              f"HAVING COUNT(*) > 1)").fetchone()[0]
+    assert duplicated == 0
+    assert conn.execute(f"SELECT COUNT(*) FROM {view}").fetchone()[0] == 2 * len(dates)
+    conn.close()
+
+
+def test_view_with_empty_main(tmp_path):
+    """主库表为空时视图返回归档库的全部行"""
+    dates = business_days('2024-01-01', '2024-06-28')
+    conn = make_db(str(tmp_path / 'etf.db'), dates)
+    retention.compact(conn, hot_days=30, weekly_days=90)
+    archive_rows = conn.execute(f"SELECT COUNT(*) FROM archive.{TABLE}").fetchone()[0]
+    conn.execute(f"DELETE FROM main.{TABLE}")
+    conn.commit()
+    view = retention.history_source(conn, TABLE)
+    assert conn.execute(f"SELECT COUNT(*) FROM {view}").fetchone()[0] == archive_rows
+    conn.close()
+
+
+if __name__ == '__main__':
+    pytest.main(['-q', __file__])
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试按行比对：只返回新增或值有变化的行
+
+python -m pytest -q test_row_diff.py
+"""
+
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from database.row_diff import changed_rows
+
+TABLE = 'etf_holders_history'
+VALUES = ['holder_count', 'holding_value']
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute(f"""
+        CREATE TABLE {TABLE} (
+            code TEXT, date TEXT, holder_count INTEGER, holding_value REAL, update_time TEXT,
+            UNIQUE (code, date)
+        )
+    """)
+    conn.executemany(f"INSERT INTO {TABLE} VALUES (?, ?, ?, ?, ?)", [
+        ('510300', '2024-01-02', 100, 1.5, '2024-01-02 16:00:00'),
+        ('510500', '2024-01-02', 200, None, '2024-01-02 16:00:00'),
+        ('159915', '2024-01-02', 300, 3.0, '2024-01-02 16:00:00'),
+    ])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_unchanged_rows_skipped(conn):
+    """整数与实数的相同值、缺失值与 NULL 视为相同；不参与比对的列不影响结果"""
+    frame = pd.DataFrame({
+        'code': ['510300', '510500', '159915'],
+        'date': ['2024-01-02'] * 3,
+        'holder_count': [100.0, 200, 300],
+        'holding_value': [1.5, float('nan'), 3],
+        'update_time': ['2024-01-03 09:00:00'] * 3,
+    })
+    assert changed_rows(conn, TABLE, frame, VALUES).empty
+
+
+def test_changed_and_new_rows(conn):
+    frame = pd.DataFrame({
+        'code': ['510300', '510500', '159915', '588000', '510300'],
+        'date': ['2024-01-02', '2024-01-02', '2024-01-02', '2024-01-02', '2024-01-03'],
+        'holder_count': [101, 200, 300, 1, 100],
+        'holding_value': [1.5, 2.0, None, 1.0, 1.5],
+    })
+    result = changed_rows(conn, TABLE, frame, VALUES)
+    # 值变化、NULL 变为有值、有值变为 NULL、新代码、新日期
+    assert list(result.index) == [0, 1, 2, 3, 4]
+
+    same = frame.iloc[[0]].assign(holder_count=100)
+    assert changed_rows(conn, TABLE, same, VALUES).empty
+
+
+def test_keeps_frame_columns(conn):
+    """返回 frame 的子集，保留原有列和索引"""
+    frame = pd.DataFrame({
+        'code': ['510300', '159915'],
+        'date': ['2024-01-02', '2024-01-02'],
+        'holder_count': [100, 301],
+        'holding_value': [1.5, 3.0],
+        'extra': ['a', 'b'],
+    }, index=[10, 20])
+    result = changed_rows(conn, TABLE, frame, VALUES)
+    assert list(result.index) == [20]
+    assert list(result.columns) == list(frame.columns)
+
+
+def test_empty_inputs(conn):
+    empty = pd.DataFrame(columns=['code', 'date'] + VALUES)
+    assert changed_rows(conn, TABLE, empty, VALUES).empty
+    new_day = pd.DataFrame({'code': ['510300'], 'date': ['2024-02-01'], 'holder_count': [1],
+                            'holding_value': [1.0]})
+    assert len(changed_rows(conn, TABLE, new_day, VALUES)) == 1
+
+
+if __name__ == '__main__':
+    pytest.main(['-q', __file__])
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试分阶段构建数据库的发布与拒绝发布
+
+python -m pytest -q test_staging.py
+"""
+
+import sqlite3
+
+import pytest
+
+from database import staging
+
+
+def make_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+    conn.executemany("INSERT INTO t (v) VALUES (?)", [(v,) for v in rows])
+    conn.commit()
+    conn.close()
+
+
+def values(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute("SELECT v FROM t ORDER BY id")]
+    finally:
+        conn.close()
+
+
+def write_live(path, value):
+    """模拟不取写锁的旧脚本直接写正式库"""
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO t (v) VALUES (?)", (value,))
+    conn.commit()
+    conn.close()
+
+
+def test_publish(tmp_path):
+    """构建结果替换正式库，暂存文件被清理"""
+    live = str(tmp_path / 'etf.db')
+    make_db(live, ['a'])
+    with staging.staged(live) as build:
+        write_live(build.path, 'b')
+        build.publish = True
+    assert build.published
+    assert values(live) == ['a', 'b']
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['etf.db']
+
+
+def test_discard(tmp_path):
+    """build.publish 为 False 时正式库不变"""
+    live = str(tmp_path / 'etf.db')
+    make_db(live, ['a'])
+    with staging.staged(live) as build:
+        write_live(build.path, 'b')
+    assert not build.published
+    assert values(live) == ['a']
+
+
+def test_refuse_after_live_write(tmp_path):
+    """克隆之后正式库被写入时拒绝发布，写入保留"""
+    live = str(tmp_path / 'etf.db')
+    make_db(live, ['a'])
+    with pytest.raises(staging.LiveChangedError):
+        with staging.staged(live) as build:
+            write_live(build.path, 'b')
+            write_live(live, 'legacy')
+            build.publish = True
+    assert values(live) == ['a', 'legacy']
+
+
+def test_refuse_after_live_write_wal(tmp_path):
+    """正式库为 WAL 模式时同样能发现克隆之后的写入"""
+    live = str(tmp_path / 'etf.db')
+    make_db(live, ['a'])
+    conn = sqlite3.connect(live)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
+    with pytest.raises(staging.LiveChangedError):
+        with staging.staged(live) as build:
+            write_live(live, 'legacy')
+            build.publish = True
+    assert values(live) == ['a', 'legacy']
+
+
+def test_run_rebuilds(tmp_path, monkeypatch):
+    """run() 在正式库被修改后重新克隆，发布的结果包含旧脚本的写入"""
+    live = str(tmp_path / 'etf.db')
+    make_db(live, ['a'])
+    monkeypatch.setattr(staging, 'DATABASE_PATH', live)
+    calls = []
+
+    def build_step(build):
+        calls.append(build.path)
+        write_live(build.path, 'built')
+        if len(calls) == 1:
+            write_live(live, 'legacy')
+        build.publish = True
+
+    build = staging.run('test', build_step, enabled=True)
+    assert build.published
+    assert len(calls) == 2
+    assert values(live) == ['a', 'legacy', 'built']
+
+
+def test_run_gives_up(tmp_path, monkeypatch):
+    """每次构建期间都有写入时重试 attempts 次后抛出"""
+    live = str(tmp_path / 'etf.db')
+    make_db(live, ['a'])
+    monkeypatch.setattr(staging, 'DATABASE_PATH', live)
+
+    def build_step(build):
+        write_live(live, 'legacy')
+        build.publish = True
+
+    with pytest.raises(staging.LiveChangedError):
+        staging.run('test', build_step, enabled=True, attempts=2)
+    assert values(live) == ['a', 'legacy', 'legacy']
+
+
+if __name__ == '__main__':
+    pytest.main(['-q', __file__])
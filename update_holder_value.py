@@ -19,8 +19,13 @@ from datetime import datetime
 import glob
 import re
 
+from database import dataset_versions
+from database.models import DATABASE_PATH
+from database.timeseries_store import append_history
+from database.writer_lock import locked
+
 # 数据库路径
-DB_PATH = "data/etf_data.db"
+DB_PATH = DATABASE_PATH
 # Excel文件目录
 EXCEL_DIR = "data"
 # Excel文件名模式
@@ -163,6 +168,7 @@ def read_excel_data(excel_path):
         traceback.print_exc()
         return None
 
+@locked('update_holder_value')
 def update_database(date_str, data_df):
     """更新数据库中的持仓份额和持仓市值数据"""
     if data_df is None or data_df.empty:
@@ -215,6 +221,8 @@ def update_database(date_str, data_df):
         
         # 提交事务
         conn.commit()
+        append_history('holders', data_df.assign(date=date_str), conn)
+        dataset_versions.refresh(conn, ['holders'])
         print(f"成功更新{update_count}条记录")
         
         return update_count
@@ -0,0 +1,87 @@
+"""
+批量生成Word表格
+
+python-docx 的 table.add_row().cells[i].text 每次都要在XML树中重新定位行和单元格，
+大表的填充是平方复杂度。这里把 DataFrame 按列格式化成文本后一次拼出全部 <w:tr> 的XML，
+解析一次再整体挂到表格上，数千行的表格也是线性时间。
+
+列定义是 (表头, 列名, 格式化函数) 的列表，格式化函数为 None 时用 str；
+列名也可以是可调用对象，接收整个 DataFrame 返回一列值。
+"""
+
+from xml.sax.saxutils import escape
+
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+
+DEFAULT_STYLE = 'Light Shading Accent 1'
+# 汇总行、商务品行的底色
+TOTAL_FILL = 'D9D9D9'
+BUSINESS_FILL = 'FFF2CC'
+
+
+def _is_missing(value):
+    return value is None or value != value
+
+
+def format_column(frame, source, formatter=None):
+    """把一列值格式化为文本列表（缺失值为空字符串）"""
+    values = source(frame) if callable(source) else frame[source]
+    formatter = formatter or str
+    return ['' if _is_missing(v) else str(formatter(v)) for v in values]
+
+
+def _run_xml(text, bold):
+    props = '<w:rPr><w:b/></w:rPr>' if bold else ''
+    # 与 cell.text 一致：换行写成 <w:br/>
+    parts = [f'<w:t xml:space="preserve">{escape(part)}</w:t>' for part in str(text).split('\n')]
+    return f'<w:r>{props}{"<w:br/>".join(parts)}</w:r>' if text != '' else ''
+
+
+def _row_xml(texts, widths, fill=None, bold=False, bold_first=False):
+    cells = []
+    for i, (text, width) in enumerate(zip(texts, widths)):
+        # dxa 单位是缇（1/20磅），gridCol 的宽度是 EMU
+        props = f'<w:tcW w:type="dxa" w:w="{int(width.twips)}"/>' if width else ''
+        if fill:
+            props += f'<w:shd w:val="clear" w:color="auto" w:fill="{fill}"/>'
+        run = _run_xml(text, bold or (bold_first and i == 0))
+        cells.append(f'<w:tc><w:tcPr>{props}</w:tcPr><w:p>{run}</w:p></w:tc>')
+    return f'<w:tr>{"".join(cells)}</w:tr>'
+
+
+def add_dataframe_table(doc, frame, columns, style=DEFAULT_STYLE, row_fills=None, total_row=None,
+                        bold_header=True):
+    """
+    在文档末尾添加表格：首行为表头，每行一个 DataFrame 行
+
+    参数:
+        doc: docx.Document
+        frame: pandas.DataFrame
+        columns: [(表头, 列名或可调用对象, 格式化函数或None), ...]
+        style: 表格样式名
+        row_fills: 与 frame 等长的底色序列（如商务品行高亮），None 或空字符串表示不填充
+        total_row: 追加在最后的汇总行文本列表，首列加粗、底色 TOTAL_FILL
+        bold_header: 表头是否加粗
+
+    返回:
+        docx.table.Table
+    """
+    table = doc.add_table(rows=0, cols=len(columns))
+    if style:
+        table.style = style
+    widths = [col.w for col in table._tbl.tblGrid.gridCol_lst]
+
+    texts = [format_column(frame, source, formatter) for _, source, formatter in columns]
+    fills = list(row_fills) if row_fills is not None else [None] * len(frame)
+
+    rows = [_row_xml([header for header, _, _ in columns], widths, bold=bold_header)]
+    rows.extend(_row_xml(row, widths, fill) for row, fill in zip(zip(*texts), fills))
+    if total_row is not None:
+        rows.append(_row_xml(total_row, widths, fill=TOTAL_FILL, bold_first=True))
+
+    # 一次解析全部行，再依次挂到表格下
+    parsed = parse_xml(f'<w:tbl {nsdecls("w")}>{"".join(rows)}</w:tbl>')
+    for tr in list(parsed):
+        table._tbl.append(tr)
+    return table